@@ -1,6 +1,8 @@
 # app.py
 from flask import Flask, render_template, request, jsonify, Response, stream_with_context # Added Response, stream_with_context
+import math
 import os
+import threading
 from dotenv import load_dotenv
 import logging
 
@@ -9,33 +11,142 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-from modules.ai_core.gemini_client import GeminiClient
+from modules.ai_core.gemini_client import GeminiClient, extract_chunk_text
 from modules.ai_core.processor import AIProcessor
+from modules.ai_core.response_cache import ResponseCache
+from modules.ai_core.semantic_cache import SemanticCache
+from modules.ai_core.single_flight import SingleFlight
+from modules.ai_core.resilience import ResiliencePolicy, CircuitBreaker
+from modules.ai_core.context_cache import ContextCacheManager, caching_can_apply
+from modules.ai_core.rate_limit import (
+    RateLimiter,
+    RateLimitExceeded,
+    SharedRateLimitBackend,
+    client_ip,
+    API_KEY_HEADER_NAME
+)
+from modules.ai_core.router import ModelRouter, ModelRoute
+from modules.ai_core.sse import stream_sse, SSE_HEADERS
 from modules.ai_core.config import (
-    DEFAULT_MODEL_NAME,
+    MODEL_POOL_CONFIG,
+    MODEL_WARMUP,
+    ROUTER_CONFIG,
     DEFAULT_GENERATION_CONFIG,
     DEFAULT_SAFETY_SETTINGS,
+    CONTEXT_WINDOW_MAX_TOKENS,
+    RESPONSE_CACHE_CONFIG,
+    SEMANTIC_CACHE_CONFIG,
+    SSE_CONFIG,
+    RESILIENCE_CONFIG,
+    CIRCUIT_BREAKER_CONFIG,
+    CONTEXT_CACHE_CONFIG,
     SYSTEM_INSTRUCTION_TEXT # Import the system instruction
 )
-from modules.context.history import ConversationHistory
+from modules.monitoring.metrics import REGISTRY
+from modules.monitoring.instrumentation import instrument_chat, observe_chat_stream, register_stats_source
+from modules.context.session_store import (
+    SessionHistoryStore,
+    SharedSessionHistoryStore,
+    resolve_session_id,
+    SESSION_COOKIE_NAME,
+    SESSION_HEADER_NAME
+)
+from modules.context.shared_store import SQLiteSharedStore
+from modules.context.summarizer import ExtractiveSummarizer, ModelSummarizer, SummaryWorker
+from modules.sentiment.pipeline import TonePipeline
+from config import (
+    SESSION_STORE_CONFIG,
+    SUMMARIZATION_CONFIG,
+    TONE_ADAPTATION_CONFIG,
+    RATE_LIMIT_CONFIG,
+    SHARED_STATE_CONFIG
+)
 
 app = Flask(__name__)
 
 # --- INITIAL WELCOME MESSAGE ---
 GURU_WELCOME_MESSAGE = "Hello there! I'm GURU, your witty and insightful AI assistant. How can I illuminate your day or help you conquer your to-do list?"
 
+# These don't depend on the API key, so they exist even when the client can't be built
+ai_processor = AIProcessor()
+summary_worker = SummaryWorker(
+    ExtractiveSummarizer(max_tokens=SUMMARIZATION_CONFIG["max_tokens"]),
+    max_workers=SUMMARIZATION_CONFIG["max_workers"]
+) if SUMMARIZATION_CONFIG["enabled"] else None
+# Under serve.py every worker process opens the same store, so sessions, cached replies and
+# rate limits are shared between them (see SHARED_STATE_CONFIG)
+shared_store_path = os.getenv("GURU_SHARED_STORE") or SHARED_STATE_CONFIG["path"]
+shared_store = SQLiteSharedStore(
+    shared_store_path,
+    busy_timeout=SHARED_STATE_CONFIG["busy_timeout_seconds"]
+) if shared_store_path else None
+# Each session keeps its Gemini contents pre-built, so a request doesn't re-walk the history
+session_store_options = dict(
+    summary_worker=summary_worker,
+    contents_factory=lambda: ai_processor.incremental_contents(SYSTEM_INSTRUCTION_TEXT),
+    **SESSION_STORE_CONFIG
+)
+session_store = (SharedSessionHistoryStore(shared_store, **session_store_options) if shared_store is not None
+                 else SessionHistoryStore(**session_store_options))
+response_cache = ResponseCache(shared_store=shared_store, **RESPONSE_CACHE_CONFIG)
+semantic_cache = SemanticCache(**SEMANTIC_CACHE_CONFIG)
+single_flight = SingleFlight()
+rate_limiter = RateLimiter(
+    RATE_LIMIT_CONFIG["limits"],
+    max_streams=RATE_LIMIT_CONFIG["max_streams"],
+    tenant_limits=RATE_LIMIT_CONFIG["tenant_limits"],
+    backend=SharedRateLimitBackend(
+        shared_store,
+        stream_lease_seconds=SHARED_STATE_CONFIG["stream_lease_seconds"]
+    ) if shared_store is not None else None,
+    max_keys=RATE_LIMIT_CONFIG["max_keys"]
+) if RATE_LIMIT_CONFIG["enabled"] else None
+tone_pipeline = TonePipeline(
+    max_workers=TONE_ADAPTATION_CONFIG["max_workers"],
+    min_words=TONE_ADAPTATION_CONFIG["min_words"],
+    min_compound=TONE_ADAPTATION_CONFIG["min_compound"]
+) if TONE_ADAPTATION_CONFIG["enabled"] else None
+# One resilience policy (and circuit breaker) per model, so one model's brownout doesn't trip the others
+resilience_policies = {
+    model["model_name"]: ResiliencePolicy(breaker=CircuitBreaker(**CIRCUIT_BREAKER_CONFIG), **RESILIENCE_CONFIG)
+    for model in MODEL_POOL_CONFIG
+}
+# Shared by every model's client (handles are keyed by model name). Only created if the
+# persona plus the history budget can reach min_tokens; otherwise nothing would ever be cached.
+context_cache = ContextCacheManager(
+    **{name: value for name, value in CONTEXT_CACHE_CONFIG.items() if name != "enabled"}
+) if CONTEXT_CACHE_CONFIG["enabled"] and caching_can_apply(
+    SYSTEM_INSTRUCTION_TEXT, CONTEXT_WINDOW_MAX_TOKENS, CONTEXT_CACHE_CONFIG["min_tokens"]) else None
+if CONTEXT_CACHE_CONFIG["enabled"] and context_cache is None:
+    logger.info(f"Context caching is off: prompts (at most {CONTEXT_WINDOW_MAX_TOKENS} tokens of history plus "
+                f"the persona) never reach its min_tokens of {CONTEXT_CACHE_CONFIG['min_tokens']}.")
+
 try:
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
         raise ValueError("FATAL: GEMINI_API_KEY not found in .env file. Please set it.")
-    
-    gemini_client = GeminiClient(
-        api_key=gemini_api_key,
-        model_name=DEFAULT_MODEL_NAME,
-        system_instruction=SYSTEM_INSTRUCTION_TEXT
-    )
-    ai_processor = AIProcessor()
-    conversation_history = ConversationHistory(max_history_length=10)
+
+    model_routes = []
+    for model in MODEL_POOL_CONFIG:
+        client = GeminiClient(
+            api_key=gemini_api_key,
+            model_name=model["model_name"],
+            system_instruction=SYSTEM_INSTRUCTION_TEXT,
+            response_cache=response_cache,
+            semantic_cache=semantic_cache,
+            single_flight=single_flight,
+            resilience=resilience_policies[model["model_name"]],
+            context_cache=context_cache
+        )
+        model_routes.append(ModelRoute(
+            model["model_name"],
+            client,
+            tier=model["tier"],
+            expected_ttft_ms=model["expected_ttft_ms"],
+            cost_per_million_tokens=model["cost_per_million_tokens"]
+        ))
+    # The router has GeminiClient's generate_response/agenerate_response interface
+    gemini_client = ModelRouter(model_routes, **ROUTER_CONFIG)
     logger.info("GURU core modules initialized successfully with persona.")
 except ValueError as ve:
     logger.error(ve)
@@ -44,12 +155,65 @@ except Exception as e:
     logger.critical(f"FATAL: Error initializing GURU components: {e}")
     gemini_client = None
 
+if summary_worker is not None and gemini_client is not None and SUMMARIZATION_CONFIG["summarizer"] == "model":
+    summary_worker.summarizer = ModelSummarizer(gemini_client, max_tokens=SUMMARIZATION_CONFIG["max_tokens"],
+                                                fallback=summary_worker.summarizer)
+
+def warm_up_models():
+    """Builds the SDK models so the first chat request doesn't pay for it (see MODEL_WARMUP)."""
+    if gemini_client.warm_up():
+        logger.info("Gemini models warmed up; GURU is ready.")
+
+if gemini_client is not None and MODEL_WARMUP == "background":
+    threading.Thread(target=warm_up_models, name="gemini-warm-up", daemon=True).start()
+
+register_stats_source("session_store", "Session history store", session_store.stats,
+                      gauges=("sessions",),
+                      counters=("evicted_lru", "evicted_expired", "reloads", "conflicts", "lost_changes"))
+register_stats_source("response_cache", "Exact-match response cache", response_cache.stats,
+                      gauges=("entries", "bytes", "hit_ratio"),
+                      counters=("hits", "misses", "evictions", "bypasses", "shared_hits"))
+register_stats_source("semantic_cache", "Semantic response cache", semantic_cache.stats,
+                      gauges=("entries", "hit_ratio"), counters=("hits", "misses", "evictions"))
+register_stats_source("single_flight", "Request coalescing", single_flight.stats,
+                      gauges=("in_flight",), counters=("leaders", "followers", "abandoned"))
+if summary_worker is not None:
+    register_stats_source("summaries", "Conversation summaries", summary_worker.stats,
+                          gauges=("pending",), counters=("jobs", "summaries", "folded_turns", "failed"))
+if context_cache is not None:
+    register_stats_source("context_cache", "Server-side context cache", context_cache.stats,
+                          gauges=("handles", "creating"),
+                          counters=("hits", "misses", "cached_tokens", "created", "create_failures", "refreshed",
+                                    "expired", "evicted", "fallbacks"))
+if rate_limiter is not None:
+    register_stats_source("rate_limit", "Chat rate limiting", rate_limiter.stats,
+                          gauges=("buckets", "open_streams"),
+                          counters=("allowed", "rate_limited", "stream_limited", "evicted_buckets"))
+if tone_pipeline is not None:
+    register_stats_source("tone", "Tone prefixes", tone_pipeline.stats,
+                          counters=("prefixed", "neutral", "late", "failed"))
+
+def admit_chat(remote_addr, forwarded_for, session_id, is_new_session, api_key):
+    """
+    Applies RATE_LIMIT_CONFIG to a chat request (shared by the Flask and ASGI routes).
+    :return: StreamPermit to release once the reply has finished, or None when limiting is off.
+    :raises RateLimitExceeded: When the caller is over a limit.
+    """
+    if rate_limiter is None:
+        return None
+    return rate_limiter.admit(
+        ip=client_ip(remote_addr, forwarded_for, RATE_LIMIT_CONFIG["trust_forwarded_for"]),
+        session_id=None if is_new_session else session_id,
+        api_key=api_key
+    )
+
 @app.route('/')
 def index():
     # Pass the initial welcome message to the template
     return render_template('index.html', initial_message=GURU_WELCOME_MESSAGE)
 
 @app.route('/api/chat', methods=['POST'])
+@instrument_chat
 def chat():
     if not gemini_client:
         return jsonify({'error': 'AI service is not available due to initialization issues.'}), 503
@@ -58,51 +222,99 @@ def chat():
     if not user_message:
         return jsonify({'error': 'No message provided'}), 400
 
+    session_id, is_new_session = resolve_session_id(
+        request.headers.get(SESSION_HEADER_NAME),
+        request.cookies.get(SESSION_COOKIE_NAME)
+    )
+    try:
+        permit = admit_chat(request.remote_addr, request.headers.get("X-Forwarded-For"), session_id, is_new_session,
+                            request.headers.get(API_KEY_HEADER_NAME))
+    except RateLimitExceeded as e:
+        logger.info(f"Rate limited chat request ({e.scope}): {e}")
+        response = jsonify({'error': 'Too many requests. Please slow down and try again shortly.'})
+        response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+        return response, 429
+    conversation_history = session_store.get(session_id)
     conversation_history.add_message(role="user", content=user_message)
+    contents = conversation_history.get_prompt_contents(max_tokens=CONTEXT_WINDOW_MAX_TOKENS)
 
-    def generate_stream():
+    def chat_events():
+        logger.info(f"DEBUG: Sending prompt: '{user_message}' with {len(contents)} context turns")
+        # Sentiment runs alongside the model call; its prefix is only used if ready by the first token
+        tone = tone_pipeline.start(user_message) if tone_pipeline is not None else None
+        response_stream = gemini_client.generate_response(
+            prompt=contents,
+            generation_config=DEFAULT_GENERATION_CONFIG,
+            safety_settings=DEFAULT_SAFETY_SETTINGS,
+            stream=True
+        )
         try:
-            logger.info(f"DEBUG: Sending prompt: '{user_message}'")
-            response_stream = gemini_client.generate_response(
-                prompt=user_message,
-                generation_config=DEFAULT_GENERATION_CONFIG,
-                safety_settings=DEFAULT_SAFETY_SETTINGS,
-                stream=True
-            )
-
-            full_ai_response_for_history = ""
+            # Carries whitespace/markup state across chunk boundaries and collects the full reply
+            parser = ai_processor.stream_parser()
             for chunk in response_stream:
-                # Handle chunk based on its structure
                 if isinstance(chunk, str):
-                    # If the chunk is a plain string
-                    processed_chunk = ai_processor.parse_response(chunk)
-                    full_ai_response_for_history += processed_chunk
-                    yield processed_chunk
-                elif hasattr(chunk, 'text') and chunk.text:
-                    # If the chunk has a 'text' attribute
-                    processed_chunk = ai_processor.parse_response(chunk.text)
-                    full_ai_response_for_history += processed_chunk
-                    yield processed_chunk
-                else:
+                    # GeminiClient reports upstream failures as plain "Error_...: ..." strings
+                    yield "error", {"message": chunk}
+                    return
+                chunk_text = extract_chunk_text(chunk)
+                if chunk_text is None:
                     # Log unexpected chunk structure and skip
                     logger.warning(f"Unexpected chunk structure: {chunk}")
                     logger.debug(f"Chunk details: {chunk.__dict__ if hasattr(chunk, '__dict__') else str(chunk)}")
                     continue
+                processed_chunk = parser.feed(chunk_text)
+                if processed_chunk:
+                    if tone is not None:
+                        prefix, tone = tone.prefix_if_ready(), None
+                        if prefix:
+                            yield "token", prefix
+                    yield "token", processed_chunk
+            parser.finish()
 
+            full_ai_response_for_history = parser.text
             if full_ai_response_for_history:
+                # Only the model's words: the tone opener isn't part of what the model said
                 conversation_history.add_message(role="model", content=full_ai_response_for_history)
             else:
-                yield "Sorry, I couldn't generate a response this time. Please try again."
+                yield "error", {"message": "Sorry, I couldn't generate a response this time. Please try again."}
+        finally:
+            response_stream.close()  # Stops the model stream if the client went away mid-reply
 
-        except Exception as e:
-            logger.error(f"Unexpected error in generate_response: {e}", exc_info=True)
-            yield f"Error: Could not stream AI response. {str(e)}"
-
-    return Response(stream_with_context(generate_stream()), mimetype='text/event-stream')
+    sse_stream = stream_sse(
+        chat_events(),
+        heartbeat_interval=SSE_CONFIG["heartbeat_seconds"],
+        flush_bytes=SSE_CONFIG["flush_bytes"],
+        flush_interval=SSE_CONFIG["flush_interval_seconds"],
+        on_finish=observe_chat_stream
+    )
+    response = Response(stream_with_context(sse_stream), mimetype='text/event-stream', headers=SSE_HEADERS)
+    if is_new_session:
+        response.set_cookie(SESSION_COOKIE_NAME, session_id, httponly=True, samesite='Lax')
+    if permit is not None:
+        response.call_on_close(permit.release)  # Runs even if the client leaves before the stream starts
+    return response
 
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'GURU is healthy!'}), 200
+    return jsonify({
+        'status': 'GURU is healthy!',
+        'sessions': session_store.stats(),
+        'response_cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'single_flight': single_flight.stats(),
+        'gemini_upstream': {name: policy.stats() for name, policy in resilience_policies.items()},
+        'model_router': gemini_client.stats() if isinstance(gemini_client, ModelRouter) else None
+    }), 200
+
+@app.route('/ready')
+def readiness_check():
+    """Readiness, unlike /health (liveness): 503 until chat requests can be served without warm-up."""
+    ready = gemini_client is not None and (MODEL_WARMUP == "lazy" or gemini_client.ready)
+    return jsonify({'ready': ready, 'model_configured': gemini_client is not None}), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     port = os.getenv("PORT")
@@ -0,0 +1,253 @@
+# asgi.py
+# ASGI entry point for GURU. Serves /api/chat natively on the event loop so one process
+# can hold hundreds of open model streams; every other route is delegated to the Flask app.
+# Run with: uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+import asyncio
+import json
+import logging
+import math
+import os
+from http.cookies import SimpleCookie
+
+from app import app as flask_app
+import app as guru_app
+from modules.ai_core.config import (
+    DEFAULT_GENERATION_CONFIG,
+    DEFAULT_SAFETY_SETTINGS,
+    CONTEXT_WINDOW_MAX_TOKENS,
+    SSE_CONFIG,
+    STREAM_SCHEDULER_CONFIG
+)
+from modules.ai_core.gemini_client import extract_chunk_text
+from modules.ai_core.sse import astream_sse, SSE_HEADERS
+from modules.monitoring.instrumentation import CHAT_REQUESTS, observe_chat_stream
+from modules.ai_core.scheduler import StreamScheduler, SchedulerOverloaded, StreamDeadlineExceeded
+from modules.ai_core.rate_limit import RateLimitExceeded, API_KEY_HEADER_NAME
+from modules.context.session_store import resolve_session_id, SESSION_COOKIE_NAME, SESSION_HEADER_NAME
+
+logger = logging.getLogger(__name__)
+
+stream_scheduler = StreamScheduler(
+    max_concurrency=int(os.getenv("GURU_MAX_CONCURRENT_STREAMS", STREAM_SCHEDULER_CONFIG["max_concurrency"])),
+    max_queue=int(os.getenv("GURU_MAX_QUEUED_STREAMS", STREAM_SCHEDULER_CONFIG["max_queue"])),
+    default_deadline=float(os.getenv("GURU_STREAM_DEADLINE_SECONDS", STREAM_SCHEDULER_CONFIG["deadline_seconds"])),
+    max_queue_per_tenant=STREAM_SCHEDULER_CONFIG["max_queue_per_tenant"]
+)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    _flask_asgi = WsgiToAsgi(flask_app)
+except ImportError:  # asgiref is optional; without it only /api/chat is served here
+    _flask_asgi = None
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def _send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    name = name.lower().encode("latin-1")
+    for header_name, value in scope.get("headers", []):
+        if header_name == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _session_from_scope(scope):
+    header_name = SESSION_HEADER_NAME.lower().encode("latin-1")
+    header_value = cookie_value = None
+    for name, value in scope.get("headers", []):
+        if name == header_name:
+            header_value = value.decode("latin-1")
+        elif name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(SESSION_COOKIE_NAME)
+            if morsel is not None:
+                cookie_value = morsel.value
+    return resolve_session_id(header_value, cookie_value)
+
+
+async def chat(scope, receive, send):
+    """Async counterpart of app.chat(): streams the model reply without pinning a thread."""
+    gemini_client = guru_app.gemini_client
+    if not gemini_client:
+        await _send_json(send, 503, {'error': 'AI service is not available due to initialization issues.'})
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        payload = {}
+    user_message = payload.get('message') if isinstance(payload, dict) else None
+    if not user_message:
+        await _send_json(send, 400, {'error': 'No message provided'})
+        return
+
+    session_id, is_new_session = _session_from_scope(scope)
+    client = scope.get("client")
+    remote_addr = client[0] if client else None
+    try:
+        permit = guru_app.admit_chat(remote_addr, _header(scope, "X-Forwarded-For"), session_id, is_new_session,
+                                     _header(scope, API_KEY_HEADER_NAME))
+    except RateLimitExceeded as e:
+        logger.info(f"Rate limited chat request ({e.scope}): {e}")
+        await _send_json(send, 429, {'error': 'Too many requests. Please slow down and try again shortly.'},
+                         [(b"retry-after", str(math.ceil(e.retry_after)).encode())])
+        return
+    tenant = permit.tenant if permit is not None else remote_addr
+    try:
+        await _chat_stream(receive, send, gemini_client, user_message, session_id, is_new_session, tenant)
+    finally:
+        if permit is not None:
+            permit.release()
+
+
+async def _chat_stream(receive, send, gemini_client, user_message, session_id, is_new_session, tenant):
+    """Streams one admitted chat request; `tenant` is its fair-queueing group in the scheduler."""
+    # Before touching the history: a rejected question must not stay in it as a turn without a
+    # reply (the client's retry would then send it twice)
+    try:
+        stream_scheduler.check_admission(tenant)
+    except SchedulerOverloaded as e:
+        logger.warning(f"Rejecting chat stream: {e}")
+        await _send_json(send, 429, {'error': 'GURU is busy right now. Please try again shortly.'})
+        return
+
+    conversation_history = guru_app.session_store.get(session_id)
+    ai_processor = guru_app.ai_processor
+    extra_headers = []
+    if is_new_session:
+        extra_headers.append((b"set-cookie", f"{SESSION_COOKIE_NAME}={session_id}; HttpOnly; Path=/; SameSite=Lax".encode("latin-1")))
+    conversation_history.add_message(role="user", content=user_message)
+    contents = conversation_history.get_prompt_contents(max_tokens=CONTEXT_WINDOW_MAX_TOKENS)
+
+    async def chat_events():
+        tone_pipeline = guru_app.tone_pipeline
+        tone = tone_pipeline.start(user_message) if tone_pipeline is not None else None
+        upstream = stream_scheduler.stream(
+            lambda: gemini_client.agenerate_response(
+                prompt=contents,
+                generation_config=DEFAULT_GENERATION_CONFIG,
+                safety_settings=DEFAULT_SAFETY_SETTINGS
+            ),
+            tenant=tenant
+        )
+        parser = ai_processor.stream_parser()
+        try:
+            async for chunk in upstream:
+                if isinstance(chunk, str):
+                    yield "error", {"message": chunk}
+                    return
+                chunk_text = extract_chunk_text(chunk)
+                if chunk_text is None:
+                    logger.warning(f"Unexpected chunk structure: {chunk}")
+                    continue
+                processed_chunk = parser.feed(chunk_text)
+                if processed_chunk:
+                    if tone is not None:
+                        prefix, tone = tone.prefix_if_ready(), None
+                        if prefix:
+                            yield "token", prefix
+                    yield "token", processed_chunk
+
+            parser.finish()
+            full_ai_response_for_history = parser.text
+            if full_ai_response_for_history:
+                # Only the model's words: the tone opener isn't part of what the model said
+                conversation_history.add_message(role="model", content=full_ai_response_for_history)
+            else:
+                yield "error", {"message": "Sorry, I couldn't generate a response this time. Please try again."}
+        except (SchedulerOverloaded, StreamDeadlineExceeded) as e:
+            logger.warning(f"Chat stream stopped by scheduler: {e}")
+            yield "error", {"message": f"Error: Could not stream AI response. {str(e)}"}
+        finally:
+            await upstream.aclose()  # Cancels the model stream when the client has gone away
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    await _start_stream(send, extra_headers)
+    try:
+        async for frame in astream_sse(
+            chat_events(),
+            heartbeat_interval=SSE_CONFIG["heartbeat_seconds"],
+            flush_bytes=SSE_CONFIG["flush_bytes"],
+            flush_interval=SSE_CONFIG["flush_interval_seconds"],
+            disconnected=disconnected,
+            on_finish=observe_chat_stream
+        ):
+            await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+        if not disconnected.is_set():
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        watcher.cancel()
+
+
+async def _watch_disconnect(receive, disconnected):
+    """Sets `disconnected` once the server reports the client has gone away."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+async def _start_stream(send, extra_headers=()):
+    sse_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in SSE_HEADERS.items()]
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), *sse_headers, *extra_headers],
+    })
+
+
+def _counting_status(send):
+    """Counts chat responses by status, like instrument_chat does for the Flask view."""
+    async def counted_send(message):
+        if message["type"] == "http.response.start":
+            CHAT_REQUESTS.inc(labels=(str(message["status"]),))
+        await send(message)
+    return counted_send
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await chat(scope, receive, _counting_status(send))
+        return
+    if _flask_asgi is None:
+        await _send_json(send, 404, {'error': 'Not found'})
+        return
+    await _flask_asgi(scope, receive, send)
@@ -0,0 +1,90 @@
+# benchmarks/bench_context_cache.py
+# A long conversation sent through GeminiClient with and without server-side context caching
+# (FakeCachingAPI stands in for the caching API): prompt tokens sent per request, and the
+# client-side cost of a request including the cached-prefix lookup.
+# Run from the repository root: python -m benchmarks.bench_context_cache --turns 400
+
+import argparse
+import json
+import statistics
+import time
+
+from modules.ai_core.config import SYSTEM_INSTRUCTION_TEXT
+from modules.ai_core.context_cache import ContextCacheManager
+from modules.ai_core.fake_model import FakeCachingAPI, FakeGenerativeModel
+from modules.ai_core.gemini_client import GeminiClient
+from modules.ai_core.processor import AIProcessor
+from modules.context.history import ConversationHistory
+from modules.context.tokens import estimate_tokens
+
+REPLY = "Sure, here is a detailed answer to that question. " * 4
+
+
+def contents_tokens(contents):
+    if isinstance(contents, str):
+        return estimate_tokens(contents)
+    return sum(estimate_tokens(part.get("text", "")) for entry in contents for part in entry.get("parts", []))
+
+
+def run(turns, persona, context_cache):
+    """Returns the prompt tokens sent (system instruction included unless cached) and µs per request."""
+    fake_model = FakeGenerativeModel(chunks=[REPLY])
+    client = GeminiClient(model=fake_model, system_instruction=persona, context_cache=context_cache)
+    history = ConversationHistory(max_history_length=10 ** 6, contents_builder=AIProcessor().incremental_contents(persona))
+    persona_tokens = estimate_tokens(persona)
+    sent_tokens, request_us = [], []
+    for turn in range(turns):
+        history.add_message("user", f"Question {turn}: how should I structure part {turn} of the project?")
+        prompt = history.get_prompt_contents(max_tokens=10 ** 9)
+        calls_before = len(fake_model.calls)
+        start = time.perf_counter()
+        reply = "".join(chunk.text for chunk in client.generate_response(prompt, stream=True))
+        request_us.append((time.perf_counter() - start) * 1e6)
+        history.add_message("model", reply)
+        if len(fake_model.calls) > calls_before:
+            sent_tokens.append(persona_tokens + contents_tokens(fake_model.calls[-1][0]))
+        else:
+            cached_model = max(context_cache.api.models, key=lambda model: len(model.calls))
+            sent_tokens.append(contents_tokens(cached_model.calls[-1][0]))
+        if context_cache is not None:
+            context_cache.wait()  # As if the next turn came later; creates run in the background
+    return sent_tokens, request_us
+
+
+def summarize(sent_tokens, request_us):
+    request_us = sorted(request_us)
+    return {
+        "prompt_tokens_total": sum(sent_tokens),
+        "prompt_tokens_last_100_mean": round(statistics.mean(sent_tokens[-100:]), 1),
+        "request_us": {"p50": round(request_us[len(request_us) // 2], 1),
+                       "p99": round(request_us[int(len(request_us) * 0.99)], 1)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt tokens sent with and without context caching.")
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--persona-tokens", type=int, default=0,
+                        help="Pad the system instruction to about this many tokens (0: the GURU persona as is)")
+    parser.add_argument("--min-tokens", type=int, default=4096)
+    parser.add_argument("--step-tokens", type=int, default=2048)
+    args = parser.parse_args()
+
+    persona = SYSTEM_INSTRUCTION_TEXT
+    while estimate_tokens(persona) < args.persona_tokens:
+        persona += "\nReference note: answer with concrete, verifiable steps and cite the user's own words."
+
+    report = {"turns": args.turns, "persona_tokens": estimate_tokens(persona)}
+    report["uncached"] = summarize(*run(args.turns, persona, None))
+    context_cache = ContextCacheManager(FakeCachingAPI(min_tokens=args.min_tokens), min_tokens=args.min_tokens,
+                                        history_step_tokens=args.step_tokens, max_handles=args.turns)
+    report["cached"] = summarize(*run(args.turns, persona, context_cache))
+    report["cached"]["context_cache"] = context_cache.stats()
+    context_cache.close()
+    report["prompt_tokens_saved"] = round(
+        1 - report["cached"]["prompt_tokens_total"] / report["uncached"]["prompt_tokens_total"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
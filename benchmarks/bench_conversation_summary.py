@@ -0,0 +1,78 @@
+# benchmarks/bench_conversation_summary.py
+# Long synthetic conversation through a ConversationHistory with rolling summaries: prompt size
+# (summary + context window) per turn, add_message latency on the request path, and the
+# background cost of one extractive fold.
+# Run from the repository root: python -m benchmarks.bench_conversation_summary --turns 2000
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from modules.context.history import ConversationHistory
+from modules.context.summarizer import ExtractiveSummarizer, SummaryWorker
+
+TOPICS = ["Flask deployment", "SQLite locking", "Python decorators", "Kubernetes probes", "unit tests",
+          "rate limiting", "Gemini prompts", "async generators"]
+TEMPLATES = [
+    "I'm working on {topic} and it fails when I add {n} workers.",
+    "Can you explain how {topic} interacts with my config? I changed it {n} times.",
+    "Thanks, that helped. Next question about {topic}: why does it take {n} seconds?",
+    "Here is what I tried for {topic}: set the timeout to {n} and restarted. Still broken.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling conversation summaries: prompt size and overhead.")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--window-tokens", type=int, default=2000, help="CONTEXT_WINDOW_MAX_TOKENS")
+    parser.add_argument("--history-tokens", type=int, default=1600, help="History token budget")
+    parser.add_argument("--summary-tokens", type=int, default=300, help="Summary token budget")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    summarizer = ExtractiveSummarizer(max_tokens=args.summary_tokens)
+    fold_ms = []
+
+    class TimedSummarizer:
+        def summarize(self, previous_summary, messages):
+            start = time.perf_counter()
+            try:
+                return summarizer.summarize(previous_summary, messages)
+            finally:
+                fold_ms.append((time.perf_counter() - start) * 1e3)
+
+    worker = SummaryWorker(TimedSummarizer())
+    history = ConversationHistory(max_history_length=10 ** 6, max_tokens=args.history_tokens, summary_worker=worker)
+    add_us, prompt_tokens = [], []
+    conversation_tokens = 0  # What the prompt would grow to if nothing were trimmed
+    for turn in range(args.turns):
+        text = rng.choice(TEMPLATES).format(topic=rng.choice(TOPICS), n=rng.randint(2, 500))
+        if turn % 2:
+            text = "Good question. " + text.replace("I'm", "You're").replace("my", "your") + " Try the other way."
+        start = time.perf_counter()
+        history.add_message("model" if turn % 2 else "user", text)
+        add_us.append((time.perf_counter() - start) * 1e6)
+        conversation_tokens += history.token_counter(text)
+        window = history.get_context_window(max_tokens=args.window_tokens)
+        prompt_tokens.append(sum(history.token_counter(message["content"]) for message in window))
+    worker.wait()
+    worker.close()
+
+    add_us.sort()
+    print(json.dumps({
+        "turns": args.turns,
+        "prompt_tokens": {"max": max(prompt_tokens), "mean": round(statistics.mean(prompt_tokens), 1),
+                          "last_100_mean": round(statistics.mean(prompt_tokens[-100:]), 1)},
+        "conversation_tokens": conversation_tokens,
+        "add_message_us": {"p50": round(add_us[len(add_us) // 2], 2), "p99": round(add_us[int(len(add_us) * 0.99)], 2)},
+        "fold_ms": {"count": len(fold_ms), "p50": round(statistics.median(fold_ms), 3) if fold_ms else None,
+                    "max": round(max(fold_ms), 3) if fold_ms else None},
+        "summary_tokens": history.summary_tokens,
+        "worker": worker.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
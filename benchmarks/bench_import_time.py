@@ -0,0 +1,75 @@
+# benchmarks/bench_import_time.py
+# Cold-start cost: how long `import app` takes in a fresh interpreter, how long the background
+# model warm-up needs after that (until /ready would turn 200), and what importing the Gemini SDK
+# alone costs, i.e. what lazy initialization keeps off the startup path. Uses a dummy API key;
+# building the SDK model makes no network calls.
+# Run from the repository root: python -m benchmarks.bench_import_time --runs 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE_APP = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+while app.gemini_client is not None and not app.gemini_client.ready and time.perf_counter() - imported < 60:
+    time.sleep(0.005)
+print(json.dumps({"import_ms": (imported - started) * 1000,
+                  "warm_up_ms": (time.perf_counter() - imported) * 1000}))
+"""
+
+PROBE_SDK = """
+import json, time
+started = time.perf_counter()
+import google.generativeai
+print(json.dumps({"sdk_import_ms": (time.perf_counter() - started) * 1000}))
+"""
+
+
+def probe(code):
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "bench-dummy-key"))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def top_imports(count):
+    """Modules with the largest cumulative import time under `import app` (python -X importtime)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True, env=dict(os.environ, GEMINI_API_KEY=""))
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative) / 1000, name.strip()))
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in sorted(rows, reverse=True)[:count]]
+
+
+def summarize(values):
+    return {"median_ms": round(statistics.median(values), 1), "min_ms": round(min(values), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time / cold-start benchmark.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest imports under `import app`.")
+    args = parser.parse_args()
+
+    app_runs = [probe(PROBE_APP) for _ in range(args.runs)]
+    sdk_runs = [probe(PROBE_SDK) for _ in range(args.runs)]
+    print(json.dumps({
+        "runs": args.runs,
+        "import_app": summarize([run["import_ms"] for run in app_runs]),
+        "warm_up_after_import": summarize([run["warm_up_ms"] for run in app_runs]),
+        "sdk_import_alone": summarize([run["sdk_import_ms"] for run in sdk_runs]),
+        "top_imports": top_imports(args.top),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# benchmarks/bench_prompt_assembly.py
+# Per-request cost of turning a session's history into Gemini contents: rebuilding from the
+# context window (build_gemini_contents) vs the pre-built IncrementalContents snapshot
+# (ConversationHistory.get_prompt_contents), across history lengths.
+# Run from the repository root: python -m benchmarks.bench_prompt_assembly
+
+import argparse
+import json
+import time
+
+from modules.ai_core.processor import AIProcessor
+from modules.context.history import ConversationHistory
+
+
+def per_call_us(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt assembly cost vs history length.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    processor = AIProcessor()
+    report = {}
+    for length in args.lengths:
+        history = ConversationHistory(max_history_length=length, contents_builder=processor.incremental_contents())
+        for i in range(length):
+            history.add_message("user" if i % 2 == 0 else "model", f"Message {i}: a typical sentence or two of chat text.")
+        budget = history.total_tokens
+        rebuild = per_call_us(lambda: processor.build_gemini_contents(history.get_context_window(max_tokens=budget)),
+                              args.repeats)
+        prebuilt = per_call_us(lambda: history.get_prompt_contents(max_tokens=budget), args.repeats)
+        report[str(length)] = {"rebuild_us": round(rebuild, 2), "prebuilt_us": round(prebuilt, 2)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
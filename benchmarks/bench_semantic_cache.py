@@ -0,0 +1,67 @@
+# benchmarks/bench_semantic_cache.py
+# Lookup latency of SemanticCache at 10k / 100k cached entries.
+# Run from the repository root: python -m benchmarks.bench_semantic_cache [--sizes 10000 100000]
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from modules.ai_core.semantic_cache import SemanticCache, make_scope_id
+
+WORDS = ("joke weather capital france python code story robot travel recipe music movie book history "
+         "science space planet ocean coffee tea exercise sleep health money budget plan trip city "
+         "language learn teach write poem song game sport football chess art paint photo camera").split()
+
+
+def random_prompt(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+
+
+def bench(size, queries, seed=0):
+    rng = random.Random(seed)
+    cache = SemanticCache(capacity=size, threshold=0.9)
+    scope = make_scope_id("bench-model", "bench-system", [])
+
+    prompts = [random_prompt(rng) for _ in range(size)]
+    start = time.perf_counter()
+    vectors = cache.embedder.embed_batch(prompts)
+    for prompt, vector in zip(prompts, vectors):
+        cache.add_vector(vector, scope, prompt, ("cached reply",))
+    fill_seconds = time.perf_counter() - start
+
+    # Half the queries are exact repeats, half are fresh prompts (mostly misses).
+    query_texts = [prompts[rng.randrange(size)] if i % 2 == 0 else random_prompt(rng) for i in range(queries)]
+    latencies = []
+    for text in query_texts:
+        t0 = time.perf_counter()
+        cache.lookup("bench-model", "bench-system", text)
+        latencies.append(time.perf_counter() - t0)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "entries": size,
+        "dim": cache.embedder.dim,
+        "matrix_mb": round(cache._vectors.nbytes / 1e6, 1),
+        "fill_seconds": round(fill_seconds, 2),
+        "queries": queries,
+        "lookup_ms_p50": round(float(np.percentile(latencies_ms, 50)), 3),
+        "lookup_ms_p95": round(float(np.percentile(latencies_ms, 95)), 3),
+        "lookup_ms_p99": round(float(np.percentile(latencies_ms, 99)), 3),
+        "hit_ratio": cache.stats()["hit_ratio"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SemanticCache lookup latency benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    results = [bench(size, args.queries) for size in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
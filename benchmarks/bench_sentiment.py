@@ -0,0 +1,61 @@
+# benchmarks/bench_sentiment.py
+# Cost of the lexicon sentiment engine: one chat message (the per-turn path), analyze_batch()
+# throughput across batch sizes, and the streaming scorer's cost per fed chunk.
+# Run from the repository root: python -m benchmarks.bench_sentiment
+
+import argparse
+import json
+import random
+import time
+
+from modules.sentiment.analyzer import SentimentAnalyzer
+
+WORDS = ("I you it the this code answer reply really very not so but great good bad awful love hate "
+         "thanks help slow broken helpful GREAT confusing perfect never question why how").split()
+
+
+def make_message(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + rng.choice([".", "!", "?", "!!", ""])
+
+
+def per_call_us(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentiment engine latency and throughput.")
+    parser.add_argument("--words", type=int, default=20, help="Words per message.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    analyzer = SentimentAnalyzer()
+    message = make_message(rng, args.words)
+    report = {
+        "words_per_message": args.words,
+        "single_message_us": round(per_call_us(lambda: analyzer.analyze_sentiment(message), args.repeats), 2),
+        "batch": {},
+    }
+    for size in args.batch_sizes:
+        texts = [make_message(rng, args.words) for _ in range(size)]
+        repeats = max(1, args.repeats * 10 // size)
+        seconds = per_call_us(lambda: analyzer.analyze_batch(texts), repeats) / 1e6
+        report["batch"][str(size)] = {"texts_per_second": round(size / seconds), "us_per_text": round(seconds / size * 1e6, 2)}
+
+    chunks = [message[i:i + 8] for i in range(0, len(message), 8)]
+
+    def stream():
+        running = analyzer.stream()
+        for chunk in chunks:
+            running.feed(chunk)
+        running.finish()
+    report["streaming_us_per_chunk"] = round(per_call_us(stream, args.repeats) / len(chunks), 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
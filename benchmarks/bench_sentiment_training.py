@@ -0,0 +1,109 @@
+# benchmarks/bench_sentiment_training.py
+# Throughput of the custom_ml training pipeline on a synthetic labelled CSV: streaming the file
+# into memory-mapped hashed features, SGD epochs over them, and the held-out report. Also times
+# loading the saved artifact and scoring one message with SentimentAnalyzer(method="custom_ml").
+# With --folds, also times cross-validation in one process vs on --workers processes.
+# Run from the repository root: python -m benchmarks.bench_sentiment_training --rows 1000000
+
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+from modules.sentiment.analyzer import SentimentAnalyzer
+from modules.sentiment.training import SentimentModelTrainer, default_workers
+
+POSITIVE = "great love helpful perfect thanks awesome nice clear".split()
+NEGATIVE = "awful hate broken slow useless terrible bad confusing".split()
+FILLER = ("I you it the this code answer reply really very so but was is and my to "
+          "question why how what function error works".split())
+
+
+def write_dataset(path, rows, words, seed):
+    """Noisy two-class data: a couple of polar words, some negated the other way, 5% flipped labels."""
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["text", "label"])
+        for _ in range(rows):
+            positive = rng.random() < 0.5
+            tokens = [rng.choice(FILLER) for _ in range(words - 2)]
+            tokens += [rng.choice(POSITIVE if positive else NEGATIVE) for _ in range(2)]
+            rng.shuffle(tokens)
+            if rng.random() < 0.2:
+                tokens += ["not", rng.choice(NEGATIVE if positive else POSITIVE)]
+            label = positive if rng.random() >= 0.05 else not positive
+            writer.writerow([" ".join(tokens), "positive" if label else "negative"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="custom_ml sentiment training throughput.")
+    parser.add_argument("--rows", type=int, default=200000, help="Training rows.")
+    parser.add_argument("--test-rows", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=12, help="Words per row.")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--n-features", type=int, default=2 ** 20)
+    parser.add_argument("--folds", type=int, default=0, help="Also time k-fold cross-validation (0: skip).")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Processes for the parallel CV run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path, test_path = os.path.join(tmp, "train.csv"), os.path.join(tmp, "test.csv")
+        write_dataset(train_path, args.rows, args.words, seed=0)
+        write_dataset(test_path, args.test_rows, args.words, seed=1)
+        trainer = SentimentModelTrainer(model_path=os.path.join(tmp, "model"), n_features=args.n_features,
+                                        epochs=args.epochs)
+
+        start = time.perf_counter()
+        X_train, y_train = trainer.preprocess_file(train_path)
+        vectorize_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        trainer.train_model(X_train, y_train)
+        train_seconds = time.perf_counter() - start
+        X_test, y_test = trainer.preprocess_file(test_path, os.path.join(tmp, "test-features"))
+        test_report = trainer.evaluate_model(X_test, y_test)
+        trainer.save_model()
+
+        start = time.perf_counter()
+        analyzer = SentimentAnalyzer(method="custom_ml", model_path=trainer.model_path)
+        load_ms = (time.perf_counter() - start) * 1e3
+        message = "thanks, this answer is really clear and helpful"
+        analyzer.analyze_sentiment(message)
+        repeats = 2000
+        start = time.perf_counter()
+        for _ in range(repeats):
+            analyzer.analyze_sentiment(message)
+        single_us = (time.perf_counter() - start) / repeats * 1e6
+
+        report = {
+            "rows": args.rows,
+            "feature_nnz": X_train.nnz,
+            "vectorize_rows_per_second": round(args.rows / vectorize_seconds),
+            "sgd_rows_per_second": round(args.rows * args.epochs / train_seconds),
+            "train_seconds": round(train_seconds, 2),
+            "epoch_log_loss": [round(loss, 4) for loss in trainer.training_history],
+            "test": {key: test_report[key] for key in ("accuracy", "macro_f1", "log_loss", "roc_auc")},
+            "artifact_bytes": os.path.getsize(f"{trainer.model_path}.weights.npy"),
+            "artifact_load_ms": round(load_ms, 2),
+            "single_message_us": round(single_us, 2),
+        }
+        if args.folds:
+            timings = {}
+            for workers in sorted({1, args.workers}):
+                start = time.perf_counter()
+                trainer.cross_validate(X_train, y_train, folds=args.folds, workers=workers)
+                timings[workers] = time.perf_counter() - start
+            report["cross_validation"] = {
+                "folds": args.folds,
+                "seconds_by_workers": {str(workers): round(seconds, 2) for workers, seconds in timings.items()},
+                "speedup": round(timings[1] / timings[args.workers], 2),
+                "mean": trainer.cv_results[0]["mean"],
+            }
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
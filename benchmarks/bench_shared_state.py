@@ -0,0 +1,103 @@
+# benchmarks/bench_shared_state.py
+# Cost of keeping session histories in the shared store (see serve.py / SHARED_STATE_CONFIG):
+# the per-turn cost of SharedSessionHistoryStore over SQLite and over the in-process store, next
+# to the plain SessionHistoryStore, and turns per second when several processes work on the same
+# conversations at once, with the compare-and-set conflicts that causes.
+# Run from the repository root: python -m benchmarks.bench_shared_state --turns 2000 --processes 4
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from modules.ai_core.processor import AIProcessor
+from modules.context.session_store import SessionHistoryStore, SharedSessionHistoryStore
+from modules.context.shared_store import MemorySharedStore, SQLiteSharedStore
+
+REPLY = "Sure, here is a detailed answer to that question with a few concrete steps. " * 3
+
+
+def session_store(kind, path, max_history_length=10):
+    options = dict(max_history_length=max_history_length,
+                   contents_factory=lambda: AIProcessor().incremental_contents("You are GURU."))
+    if kind == "local":
+        return SessionHistoryStore(**options)
+    store = MemorySharedStore() if kind == "shared-memory" else SQLiteSharedStore(path)
+    return SharedSessionHistoryStore(store, **options)
+
+
+def turn(store, session_id, index):
+    """What /api/chat does with the session: load it, add the question, build the prompt, add the reply."""
+    history = store.get(session_id)
+    history.add_message("user", f"Question {index}: how should I structure this part of the project?")
+    history.get_prompt_contents(max_tokens=2000)
+    history.add_message("model", REPLY)
+
+
+def per_turn_us(kind, path, turns, sessions):
+    store = session_store(kind, path)
+    timings = []
+    for index in range(turns):
+        start = time.perf_counter()
+        turn(store, f"session-{index % sessions:05d}", index)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {"p50": round(timings[len(timings) // 2], 1), "p99": round(timings[int(len(timings) * 0.99)], 1),
+            "mean": round(statistics.mean(timings), 1)}
+
+
+def worker_process(path, worker, turns, sessions, results):
+    store = session_store("shared-sqlite", path)
+    start = time.perf_counter()
+    for index in range(turns):
+        turn(store, f"session-{index % sessions:05d}", f"{worker}-{index}")
+    store.wait()  # Contended writes still being retried in the background
+    results.put((time.perf_counter() - start, store.stats()))
+
+
+def contention(path, processes, turns, sessions):
+    """`processes` processes each run `turns` turns over the same `sessions` conversations."""
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=worker_process, args=(path, worker, turns, sessions, results))
+               for worker in range(processes)]
+    start = time.perf_counter()
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "processes": processes,
+        "turns_per_second": round(processes * turns / elapsed, 1),
+        "conflicts": sum(stats["conflicts"] for _, stats in outcomes),
+        "lost_changes": sum(stats["lost_changes"] for _, stats in outcomes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn cost and multi-process throughput of shared session state.")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--contended-sessions", type=int, default=4,
+                        help="Conversations shared by all processes in the contention run (fewer: more conflicts)")
+    args = parser.parse_args()
+
+    report = {"cpus": os.cpu_count(), "per_turn_us": {}, "contention": []}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for kind in ("local", "shared-memory", "shared-sqlite"):
+            report["per_turn_us"][kind] = per_turn_us(kind, os.path.join(temp_dir, f"{kind}.db"),
+                                                      args.turns, args.sessions)
+        for processes in sorted({1, args.processes}):
+            report["contention"].append(contention(os.path.join(temp_dir, f"contention-{processes}.db"), processes,
+                                                   args.turns // processes, args.contended_sessions))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_single_flight.py
+# Burst of identical concurrent streamed requests against the fake model, with and without
+# request coalescing: upstream calls made and time to first chunk for every caller.
+# Run from the repository root: python -m benchmarks.bench_single_flight
+
+import argparse
+import json
+import statistics
+import threading
+import time
+
+from modules.ai_core.fake_model import FakeGenerativeModel
+from modules.ai_core.gemini_client import GeminiClient
+from modules.ai_core.single_flight import SingleFlight
+
+
+def run_burst(client, callers, prompt):
+    ttfts, totals = [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(callers)
+
+    def ask():
+        start_gate.wait()
+        started = time.perf_counter()
+        first = None
+        for _ in client.generate_response(prompt, stream=True):
+            if first is None:
+                first = time.perf_counter() - started
+        with lock:
+            ttfts.append(first)
+            totals.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=ask) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ttfts, totals
+
+
+def summarize(label, fake_model, ttfts, totals):
+    ttfts = sorted(ttfts)
+    return {
+        "mode": label,
+        "upstream_calls": len(fake_model.calls),
+        "ttft_p50_ms": round(statistics.median(ttfts) * 1000, 2),
+        "ttft_max_ms": round(ttfts[-1] * 1000, 2),
+        "total_p50_ms": round(statistics.median(totals) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-flight request coalescing benchmark.")
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--first-chunk-delay", type=float, default=0.3)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    report = []
+    for label, single_flight in (("independent", None), ("single_flight", SingleFlight())):
+        fake_model = FakeGenerativeModel(chunks=["token "] * args.chunks, chunk_delay=args.chunk_delay,
+                                         first_chunk_delay=args.first_chunk_delay)
+        client = GeminiClient(model=fake_model, single_flight=single_flight)
+        ttfts, totals = run_burst(client, args.callers, "What is the capital of France?")
+        report.append(summarize(label, fake_model, ttfts, totals))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
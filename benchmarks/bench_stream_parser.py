@@ -0,0 +1,75 @@
+# benchmarks/bench_stream_parser.py
+# Throughput of streamed-reply post-processing on long (2048-token) responses:
+# per-chunk AIProcessor.parse_response + string += versus the stateful stream parser + list join.
+# Run from the repository root: python -m benchmarks.bench_stream_parser
+
+import argparse
+import json
+import random
+import time
+
+from modules.ai_core.processor import AIProcessor
+
+WORDS = ("the quick brown fox jumps over a lazy dog while GURU explains *why* streaming "
+         "matters for latency and throughput in real systems").split()
+
+
+def make_chunks(tokens, tokens_per_chunk, rng):
+    """A reply of roughly `tokens` tokens (one word ~ one token) split into stream chunks."""
+    words = [rng.choice(WORDS) + ("\n" if rng.random() < 0.05 else " ") for _ in range(tokens)]
+    return ["".join(words[i:i + tokens_per_chunk]) for i in range(0, tokens, tokens_per_chunk)]
+
+
+def legacy(processor, chunks):
+    full = ""
+    for chunk in chunks:
+        processed = processor.parse_response(chunk)
+        full += processed
+    return full
+
+
+def streaming(processor, chunks):
+    parser = processor.stream_parser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.finish()
+    return parser.text
+
+
+def measure(fn, processor, chunks, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn(processor, chunks)
+    elapsed = time.perf_counter() - start
+    return result, elapsed / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream post-processing throughput benchmark.")
+    parser.add_argument("--tokens", type=int, default=2048)
+    parser.add_argument("--tokens-per-chunk", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    processor = AIProcessor()
+    rng = random.Random(0)
+    report = []
+    for tokens_per_chunk in args.tokens_per_chunk:
+        chunks = make_chunks(args.tokens, tokens_per_chunk, rng)
+        expected = "".join(chunks).replace("*", "").strip()
+        legacy_text, legacy_seconds = measure(legacy, processor, chunks, args.repeats)
+        stream_text, stream_seconds = measure(streaming, processor, chunks, args.repeats)
+        report.append({
+            "tokens": args.tokens,
+            "chunks": len(chunks),
+            "legacy_ms_per_response": round(legacy_seconds * 1000, 3),
+            "stream_parser_ms_per_response": round(stream_seconds * 1000, 3),
+            "stream_parser_chunks_per_second": int(len(chunks) / stream_seconds),
+            "legacy_output_correct": legacy_text == expected,
+            "stream_parser_output_correct": stream_text == expected,
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_vector_index.py
+# Recall vs latency of VectorIndex on CPU: exact scan vs IVF at several nprobe values.
+# Run from the repository root: python -m benchmarks.bench_vector_index [--n 1000000 --dim 128]
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from modules.context.vector_index import VectorIndex
+
+
+def clustered_unit_vectors(n, dim, n_clusters, rng, batch_size=100000):
+    """Synthetic embeddings: points scattered around random topic centres, L2-normalized."""
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    for start in range(0, n, batch_size):
+        count = min(batch_size, n - start)
+        batch = centres[rng.integers(0, n_clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+        yield batch / np.linalg.norm(batch, axis=1, keepdims=True)
+
+
+def timed_search(index, queries, top_k, nprobe=None):
+    results, latencies = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        hits = index.search(query, top_k=top_k, nprobe=nprobe)
+        latencies.append(time.perf_counter() - t0)
+        results.append({fact_id for fact_id, _ in hits})
+    latencies_ms = np.array(latencies) * 1000
+    return results, round(float(np.percentile(latencies_ms, 50)), 3), round(float(np.percentile(latencies_ms, 95)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VectorIndex recall/latency benchmark.")
+    parser.add_argument("--n", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = VectorIndex(path=os.path.join(tmp_dir, "bench.vectors"), dim=args.dim, capacity=args.n)
+        start = time.perf_counter()
+        next_id = 0
+        for batch in clustered_unit_vectors(args.n, args.dim, n_clusters=2000, rng=rng):
+            index.add_batch(range(next_id, next_id + len(batch)), batch)
+            next_id += len(batch)
+        load_seconds = time.perf_counter() - start
+
+        sample_rows = rng.choice(args.n, size=args.queries, replace=False)
+        queries = np.asarray(index._vectors[sample_rows]) + 0.05 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        truth, exact_p50, exact_p95 = timed_search(index, queries, args.top_k)
+        report = {
+            "vectors": args.n,
+            "dim": args.dim,
+            "top_k": args.top_k,
+            "load_seconds": round(load_seconds, 2),
+            "exact": {"recall": 1.0, "latency_ms_p50": exact_p50, "latency_ms_p95": exact_p95},
+            "ivf": [],
+        }
+
+        start = time.perf_counter()
+        index.train_ivf(n_lists=args.n_lists)
+        report["ivf_build_seconds"] = round(time.perf_counter() - start, 2)
+        for nprobe in args.nprobe:
+            found, p50, p95 = timed_search(index, queries, args.top_k, nprobe=nprobe)
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+            report["ivf"].append({"nprobe": nprobe, "recall": round(float(recall), 4),
+                                  "latency_ms_p50": p50, "latency_ms_p95": p95})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# benchmarks/load_test.py
+# End-to-end load test for /api/chat against a local fake Gemini backend (no network, no API key).
+# Starts the app in a child process (Flask/werkzeug threaded server, or uvicorn for asgi.py),
+# opens N concurrent SSE streams and reports throughput, TTFT and full-stream percentiles, plus
+# the server's memory growth and CPU time per request. Linux only (/proc is used for the server stats).
+# With --workers N the server is serve.py's pre-fork master with N workers sharing state through
+# SQLite (see SHARED_STATE_CONFIG); --sessions spreads the requests over that many conversations,
+# so consecutive turns of one conversation land on different workers.
+# Run from the repository root:
+#   python -m benchmarks.load_test --concurrency 50 --requests 500 --output run.json
+#   python -m benchmarks.load_test --concurrency 50 --requests 500 --baseline run.json
+#   python -m benchmarks.load_test --concurrency 50 --requests 500 --workers 4 --sessions 50
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WORDS = ("guru explain weather plan travel budget recipe music history science code python "
+         "garden fitness sleep coffee movie book space ocean mountain city language").split()
+
+
+# --- Server side (child process) ---
+def serve(args):
+    if args.workers > 1:
+        import serve as prefork
+        sock = prefork.bind_socket("127.0.0.1", args.port)
+        prefork.run_workers(lambda: serve_worker(args, sock), args.workers)
+    else:
+        serve_worker(args, None)
+
+
+def serve_worker(args, sock):
+    """One server process; with sock, a pre-fork worker accepting on the master's socket."""
+    logging.basicConfig(level=logging.WARNING)
+    import app as guru_app
+    from modules.ai_core.fake_model import FakeGenerativeModel
+    from modules.ai_core.gemini_client import GeminiClient
+
+    logging.getLogger().setLevel(logging.WARNING)  # app.py configures INFO; keep logging off the hot path
+    chunk_text = ("lorem ipsum dolor sit amet " * (args.chunk_size // 27 + 1))[:args.chunk_size]
+    fake_model = FakeGenerativeModel(chunks=[chunk_text] * args.chunks, chunk_delay=args.chunk_delay,
+                                     first_chunk_delay=args.first_chunk_delay)
+    caches = {}
+    if args.with_caches:
+        caches = dict(response_cache=guru_app.response_cache, semantic_cache=guru_app.semantic_cache,
+                      single_flight=guru_app.single_flight)
+    guru_app.gemini_client = GeminiClient(model=fake_model, **caches)
+    if not args.rate_limit:
+        guru_app.rate_limiter = None  # Every simulated user shares one address
+
+    if sock is not None:
+        import serve as prefork
+        if args.server == "asgi":
+            from asgi import application
+            prefork.serve_asgi(application, sock)
+        else:
+            prefork.serve_wsgi(guru_app.app, sock)
+    elif args.server == "asgi":
+        import uvicorn
+        from asgi import application
+        uvicorn.run(application, host="127.0.0.1", port=args.port, log_level="warning")
+    else:
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", args.port, guru_app.app, threaded=True)
+        server.serve_forever()
+
+
+# --- Driver side ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_stats(pid):
+    """(rss_mb, cpu_seconds) of a process and its children (pre-fork workers), from /proc."""
+    rss_kb, ticks = 0, 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(entry) != pid and int(fields[1]) != pid:
+                continue
+            with open(f"/proc/{entry}/status") as f:
+                rss_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue  # Exited meanwhile
+        ticks += int(fields[11]) + int(fields[12])  # utime + stime
+    return rss_kb / 1024, ticks / os.sysconf("SC_CLK_TCK")
+
+
+def wait_until_listening(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start listening on port {port}.")
+
+
+def one_request(port, prompt, timeout, session_id=None):
+    """Returns (ttft_seconds, total_seconds, ok)."""
+    started = time.perf_counter()
+    ttft = None
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    headers = {"Content-Type": "application/json"}
+    if session_id:
+        headers["X-Session-ID"] = session_id
+    try:
+        connection.request("POST", "/api/chat", body=json.dumps({"message": prompt}), headers=headers)
+        response = connection.getresponse()
+        if response.status != 200:
+            response.read()
+            return None, time.perf_counter() - started, False
+        body = b""
+        while True:
+            data = response.read1(65536)
+            if not data:
+                break
+            if ttft is None and b"event: token" in data:
+                ttft = time.perf_counter() - started
+            body += data
+        return ttft, time.perf_counter() - started, b"event: done" in body and b"event: error" not in body
+    except (OSError, http.client.HTTPException):
+        return ttft, time.perf_counter() - started, False
+    finally:
+        connection.close()
+
+
+def run_load(port, concurrency, total_requests, timeout, unique_prompts, seed=0, sessions=0):
+    rng = random.Random(seed)
+    prompts = [" ".join(rng.choice(WORDS) for _ in range(8)) + f" #{i}" if unique_prompts else "Tell me a joke"
+               for i in range(total_requests)]
+    results = []
+    lock = threading.Lock()
+    next_index = [0]
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= total_requests:
+                    return
+                next_index[0] += 1
+            session_id = f"load-session-{index % sessions:05d}" if sessions else None
+            outcome = one_request(port, prompts[index], timeout, session_id)
+            with lock:
+                results.append(outcome)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 2)
+    return {"p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(values[-1] * 1000, 2)}
+
+
+def compare(report, baseline, max_regression):
+    """Relative change vs baseline for the headline numbers; flags regressions beyond max_regression %."""
+    checks = [
+        ("requests_per_second", report["requests_per_second"], baseline["requests_per_second"], True),
+        ("ttft_p50_ms", report["ttft_ms"]["p50"], baseline["ttft_ms"]["p50"], False),
+        ("ttft_p99_ms", report["ttft_ms"]["p99"], baseline["ttft_ms"]["p99"], False),
+        ("total_p50_ms", report["total_ms"]["p50"], baseline["total_ms"]["p50"], False),
+        ("cpu_ms_per_request", report["server"]["cpu_ms_per_request"], baseline["server"]["cpu_ms_per_request"], False),
+    ]
+    comparison, regressions = {}, []
+    for name, current, previous, higher_is_better in checks:
+        if not previous:
+            continue
+        change = (current - previous) / previous * 100
+        comparison[name] = {"baseline": previous, "current": current, "change_pct": round(change, 1)}
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(name)
+    return comparison, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /api/chat load test against a fake Gemini backend.")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per fake reply.")
+    parser.add_argument("--chunk-size", type=int, default=40, help="Characters per chunk.")
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--first-chunk-delay", type=float, default=0.2)
+    parser.add_argument("--with-caches", action="store_true", help="Enable caches/coalescing and repeat one prompt.")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="Keep /api/chat rate limiting on (all load comes from one address, so expect 429s).")
+    parser.add_argument("--workers", type=int, default=1, help="Pre-fork worker processes (see serve.py).")
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="Spread requests over this many conversations (0: a new session per request).")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Write the JSON report here as well.")
+    parser.add_argument("--baseline", help="JSON report from an earlier run to compare against.")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="Percent; exit 1 beyond this.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)  # Child process mode
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(port),
+               "--server", args.server, "--chunks", str(args.chunks), "--chunk-size", str(args.chunk_size),
+               "--chunk-delay", str(args.chunk_delay), "--first-chunk-delay", str(args.first_chunk_delay),
+               "--workers", str(args.workers)]
+    if args.with_caches:
+        command.append("--with-caches")
+    if args.rate_limit:
+        command.append("--rate-limit")
+    env = dict(os.environ)
+    state_dir = tempfile.TemporaryDirectory()
+    if args.workers > 1:
+        env["GURU_SHARED_STORE"] = os.path.join(state_dir.name, "shared.db")
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    try:
+        wait_until_listening(port)
+        run_load(port, min(args.concurrency, args.warmup) or 1, args.warmup, args.timeout, not args.with_caches, seed=1)
+        rss_before, cpu_before = process_stats(server.pid)
+        results, elapsed = run_load(port, args.concurrency, args.requests, args.timeout, not args.with_caches,
+                                    sessions=args.sessions)
+        rss_after, cpu_after = process_stats(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        state_dir.cleanup()
+
+    ok = [result for result in results if result[2]]
+    report = {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("serve", "port", "output", "baseline", "max_regression")},
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(ok) / elapsed, 2),
+        "ttft_ms": percentiles([ttft for ttft, _, _ in ok if ttft is not None]),
+        "total_ms": percentiles([total for _, total, _ in ok]),
+        "server": {
+            "rss_mb_before": round(rss_before, 1),
+            "rss_mb_after": round(rss_after, 1),
+            "rss_growth_mb": round(rss_after - rss_before, 1),
+            "cpu_ms_per_request": round((cpu_after - cpu_before) * 1000 / max(len(results), 1), 3),
+        },
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"], regressions = compare(report, json.load(f), args.max_regression)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
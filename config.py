@@ -10,5 +10,68 @@ DEBUG_MODE = True  # Set to False in production
 # Example: Paths (though usually derived dynamically)
 # LOG_FILE_PATH = "logs/app.log"
 
+# Per-session conversation history (see modules/context/session_store.py).
+# Memory is bounded by max_sessions * max_history_length messages. Turns beyond
+# history_max_tokens are trimmed too (and summarized, see SUMMARIZATION_CONFIG); keep it at or
+# below CONTEXT_WINDOW_MAX_TOKENS minus the summary budget so every kept turn reaches the model.
+SESSION_STORE_CONFIG = {
+    "max_sessions": 20000,
+    "ttl_seconds": 3600,
+    "max_history_length": 10,
+    "history_max_tokens": 1600
+}
+
+# Rolling conversation summaries (see modules/context/summarizer.py): trimmed turns are folded
+# into a per-session summary on a background thread and sent ahead of the recent turns.
+# "summarizer" is "extractive" (local) or "model" (Gemini, falling back to extractive).
+SUMMARIZATION_CONFIG = {
+    "enabled": True,
+    "summarizer": "extractive",
+    "max_tokens": 300,
+    "max_workers": 1
+}
+
+# Tone adaptation (see modules/sentiment/pipeline.py): the user's message is scored while the
+# model call starts, and an empathetic/positive opener is sent only if that finished first.
+# Messages shorter than min_words get no opener (nor a sentiment pass), and neither do messages
+# whose |compound| score is below min_compound: "thanks" or "This is terrible" (-0.48) are too
+# little to go on, "This is terrible, I hate it" (-0.78) isn't. The opener is never stored in
+# the conversation history.
+TONE_ADAPTATION_CONFIG = {
+    "enabled": True,
+    "max_workers": 2,
+    "min_words": 3,
+    "min_compound": 0.5
+}
+
+# Per-caller limits on /api/chat (see modules/ai_core/rate_limit.py). A request must pass the
+# limits of its client IP, its session (once it has one) and its API key (X-API-Key header, when
+# sent); over a limit it gets 429 with Retry-After. "tenant_limits" overrides the api_key limits
+# for specific keys, e.g. {"<key>": {"requests_per_minute": 6000, "burst": 500, "max_streams": 256}}.
+# Behind a reverse proxy set "trust_forwarded_for" so the proxy's X-Forwarded-For entry is used.
+RATE_LIMIT_CONFIG = {
+    "enabled": True,
+    "limits": {
+        "ip": {"requests_per_minute": 60, "burst": 20},
+        "session": {"requests_per_minute": 20, "burst": 10},
+        "api_key": {"requests_per_minute": 600, "burst": 100}
+    },
+    "max_streams": {"ip": 8, "session": 2, "api_key": 64},
+    "tenant_limits": {},
+    "max_keys": 100000,
+    "trust_forwarded_for": False
+}
+
+# Shared state for multi-process deployments (see serve.py and modules/context/shared_store.py).
+# With a "path" (or the GURU_SHARED_STORE environment variable, which serve.py sets for its
+# workers), session histories, exact-match response cache entries and rate-limit counters are
+# kept in that SQLite file as well, so every worker process on the box serves every session.
+# Without one, all state stays in the process. "stream_lease_seconds" must exceed the longest
+# reply: the open-stream slots of a worker that dies are freed when its lease runs out.
+SHARED_STATE_CONFIG = {
+    "path": None,
+    "busy_timeout_seconds": 5.0,
+    "stream_lease_seconds": 600
+}
+
 # Add other global configurations as needed
-print(f"{APP_NAME} configuration loaded.")
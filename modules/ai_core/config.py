@@ -23,11 +23,106 @@ DEFAULT_GENERATION_CONFIG = {
     "candidate_count": 1
 }
 
+# Model pool for ModelRouter (see router.py). Chit-chat goes to the "fast" tier, long or
+# complex prompts to the "large" tier; expected_ttft_ms is the latency prior until real
+# samples arrive and cost_per_million_tokens breaks ties. The first entry is the default model.
+MODEL_POOL_CONFIG = [
+    {"model_name": DEFAULT_MODEL_NAME, "tier": "large", "expected_ttft_ms": 900.0, "cost_per_million_tokens": 0.40},
+    {"model_name": "gemini-2.0-flash-lite", "tier": "fast", "expected_ttft_ms": 500.0, "cost_per_million_tokens": 0.30},
+]
+# When the SDK models are built: "background" starts a warm-up thread at startup (/ready turns
+# 200 once it finishes), "lazy" builds each model on its first request.
+MODEL_WARMUP = "background"
+ROUTER_CONFIG = {
+    "long_prompt_tokens": 1500,
+    "complexity_threshold": 0.5,
+    "ewma_alpha": 0.2,
+    # Latency sample for a model that errors before its first token (RESILIENCE first_token_timeout)
+    "failure_penalty_seconds": 20.0
+}
+
+# Token budget for the conversation history sent with each request
+# (see ConversationHistory.get_context_window).
+CONTEXT_WINDOW_MAX_TOKENS = 2000
+
+# Exact-match response cache in front of GeminiClient (see response_cache.py).
+# Requests with a temperature above max_temperature bypass the cache.
+RESPONSE_CACHE_CONFIG = {
+    "max_entries": 2048,
+    "max_bytes": 16 * 1024 * 1024,
+    "ttl_seconds": 3600,
+    "max_temperature": 1.0
+}
+
+# Semantic (near-duplicate) cache consulted after an exact-match miss (see semantic_cache.py).
+# With the default HashingEmbedder, 0.85 serves rephrasings that differ in function words
+# ("can you explain recursion?" / "could you please explain recursion": 1.0) but not another
+# question word ("who is X" / "what is X": 0.77), a negation ("is it safe ..." / "is it not
+# safe ...": 0.71) or another subject ("capital of France" / "capital of Spain": 0.63); see
+# HashingEmbedder's marker weights. Entries expire with the exact-match cache's.
+SEMANTIC_CACHE_CONFIG = {
+    "capacity": 10000,
+    "threshold": 0.85,
+    "max_temperature": 1.0,
+    "ttl_seconds": RESPONSE_CACHE_CONFIG["ttl_seconds"]
+}
+
+# Async streaming (asgi.py): how many upstream streams may run at once, how many
+# requests may wait for a slot (in total and per caller), and the per-request deadline in
+# seconds. Waiting callers are served round-robin.
+STREAM_SCHEDULER_CONFIG = {
+    "max_concurrency": 256,
+    "max_queue": 1024,
+    "max_queue_per_tenant": 64,
+    "deadline_seconds": 120.0
+}
+
+# Timeouts, retries, hedging and circuit breaker around streamed Gemini calls (see resilience.py).
+# Retries only happen before the first token reaches the user.
+RESILIENCE_CONFIG = {
+    "connect_timeout": 10.0,
+    "first_token_timeout": 20.0,
+    "max_retries": 2,
+    "backoff_base": 0.25,
+    "backoff_max": 4.0,
+    "hedge": True,
+    "hedge_percentile": 95,
+    "hedge_min_samples": 20
+}
+CIRCUIT_BREAKER_CONFIG = {
+    "failure_threshold": 5,
+    "recovery_timeout": 30.0,
+    "half_open_max_calls": 1
+}
+
+# Server-Sent Events for /api/chat (see sse.py): keepalive comment interval while the model
+# is quiet, and when coalesced token text is flushed (size in bytes or age in seconds).
+SSE_CONFIG = {
+    "heartbeat_seconds": 15.0,
+    "flush_bytes": 64,
+    "flush_interval_seconds": 0.05
+}
+
+# Server-side context caching (see context_cache.py): the system instruction and the older part
+# of long conversations are cached as Gemini cached content, and requests send only the rest.
+# Prefixes below min_tokens aren't cached (the API's minimum). The cache is only set up when the
+# persona plus CONTEXT_WINDOW_MAX_TOKENS can reach min_tokens (see caching_can_apply); with the
+# default 2000-token window they can't, so "enabled" has no effect (and no per-request cost)
+# until the window is raised. A longer history prefix is cached every history_step_tokens;
+# handles are refreshed refresh_margin_seconds before their TTL runs out.
+CONTEXT_CACHE_CONFIG = {
+    "enabled": True,
+    "ttl_seconds": 3600,
+    "refresh_margin_seconds": 300,
+    "min_tokens": 4096,
+    "history_step_tokens": 2048,
+    "max_handles": 64,
+    "retry_after_seconds": 600
+}
+
 DEFAULT_SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
-
-print("AI Core model-specific configuration loaded.")
\ No newline at end of file
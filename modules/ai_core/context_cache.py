@@ -0,0 +1,314 @@
+# modules/ai_core/context_cache.py
+# Server-side context caching (Gemini cached content) for long, stable prompt prefixes: the
+# system instruction, and the older part of a growing conversation. A cached prefix is billed
+# and processed once; later requests send only the turns after it.
+# Handles are created and refreshed on a background thread, so a request never waits on the
+# caching API. A request with no usable handle - too short, not created yet, expired, or
+# rejected by the API - is sent in full, exactly as without caching.
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ..context.tokens import estimate_tokens
+from .response_cache import _content_texts
+
+logger = logging.getLogger(__name__)
+
+# Handles this close to expiry are no longer used: a request could outlive them.
+EXPIRY_SAFETY_SECONDS = 15
+# Prefix digests memoized per contents entry (see ContextCacheManager._prefix_keys)
+MAX_MEMOIZED_ENTRIES = 65536
+
+
+def caching_can_apply(system_instruction, max_contents_tokens, min_tokens, token_counter=None):
+    """
+    Whether any prompt could have a cacheable prefix: the system instruction plus at most
+    max_contents_tokens of conversation (the history budget) must be able to reach min_tokens.
+    When they can't, a ContextCacheManager would never cache anything and only add a prefix
+    lookup to every request.
+    """
+    token_counter = token_counter or estimate_tokens
+    return token_counter(system_instruction or "") + max_contents_tokens >= min_tokens
+
+
+class GenaiCachingAPI:
+    """
+    The caching operations ContextCacheManager needs, over google.generativeai.caching
+    (imported on first use). FakeCachingAPI in fake_model.py implements the same methods.
+    """
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        """Creates cached content; returns (handle, expiry as a Unix timestamp)."""
+        from google.generativeai import caching
+        model = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        handle = caching.CachedContent.create(
+            model=model,
+            system_instruction=system_instruction or None,
+            contents=list(contents) or None,
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        return handle, handle.expire_time.timestamp()
+
+    def refresh(self, handle, ttl_seconds):
+        """Extends the handle's TTL; returns the new expiry timestamp."""
+        handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+        return handle.expire_time.timestamp()
+
+    def delete(self, handle):
+        handle.delete()
+
+    def bind_model(self, handle):
+        """A model whose requests are prefixed by the cached content."""
+        import google.generativeai as genai
+        return genai.GenerativeModel.from_cached_content(cached_content=handle)
+
+
+class CachedContext:
+    """One cached prefix: the system instruction plus the first `prefix_length` contents entries."""
+    __slots__ = ("key", "handle", "model", "prefix_length", "token_count", "expires_at", "refreshing")
+
+    def __init__(self, key, handle, model, prefix_length, token_count, expires_at):
+        self.key = key
+        self.handle = handle
+        self.model = model
+        self.prefix_length = prefix_length
+        self.token_count = token_count
+        self.expires_at = expires_at
+        self.refreshing = False
+
+
+def _update(digest, text):
+    data = text.encode("utf-8")
+    digest.update(len(data).to_bytes(8, "little"))  # Length-prefixed, so no two prefixes serialize alike
+    digest.update(data)
+
+
+class ContextCacheManager:
+    def __init__(self, caching_api=None, ttl_seconds=3600, refresh_margin_seconds=300, min_tokens=4096,
+                 history_step_tokens=2048, max_handles=64, retry_after_seconds=600, token_counter=None,
+                 clock=time.time):
+        """
+        :param caching_api: GenaiCachingAPI (default) or a stand-in such as FakeCachingAPI.
+        :param ttl_seconds: TTL of new handles, and what a refresh extends them to.
+        :param refresh_margin_seconds: A handle used with less than this left is refreshed in the background.
+        :param min_tokens: Smallest prefix worth caching; the API rejects prefixes below the
+                           model's minimum (4096 tokens for current Flash/Pro models).
+        :param history_step_tokens: A longer conversation prefix is cached once this many
+                                    uncached tokens have accumulated before the newest turn.
+        :param max_handles: Handles kept (least recently used are deleted beyond this).
+        :param retry_after_seconds: After a failed create (e.g. a model without caching support),
+                                    nothing more is cached for that model for this long.
+        :param token_counter: Callable text -> token count (defaults to estimate_tokens).
+        :param clock: Wall-clock time source (handle expiry is a server timestamp); injectable for tests.
+        """
+        self.api = caching_api or GenaiCachingAPI()
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.min_tokens = min_tokens
+        self.history_step_tokens = history_step_tokens
+        self.max_handles = max_handles
+        self.retry_after_seconds = retry_after_seconds
+        self.token_counter = token_counter or estimate_tokens
+        self._clock = clock
+        self._handles = OrderedDict()  # key -> CachedContext, least recently used first
+        self._prefix_lengths = Counter()  # prefix_length -> handles, so lookups only digest those lengths
+        self._creating = set()  # Keys with a create in flight
+        self._paused_until = {}  # model name -> time after which creates may be retried
+        self._instruction_tokens = {}  # system instruction -> token count
+        self._root_keys = {}  # (model name, system instruction) -> digest
+        self._entry_keys = {}  # id(entry) -> (entry, parent digest, digest, token count)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="guru-context-cache")
+        self._counts = {"hits": 0, "misses": 0, "cached_tokens": 0, "created": 0, "create_failures": 0,
+                        "refreshed": 0, "expired": 0, "evicted": 0, "fallbacks": 0}
+
+    def _count_instruction(self, system_instruction):
+        tokens = self._instruction_tokens.get(system_instruction)
+        if tokens is None:
+            tokens = self.token_counter(system_instruction or "")
+            self._instruction_tokens[system_instruction] = tokens
+        return tokens
+
+    def _prefix_keys(self, model_name, system_instruction, contents):
+        """
+        Chained digests: keys[k] identifies the model, system instruction and contents[:k].
+        Session histories reuse their (immutable) entry dicts from request to request, so each
+        entry's digest (and token count) is memoized by identity and only new turns are hashed.
+        :return: (keys, token count of each entry)
+        """
+        root = self._root_keys.get((model_name, system_instruction))
+        if root is None:
+            digest = hashlib.sha256()
+            _update(digest, model_name)
+            _update(digest, system_instruction or "")
+            root = self._root_keys[(model_name, system_instruction)] = digest.hexdigest()
+        keys, tokens = [root], []
+        memo = self._entry_keys
+        for entry in contents:
+            parent = keys[-1]
+            known = memo.get(id(entry))
+            if known is None or known[0] is not entry or known[1] != parent:
+                digest = hashlib.sha256(parent.encode("ascii"))
+                texts = _content_texts(entry)
+                _update(digest, f"{entry.get('role')}/{len(texts)}")
+                for text in texts:
+                    _update(digest, text)
+                known = (entry, parent, digest.hexdigest(), self.token_counter(" ".join(texts)))
+                if len(memo) >= MAX_MEMOIZED_ENTRIES:
+                    memo.clear()
+                memo[id(entry)] = known
+            keys.append(known[2])
+            tokens.append(known[3])
+        return keys, tokens
+
+    def lookup(self, model_name, system_instruction, prompt):
+        """
+        Finds the longest cached prefix of this request and schedules caching of a longer one
+        when it is worth it.
+        :param prompt: A string or a Gemini contents list.
+        :return: (CachedContext, contents to send after it) or None to send the request in full.
+        """
+        contents = [{"role": "user", "parts": [{"text": prompt}]}] if isinstance(prompt, str) else list(prompt)
+        if not contents:
+            return None
+        history_length = len(contents) - 1  # The newest turn is never part of a cached prefix
+        with self._lock:
+            lengths = sorted((length for length in self._prefix_lengths if length <= history_length), reverse=True)
+        keys, tokens = self._prefix_keys(model_name, system_instruction, contents[:history_length])
+        now = self._clock()
+        with self._lock:
+            best = None
+            for length in lengths:
+                cached = self._handles.get(keys[length])
+                if cached is None:
+                    continue
+                if cached.expires_at - now <= EXPIRY_SAFETY_SECONDS:
+                    self._remove(cached)
+                    self._counts["expired"] += 1
+                    continue
+                self._handles.move_to_end(cached.key)
+                best = cached
+                break
+            if best is not None:
+                self._counts["hits"] += 1
+                self._counts["cached_tokens"] += best.token_count
+                if best.expires_at - now < self.refresh_margin_seconds and not best.refreshing:
+                    best.refreshing = True
+                    self._executor.submit(self._refresh, best)
+            else:
+                self._counts["misses"] += 1
+        self._maybe_create(model_name, system_instruction, contents, keys, tokens, best, now)
+        if best is None:
+            return None
+        tail = prompt if isinstance(prompt, str) else contents[best.prefix_length:]
+        return best, tail
+
+    def _maybe_create(self, model_name, system_instruction, contents, keys, tokens, best, now):
+        instruction_tokens = self._count_instruction(system_instruction)
+        candidates = []
+        if best is None and system_instruction and instruction_tokens >= self.min_tokens:
+            candidates.append(0)  # The static persona prefix, shared by every conversation
+        history_length = len(tokens)
+        cached_length = best.prefix_length if best is not None else 0
+        if history_length > cached_length:
+            uncached = sum(tokens[cached_length:])
+            cached_tokens = best.token_count if best is not None else instruction_tokens
+            if cached_tokens + uncached >= self.min_tokens and uncached >= min(self.history_step_tokens, self.min_tokens):
+                candidates = [history_length]  # A longer prefix covers the persona too
+        for length in candidates:
+            key = keys[length]
+            with self._lock:
+                if key in self._handles or key in self._creating or self._paused_until.get(model_name, 0) > now:
+                    continue
+                self._creating.add(key)
+            replaces = best if best is not None and best.prefix_length > 0 else None
+            token_count = instruction_tokens + sum(tokens[:length])
+            self._executor.submit(self._create, key, model_name, system_instruction, contents[:length], token_count, replaces)
+
+    def _create(self, key, model_name, system_instruction, contents, token_count, replaces):
+        try:
+            handle, expires_at = self.api.create(model_name, system_instruction, contents, self.ttl_seconds)
+            model = self.api.bind_model(handle)
+        except Exception as e:
+            logger.warning(f"Context cache create failed for {model_name} ({len(contents)} turns); sending prompts in full: {e}")
+            with self._lock:
+                self._creating.discard(key)
+                self._paused_until[model_name] = self._clock() + self.retry_after_seconds
+                self._counts["create_failures"] += 1
+            return
+        evicted = []
+        with self._lock:
+            self._creating.discard(key)
+            self._handles[key] = CachedContext(key, handle, model, len(contents), token_count, expires_at)
+            self._prefix_lengths[len(contents)] += 1
+            self._counts["created"] += 1
+            # A conversation's longer prefix supersedes its shorter one
+            if replaces is not None and self._remove(replaces):
+                evicted.append(replaces)
+            while len(self._handles) > self.max_handles:
+                oldest = next(iter(self._handles.values()))
+                self._remove(oldest)
+                evicted.append(oldest)
+                self._counts["evicted"] += 1
+        logger.info(f"Cached {token_count} prompt tokens for {model_name} ({len(contents)} turns).")
+        for cached in evicted:
+            self._delete(cached)
+
+    def _remove(self, cached):
+        """Drops a handle from the table (caller holds the lock); False if it was already gone."""
+        if self._handles.get(cached.key) is not cached:
+            return False
+        del self._handles[cached.key]
+        self._prefix_lengths[cached.prefix_length] -= 1
+        if not self._prefix_lengths[cached.prefix_length]:
+            del self._prefix_lengths[cached.prefix_length]
+        return True
+
+    def _refresh(self, cached):
+        try:
+            expires_at = self.api.refresh(cached.handle, self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Context cache refresh failed; dropping the handle: {e}")
+            self.invalidate(cached)
+            return
+        with self._lock:
+            cached.expires_at = expires_at
+            cached.refreshing = False
+            self._counts["refreshed"] += 1
+
+    def _delete(self, cached):
+        try:
+            self.api.delete(cached.handle)
+        except Exception as e:
+            logger.debug(f"Context cache delete failed (it will expire on its own): {e}")
+
+    def invalidate(self, cached, error=None):
+        """Stops using a handle the API rejected (e.g. expired or deleted server-side)."""
+        with self._lock:
+            self._remove(cached)
+            if error is not None:
+                self._counts["fallbacks"] += 1
+        if error is not None:
+            logger.warning(f"Cached content request failed; retrying without the cache: {error}")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "handles": len(self._handles), "creating": len(self._creating)}
+
+    def wait(self, timeout=None):
+        """Blocks until background creates/refreshes queued so far have finished (tests, benchmarks)."""
+        self._executor.submit(lambda: None).result(timeout=timeout)
+
+    def close(self):
+        """Deletes every handle (so storage stops being billed) and stops the background thread."""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._prefix_lengths.clear()
+        for cached in handles:
+            self._delete(cached)
+        self._executor.shutdown(wait=False)
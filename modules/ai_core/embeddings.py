@@ -0,0 +1,119 @@
+# modules/ai_core/embeddings.py
+# Local, offline text embeddings for similarity lookups (semantic cache, memory search).
+# Any object with embed(text) -> 1-D float32 array and embed_batch(texts) -> 2-D array can be plugged in.
+
+import re
+import zlib
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Spelled out before tokenizing so "isn't" / "can't" become a "not" instead of "isn" / "t"
+_CONTRACTIONS = (
+    (re.compile(r"\bcan['\u2019]?t\b"), "can not"),
+    (re.compile(r"\bwon['\u2019]t\b"), "will not"),
+    (re.compile(r"n['\u2019]t\b"), " not"),
+)
+
+# Very common function words carry little meaning for "is this the same question?" lookups.
+# Content words (even "tell" or "good") are kept: dropping them makes more rephrasings match,
+# but also more different questions. Pass a larger set as HashingEmbedder(stopwords=...) for
+# a domain where such words are known to be noise.
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for with about from by as is are was were be been am
+i me my you your we our it its this that these those do does did can could would should will
+please s t just so some any
+""".split())
+
+# Words that change what is asked rather than what it is about: "who is X" and "what is X",
+# or "is it safe" and "is it not safe", must not look like the same question. They are kept
+# out of the bag of words and added as marker features carrying a fixed share of the vector
+# (see HashingEmbedder.embed), so they count the same however long the prompt is.
+QUESTION_WORDS = frozenset("what how which who whom whose why when where".split())
+NEGATIONS = frozenset("not cannot no never nor none nothing neither nobody nowhere".split())
+
+
+def _stable_hash(token):
+    # Python's hash() is salted per process; crc32 keeps vectors comparable across runs
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class HashingEmbedder:
+    def __init__(self, dim=256, use_bigrams=True, char_ngram=3, stopwords=STOPWORDS,
+                 question_weight=0.3, negation_weight=1.0):
+        """
+        Hashing-trick bag-of-words embedder.
+        :param dim: Output vector size.
+        :param use_bigrams: Also hash adjacent word pairs (captures some word order).
+        :param char_ngram: If set, also hash character n-grams of each word so inflections
+                           ('joke' / 'jokes') still overlap. 0 disables it.
+        :param stopwords: Words ignored when building features (default: English function words).
+        :param question_weight: Squared weight of the question-word markers relative to the rest
+                                of the text. With 0.3, the same text under another question word
+                                scores 1 / 1.3 = 0.77; with or without one, 1 / sqrt(1.3) = 0.88.
+        :param negation_weight: Same for the negation marker. With 1.0, the same text with and
+                                without a negation scores 1 / sqrt(2) = 0.71.
+        """
+        self.dim = dim
+        self.use_bigrams = use_bigrams
+        self.char_ngram = char_ngram
+        self.stopwords = stopwords or frozenset()
+        self.question_weight = question_weight
+        self.negation_weight = negation_weight
+
+    def _words(self, text):
+        text = text.lower()
+        for pattern, replacement in _CONTRACTIONS:
+            text = pattern.sub(replacement, text)
+        return _TOKEN_PATTERN.findall(text)
+
+    def features(self, text):
+        """(bag-of-words features, marker features) of text."""
+        words, markers = [], []
+        for word in self._words(text):
+            if word in QUESTION_WORDS:
+                markers.append(f"?{word}")
+            elif word in NEGATIONS:
+                markers.append("!not")
+            elif word not in self.stopwords:
+                words.append(word)
+        features = list(words)
+        if self.use_bigrams:
+            features.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+        if self.char_ngram:
+            n = self.char_ngram
+            for word in words:
+                if len(word) >= n:
+                    padded = f"<{word}>"
+                    features.extend(f"#{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+        return features, markers
+
+    def _add(self, vector, feature, weight):
+        h = _stable_hash(feature)
+        vector[h % self.dim] += weight if (h >> 31) & 1 else -weight
+
+    def embed(self, text):
+        """Returns an L2-normalized float32 vector for text (all zeros for empty text)."""
+        features, markers = self.features(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            self._add(vector, feature, 1.0)
+        # Markers get a share of the squared norm, split between the question words present
+        # (several negations are still one "not")
+        scale = max(float(np.linalg.norm(vector)), 1.0)
+        questions = sorted({marker for marker in markers if marker != "!not"})
+        for marker in questions:
+            self._add(vector, marker, scale * np.sqrt(self.question_weight / len(questions)))
+        if "!not" in markers:
+            self._add(vector, "!not", scale * np.sqrt(self.negation_weight))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_batch(self, texts):
+        """Returns an (n, dim) float32 matrix of normalized vectors."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
@@ -0,0 +1,212 @@
+# modules/ai_core/fake_model.py
+# Local stand-in for google.generativeai.GenerativeModel, used by tests and benchmarks.
+# It streams canned chunks with configurable delays and never touches the network.
+# FakeCachingAPI likewise stands in for the context caching API (see context_cache.py).
+
+import asyncio
+import itertools
+import time
+
+from ..context.tokens import estimate_tokens
+
+
+class FakeChunk:
+    """Mimics the parts of a streamed GenerateContentResponse chunk that GURU reads."""
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f"FakeChunk({self.text!r})"
+
+
+class _FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeContent:
+    def __init__(self, text):
+        self.parts = [_FakePart(text)]
+
+
+class _FakeFinishReason:
+    name = "STOP"
+
+    def __eq__(self, other):
+        return other == 1 or other is self
+
+    def __hash__(self):
+        return 1
+
+
+class _FakeCandidate:
+    def __init__(self, text):
+        self.content = _FakeContent(text)
+        self.finish_reason = _FakeFinishReason()
+
+
+class FakeResponse:
+    """Mimics a non-streaming GenerateContentResponse."""
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [_FakeCandidate(text)]
+        self.prompt_feedback = None
+
+
+class _FakeAsyncStream:
+    """Async-iterable returned by FakeGenerativeModel.generate_content_async(stream=True)."""
+    def __init__(self, model, first_chunk_delay):
+        self._model = model
+        self._first_chunk_delay = first_chunk_delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        model = self._model
+        try:
+            for index, text in enumerate(model.chunks):
+                delay = self._first_chunk_delay if index == 0 else model.chunk_delay
+                if delay:
+                    await asyncio.sleep(delay)
+                if model.error_after is not None and index >= model.error_after:
+                    raise model.error_factory()
+                model.chunks_streamed += 1
+                yield FakeChunk(text)
+        except (GeneratorExit, asyncio.CancelledError):
+            model.cancelled += 1
+            raise
+
+
+class FakeGenerativeModel:
+    def __init__(self, chunks=None, chunk_delay=0.0, first_chunk_delay=None,
+                 error_after=None, error_factory=None, model_name="fake-gemini",
+                 fail_first_calls=0, first_chunk_delays=None, cached_content=None):
+        """
+        Initializes the fake model.
+        :param chunks: List of text chunks to stream for every request.
+        :param chunk_delay: Seconds to wait before each chunk after the first.
+        :param first_chunk_delay: Seconds to wait before the first chunk (defaults to chunk_delay).
+        :param error_after: If set, raise after this many chunks have been streamed.
+        :param error_factory: Callable returning the exception to raise (defaults to RuntimeError).
+        :param model_name: Name reported by the fake, mirroring GenerativeModel.model_name.
+        :param fail_first_calls: The first N requests raise error_factory() before streaming.
+        :param first_chunk_delays: Optional per-request first-chunk delays (request i uses item i;
+                                   later requests fall back to first_chunk_delay).
+        :param cached_content: FakeCachedContent this model is bound to (see FakeCachingAPI);
+                               requests fail once it has expired or been deleted.
+        """
+        self.chunks = list(chunks) if chunks is not None else ["Hello ", "from ", "the ", "fake ", "GURU!"]
+        self.chunk_delay = chunk_delay
+        self.first_chunk_delay = chunk_delay if first_chunk_delay is None else first_chunk_delay
+        self.error_after = error_after
+        self.error_factory = error_factory or (lambda: RuntimeError("Fake upstream failure"))
+        self.model_name = model_name
+        self.fail_first_calls = fail_first_calls
+        self.first_chunk_delays = list(first_chunk_delays or [])
+        self.calls = []  # (contents, kwargs) for every request, for assertions in tests
+        self.chunks_streamed = 0
+        self.cancelled = 0  # Streams closed by the consumer before they finished
+        self.cached_content = cached_content
+
+    def _start(self):
+        """Applies the per-request failure/delay settings; returns this request's first-chunk delay."""
+        call_index = len(self.calls) - 1
+        if self.cached_content is not None and not self.cached_content.is_live():
+            raise RuntimeError(f"404 {self.cached_content.name} not found or expired")
+        if call_index < self.fail_first_calls:
+            raise self.error_factory()
+        if call_index < len(self.first_chunk_delays):
+            return self.first_chunk_delays[call_index]
+        return self.first_chunk_delay
+
+    def _stream(self, first_chunk_delay):
+        try:
+            for index, text in enumerate(self.chunks):
+                delay = first_chunk_delay if index == 0 else self.chunk_delay
+                if delay:
+                    time.sleep(delay)
+                if self.error_after is not None and index >= self.error_after:
+                    raise self.error_factory()
+                self.chunks_streamed += 1
+                yield FakeChunk(text)
+        except GeneratorExit:
+            self.cancelled += 1
+            raise
+
+    def generate_content(self, contents, generation_config=None, safety_settings=None, stream=False, **kwargs):
+        self.calls.append((contents, dict(kwargs, generation_config=generation_config, stream=stream)))
+        first_chunk_delay = self._start()
+        if stream:
+            return self._stream(first_chunk_delay)
+        return FakeResponse("".join(chunk.text for chunk in self._stream(first_chunk_delay)))
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None, stream=False, **kwargs):
+        self.calls.append((contents, dict(kwargs, generation_config=generation_config, stream=stream)))
+        first_chunk_delay = self._start()
+        if stream:
+            return _FakeAsyncStream(self, first_chunk_delay)
+        texts = [chunk.text async for chunk in _FakeAsyncStream(self, first_chunk_delay)]
+        return FakeResponse("".join(texts))
+
+
+class FakeCachedContent:
+    """Mimics caching.CachedContent: what was cached, and until when."""
+    def __init__(self, name, model_name, system_instruction, contents, token_count, expire_time, clock):
+        self.name = name
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.token_count = token_count
+        self.expire_time = expire_time
+        self.deleted = False
+        self._clock = clock
+
+    def is_live(self):
+        return not self.deleted and self._clock() < self.expire_time
+
+
+class FakeCachingAPI:
+    def __init__(self, chunks=None, min_tokens=0, clock=time.time, unsupported_models=()):
+        """
+        Local stand-in for the context caching API with ContextCacheManager's interface.
+        :param chunks: Chunks streamed by models bound to cached content.
+        :param min_tokens: Creates of smaller prefixes fail, as the real API's do.
+        :param clock: Time source for expiry (share it with the ContextCacheManager under test).
+        :param unsupported_models: Model names whose creates always fail.
+        """
+        self.chunks = chunks
+        self.min_tokens = min_tokens
+        self.unsupported_models = set(unsupported_models)
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self.handles = []  # Every FakeCachedContent created
+        self.models = []  # Every model bound to a handle
+        self.refreshes = 0
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        if model_name in self.unsupported_models:
+            raise RuntimeError(f"400 Model {model_name} does not support cached content")
+        texts = [system_instruction or ""] + [part.get("text", "") for entry in contents for part in entry.get("parts", [])]
+        token_count = sum(estimate_tokens(text) for text in texts)
+        if token_count < self.min_tokens:
+            raise RuntimeError(f"400 Cached content is too small: {token_count} < {self.min_tokens} tokens")
+        handle = FakeCachedContent(f"cachedContents/fake-{next(self._ids)}", model_name, system_instruction,
+                                   list(contents), token_count, self._clock() + ttl_seconds, self._clock)
+        self.handles.append(handle)
+        return handle, handle.expire_time
+
+    def refresh(self, handle, ttl_seconds):
+        if not handle.is_live():
+            raise RuntimeError(f"404 {handle.name} not found or expired")
+        self.refreshes += 1
+        handle.expire_time = self._clock() + ttl_seconds
+        return handle.expire_time
+
+    def delete(self, handle):
+        handle.deleted = True
+
+    def bind_model(self, handle):
+        model = FakeGenerativeModel(chunks=self.chunks, model_name=handle.model_name, cached_content=handle)
+        self.models.append(model)
+        return model
@@ -1,57 +1,134 @@
 # modules/ai_core/gemini_client.py
+# google.generativeai is imported on first use (see _import_genai): it accounts for most of
+# the app's import time, and a cold start shouldn't pay for it before the first request.
+import asyncio
 import os
-import google.generativeai as genai
+import threading
 from .config import SYSTEM_INSTRUCTION_TEXT
+from .processor import GeminiContents
+from .response_cache import CachedChunk, make_cache_key
+from .resilience import cancel_upstream
+from ..monitoring.instrumentation import observe_gemini_stream, aobserve_gemini_stream
 import logging # Add logging
 
 logger = logging.getLogger(__name__)
 
+def _import_genai():
+    import google.generativeai as genai
+    return genai
+
+def extract_chunk_text(chunk):
+    """Returns the text carried by a streamed chunk (plain string or SDK chunk), or None."""
+    if isinstance(chunk, str):
+        return chunk
+    if hasattr(chunk, 'text') and chunk.text:
+        return chunk.text
+    return None
+
 class GeminiClient:
-    def __init__(self, api_key=None, model_name="gemini-2.0-flash", system_instruction=SYSTEM_INSTRUCTION_TEXT):
+    def __init__(self, api_key=None, model_name="gemini-2.0-flash", system_instruction=SYSTEM_INSTRUCTION_TEXT, model=None,
+                 response_cache=None, semantic_cache=None, single_flight=None, resilience=None, context_cache=None):
+        """
+        The SDK model is built lazily, on first use or by warm_up(), so constructing a client
+        is cheap and never touches the network.
+        :param model: Optional pre-built model object (e.g. FakeGenerativeModel). When given,
+                      no API key is needed and the SDK is not configured.
+        :param response_cache: Optional ResponseCache consulted for streamed requests.
+        :param semantic_cache: Optional SemanticCache consulted after an exact-match miss.
+        :param single_flight: Optional SingleFlight; identical concurrent streamed requests then
+                              share one upstream call.
+        :param resilience: Optional ResiliencePolicy (timeouts, retries, hedging, circuit breaker)
+                           applied to streamed calls.
+        :param context_cache: Optional ContextCacheManager; requests whose system instruction and
+                              older turns are cached server-side send only the turns after them.
+        """
+        self.model_name = model_name
+        self.system_instruction_text = system_instruction # Store for potential use
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.single_flight = single_flight
+        self.resilience = resilience
+        self.context_cache = context_cache
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.model_supports_system_instruction_directly = False
+
+        if model is not None:
+            self.model = model
+            logger.info(f"GeminiClient using injected model object for '{model_name}'.")
+            return
+
         if api_key is None:
             api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment or provided.")
-        
-        genai.configure(api_key=api_key)
-        
-        self.model_name = model_name
-        self.system_instruction_text = system_instruction # Store for potential use
-        self.model_supports_system_instruction_directly = False
+        self._api_key = api_key
+
+    @property
+    def model(self):
+        """The model object; the SDK model is built on first access."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._build_model()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self.model_supports_system_instruction_directly = True
 
+    @property
+    def ready(self):
+        """True once the model exists, i.e. the first request won't pay for building it."""
+        return self._model is not None
+
+    def warm_up(self):
+        """Builds the model now (e.g. from a background thread at startup). Returns True on success."""
+        try:
+            self.model
+            return True
+        except Exception as e:
+            logger.error(f"Warm-up of model '{self.model_name}' failed: {e}")
+            return False
+
+    def _build_model(self):
+        genai = _import_genai()
+        genai.configure(api_key=self._api_key)
         try:
-            self.model = genai.GenerativeModel(
-                model_name,
+            model = genai.GenerativeModel(
+                self.model_name,
                 system_instruction=self.system_instruction_text
             )
             self.model_supports_system_instruction_directly = True
-            logger.info(f"GeminiClient initialized model '{model_name}' directly WITH system instruction.")
+            logger.info(f"GeminiClient initialized model '{self.model_name}' directly WITH system instruction.")
         except (TypeError, ValueError) as e:
-            logger.warning(f"Model '{model_name}' might not support 'system_instruction' parameter directly in constructor ({e}).")
-            logger.info("Fetching available models for debugging...")
-            self.list_available_models()  # Log available models
-            self.model = genai.GenerativeModel(model_name)
+            # Call list_available_models() explicitly when debugging; it's a network round trip
+            logger.warning(f"Model '{self.model_name}' might not support 'system_instruction' parameter directly in constructor ({e}).")
+            model = genai.GenerativeModel(self.model_name)
             self.model_supports_system_instruction_directly = False
-        except Exception as e:
-            logger.error(f"Error initializing model '{model_name}': {e}")
-            logger.info("Fetching available models for debugging...")
-            self.list_available_models()  # Log available models
-            raise
+        return model
 
-    def generate_response(self, prompt, generation_config=None, safety_settings=None, stream=False):
+    def _prepare_prompt(self, prompt):
+        """Applies the system instruction to the prompt when the model can't take it directly."""
         final_prompt_for_api = prompt
 
         # If model doesn't support system_instruction directly and prompt is a list (chat history)
         # we should prepend the system instruction as the first message in the list.
         if not self.model_supports_system_instruction_directly and isinstance(prompt, list) and self.system_instruction_text:
             logger.info("Prepending system instruction to message list for model.")
-            # Ensure system instruction isn't already there to avoid duplication
-            is_system_instruction_present = any(
-                part.get('text', '').strip() == self.system_instruction_text.strip()
-                for msg in prompt 
-                if msg.get('role') == 'user' or msg.get('role') == 'system' # Check user or potential system role
-                for part in msg.get('parts', [])
-            )
+            # Ensure system instruction isn't already there to avoid duplication.
+            # IncrementalContents snapshots track this as turns are added, so only other lists are scanned.
+            if isinstance(prompt, GeminiContents) and prompt.system_instruction == self.system_instruction_text:
+                is_system_instruction_present = prompt.has_system_instruction
+            else:
+                instruction = self.system_instruction_text.strip()
+                is_system_instruction_present = any(
+                    part.get('text', '').strip() == instruction
+                    for msg in prompt
+                    if msg.get('role') == 'user' or msg.get('role') == 'system' # Check user or potential system role
+                    for part in msg.get('parts', [])
+                )
             if not is_system_instruction_present:
                 # Gemini often expects system-like prompts to be from 'user' if no 'system' role is supported in contents
                 # Or, for models that do support it in contents, 'system' role.
@@ -62,17 +139,112 @@ class GeminiClient:
         elif not self.model_supports_system_instruction_directly and isinstance(prompt, str) and self.system_instruction_text:
             logger.info("Prepending system instruction to string prompt for model.")
             final_prompt_for_api = f"[SYSTEM GUIDANCE]:\n{self.system_instruction_text}\n\nUser: {prompt}\nAssistant:"
+        return final_prompt_for_api
 
+    def _context_cache_lookup(self, prompt):
+        """(CachedContext, remaining contents) when a prefix of the prompt is cached server-side, else None."""
+        if self.context_cache is None:
+            return None
         try:
+            return self.context_cache.lookup(self.model_name, self.system_instruction_text, prompt)
+        except Exception as e:
+            logger.error(f"Context cache lookup failed; sending the prompt in full: {e}")
+            return None
+
+    def cache_key(self, prompt, generation_config=None):
+        """Key identifying this request for the response cache (and request coalescing)."""
+        return make_cache_key(self.model_name, self.system_instruction_text, prompt, generation_config)
+
+    def _cache_lookup(self, prompt, generation_config):
+        """
+        Checks the exact-match cache, then the semantic cache.
+        Returns (ticket, cached chunk texts); ticket is None when caching doesn't apply,
+        otherwise it carries what _cache_store needs to fill the caches on a miss.
+        """
+        caches = [cache for cache in (self.response_cache, self.semantic_cache) if cache is not None]
+        if not caches or any(cache.should_bypass(generation_config) for cache in caches):
+            return None, None
+        ticket = (self.cache_key(prompt, generation_config), prompt, generation_config)
+        cached = self.response_cache.get(ticket[0]) if self.response_cache is not None else None
+        if cached is None and self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(self.model_name, self.system_instruction_text, prompt, generation_config)
+        return ticket, cached
+
+    def _cache_store(self, ticket, texts, complete):
+        # Only complete, error-free responses are cached. Error chunks are plain strings,
+        # blocked/empty chunks carry no text, and an abandoned stream never sets complete.
+        if ticket is None or not complete or not texts:
+            return
+        key, prompt, generation_config = ticket
+        if self.response_cache is not None:
+            self.response_cache.put(key, texts)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(self.model_name, self.system_instruction_text, prompt, generation_config, texts)
+
+    def generate_response(self, prompt, generation_config=None, safety_settings=None, stream=False):
+        if not stream:
+            return self._generate(prompt, generation_config, safety_settings, stream)
+        ticket, cached = self._cache_lookup(prompt, generation_config)
+        if cached is not None:
+            logger.info(f"Serving response from cache ({len(cached)} chunks).")
+            return (CachedChunk(text) for text in cached)
+
+        def upstream():
+            chunks = observe_gemini_stream(self.model_name, self._generate(prompt, generation_config, safety_settings, stream))
+            return chunks if ticket is None else self._caching_stream(ticket, chunks)
+
+        if self.single_flight is None:
+            return upstream()
+        key = ticket[0] if ticket is not None else self.cache_key(prompt, generation_config)
+        return self.single_flight.stream(key, upstream)
+
+    def _caching_stream(self, ticket, upstream):
+        texts, complete = [], True
+        try:
+            for chunk in upstream:
+                if isinstance(chunk, str) or not getattr(chunk, 'text', None):
+                    complete = False
+                else:
+                    texts.append(chunk.text)
+                yield chunk
+        finally:
+            upstream.close()  # Propagates an early close (client gone) to the model stream
+        self._cache_store(ticket, texts, complete)
+
+    def _generate(self, prompt, generation_config=None, safety_settings=None, stream=False):
+        try:
+            model = self.model  # Built on first use; must exist before _prepare_prompt
+            final_prompt_for_api = self._prepare_prompt(prompt)
             logger.info(f"Sending to Gemini Model ({self.model_name}): stream_enabled={stream}")
             logger.debug(f"Final prompt for API: {final_prompt_for_api}") # Can be very verbose
+            cached = self._context_cache_lookup(prompt)
 
-            response_iterable = self.model.generate_content(
-                final_prompt_for_api,
-                generation_config=generation_config,
-                safety_settings=safety_settings,
-                stream=stream
-            )
+            def start_call():
+                nonlocal cached
+                if cached is not None:
+                    # The cached model already carries the system instruction and older turns
+                    context, tail = cached
+                    try:
+                        return context.model.generate_content(
+                            tail,
+                            generation_config=generation_config,
+                            safety_settings=safety_settings,
+                            stream=stream
+                        )
+                    except Exception as e:  # e.g. the handle expired server-side
+                        cached = None
+                        self.context_cache.invalidate(context, e)
+                return model.generate_content(
+                    final_prompt_for_api,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    stream=stream
+                )
+
+            if stream and self.resilience is not None:
+                response_iterable = self.resilience.open_stream(start_call)
+            else:
+                response_iterable = start_call()
             
             if stream:
                 logger.info("Streaming response from Gemini...")
@@ -80,6 +252,10 @@ class GeminiClient:
                 try:
                     for chunk in response_iterable:
                         yield chunk
+                except GeneratorExit:
+                    logger.info("Stream closed by consumer; cancelling upstream Gemini stream.")
+                    cancel_upstream(response_iterable)
+                    raise
                 except Exception as stream_e:
                     logger.error(f"Error DURING Gemini stream iteration: {stream_e}")
                     yield f"Error_Stream_Iteration: {str(stream_e)}" # Yield an error string
@@ -115,19 +291,108 @@ class GeminiClient:
             if stream: yield f"Error_API_Call: {str(e)}" # Yield an error chunk
             else: return f"Error_API_Call: {str(e)}"
 
+    async def agenerate_response(self, prompt, generation_config=None, safety_settings=None):
+        """
+        Async streaming variant of generate_response.
+        Yields the same chunk objects / error strings as the sync stream, but awaits the
+        upstream so many streams can share one event loop instead of one thread each.
+        """
+        ticket, cached = self._cache_lookup(prompt, generation_config)
+        if cached is not None:
+            logger.info(f"Serving response from cache ({len(cached)} chunks).")
+            for text in cached:
+                yield CachedChunk(text)
+            return
+
+        def upstream():
+            return aobserve_gemini_stream(
+                self.model_name, self._agenerate(ticket, prompt, generation_config, safety_settings))
+
+        if self.single_flight is None:
+            chunks = upstream()
+        else:
+            key = ticket[0] if ticket is not None else self.cache_key(prompt, generation_config)
+            chunks = self.single_flight.astream(key, upstream)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()  # Propagates an early close (client gone) to the model stream
+
+    async def _agenerate(self, ticket, prompt, generation_config=None, safety_settings=None):
+        texts, complete = [], True
+        try:
+            model = self.model
+            final_prompt_for_api = self._prepare_prompt(prompt)
+            logger.info(f"Sending to Gemini Model ({self.model_name}) asynchronously: stream_enabled=True")
+            cached = self._context_cache_lookup(prompt)
+
+            async def start_call():
+                nonlocal cached
+                if cached is not None:
+                    context, tail = cached
+                    try:
+                        return await context.model.generate_content_async(
+                            tail,
+                            generation_config=generation_config,
+                            safety_settings=safety_settings,
+                            stream=True
+                        )
+                    except Exception as e:
+                        cached = None
+                        self.context_cache.invalidate(context, e)
+                return await model.generate_content_async(
+                    final_prompt_for_api,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                    stream=True
+                )
+
+            if self.resilience is not None:
+                response_iterable = await self.resilience.aopen_stream(start_call)
+            else:
+                response_iterable = await start_call()
+            chunks = response_iterable.__aiter__()
+            try:
+                async for chunk in chunks:
+                    if getattr(chunk, 'text', None):
+                        texts.append(chunk.text)
+                    else:
+                        complete = False
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                logger.info("Async stream closed by consumer; cancelling upstream Gemini stream.")
+                cancel_upstream(response_iterable)
+                aclose = getattr(chunks, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+                raise
+            except Exception as stream_e:
+                logger.error(f"Error DURING async Gemini stream iteration: {stream_e}")
+                yield f"Error_Stream_Iteration: {str(stream_e)}"
+                return
+            self._cache_store(ticket, texts, complete)
+        except ValueError as ve:
+            logger.error(f"ValueError during async Gemini API call: {ve}")
+            yield f"Error_API_Config: {str(ve)}"
+        except Exception as e:
+            logger.error(f"Unexpected error during async Gemini API call: {e}")
+            yield f"Error_API_Call: {str(e)}"
+
     def list_available_models(self):
+        """Lists the models visible to this API key. A network call: only invoked explicitly, for debugging."""
         try:
-            from google.generativeai import models
-            available_models = models.list_models()
+            genai = _import_genai()
+            if getattr(self, '_api_key', None):
+                genai.configure(api_key=self._api_key)
+            available_models = list(genai.list_models())
             logger.info("Available models:")
             for model in available_models:
                 # Dynamically log all attributes of the model object
                 logger.info(f"Model: {model}")
-                print(f"Model: {model}")
             return available_models
         except Exception as e:
             logger.error(f"Error fetching available models: {e}")
-            print(f"Error fetching available models: {e}")
             return []
 
 # ... (rest of the file, including if __name__ == '__main__')
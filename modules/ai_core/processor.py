@@ -1,29 +1,206 @@
 # modules/ai_core/processor.py
 # Handles request/response formatting and any additional NLP beyond Gemini.
+# IncrementalContents keeps a conversation's Gemini `contents` pre-built as turns are added
+# and trimmed, so assembling a request doesn't re-walk the history.
+
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def format_history(messages):
+    """Plain-text history: one 'role: content' line per message, oldest first."""
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+
+
+def _gemini_role(role):
+    return 'model' if role in ('model', 'assistant') else 'user'
+
+
+class GeminiContents(list):
+    """
+    A Gemini `contents` list that records whether a user turn already carries the system
+    instruction, so GeminiClient doesn't have to scan every part to find out.
+    """
+    __slots__ = ('system_instruction', 'has_system_instruction')
+
+    def __init__(self, entries, system_instruction=None, has_system_instruction=False):
+        super().__init__(entries)
+        self.system_instruction = system_instruction
+        self.has_system_instruction = has_system_instruction
+
+
+class IncrementalContents:
+    def __init__(self, system_instruction=None):
+        """
+        Gemini `contents` for one conversation, updated as messages are added and trimmed.
+        Entries are never modified once built (a merge or trim replaces the entry), so a
+        snapshot handed to a request stays valid while the conversation moves on, and the
+        part dicts are shared between snapshots instead of being rebuilt for each request.
+        Follows build_gemini_contents(): same-role turns merge, and a leading model turn is
+        dropped since a conversation must open with the user.
+        :param system_instruction: Instruction text whose presence in user turns is tracked.
+        """
+        self.system_instruction = system_instruction
+        self._instruction = system_instruction.strip() if system_instruction else None
+        self._entries = deque()  # {'role', 'parts'} dicts, oldest first
+        self._instruction_parts = 0  # User parts equal to the system instruction
+
+    def _is_instruction(self, role, part):
+        return self._instruction is not None and role == 'user' and part['text'].strip() == self._instruction
+
+    def append(self, role, text):
+        """Adds the newest message. O(1), or O(run length) when merging into a same-role entry."""
+        role = _gemini_role(role)
+        part = {'text': text}
+        if self._is_instruction(role, part):
+            self._instruction_parts += 1
+        entries = self._entries
+        if entries and entries[-1]['role'] == role:
+            entries[-1] = {'role': role, 'parts': entries[-1]['parts'] + [part]}
+        else:
+            entries.append({'role': role, 'parts': [part]})
+
+    def trim(self, count):
+        """Drops the `count` oldest messages."""
+        entries = self._entries
+        for _ in range(count):
+            if not entries:
+                break
+            first = entries[0]
+            if self._is_instruction(first['role'], first['parts'][0]):
+                self._instruction_parts -= 1
+            if len(first['parts']) == 1:
+                entries.popleft()
+            else:
+                entries[0] = {'role': first['role'], 'parts': first['parts'][1:]}
+
+    def clear(self):
+        self._entries.clear()
+        self._instruction_parts = 0
+
+    def snapshot(self, summary=None):
+        """
+        The contents to send, as a GeminiContents list. Copies entry references only.
+        :param summary: Optional text sent first as a user turn (e.g. the rolling summary).
+        """
+        entries = list(self._entries)
+        if summary:
+            part = {'text': summary}
+            if entries and entries[0]['role'] == 'user':
+                entries[0] = {'role': 'user', 'parts': [part] + entries[0]['parts']}
+            else:
+                entries.insert(0, {'role': 'user', 'parts': [part]})
+        elif entries and entries[0]['role'] == 'model':
+            del entries[0]
+        return GeminiContents(entries, self.system_instruction, self._instruction_parts > 0)
+
+    def from_messages(self, messages):
+        """GeminiContents for an arbitrary message list (the non-incremental path)."""
+        contents = IncrementalContents(self.system_instruction)
+        for msg in messages:
+            contents.append(msg['role'], msg['content'])
+        return contents.snapshot()
+
+class StreamingResponseParser:
+    """
+    Cleans a streamed reply chunk by chunk without losing text at chunk boundaries.
+    Whitespace is only stripped at the true edges of the message: leading whitespace before
+    the first visible character, and trailing whitespace after the last one (held back until
+    more text arrives, dropped by finish()). Asterisks are removed wherever they fall, so a
+    '**' split across two chunks is handled too.
+    """
+    __slots__ = ('_parts', '_pending_whitespace', '_started')
+
+    def __init__(self):
+        self._parts = []
+        self._pending_whitespace = ''
+        self._started = False
+
+    def feed(self, chunk):
+        """Processes one chunk and returns the text that can be emitted now ('' if none)."""
+        if '*' in chunk:
+            chunk = chunk.replace('*', '')
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ''
+            self._started = True
+        body = chunk.rstrip()
+        if not body:
+            self._pending_whitespace += chunk
+            return ''
+        trailing = chunk[len(body):]
+        if self._pending_whitespace:
+            body = self._pending_whitespace + body
+        self._pending_whitespace = trailing
+        self._parts.append(body)
+        return body
+
+    def finish(self):
+        """Ends the message; trailing whitespace is dropped. Returns any text still to emit ('')."""
+        self._pending_whitespace = ''
+        return ''
+
+    @property
+    def text(self):
+        """The full cleaned message so far, joined once."""
+        return ''.join(self._parts)
+
 
 class AIProcessor:
     def __init__(self):
-        print("AIProcessor initialized.")
+        logger.debug("AIProcessor initialized.")
+
+    def stream_parser(self):
+        """Returns a fresh StreamingResponseParser for one streamed reply."""
+        return StreamingResponseParser()
 
-    def format_prompt(self, user_query, conversation_history=None, context_data=None, system_instruction=None):
-        # ... (keep existing logic, or adjust if system_instruction is prepended here for certain models)
+    def format_prompt(self, user_query, conversation_history=None, context_data=None, system_instruction=None,
+                      max_turns=5):
+        """
+        Single-string prompt for models/callers that don't take a `contents` list.
+        Chat requests use IncrementalContents instead (see ConversationHistory.get_prompt_contents).
+        :param max_turns: Most recent history messages to include.
+        """
         prompt = user_query # Base
-        
-        # This is a simplified history injection. For Gemini chat models, 
-        # you'd typically build a list of {'role': 'user'/'model', 'parts': [{'text': ...}]}
         if conversation_history:
-            history_str = "\\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history[-5:]]) # Last 5 turns
-            prompt = f"Conversation History:\\n{history_str}\\n\\nUser: {user_query}"
+            history_str = format_history(conversation_history[-max_turns:])
+            prompt = f"Conversation History:\n{history_str}\n\nUser: {user_query}"
         
         if context_data:
-            prompt += f"\\n\\nRelevant Information: {context_data}"
+            prompt += f"\n\nRelevant Information: {context_data}"
         
         # If the model expects system instruction as part of the main prompt:
         # if system_instruction:
-        #     prompt = f"{system_instruction}\\n\\n{prompt}"
+        #     prompt = f"{system_instruction}\n\n{prompt}"
             
         return prompt
 
+    def incremental_contents(self, system_instruction=None):
+        """A fresh IncrementalContents (one per conversation)."""
+        return IncrementalContents(system_instruction)
+
+    def build_gemini_contents(self, messages):
+        """
+        Converts history messages into a Gemini `contents` list:
+        [{'role': 'user' | 'model', 'parts': [{'text': ...}]}, ...]
+        Leading model turns are dropped (a conversation must open with the user) and
+        consecutive turns from the same role are merged into one entry, since the API
+        expects user/model turns to alternate.
+        """
+        contents = []
+        for msg in messages:
+            role = _gemini_role(msg['role'])
+            if not contents and role == 'model':
+                continue
+            if contents and contents[-1]['role'] == role:
+                contents[-1]['parts'].append({'text': msg['content']})
+            else:
+                contents.append({'role': role, 'parts': [{'text': msg['content']}]})
+        return contents
+
     def parse_response(self, ai_raw_response):
         cleaned_response = ai_raw_response.strip()
         # Fallback to remove asterisks if the model still uses them despite instructions
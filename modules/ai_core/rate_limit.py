@@ -0,0 +1,346 @@
+# modules/ai_core/rate_limit.py
+# Per-caller admission control for /api/chat: token buckets (a sustained request rate plus a
+# burst allowance) and caps on concurrently open streams, for the client IP, the session and the
+# API key. A request must pass every limit that applies to it, so rotating session IDs or
+# inventing API keys doesn't get around the per-IP limit.
+# The counters live in a backend. MemoryRateLimitBackend keeps them in this process;
+# SharedRateLimitBackend keeps them in a shared store (see modules/context/shared_store.py), so
+# the limits hold across all worker processes.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HEADER_NAME = "X-API-Key"
+SCOPES = ("ip", "session", "api_key")
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is over one of its limits."""
+    def __init__(self, message, scope, retry_after):
+        """
+        :param scope: Which limit was hit ("ip", "session" or "api_key").
+        :param retry_after: Seconds until a retry could succeed (for the Retry-After header).
+        """
+        super().__init__(message)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def client_ip(remote_addr, forwarded_for=None, trust_forwarded_for=False):
+    """
+    The caller's address. Behind a reverse proxy every request comes from the proxy, so with
+    trust_forwarded_for the address the proxy appended to X-Forwarded-For (the last one) is used.
+    Earlier entries are whatever the client sent and are never trusted.
+    """
+    if trust_forwarded_for and forwarded_for:
+        return forwarded_for.split(",")[-1].strip() or remote_addr
+    return remote_addr
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class MemoryRateLimitBackend:
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        """
+        In-process token buckets and open-stream counts.
+        Buckets refill lazily: a bucket stores its level and when it was last touched, and the
+        refill is computed on the next request, so idle callers cost nothing. At most max_keys
+        buckets are kept; the least recently used is dropped beyond that (it comes back full, so
+        eviction only ever errs towards allowing). Stream counts exist only while streams are open.
+        One instance shared by several RateLimiters enforces one limit across them.
+        :param clock: Time source (injectable for tests).
+        """
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict()  # key -> _Bucket, least recently used first
+        self._streams = {}  # key -> open streams
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def take(self, buckets, cost=1.0):
+        """
+        Takes `cost` tokens from every bucket, or from none of them if any is short.
+        :param buckets: [(key, refill rate in tokens per second, burst capacity)]
+        :return: (allowed, index of the first bucket that was short or None, seconds until it has enough)
+        """
+        now = self._clock()
+        with self._lock:
+            levels = []
+            for index, (key, rate, burst) in enumerate(buckets):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    level = burst
+                else:
+                    level = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+                if level < cost:
+                    wait = (cost - level) / rate if rate > 0 else float("inf")
+                    return False, index, wait
+                levels.append(level)
+            for (key, _, _), level in zip(buckets, levels):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._buckets[key] = _Bucket(level - cost, now)
+                    if len(self._buckets) > self.max_keys:
+                        self._buckets.popitem(last=False)
+                        self.evicted += 1
+                else:
+                    bucket.tokens = level - cost
+                    bucket.updated = now
+                    self._buckets.move_to_end(key)
+            return True, None, 0.0
+
+    def acquire_streams(self, slots):
+        """
+        Counts one more open stream against every (key, limit) in slots, or against none of
+        them if any is at its limit.
+        :return: Index of the first slot at its limit, or None if the stream was admitted.
+        """
+        with self._lock:
+            for index, (key, limit) in enumerate(slots):
+                if self._streams.get(key, 0) >= limit:
+                    return index
+            for key, _ in slots:
+                self._streams[key] = self._streams.get(key, 0) + 1
+            return None
+
+    def release_streams(self, keys):
+        with self._lock:
+            for key in keys:
+                count = self._streams.get(key, 0) - 1
+                if count > 0:
+                    self._streams[key] = count
+                else:
+                    self._streams.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"buckets": len(self._buckets), "open_streams": sum(self._streams.values()),
+                    "evicted_buckets": self.evicted}
+
+
+class SharedRateLimitBackend:
+    BUCKETS_NAMESPACE = "rate_buckets"
+    STREAMS_NAMESPACE = "rate_streams"
+
+    def __init__(self, store, stream_lease_seconds=600, clock=time.time):
+        """
+        Token buckets and open-stream counts in a shared store, with MemoryRateLimitBackend's
+        methods; each take/acquire/release is one store transaction. A bucket expires from the
+        store once it would have refilled, so idle callers cost nothing there either. Open
+        streams are counted per worker process, and each process's count is a lease renewed
+        whenever it opens a stream: the slots of a worker that died with streams open are freed
+        once the lease runs out (keep stream_lease_seconds above the longest reply).
+        :param store: MemorySharedStore or SQLiteSharedStore.
+        :param clock: Wall-clock time source, the same in every process (injectable for tests).
+        """
+        self.store = store
+        self.stream_lease_seconds = stream_lease_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._open_streams = 0  # Held by this process
+
+    def take(self, buckets, cost=1.0):
+        """
+        Takes `cost` tokens from every bucket, or from none of them if any is short.
+        :param buckets: [(key, refill rate in tokens per second, burst capacity)]
+        :return: (allowed, index of the first bucket that was short or None, seconds until it has enough)
+        """
+        now = self._clock()
+        with self.store.transaction():
+            levels = []
+            for index, (key, rate, burst) in enumerate(buckets):
+                entry = self.store.get(self.BUCKETS_NAMESPACE, key)
+                if entry is None:
+                    level = burst
+                else:
+                    tokens, updated = json.loads(entry[1])
+                    level = min(burst, tokens + max(now - updated, 0.0) * rate)
+                if level < cost:
+                    wait = (cost - level) / rate if rate > 0 else float("inf")
+                    return False, index, wait
+                levels.append(level)
+            for (key, rate, burst), level in zip(buckets, levels):
+                # Once full again the bucket is the same as no bucket, so it can go
+                ttl = (burst - level + cost) / rate if rate > 0 else None
+                self.store.put(self.BUCKETS_NAMESPACE, key, json.dumps([level - cost, now]), ttl)
+            return True, None, 0.0
+
+    def _holders(self, key, now):
+        # {pid: [open streams, lease expiry]} for the processes with live leases
+        entry = self.store.get(self.STREAMS_NAMESPACE, key)
+        holders = json.loads(entry[1]) if entry is not None else {}
+        return {pid: holder for pid, holder in holders.items() if holder[1] > now}
+
+    def _write_holders(self, key, holders):
+        if holders:
+            self.store.put(self.STREAMS_NAMESPACE, key, json.dumps(holders), self.stream_lease_seconds)
+        else:
+            self.store.delete(self.STREAMS_NAMESPACE, key)
+
+    def acquire_streams(self, slots):
+        """
+        Counts one more open stream against every (key, limit) in slots, or against none of
+        them if any is at its limit.
+        :return: Index of the first slot at its limit, or None if the stream was admitted.
+        """
+        now = self._clock()
+        pid = str(os.getpid())
+        with self.store.transaction():
+            slot_holders = []
+            for index, (key, limit) in enumerate(slots):
+                holders = self._holders(key, now)
+                if sum(holder[0] for holder in holders.values()) >= limit:
+                    return index
+                slot_holders.append(holders)
+            for (key, _), holders in zip(slots, slot_holders):
+                holders[pid] = [holders.get(pid, [0])[0] + 1, now + self.stream_lease_seconds]
+                self._write_holders(key, holders)
+        with self._lock:
+            self._open_streams += 1
+        return None
+
+    def release_streams(self, keys):
+        now = self._clock()
+        pid = str(os.getpid())
+        with self.store.transaction():
+            for key in keys:
+                holders = self._holders(key, now)
+                if pid in holders:
+                    holders[pid][0] -= 1
+                    if holders[pid][0] <= 0:
+                        del holders[pid]
+                    self._write_holders(key, holders)
+        with self._lock:
+            self._open_streams -= 1
+
+    def stats(self):
+        # Bucket counts live in the shared store; only this process's streams are known here
+        with self._lock:
+            return {"open_streams": self._open_streams}
+
+
+class StreamPermit:
+    """An admitted request's hold on its stream slots; release() (idempotent) when the reply ends."""
+    def __init__(self, limiter, stream_keys, tenant):
+        self._limiter = limiter
+        self._stream_keys = stream_keys
+        self._released = False
+        self.tenant = tenant
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._stream_keys:
+            self._limiter.backend.release_streams(self._stream_keys)
+
+
+class RateLimiter:
+    def __init__(self, limits, max_streams=None, tenant_limits=None, backend=None, max_keys=100000):
+        """
+        :param limits: {scope: {"requests_per_minute": r, "burst": b}} for the scopes in SCOPES;
+                       a scope without an entry isn't rate limited.
+        :param max_streams: {scope: n}, open streams allowed per caller in that scope.
+        :param tenant_limits: {api_key: overrides} for specific API keys; overrides may set
+                              "requests_per_minute", "burst" and "max_streams".
+        :param backend: Where counters live (default: a MemoryRateLimitBackend of max_keys buckets).
+        """
+        unknown = (set(limits) | set(max_streams or {})) - set(SCOPES)
+        if unknown:
+            raise ValueError(f"Unknown rate limit scopes: {sorted(unknown)}")
+        self.limits = {scope: (rule["requests_per_minute"] / 60.0, rule["burst"]) for scope, rule in limits.items()}
+        self.max_streams = dict(max_streams or {})
+        self.tenant_limits = {self._digest(api_key): overrides for api_key, overrides in (tenant_limits or {}).items()}
+        self.backend = backend or MemoryRateLimitBackend(max_keys=max_keys)
+        self._counts_lock = threading.Lock()
+        self._counts = {"allowed": 0, "rate_limited": 0, "stream_limited": 0}
+
+    @staticmethod
+    def _digest(api_key):
+        # API keys are secrets: only a digest is ever stored (or sent to a shared backend)
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+
+    def _identities(self, ip, session_id, api_key):
+        identities = []
+        if ip:
+            identities.append(("ip", ip))
+        if session_id:
+            identities.append(("session", session_id))
+        if api_key:
+            identities.append(("api_key", self._digest(api_key)))
+        return identities
+
+    def _rule(self, scope, identity):
+        rate, burst = self.limits.get(scope, (None, None))
+        streams = self.max_streams.get(scope)
+        if scope == "api_key" and identity in self.tenant_limits:
+            overrides = self.tenant_limits[identity]
+            if "requests_per_minute" in overrides:
+                rate = overrides["requests_per_minute"] / 60.0
+            burst = overrides.get("burst", burst)
+            streams = overrides.get("max_streams", streams)
+        return rate, burst, streams
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+
+    def admit(self, ip=None, session_id=None, api_key=None):
+        """
+        Takes one request from every applicable bucket and holds a stream slot for each scope
+        with a stream cap.
+        :param session_id: Only pass an existing session (a freshly minted ID has no history to protect).
+        :return: StreamPermit; release it when the reply has finished streaming.
+        :raises RateLimitExceeded: Nothing is taken or held in that case.
+        """
+        identities = self._identities(ip, session_id, api_key)
+        buckets, stream_slots, slot_scopes = [], [], []
+        for scope, identity in identities:
+            rate, burst, streams = self._rule(scope, identity)
+            if rate is not None:
+                buckets.append((f"{scope}:{identity}", rate, burst))
+            if streams is not None:
+                stream_slots.append((f"streams:{scope}:{identity}", streams))
+                slot_scopes.append(scope)
+        # Stream slots first: they can be handed back if a bucket is short, while taken tokens can't
+        # (so a caller retrying against its stream cap doesn't also drain its request rate)
+        if stream_slots:
+            index = self.backend.acquire_streams(stream_slots)
+            if index is not None:
+                self._count("stream_limited")
+                scope = slot_scopes[index]
+                raise RateLimitExceeded(f"Too many open replies for this {scope}.", scope, 1.0)
+        permit = StreamPermit(self, [key for key, _ in stream_slots], None)
+        if buckets:
+            try:
+                allowed, index, retry_after = self.backend.take(buckets)
+            except BaseException:
+                permit.release()
+                raise
+            if not allowed:
+                permit.release()
+                self._count("rate_limited")
+                scope = buckets[index][0].split(":", 1)[0]
+                raise RateLimitExceeded(f"Too many requests for this {scope}.", scope, retry_after)
+        self._count("allowed")
+        # Fair queueing groups requests by API key when there is one, else by address
+        permit.tenant = identities[-1][1] if api_key else ip
+        return permit
+
+    def stats(self):
+        with self._counts_lock:
+            counts = dict(self._counts)
+        return {**counts, **self.backend.stats()}
@@ -0,0 +1,489 @@
+# modules/ai_core/resilience.py
+# Resilience layer for the streamed Gemini call: connect and first-token timeouts, jittered
+# exponential retries (only before the first token, so a reply is never duplicated), optional
+# hedged requests once first-token latency passes its observed p95, and a circuit breaker that
+# fails fast while the upstream is unhealthy.
+
+import asyncio
+import collections
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Exception class names (anywhere in the MRO) worth retrying. Matching by name covers
+# google.api_core.exceptions without importing it here.
+RETRYABLE_ERROR_NAMES = frozenset({
+    "ServiceUnavailable", "DeadlineExceeded", "ResourceExhausted", "TooManyRequests",
+    "InternalServerError", "BadGateway", "GatewayTimeout", "Aborted",
+})
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while the circuit breaker is open."""
+
+
+class UpstreamTimeout(TimeoutError):
+    """Raised when an attempt misses its connect or first-token deadline."""
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def cancel_upstream(response):
+    """
+    Best-effort stop of an abandoned model stream so it stops generating (and billing) tokens.
+    SDK responses wrap the transport iterator; whichever object offers cancel()/close() is used.
+    """
+    for target in (response, getattr(response, '_iterator', None)):
+        for method_name in ('cancel', 'close'):
+            method = getattr(target, method_name, None)
+            if callable(method):
+                try:
+                    method()
+                except Exception as e:
+                    logger.debug(f"Ignoring error while cancelling upstream stream: {e}")
+                return
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        """
+        Initializes the breaker.
+        :param failure_threshold: Consecutive failures that open the circuit (ResiliencePolicy
+                                  records one outcome per call, not per retry or hedge).
+        :param recovery_timeout: Seconds the circuit stays open before letting trial calls through.
+        :param half_open_max_calls: Trial calls allowed at once while half-open.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_calls = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_calls = 0
+        return self._state
+
+    def allow(self):
+        """Returns True if a call may go to the upstream now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._trial_calls < self.half_open_max_calls:
+                self._trial_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self, calls=1):
+        """
+        Gives back the trial slots of calls allow() admitted that ended without an outcome (e.g.
+        cancelled because the client left): they say nothing about the upstream, and a slot that
+        is never given back would keep the breaker half-open and rejecting calls for good.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_calls = max(self._trial_calls - calls, 0)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info("Circuit breaker closed; upstream recovered.")
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker opened after {self._consecutive_failures} consecutive failures.")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        """Sliding window of recent first-token latencies (seconds)."""
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class ResilientStream:
+    """A won attempt: replays the first chunk, then the rest of the upstream stream."""
+    def __init__(self, response, iterator, first, has_first=True):
+        self.response = response
+        self._iterator = iterator
+        self._first = first
+        self._has_first = has_first
+
+    def __iter__(self):
+        if self._has_first:
+            self._has_first = False
+            yield self._first
+        yield from self._iterator
+
+    def cancel(self):
+        cancel_upstream(self.response)
+
+
+class AsyncResilientStream(ResilientStream):
+    def __aiter__(self):
+        return self._aiterate()
+
+    async def _aiterate(self):
+        try:
+            if self._has_first:
+                self._has_first = False
+                yield self._first
+            async for chunk in self._iterator:
+                yield chunk
+        finally:
+            aclose = getattr(self._iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class _Attempt(threading.Thread):
+    """Runs the blocking connect + first-chunk phase of one sync attempt."""
+    def __init__(self, start_call, results):
+        super().__init__(name="guru-upstream-attempt", daemon=True)
+        self.start_call = start_call
+        self.results = results
+        self.started_at = time.monotonic()
+        self.connected = False
+        self.abandoned = False
+        self.response = None
+
+    def run(self):
+        try:
+            response = self.start_call()
+            self.response = response
+            self.results.put(("connected", self, None))
+            iterator = iter(response)
+            try:
+                first = next(iterator)
+                outcome = ResilientStream(response, iterator, first)
+            except StopIteration:
+                outcome = ResilientStream(response, iterator, None, has_first=False)
+            if self.abandoned:
+                cancel_upstream(response)  # Lost the race or timed out while we were blocked
+                return
+            self.results.put(("first", self, outcome))
+        except Exception as e:
+            self.results.put(("error", self, e))
+
+    def abandon(self):
+        self.abandoned = True
+        if self.response is not None:
+            cancel_upstream(self.response)
+
+
+class ResiliencePolicy:
+    def __init__(self, connect_timeout=10.0, first_token_timeout=20.0, max_retries=2,
+                 backoff_base=0.25, backoff_max=4.0, hedge=False, hedge_percentile=95,
+                 hedge_min_samples=20, breaker=None, rng=None, sleep=time.sleep):
+        """
+        Initializes the policy.
+        :param connect_timeout: Seconds allowed for the call to return a stream.
+        :param first_token_timeout: Seconds (from the start of the attempt) allowed for the first chunk.
+        :param max_retries: Extra attempts for retryable errors, all before the first token.
+        :param backoff_base: Base of the exponential backoff; each wait is uniform in
+                             [0, min(backoff_max, backoff_base * 2**retry)] ("full jitter").
+        :param hedge: Start a second, identical attempt when the first token is slower than the
+                      observed hedge_percentile; whichever answers first wins.
+        :param hedge_min_samples: Latency samples needed before hedging kicks in.
+        :param breaker: CircuitBreaker to use (a default one is created if omitted). Each call
+                        is admitted once and records one outcome: success at its first token, or
+                        failure once its retries are used up (a cancelled call records none and
+                        gives its slot back). Hedges need the breaker's admission too, so they
+                        never exceed its half-open trial calls.
+        """
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._rng = rng or random.Random()
+        self._sleep = sleep
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def stats(self):
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            "circuit": self.breaker.stats(),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "ttft_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+        }
+
+    def backoff(self, retry):
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+
+    def hedge_delay(self):
+        """Seconds after which a hedge is launched, or None if hedging is off or not yet calibrated."""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open; failing fast.")
+
+    def _admit_hedge(self):
+        try:
+            self._admit()
+        except CircuitOpenError:
+            logger.info("Not sending a hedged request: the circuit breaker isn't admitting calls.")
+            return False
+        self.hedges += 1
+        logger.info(f"First token slower than p{self.hedge_percentile}; sending a hedged request.")
+        return True
+
+    def _on_attempt_failed(self, error):
+        if isinstance(error, UpstreamTimeout):
+            self.timeouts += 1
+
+    def _on_first_token(self, started_at, hedged_winner):
+        self.breaker.record_success()
+        self.latency.record(time.monotonic() - started_at)
+        if hedged_winner:
+            self.hedge_wins += 1
+
+    def _should_retry(self, error, retry):
+        if retry >= self.max_retries or not is_retryable(error):
+            self.failures += 1
+            self.breaker.record_failure()
+            return False
+        self.retries += 1
+        return True
+
+    # --- Sync ---
+    def open_stream(self, start_call):
+        """
+        Calls start_call() (which must return a chunk iterable, e.g. generate_content(stream=True))
+        under the policy. Blocks until the first chunk has arrived and returns a ResilientStream.
+        :raises CircuitOpenError: While the breaker is open.
+        :raises Exception: The last attempt's error once retries are exhausted.
+        """
+        self._admit()
+        retry = 0
+        try:
+            while True:
+                try:
+                    return self._race(start_call)
+                except Exception as e:
+                    if not self._should_retry(e, retry):
+                        raise
+                    delay = self.backoff(retry)
+                    retry += 1
+                    logger.warning(f"Retrying Gemini call in {delay:.2f}s (retry {retry}/{self.max_retries}) after: {e}")
+                    self._sleep(delay)
+        except Exception:
+            raise  # Already recorded as a failure by _should_retry
+        except BaseException:
+            self.breaker.release()  # Interrupted without an outcome; the breaker slot goes back
+            raise
+
+    def _deadline(self, attempt):
+        timeout = self.first_token_timeout if attempt.connected else self.connect_timeout
+        return attempt.started_at + timeout
+
+    def _race(self, start_call):
+        results = queue.Queue()
+        active = []
+
+        def launch():
+            attempt = _Attempt(start_call, results)
+            active.append(attempt)
+            attempt.start()
+            return attempt
+
+        primary = launch()
+        hedge_delay = self.hedge_delay()
+        hedge_at = primary.started_at + hedge_delay if hedge_delay is not None else None
+        last_error = None
+        while active:
+            wake = min(self._deadline(attempt) for attempt in active)
+            if hedge_at is not None:
+                wake = min(wake, hedge_at)
+            try:
+                kind, attempt, payload = results.get(timeout=max(wake - time.monotonic(), 0.0))
+            except queue.Empty:
+                now = time.monotonic()
+                for attempt in list(active):
+                    if now >= self._deadline(attempt):
+                        phase = "first token" if attempt.connected else "connect"
+                        last_error = UpstreamTimeout(f"Gemini {phase} timed out.")
+                        attempt.abandon()
+                        active.remove(attempt)
+                        self._on_attempt_failed(last_error)
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if active and self._admit_hedge():
+                        launch()
+                continue
+
+            if attempt.abandoned or attempt not in active:
+                continue
+            if kind == "connected":
+                attempt.connected = True
+            elif kind == "first":
+                for other in active:
+                    if other is not attempt:
+                        other.abandon()
+                self._on_first_token(primary.started_at, attempt is not primary)
+                return payload
+            else:
+                active.remove(attempt)
+                last_error = payload
+                self._on_attempt_failed(payload)
+        raise last_error
+
+    # --- Async ---
+    async def aopen_stream(self, start_call):
+        """
+        Async variant of open_stream; start_call() must return an awaitable resolving to an
+        async-iterable stream (e.g. generate_content_async(stream=True)).
+        """
+        self._admit()
+        retry = 0
+        try:
+            while True:
+                try:
+                    return await self._arace(start_call)
+                except Exception as e:
+                    if not self._should_retry(e, retry):
+                        raise
+                    delay = self.backoff(retry)
+                    retry += 1
+                    logger.warning(f"Retrying Gemini call in {delay:.2f}s (retry {retry}/{self.max_retries}) after: {e}")
+                    await asyncio.sleep(delay)
+        except Exception:
+            raise  # Already recorded as a failure by _should_retry
+        except BaseException:
+            # Cancelled (client gone, deadline), possibly while backing off: no outcome to record,
+            # but the breaker slot must go back
+            self.breaker.release()
+            raise
+
+    async def _afirst(self, start_call):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        try:
+            response = await asyncio.wait_for(start_call(), timeout=self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout("Gemini connect timed out.")
+        iterator = response.__aiter__()
+        remaining = max(self.first_token_timeout - (loop.time() - started_at), 0.0)
+        try:
+            first = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+        except StopAsyncIteration:
+            return AsyncResilientStream(response, iterator, None, has_first=False)
+        except asyncio.TimeoutError:
+            cancel_upstream(response)
+            raise UpstreamTimeout("Gemini first token timed out.")
+        return AsyncResilientStream(response, iterator, first)
+
+    async def _arace(self, start_call):
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(self._afirst(start_call))
+        active = {primary}
+        hedge_delay = self.hedge_delay()
+        hedged = 0
+        last_error = None
+        try:
+            while active:
+                done, _ = await asyncio.wait(active, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_delay = None
+                    if self._admit_hedge():
+                        hedged += 1
+                        active.add(asyncio.ensure_future(self._afirst(start_call)))
+                    continue
+                winner = next((task for task in done if task.exception() is None), None)
+                for task in done:
+                    active.discard(task)
+                    if task is winner:
+                        continue
+                    if task.exception() is None:
+                        task.result().cancel()  # Both attempts answered at once; keep one
+                    else:
+                        last_error = task.exception()
+                        self._on_attempt_failed(last_error)
+                if winner is not None:
+                    self._on_first_token(started_at, winner is not primary)
+                    return winner.result()
+            raise last_error
+        except Exception:
+            raise
+        except BaseException:
+            self.breaker.release(hedged)  # Cancelled: the hedges' slots go back (aopen_stream gives back the primary's)
+            raise
+        finally:
+            for task in active:
+                task.cancel()
+            if active:
+                await asyncio.gather(*active, return_exceptions=True)
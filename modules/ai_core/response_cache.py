@@ -0,0 +1,177 @@
+# modules/ai_core/response_cache.py
+# Exact-match response cache in front of GeminiClient.
+# Keys are hashes of (model, system instruction, normalized prompt, generation config, history);
+# entries are the streamed chunk texts so hits replay through the same generator interface.
+# With a shared store (see modules/context/shared_store.py) the cache has a second level that
+# every worker process reads and writes, so a reply generated by one worker is a hit in all.
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?,;:]+$")
+
+
+class CachedChunk:
+    """A replayed chunk; exposes .text like the SDK's streamed chunks."""
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f"CachedChunk({self.text!r})"
+
+
+def normalize_prompt(text):
+    """Lowercases, collapses whitespace and drops trailing punctuation: 'Hi!! ' -> 'hi'."""
+    text = _WHITESPACE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def _content_texts(entry):
+    return [part.get('text', '') for part in entry.get('parts', [])]
+
+
+def split_prompt(prompt):
+    """
+    Splits a prompt into (normalized latest user text, earlier history).
+    Accepts a plain string or a Gemini contents list.
+    """
+    if isinstance(prompt, str):
+        return normalize_prompt(prompt), []
+    if not prompt:
+        return "", []
+    *history, latest = prompt
+    latest_text = normalize_prompt(" ".join(_content_texts(latest)))
+    return latest_text, [(entry.get('role'), _content_texts(entry)) for entry in history]
+
+
+def make_cache_key(model_name, system_instruction, prompt, generation_config=None):
+    """Returns a hex digest identifying a request for caching and request coalescing."""
+    latest_text, history = split_prompt(prompt)
+    material = json.dumps(
+        [model_name, system_instruction or "", latest_text, generation_config or {}, history],
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    NAMESPACE = "responses"
+
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024, ttl_seconds=3600,
+                 max_temperature=1.0, clock=time.monotonic, shared_store=None):
+        """
+        Initializes the response cache.
+        :param max_entries: Maximum number of cached responses (LRU beyond that).
+        :param max_bytes: Cap on the total UTF-8 size of cached response text.
+        :param ttl_seconds: How long a cached response stays valid (None disables expiry).
+        :param max_temperature: Requests with a higher temperature bypass the cache, since the
+                                caller is asking for varied output.
+        :param clock: Monotonic time source (injectable for tests).
+        :param shared_store: Optional shared store consulted on a local miss; every put is
+                             written to it too (expiring after ttl_seconds).
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (chunks, size_bytes, stored_at), oldest first
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+        self.shared_store = shared_store
+        self.shared_hits = 0
+
+    def should_bypass(self, generation_config):
+        """True if the request's temperature is above the caching threshold."""
+        temperature = (generation_config or {}).get("temperature")
+        if temperature is not None and temperature > self.max_temperature:
+            self.bypasses += 1
+            return True
+        return False
+
+    def get(self, key):
+        """Returns the cached list of chunk texts for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and self._clock() - entry[2] > self.ttl_seconds:
+                self._remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        shared = self.shared_store.get(self.NAMESPACE, key) if self.shared_store is not None else None
+        with self._lock:
+            if shared is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+        chunks = tuple(json.loads(shared[1]))
+        self._store(key, chunks)
+        return chunks
+
+    def put(self, key, chunks):
+        """Stores the chunk texts of a complete response, evicting LRU entries to stay under the caps."""
+        chunks = tuple(chunks)
+        if not self._store(key, chunks):
+            return False
+        if self.shared_store is not None:
+            self.shared_store.put(self.NAMESPACE, key, json.dumps(chunks, ensure_ascii=False), self.ttl_seconds)
+        return True
+
+    def _store(self, key, chunks):
+        size = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (len(self._entries) >= self.max_entries or self.current_bytes + size > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+            self._entries[key] = (chunks, size, self._clock())
+            self.current_bytes += size
+        return True
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bypasses": self.bypasses,
+            "shared_hits": self.shared_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,235 @@
+# modules/ai_core/router.py
+# Routes each chat request to one of several Gemini models.
+# Short chit-chat goes to the fastest model, long or complex prompts to the larger one; within a
+# tier the model with the lowest observed first-token latency (EWMA) and cost wins. Errors and
+# blocked/empty replies before the first token fail over to the next model; an error also counts
+# as a slow first token, so a failing model drops down the plan.
+
+import logging
+import re
+import threading
+import time
+
+from ..context.tokens import estimate_tokens
+from .response_cache import CachedChunk, _content_texts
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+LARGE_TIER = "large"
+
+# Cues that a prompt asks for reasoning rather than chit-chat
+_COMPLEXITY_CUES = re.compile(
+    r"\b(why|explain|analy[sz]e|compare|contrast|derive|prove|design|architecture|algorithm|"
+    r"step[- ]by[- ]step|trade-?offs?|evaluate|optimi[sz]e|debug|implement|plan|strategy|summari[sz]e)\b",
+    re.IGNORECASE)
+_CODE_CUES = re.compile(r"```|\bdef |\bclass |\bfunction\b|[{};]\s*$", re.MULTILINE)
+
+
+def prompt_text(prompt):
+    """All text in a prompt (plain string or Gemini contents list)."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(text for entry in prompt or [] for text in _content_texts(entry))
+
+
+def latest_user_text(prompt):
+    if isinstance(prompt, str):
+        return prompt
+    return " ".join(_content_texts(prompt[-1])) if prompt else ""
+
+
+def estimate_complexity(text):
+    """
+    Rough 0..1 score of how much reasoning a message asks for: reasoning cue words, code,
+    several questions at once and sheer length all push it up.
+    """
+    if not text:
+        return 0.0
+    score = 0.25 * min(len(_COMPLEXITY_CUES.findall(text)), 2)
+    if _CODE_CUES.search(text):
+        score += 0.4
+    if text.count("?") > 1:
+        score += 0.15
+    score += min(len(text) / 2000, 0.3)
+    return min(score, 1.0)
+
+
+def _chunk_text(chunk):
+    # The SDK's chunk.text raises ValueError for blocked candidates, so don't use getattr
+    try:
+        return chunk.text
+    except (AttributeError, ValueError):
+        return None
+
+
+class ModelRoute:
+    def __init__(self, name, client, tier=FAST_TIER, expected_ttft_ms=1000.0, cost_per_million_tokens=0.0):
+        """
+        One model in the pool.
+        :param client: GeminiClient (or anything with the same generate_response/agenerate_response).
+        :param tier: FAST_TIER or LARGE_TIER.
+        :param expected_ttft_ms: Prior first-token latency, used until real samples arrive.
+        :param cost_per_million_tokens: Relative price; breaks ties between equally fast models.
+        """
+        self.name = name
+        self.client = client
+        self.tier = tier
+        self.cost_per_million_tokens = cost_per_million_tokens
+        self.ewma_ttft = expected_ttft_ms / 1000
+        self.requests = 0
+        self.failures = 0
+
+    def available(self):
+        """False while the client's circuit breaker is open."""
+        resilience = getattr(self.client, "resilience", None)
+        return resilience is None or resilience.breaker.state != "open"
+
+    def stats(self):
+        return {
+            "tier": self.tier,
+            "ewma_ttft_ms": round(self.ewma_ttft * 1000, 2),
+            "requests": self.requests,
+            "failures": self.failures,
+            "available": self.available(),
+            "ready": getattr(self.client, "ready", True),
+        }
+
+
+class ModelRouter:
+    def __init__(self, routes, long_prompt_tokens=1500, complexity_threshold=0.5, ewma_alpha=0.2,
+                 failure_penalty_seconds=20.0):
+        """
+        Initializes the router.
+        :param routes: List of ModelRoute, in no particular order.
+        :param long_prompt_tokens: Prompts (including history) at or above this go to the large tier.
+        :param complexity_threshold: Latest messages scoring at or above this go to the large tier.
+        :param ewma_alpha: Weight of the newest latency sample in each model's EWMA.
+        :param failure_penalty_seconds: Latency sample recorded for an error before the first token
+                                        (or the time it took to fail, if longer), e.g. the first-token
+                                        timeout. Blocked/empty replies depend on the prompt and add none.
+        """
+        if not routes:
+            raise ValueError("ModelRouter needs at least one route.")
+        self.routes = list(routes)
+        self.long_prompt_tokens = long_prompt_tokens
+        self.complexity_threshold = complexity_threshold
+        self.ewma_alpha = ewma_alpha
+        self.failure_penalty_seconds = failure_penalty_seconds
+        self._lock = threading.Lock()
+        self.failovers = 0
+
+    def wanted_tier(self, prompt):
+        tokens = estimate_tokens(prompt_text(prompt))
+        if tokens >= self.long_prompt_tokens:
+            return LARGE_TIER
+        if estimate_complexity(latest_user_text(prompt)) >= self.complexity_threshold:
+            return LARGE_TIER
+        return FAST_TIER
+
+    def plan(self, prompt):
+        """
+        Routes to try for this prompt, best first; unavailable models go last.
+        Chit-chat simply wants the fastest model right now (EWMA, then cost), whatever its tier;
+        long or complex prompts prefer the large tier.
+        """
+        wants_large = self.wanted_tier(prompt) == LARGE_TIER
+        return sorted(self.routes, key=lambda route: (
+            not route.available(),
+            wants_large and route.tier != LARGE_TIER,
+            route.ewma_ttft,
+            route.cost_per_million_tokens))
+
+    def _observe(self, route, ttft=None, failed=False):
+        with self._lock:
+            route.requests += 1
+            if failed:
+                route.failures += 1
+            if ttft is not None:
+                route.ewma_ttft += self.ewma_alpha * (ttft - route.ewma_ttft)
+
+    def _observe_first_token(self, route, chunk, started):
+        if isinstance(chunk, CachedChunk):
+            return  # Cache hits say nothing about the model's latency
+        self._observe(route, ttft=time.monotonic() - started)
+
+    def _failed_before_first_token(self, route, chunk, started, is_last):
+        penalty = None
+        if isinstance(chunk, str):  # An error (or timeout), not a blocked reply
+            penalty = max(time.monotonic() - started, self.failure_penalty_seconds)
+        self._observe(route, ttft=penalty, failed=True)
+        if is_last:
+            return False
+        self.failovers += 1
+        reason = chunk if isinstance(chunk, str) else "blocked or empty reply"
+        logger.warning(f"Model '{route.name}' failed before its first token ({reason}); failing over.")
+        return True
+
+    def generate_response(self, prompt, generation_config=None, safety_settings=None, stream=False):
+        """Same contract as GeminiClient.generate_response, spread over the model pool."""
+        routes = self.plan(prompt)
+        if not stream:
+            return routes[0].client.generate_response(prompt, generation_config, safety_settings, stream)
+        return self._stream(routes, prompt, generation_config, safety_settings)
+
+    def _stream(self, routes, prompt, generation_config, safety_settings):
+        for index, route in enumerate(routes):
+            is_last = index == len(routes) - 1
+            logger.info(f"Routing request to '{route.name}' ({route.tier}).")
+            started = time.monotonic()
+            upstream = route.client.generate_response(prompt, generation_config, safety_settings, stream=True)
+            emitted = False
+            try:
+                for chunk in upstream:
+                    if not emitted:
+                        if isinstance(chunk, str) or not _chunk_text(chunk):
+                            if self._failed_before_first_token(route, chunk, started, is_last):
+                                break
+                        else:
+                            emitted = True
+                            self._observe_first_token(route, chunk, started)
+                    yield chunk
+            finally:
+                upstream.close()
+            if emitted or is_last:
+                return
+
+    async def agenerate_response(self, prompt, generation_config=None, safety_settings=None):
+        """Async counterpart of generate_response(stream=True)."""
+        routes = self.plan(prompt)
+        for index, route in enumerate(routes):
+            is_last = index == len(routes) - 1
+            logger.info(f"Routing request to '{route.name}' ({route.tier}).")
+            started = time.monotonic()
+            upstream = route.client.agenerate_response(prompt, generation_config, safety_settings)
+            emitted = False
+            try:
+                async for chunk in upstream:
+                    if not emitted:
+                        if isinstance(chunk, str) or not _chunk_text(chunk):
+                            if self._failed_before_first_token(route, chunk, started, is_last):
+                                break
+                        else:
+                            emitted = True
+                            self._observe_first_token(route, chunk, started)
+                    yield chunk
+            finally:
+                await upstream.aclose()
+            if emitted or is_last:
+                return
+
+    @property
+    def ready(self):
+        """True once at least one model's client is built and can take requests without warm-up."""
+        return any(getattr(route.client, "ready", True) for route in self.routes)
+
+    def warm_up(self):
+        """Builds every route's model (see GeminiClient.warm_up). Returns True if any succeeded."""
+        results = [route.client.warm_up() for route in self.routes if hasattr(route.client, "warm_up")]
+        return any(results) or not results
+
+    def stats(self):
+        return {
+            "failovers": self.failovers,
+            "models": {route.name: route.stats() for route in self.routes},
+        }
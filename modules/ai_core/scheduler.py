@@ -0,0 +1,165 @@
+# modules/ai_core/scheduler.py
+# Bounded concurrency scheduler for async model streams.
+# Many in-flight streams share one event loop; at most max_concurrency hit the upstream at
+# once, a bounded wait queue absorbs bursts, and every request has a deadline. Waiting requests
+# are queued per tenant and slots are handed out round-robin between tenants, so one caller's
+# burst queues behind itself instead of in front of everyone else.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the wait queue is full and a new stream cannot be admitted."""
+
+
+class StreamDeadlineExceeded(Exception):
+    """Raised when a stream (including its time spent queued) runs past its deadline."""
+
+
+class StreamScheduler:
+    def __init__(self, max_concurrency=256, max_queue=1024, default_deadline=120.0, max_queue_per_tenant=None):
+        """
+        Initializes the scheduler.
+        :param max_concurrency: Maximum number of upstream streams running at the same time.
+        :param max_queue: Maximum number of requests waiting for a slot; beyond this new requests are rejected.
+        :param default_deadline: Seconds a request may spend queued plus streaming (None disables it).
+        :param max_queue_per_tenant: Maximum number of waiting requests of any one tenant (None: only max_queue applies).
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_deadline = default_deadline
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self._queues = OrderedDict()  # tenant -> deque of waiter futures; the next tenant to serve first
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def stats(self):
+        """Returns a snapshot of the scheduler counters."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_tenants": len(self._queues),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def check_admission(self, tenant=None):
+        """
+        Raises SchedulerOverloaded if a new stream would be rejected right now. Lets callers
+        answer 429 before committing to a streaming response.
+        """
+        if self.active < self.max_concurrency:
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerOverloaded(f"Stream queue is full ({self.max_queue} waiting).")
+        if self.max_queue_per_tenant is not None and len(self._queues.get(tenant, ())) >= self.max_queue_per_tenant:
+            self.rejected += 1
+            raise SchedulerOverloaded(f"Too many queued streams for this caller ({self.max_queue_per_tenant} waiting).")
+
+    async def _acquire(self, tenant, timeout):
+        if self.active < self.max_concurrency:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # Handed a slot just as we gave up: pass it on
+            else:
+                self._discard(tenant, waiter)
+            raise
+
+    def _discard(self, tenant, waiter):
+        queue = self._queues.get(tenant)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.queued -= 1
+        if not queue:
+            del self._queues[tenant]
+
+    def _release(self):
+        """Frees a slot, handing it straight to the next tenant's oldest waiter (round-robin)."""
+        self.active -= 1
+        while self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(tenant)
+            else:
+                del self._queues[tenant]
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+                return
+
+    async def stream(self, stream_factory, deadline=None, tenant=None):
+        """
+        Runs an async stream under the concurrency limit and yields its items.
+        :param stream_factory: Zero-argument callable returning an async iterator (e.g. a
+                               bound GeminiClient.agenerate_response call wrapped in a lambda).
+                               It is only invoked once a slot has been acquired.
+        :param deadline: Seconds allowed for queueing plus streaming; defaults to default_deadline.
+        :param tenant: Who the request is for (e.g. API key or client IP); waiting requests are
+                       served round-robin between tenants.
+        :raises SchedulerOverloaded: If the wait queue is already full.
+        :raises StreamDeadlineExceeded: If the deadline passes while queued or mid-stream.
+        """
+        self.check_admission(tenant)
+
+        deadline = self.default_deadline if deadline is None else deadline
+        expires_at = time.monotonic() + deadline if deadline else None
+
+        try:
+            await self._acquire(tenant, self._remaining(expires_at))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise StreamDeadlineExceeded("Deadline exceeded while waiting for a free stream slot.")
+
+        try:
+            upstream = stream_factory().__aiter__()
+        except BaseException:
+            self._release()
+            raise
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(upstream.__anext__(), timeout=self._remaining(expires_at))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    raise StreamDeadlineExceeded("Deadline exceeded while streaming the response.")
+                yield item
+            self.completed += 1
+        finally:
+            self._release()
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as e:
+                    logger.debug(f"Error closing upstream stream: {e}")
+
+    @staticmethod
+    def _remaining(expires_at):
+        if expires_at is None:
+            return None
+        return max(expires_at - time.monotonic(), 0.0)
@@ -0,0 +1,150 @@
+# modules/ai_core/semantic_cache.py
+# Near-duplicate response cache: serves "tell me a joke please" from the entry for "tell me a joke".
+# Prompt vectors live in one contiguous NumPy matrix and lookups are a single matrix-vector product.
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+from .embeddings import HashingEmbedder
+from .response_cache import split_prompt
+
+logger = logging.getLogger(__name__)
+
+
+def make_scope_id(model_name, system_instruction, history, generation_config=None):
+    """
+    64-bit ID for everything except the latest prompt text. Only entries with the same scope
+    (same model, persona, config and earlier conversation) are candidates for a match.
+    """
+    material = json.dumps([model_name, system_instruction or "", generation_config or {}, history],
+                          sort_keys=True, default=str, ensure_ascii=False)
+    return int.from_bytes(hashlib.sha256(material.encode("utf-8")).digest()[:8], "little", signed=True)
+
+
+class SemanticCache:
+    def __init__(self, embedder=None, capacity=10000, threshold=0.85, max_temperature=1.0, ttl_seconds=3600,
+                 clock=time.monotonic):
+        """
+        Initializes the semantic cache.
+        :param embedder: Object with embed(text) -> normalized float32 vector (defaults to HashingEmbedder).
+        :param capacity: Number of slots; once full, an expired slot or else the least recently
+                         used one is overwritten.
+        :param threshold: Minimum cosine similarity for a hit.
+        :param max_temperature: Requests with a higher temperature bypass the cache.
+        :param ttl_seconds: How long a cached response stays valid (None disables expiry); keep it
+                            in step with the exact-match ResponseCache so neither serves a reply
+                            the other has dropped.
+        :param clock: Monotonic time source (injectable for tests).
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.capacity = capacity
+        self.threshold = threshold
+        self.max_temperature = max_temperature
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        dim = self.embedder.dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._stored_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._responses = [None] * capacity
+        self._prompts = [None] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+
+    def __len__(self):
+        return self._size
+
+    def should_bypass(self, generation_config):
+        temperature = (generation_config or {}).get("temperature")
+        if temperature is not None and temperature > self.max_temperature:
+            self.bypasses += 1
+            return True
+        return False
+
+    def _query(self, model_name, system_instruction, prompt, generation_config):
+        latest_text, history = split_prompt(prompt)
+        scope = make_scope_id(model_name, system_instruction, history, generation_config)
+        return latest_text, scope
+
+    def _expired(self, n):
+        """Boolean mask of the first n slots whose entries are past ttl_seconds (None: no expiry)."""
+        if self.ttl_seconds is None:
+            return None
+        return self._clock() - self._stored_at[:n] > self.ttl_seconds
+
+    def search(self, vector, scope):
+        """
+        Returns (slot, similarity) of the best unexpired match in scope, or (None, 0.0).
+        Vectorized: one (n, dim) x (dim,) product plus masks, no Python loop over entries.
+        """
+        n = self._size
+        if n == 0:
+            return None, 0.0
+        similarities = self._vectors[:n] @ vector
+        similarities[self._scopes[:n] != scope] = -1.0
+        expired = self._expired(n)
+        if expired is not None:
+            similarities[expired] = -1.0
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+
+    def lookup(self, model_name, system_instruction, prompt, generation_config=None):
+        """Returns the cached chunk texts of the most similar prompt above threshold, or None."""
+        latest_text, scope = self._query(model_name, system_instruction, prompt, generation_config)
+        vector = self.embedder.embed(latest_text)
+        with self._lock:
+            slot, similarity = self.search(vector, scope)
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[slot] = self._clock()
+            self.hits += 1
+            logger.debug(f"Semantic cache hit for '{latest_text}' ~ '{self._prompts[slot]}' ({similarity:.3f}).")
+            return self._responses[slot]
+
+    def add(self, model_name, system_instruction, prompt, generation_config, chunks):
+        """Stores a complete response under the prompt's vector."""
+        latest_text, scope = self._query(model_name, system_instruction, prompt, generation_config)
+        if not latest_text:
+            return
+        self.add_vector(self.embedder.embed(latest_text), scope, latest_text, tuple(chunks))
+
+    def add_vector(self, vector, scope, prompt_text, chunks):
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                expired = self._expired(self.capacity)
+                last_used = self._last_used if expired is None else np.where(expired, -np.inf, self._last_used)
+                slot = int(np.argmin(last_used))
+                self.evictions += 1
+            now = self._clock()
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._responses[slot] = chunks
+            self._prompts[slot] = prompt_text
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bypasses": self.bypasses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
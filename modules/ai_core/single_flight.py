@@ -0,0 +1,209 @@
+# modules/ai_core/single_flight.py
+# Request coalescing for identical concurrent model calls.
+# The first request for a key starts the upstream stream; identical requests that arrive while
+# it is running subscribe to a fan-out buffer that replays the chunks received so far and then
+# tails new ones, so a burst of duplicates costs one upstream call.
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FanOutBuffer:
+    """Chunks of one upstream stream, readable by any number of subscribers (threads)."""
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def close(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def read(self, index):
+        """Blocks until chunk `index` exists; returns (True, chunk) or (False, None) at the end."""
+        with self._cond:
+            while index >= len(self.chunks) and not self.done:
+                self._cond.wait()
+            if index < len(self.chunks):
+                return True, self.chunks[index]
+            if self.error is not None:
+                raise self.error
+            return False, None
+
+
+class AsyncFanOutBuffer:
+    """Event-loop counterpart of FanOutBuffer for async subscribers."""
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()  # Waiters keep the event they were given
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def close(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self):
+        """Tracks in-flight upstream streams by key (see GeminiClient.cache_key)."""
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0    # Requests that opened an upstream stream
+        self.followers = 0  # Requests served from another request's stream
+        self.abandoned = 0  # Upstream streams cancelled because every subscriber left
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights) + len(self._async_flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "abandoned": self.abandoned,
+        }
+
+    # --- Threaded callers (WSGI) ---
+    def stream(self, key, upstream_factory):
+        """
+        Returns an iterator over the upstream chunks for key.
+        :param upstream_factory: Zero-argument callable returning the upstream iterator; only
+                                 called by the first request for key. A pump thread drives it,
+                                 so a leader that disconnects doesn't stall its followers.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = FanOutBuffer()
+                self._flights[key] = flight
+                self.leaders += 1
+            else:
+                self.followers += 1
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, upstream_factory),
+                             name="guru-single-flight", daemon=True).start()
+        else:
+            logger.info("Coalescing identical in-flight request onto the running upstream stream.")
+        return self._subscribe(flight)
+
+    def _subscribe(self, flight):
+        index = 0
+        try:
+            while True:
+                more, chunk = flight.read(index)
+                if not more:
+                    return
+                index += 1
+                yield chunk
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+
+    def _pump(self, key, flight, upstream_factory):
+        upstream, error = None, None
+        try:
+            upstream = upstream_factory()
+            for chunk in upstream:
+                flight.publish(chunk)
+                with self._lock:
+                    if flight.subscribers == 0:
+                        # Removing the flight under the lock means no new subscriber can join a
+                        # stream that is about to be cut short.
+                        del self._flights[key]
+                        self.abandoned += 1
+                        logger.info("Every subscriber left; cancelling coalesced upstream stream.")
+                        break
+        except Exception as e:
+            logger.error(f"Error in coalesced upstream stream: {e}", exc_info=True)
+            error = e
+        finally:
+            close = getattr(upstream, "close", None)
+            if close is not None:
+                close()  # Cancels the model stream if we stopped early; no-op once it finished
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.close(error)
+
+    # --- Async callers (ASGI) ---
+    async def astream(self, key, upstream_factory):
+        """
+        Async variant of stream(); all callers must share one event loop.
+        The upstream runs in its own task and is cancelled as soon as the last subscriber leaves.
+        """
+        flight = self._async_flights.get(key)
+        if flight is None:
+            flight = AsyncFanOutBuffer()
+            self._async_flights[key] = flight
+            self.leaders += 1
+            flight.task = asyncio.ensure_future(self._apump(key, flight, upstream_factory))
+        else:
+            self.followers += 1
+            logger.info("Coalescing identical in-flight request onto the running upstream stream.")
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                if self._async_flights.get(key) is flight:
+                    del self._async_flights[key]
+                self.abandoned += 1
+                logger.info("Every subscriber left; cancelling coalesced upstream stream.")
+                flight.task.cancel()
+                await asyncio.gather(flight.task, return_exceptions=True)
+
+    async def _apump(self, key, flight, upstream_factory):
+        upstream, error = upstream_factory(), None
+        try:
+            async for chunk in upstream:
+                flight.publish(chunk)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error in coalesced upstream stream: {e}", exc_info=True)
+            error = e
+        finally:
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if self._async_flights.get(key) is flight:
+                del self._async_flights[key]
+            flight.close(error)
@@ -0,0 +1,298 @@
+# modules/ai_core/sse.py
+# Server-Sent Events framing for streamed chat replies.
+# Turns a stream of (event, payload) pairs into framed SSE text: tiny token chunks are
+# coalesced into larger frames, keepalive comments are sent while the upstream is quiet,
+# and an abandoned stream stops its producer so the model call is cancelled.
+# Producer and writer are joined by a small bounded queue, so a slow client slows down reading
+# from the model instead of having the whole reply buffered for it.
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_FRAME = ": keepalive\n\n"
+# How often a producer blocked on a full queue checks whether the client has gone away
+CANCEL_POLL_SECONDS = 0.05
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+
+def format_sse(event, data, event_id=None):
+    """Formats one SSE frame; data is JSON-encoded so newlines in text can't break framing."""
+    frame = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{frame}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class SSEFrameBuilder:
+    def __init__(self, flush_bytes=64, flush_interval=0.05, clock=time.monotonic):
+        """
+        Builds SSE frames and tracks per-stream metrics.
+        :param flush_bytes: Buffered token text is sent once it reaches this many bytes...
+        :param flush_interval: ...or once the oldest buffered text is this many seconds old.
+        """
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        self._next_id = 0
+        self.started_at = clock()
+        self.first_token_at = None
+        self.chunks = 0
+        self.bytes = 0
+        self.frames = 0
+        self.errors = 0
+
+    def _frame(self, event, data):
+        self._next_id += 1
+        self.frames += 1
+        return format_sse(event, data, self._next_id)
+
+    def add_token(self, text):
+        """Buffers token text; returns a frame if the buffer should be flushed, else None."""
+        now = self._clock()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        size = len(text.encode("utf-8"))
+        self.chunks += 1
+        self.bytes += size
+        if not self._buffer:
+            self._buffer_started = now
+        self._buffer.append(text)
+        self._buffer_bytes += size
+        if self._buffer_bytes >= self.flush_bytes or now - self._buffer_started >= self.flush_interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Returns a token frame for everything buffered (or None if empty)."""
+        if not self._buffer:
+            return None
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        return self._frame("token", {"text": text})
+
+    def flush_timeout(self):
+        """Seconds until buffered text must be flushed (None if nothing is buffered)."""
+        if self._buffer_started is None:
+            return None
+        return max(self.flush_interval - (self._clock() - self._buffer_started), 0.0)
+
+    def event(self, event, data):
+        """Frames a non-token event, flushing buffered tokens first so order is preserved."""
+        if event == "error":
+            self.errors += 1
+        pending = self.flush() or ""
+        return pending + self._frame(event, data)
+
+    def metrics(self):
+        now = self._clock()
+        return {
+            "ttft_ms": round((self.first_token_at - self.started_at) * 1000, 2) if self.first_token_at else None,
+            "total_ms": round((now - self.started_at) * 1000, 2),
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "frames": self.frames,
+        }
+
+    def finish(self):
+        """Frames the closing metrics and done events."""
+        closing = self.event("metrics", self.metrics())
+        return closing + self._frame("done", {})
+
+    def outcome(self, finished):
+        if not finished:
+            return "disconnected"
+        return "error" if self.errors else "completed"
+
+
+def queue_size(flush_bytes):
+    """
+    Events held between producer and writer: about one frame's worth of small token chunks
+    (a chunk is rarely under 8 bytes), and never fewer than a handful.
+    """
+    return max(4, flush_bytes // 8)
+
+
+def _report(on_finish, builder, finished):
+    if on_finish is None:
+        return
+    try:
+        on_finish(builder.metrics(), builder.outcome(finished))
+    except Exception as e:
+        logger.error(f"Error in SSE on_finish callback: {e}", exc_info=True)
+
+
+def _close_quietly(iterator):
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            logger.debug(f"Error closing event source: {e}")
+
+
+def stream_sse(events, heartbeat_interval=15.0, flush_bytes=64, flush_interval=0.05, on_finish=None):
+    """
+    Sync SSE driver for WSGI. A producer thread pulls (event, payload) pairs from `events` so
+    this generator can emit keepalives while the model is quiet. The producer stops pulling
+    while queue_size(flush_bytes) events wait to be written. When the client goes away the
+    server closes this generator; the producer notices within CANCEL_POLL_SECONDS (or as soon as
+    the model's next chunk arrives, if it is waiting for one) and closes `events`, which closes
+    the upstream model stream instead of letting it run to completion.
+    :param on_finish: Optional callback(metrics dict, outcome) run once the stream ends, where
+                      outcome is "completed", "error" or "disconnected".
+    """
+    builder = SSEFrameBuilder(flush_bytes=flush_bytes, flush_interval=flush_interval)
+    items = queue.Queue(maxsize=queue_size(flush_bytes))
+    cancelled = threading.Event()
+    _END = object()
+
+    def put(item):
+        # Waits for room in the queue; False once the client has gone away
+        while not cancelled.is_set():
+            try:
+                items.put(item, timeout=CANCEL_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in events:
+                if not put(item):
+                    logger.info("Client disconnected; cancelling upstream stream.")
+                    break
+        except Exception as e:
+            logger.error(f"Error producing SSE events: {e}", exc_info=True)
+            put(("error", {"message": f"Error: Could not stream AI response. {str(e)}"}))
+        finally:
+            _close_quietly(events)
+            put(_END)
+
+    threading.Thread(target=produce, name="guru-sse-producer", daemon=True).start()
+    last_write = time.monotonic()
+    finished = False
+    try:
+        while True:
+            flush_timeout = builder.flush_timeout()
+            heartbeat_timeout = max(heartbeat_interval - (time.monotonic() - last_write), 0.0)
+            timeout = heartbeat_timeout if flush_timeout is None else min(flush_timeout, heartbeat_timeout)
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                frame = builder.flush() if builder.flush_timeout() == 0.0 else None
+                if frame is None and time.monotonic() - last_write >= heartbeat_interval:
+                    frame = KEEPALIVE_FRAME
+                if frame:
+                    last_write = time.monotonic()
+                    yield frame
+                continue
+
+            if item is _END:
+                finished = True
+                yield builder.finish()
+                return
+            event, payload = item
+            frame = builder.add_token(payload) if event == "token" else builder.event(event, payload)
+            if frame:
+                last_write = time.monotonic()
+                yield frame
+    finally:
+        cancelled.set()
+        _report(on_finish, builder, finished)
+
+
+async def astream_sse(events, heartbeat_interval=15.0, flush_bytes=64, flush_interval=0.05, disconnected=None,
+                      on_finish=None):
+    """
+    Async SSE driver for ASGI; same framing and bounded queue as stream_sse.
+    :param events: Async iterator of (event, payload) pairs.
+    :param disconnected: Optional asyncio.Event set when the client goes away; the producer task
+                         is then cancelled, which cancels the upstream model stream.
+    :param on_finish: As for stream_sse.
+    """
+    builder = SSEFrameBuilder(flush_bytes=flush_bytes, flush_interval=flush_interval)
+    items = asyncio.Queue(maxsize=queue_size(flush_bytes))
+    _END = object()
+
+    async def produce():
+        # Not in a finally: once cancelled (client gone), a put on a full queue would never return
+        try:
+            async for item in events:
+                await items.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error producing SSE events: {e}", exc_info=True)
+            await items.put(("error", {"message": f"Error: Could not stream AI response. {str(e)}"}))
+        await items.put(_END)
+
+    producer = asyncio.ensure_future(produce())
+    watcher = asyncio.ensure_future(disconnected.wait()) if disconnected is not None else None
+    loop = asyncio.get_running_loop()
+    last_write = loop.time()
+    finished = False
+    try:
+        while True:
+            flush_timeout = builder.flush_timeout()
+            heartbeat_timeout = max(heartbeat_interval - (loop.time() - last_write), 0.0)
+            timeout = heartbeat_timeout if flush_timeout is None else min(flush_timeout, heartbeat_timeout)
+            getter = asyncio.ensure_future(items.get())
+            waiting = {getter} if watcher is None else {getter, watcher}
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if watcher is not None and watcher in done:
+                getter.cancel()
+                logger.info("Client disconnected; cancelling upstream stream.")
+                return
+            if getter not in done:
+                getter.cancel()
+                frame = builder.flush() if builder.flush_timeout() == 0.0 else None
+                if frame is None and loop.time() - last_write >= heartbeat_interval:
+                    frame = KEEPALIVE_FRAME
+                if frame:
+                    last_write = loop.time()
+                    yield frame
+                continue
+
+            item = getter.result()
+            if item is _END:
+                finished = True
+                yield builder.finish()
+                return
+            event, payload = item
+            frame = builder.add_token(payload) if event == "token" else builder.event(event, payload)
+            if frame:
+                last_write = loop.time()
+                yield frame
+    finally:
+        # A cancellation can be lost inside the event source (on Python < 3.12 asyncio.wait_for
+        # drops one that arrives as its inner await completes), so it is repeated until the
+        # producer has stopped, instead of leaving it blocked on the full queue
+        while not producer.done():
+            producer.cancel()
+            await asyncio.wait({producer}, timeout=CANCEL_POLL_SECONDS)
+        if not producer.cancelled():
+            producer.exception()  # Retrieved so it isn't logged as never retrieved
+        # Cancelled while waiting on the queue, the producer leaves `events` suspended rather
+        # than closed; close it now so the upstream stream is cancelled, not left to the GC
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception as e:
+                logger.debug(f"Error closing event source: {e}")
+        if watcher is not None and not watcher.done():
+            watcher.cancel()
+        _report(on_finish, builder, finished)
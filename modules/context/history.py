@@ -1,15 +1,56 @@
 # modules/context/history.py
 # Manages conversation history for short-term context.
+# Trimmed turns can be folded into a rolling summary (see summarizer.py), which is sent
+# ahead of the recent turns so long conversations keep their context at a bounded size.
+# get_state()/set_state() and the on_change callback let SharedSessionHistoryStore keep a
+# history in a store shared by several worker processes (see session_store.py).
+
+import logging
+import threading
+
+from .tokens import estimate_tokens
+from ..ai_core.processor import IncrementalContents
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "(Summary of our earlier conversation, for context)\n"
 
 class ConversationHistory:
-    def __init__(self, max_history_length=10):
+    def __init__(self, max_history_length=10, token_counter=None, max_tokens=None, summary_worker=None,
+                 contents_builder=None, on_change=None):
         """
         Initializes conversation history.
         :param max_history_length: Maximum number of turns to keep in history.
+        :param token_counter: Callable text -> token count (defaults to the offline estimate_tokens).
+        :param max_tokens: Optional token budget for the kept turns; older turns are trimmed
+                           beyond it (the newest turn is always kept).
+        :param summary_worker: Optional SummaryWorker; trimmed turns are folded into self.summary
+                               in the background instead of being dropped.
+        :param contents_builder: Optional IncrementalContents kept in step with the history, for
+                                 get_prompt_contents().
+        :param on_change: Optional callable (history, change), called with the history's lock
+                          held after every change: ("message", role, content),
+                          ("summary", summary, base_summary, folded_turns) or ("clear",).
         """
         self.history = []
         self.max_history_length = max_history_length
-        print(f"ConversationHistory initialized with max length: {max_history_length}")
+        self.token_counter = token_counter or estimate_tokens
+        self._token_counts = [] # Parallel to self.history; each message is counted once, on add
+        self.total_tokens = 0 # Running total over self.history
+        self._lock = threading.RLock()  # Concurrent requests in one session may append at once
+        self.max_tokens = max_tokens
+        self.summary_worker = summary_worker
+        self.summary = None  # Rolling summary of trimmed turns
+        self.summary_tokens = 0
+        self._evicted = []  # Trimmed turns not yet folded into the summary
+        self._folding = []  # Turns the running fold job took from _evicted
+        self._folding_base = None  # The summary that job is folding them into
+        self._summarizing = False  # A fold job is queued or running
+        self._generation = 0  # Bumped by clear_history so in-flight folds are discarded
+        self.contents_builder = contents_builder
+        self.on_change = on_change
+        self.store_version = None  # Version of the shared-store state this history matches (see session_store.py)
+        logger.debug(f"ConversationHistory initialized with max length: {max_history_length}")
 
     def add_message(self, role, content):
         """
@@ -20,52 +61,180 @@ class ConversationHistory:
         if role not in ['user', 'assistant', 'model']:
             raise ValueError("Role must be 'user', 'assistant', or 'model'.")
         
-        self.history.append({"role": role, "content": content})
-        self._trim_history()
+        token_count = self.token_counter(content)
+        with self._lock:
+            self.history.append({"role": role, "content": content})
+            self._token_counts.append(token_count)
+            self.total_tokens += token_count
+            if self.contents_builder is not None:
+                self.contents_builder.append(role, content)
+            self._trim_history()
+            if self.on_change is not None:
+                self.on_change(self, ("message", role, content))
 
     def get_history(self):
         """Returns the current conversation history."""
-        return list(self.history) # Return a copy
+        with self._lock:
+            return list(self.history) # Return a copy
 
     def _trim_history(self):
-        """Ensures history does not exceed max_history_length."""
-        if len(self.history) > self.max_history_length:
-            self.history = self.history[-self.max_history_length:]
-    
+        """Ensures history does not exceed max_history_length (or max_tokens); trimmed turns go to the summary."""
+        excess = max(len(self.history) - self.max_history_length, 0)
+        if self.max_tokens is not None:
+            remaining = self.total_tokens - sum(self._token_counts[:excess])
+            while remaining > self.max_tokens and excess < len(self.history) - 1:
+                remaining -= self._token_counts[excess]
+                excess += 1
+        if excess > 0:
+            self.total_tokens -= sum(self._token_counts[:excess])
+            if self.summary_worker is not None:
+                self._evicted.extend(self.history[:excess])
+                if not self._summarizing:
+                    self._summarizing = True
+                    self.summary_worker.submit(self)
+            del self.history[:excess]
+            del self._token_counts[:excess]
+            if self.contents_builder is not None:
+                self.contents_builder.trim(excess)
+
+    def _next_summary_batch(self):
+        """For SummaryWorker: (turns, summary, generation) to fold next, or None when done."""
+        with self._lock:
+            if not self._evicted:
+                self._summarizing = False
+                return None
+            turns, self._evicted = self._evicted, []
+            self._folding, self._folding_base = turns, self.summary
+            return turns, self.summary, self._generation
+
+    def _apply_summary(self, summary, generation):
+        token_count = self.token_counter(SUMMARY_PREFIX + summary) if summary else 0
+        with self._lock:
+            if generation == self._generation:
+                change = ("summary", summary, self._folding_base, self._folding)
+                self.summary = summary
+                self.summary_tokens = token_count
+                self._folding, self._folding_base = [], None
+                if self.on_change is not None:
+                    self.on_change(self, change)
+
     def clear_history(self):
         """Clears the conversation history."""
-        self.history = []
-        print("Conversation history cleared.")
+        with self._lock:
+            self.history = []
+            self._token_counts = []
+            self.total_tokens = 0
+            self.summary = None
+            self.summary_tokens = 0
+            self._evicted = []
+            self._folding, self._folding_base = [], None
+            self._generation += 1
+            if self.contents_builder is not None:
+                self.contents_builder.clear()
+            if self.on_change is not None:
+                self.on_change(self, ("clear",))
+        logger.debug("Conversation history cleared.")
+
+    def get_state(self):
+        """
+        The history as plain data (JSON-serializable) for a shared store: the kept messages,
+        the summary, and trimmed turns not folded into it yet (including any being folded now).
+        """
+        with self._lock:
+            return {"messages": list(self.history), "summary": self.summary,
+                    "pending": self._folding + self._evicted}
+
+    def set_state(self, state):
+        """
+        Replaces this history with a get_state() result (None: empty), e.g. one written by
+        another worker process. A fold job running here still applies its summary if the state
+        has the same summary and still has the turns it is folding pending; otherwise its
+        result is discarded. Pending turns are left to the worker that trimmed them (or folded
+        with this history's next trim). Doesn't call on_change.
+        """
+        messages = state["messages"] if state else []
+        summary = state["summary"] if state else None
+        pending = state["pending"] if state else []
+        token_counts = [self.token_counter(message["content"]) for message in messages]
+        summary_tokens = self.token_counter(SUMMARY_PREFIX + summary) if summary else 0
+        with self._lock:
+            if self._folding and (summary != self._folding_base or pending[:len(self._folding)] != self._folding):
+                self._folding, self._folding_base = [], None
+                self._generation += 1
+            self.history = list(messages)
+            self._token_counts = token_counts
+            self.total_tokens = sum(token_counts)
+            self.summary = summary
+            self.summary_tokens = summary_tokens
+            self._evicted = list(pending[len(self._folding):])
+            if self.contents_builder is not None:
+                self.contents_builder.clear()
+                for message in self.history:
+                    self.contents_builder.append(message["role"], message["content"])
+
+    # --- Context Window Management & Summarization ---
+    def get_context_window(self, max_tokens=1000, include_summary=True):
+        """
+        Returns the newest messages whose combined token count fits within max_tokens,
+        oldest first. Uses the counts cached at add time, so this is O(k) in the number
+        of messages returned. The newest message is always included, even if it alone
+        exceeds the budget.
+        If there is a rolling summary (and include_summary), it comes first as a user
+        message and its tokens count against max_tokens.
+        """
+        with self._lock:
+            if include_summary and self.summary:
+                summary_message = {"role": "user", "content": SUMMARY_PREFIX + self.summary}
+                return [summary_message] + self.get_context_window(max_tokens - self.summary_tokens, include_summary=False)
+            if self.total_tokens <= max_tokens:
+                return list(self.history)
+            used = 0
+            start = len(self.history)
+            while start > 0:
+                count = self._token_counts[start - 1]
+                if used + count > max_tokens and start < len(self.history):
+                    break
+                used += count
+                start -= 1
+            return self.history[start:]
 
-    # --- Context Window Management & Summarization (Placeholders) ---
-    def get_context_window(self, max_tokens=1000):
+    def get_prompt_contents(self, max_tokens=1000):
         """
-        Placeholder: Returns a part of the history that fits within a token limit.
-        Actual implementation would need a tokenizer.
+        Gemini `contents` for get_context_window(max_tokens), from the contents_builder.
+        When the whole history (plus summary) fits the budget - always, if max_tokens is at
+        least this history's max_tokens plus the summary budget - this is the builder's
+        pre-built snapshot, so its cost doesn't grow with the conversation. Otherwise (or
+        without a contents_builder) the window is converted message by message.
         """
-        # This is a very naive implementation based on message count.
-        # A real version needs token counting.
-        return self.get_history() 
+        with self._lock:
+            if self.contents_builder is None:
+                return IncrementalContents().from_messages(self.get_context_window(max_tokens))
+            if self.total_tokens + self.summary_tokens <= max_tokens:
+                return self.contents_builder.snapshot(SUMMARY_PREFIX + self.summary if self.summary else None)
+            return self.contents_builder.from_messages(self.get_context_window(max_tokens))
 
     def summarize_conversation(self):
         """
-        Placeholder: Summarizes older parts of the conversation.
-        This could involve calling an AI model.
+        Returns the rolling summary of the turns trimmed so far (None if nothing has been
+        summarized yet). Folding happens in the background as turns are trimmed, so the
+        newest trimmed turns may not be in it yet.
         """
-        if len(self.history) > 5: # Arbitrary threshold
-            return "Placeholder: Conversation is getting long, summary might be needed."
-        return None
+        with self._lock:
+            return self.summary
 
 if __name__ == '__main__':
-    hist = ConversationHistory(max_history_length=3)
+    from .summarizer import ExtractiveSummarizer, SummaryWorker
+    worker = SummaryWorker(ExtractiveSummarizer())
+    hist = ConversationHistory(max_history_length=3, summary_worker=worker)
     hist.add_message("user", "Hello GURU")
     hist.add_message("assistant", "Hi there! How can I help?")
     hist.add_message("user", "Tell me a joke.")
     print("History (1):", hist.get_history())
     hist.add_message("assistant", "Why did the scarecrow win an award? Because he was outstanding in his field!")
     print("History (2) (trimmed):", hist.get_history())
-    summary_needed = hist.summarize_conversation()
-    if summary_needed:
-        print(summary_needed)
+    hist.add_message("user", "My name is Alex and I am learning Python decorators for my Flask project.")
+    hist.add_message("assistant", "Nice to meet you, Alex! Decorators wrap a function to extend what it does.")
+    worker.wait()
+    print("Summary of trimmed turns:", hist.summarize_conversation())
     hist.clear_history()
     print("History (3) (cleared):", hist.get_history())
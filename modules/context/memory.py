@@ -1,60 +1,259 @@
 # modules/context/memory.py
 # For long-term storage and retrieval of important information.
+# Facts live in SQLite (WAL mode) with an FTS5 full-text index ranked by BM25.
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from .vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+_QUERY_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
+    key, value, content='facts', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS facts_ai AFTER INSERT ON facts BEGIN
+    INSERT INTO facts_fts(rowid, key, value) VALUES (new.id, new.key, new.value);
+END;
+CREATE TRIGGER IF NOT EXISTS facts_ad AFTER DELETE ON facts BEGIN
+    INSERT INTO facts_fts(facts_fts, rowid, key, value) VALUES ('delete', old.id, old.key, old.value);
+END;
+CREATE TRIGGER IF NOT EXISTS facts_au AFTER UPDATE ON facts BEGIN
+    INSERT INTO facts_fts(facts_fts, rowid, key, value) VALUES ('delete', old.id, old.key, old.value);
+    INSERT INTO facts_fts(rowid, key, value) VALUES (new.id, new.key, new.value);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO facts (key, value, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+"""
+
+
+def build_fts_query(query_text):
+    """
+    Turns free text into an FTS5 query: every word becomes a quoted prefix term, OR-ed
+    together, so 'meeting AI' matches 'important_meeting_date' and 'AI technology'.
+    Returns None if the text has no searchable words.
+    """
+    tokens = _QUERY_TOKEN_PATTERN.findall(query_text.lower())
+    terms = []
+    for token in tokens:
+        for word in token.split("_"):
+            if word and f'"{word}"*' not in terms:
+                terms.append(f'"{word}"*')
+    return " OR ".join(terms) if terms else None
+
+
+def fact_text(key, value):
+    """Text that represents a fact for embedding: key words plus the value."""
+    value_text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return f"{str(key).replace('_', ' ')}: {value_text}"
+
 
 class LongTermMemory:
-    def __init__(self, storage_path="long_term_memory.db"):
+    def __init__(self, storage_path="long_term_memory.db", embedder=None, vector_index=None):
         """
-        Initializes long-term memory.
-        Could use a simple file, a database (SQLite), or a vector DB.
-        :param storage_path: Path to where memory is stored.
+        Initializes long-term memory backed by SQLite.
+        Each thread gets its own connection; writes use WAL so readers never block on writers.
+        :param storage_path: Path of the SQLite database file (":memory:" for a private in-memory store).
+        :param embedder: Optional embedder (e.g. HashingEmbedder). When set, every fact is embedded
+                         once at store time and semantic_search_facts becomes available.
+        :param vector_index: Optional VectorIndex; defaults to a memory-mapped one at
+                             "<storage_path>.vectors" (in RAM for ":memory:") when an embedder is given.
         """
         self.storage_path = storage_path
-        self.memory_data = {} # Simplified in-memory storage for this example
-        print(f"LongTermMemory initialized. Storage (simulated): {storage_path}")
-        # self._load_memory() # In a real app
+        self.embedder = embedder
+        if embedder is not None and vector_index is None:
+            index_path = None if storage_path == ":memory:" else f"{storage_path}.vectors"
+            vector_index = VectorIndex(path=index_path, dim=embedder.dim)
+        self.vector_index = vector_index
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        if storage_path == ":memory:":
+            # A named shared-cache database so every thread's connection sees the same data;
+            # the anchor connection keeps it alive for the lifetime of this object.
+            self._uri = f"file:guru-ltm-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._uri = None
+        self._load_memory()
+        logger.info(f"LongTermMemory initialized. Storage: {storage_path}")
+
+    # --- Connection pool (one connection per thread) ---
+    def _connect(self):
+        if self._uri:
+            connection = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.storage_path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
 
+    def close(self):
+        """Closes every pooled connection (flushing the vector index first)."""
+        if self.vector_index is not None:
+            self.vector_index.flush()
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    # --- Facts ---
     def store_fact(self, key, value):
-        """Stores an important fact or piece of information."""
-        self.memory_data[key] = value
-        print(f"Stored fact: '{key}' -> '{value}'")
-        # self._save_memory() # In a real app
+        """Stores an important fact or piece of information (replacing any previous value for key)."""
+        self.store_facts([(key, value)])
+        logger.debug(f"Stored fact: '{key}' -> '{value}'")
+
+    def store_facts(self, facts):
+        """
+        Stores many facts in a single transaction.
+        :param facts: A dict or an iterable of (key, value) pairs.
+        :return: Number of facts written.
+        """
+        items = list(facts.items() if isinstance(facts, dict) else facts)
+        now = time.time()
+        rows = [(str(key), json.dumps(value, ensure_ascii=False, default=str), now) for key, value in items]
+        connection = self._connection()
+        with connection:
+            connection.executemany(_UPSERT, rows)
+        if self.vector_index is not None and items:
+            self._index_facts(items)
+        return len(rows)
+
+    def _index_facts(self, items):
+        latest = dict((str(key), value) for key, value in items)  # Last write wins, as in the upsert
+        keys = list(latest)
+        fact_ids = self._fact_ids(keys)
+        vectors = self.embedder.embed_batch([fact_text(key, latest[key]) for key in keys])
+        self.vector_index.add_batch([fact_ids[key] for key in keys], vectors)
+
+    def _fact_ids(self, keys, batch_size=500):
+        fact_ids = {}
+        connection = self._connection()
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            fact_ids.update(connection.execute(
+                f"SELECT key, id FROM facts WHERE key IN ({placeholders})", batch).fetchall())
+        return fact_ids
 
     def retrieve_fact(self, key):
         """Retrieves a fact by its key."""
-        return self.memory_data.get(key)
+        row = self._connection().execute("SELECT value FROM facts WHERE key = ?", (str(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_fact(self, key):
+        """Removes a fact; returns True if it existed."""
+        connection = self._connection()
+        with connection:
+            row = connection.execute("SELECT id FROM facts WHERE key = ?", (str(key),)).fetchone()
+            if row is None:
+                return False
+            connection.execute("DELETE FROM facts WHERE id = ?", row)
+        if self.vector_index is not None:
+            self.vector_index.remove(row[0])
+        return True
+
+    def count(self):
+        """Number of stored facts."""
+        return self._connection().execute("SELECT COUNT(*) FROM facts").fetchone()[0]
 
     def search_related_facts(self, query_text, top_k=3):
         """
-        Placeholder: Searches for facts related to a query.
-        Would typically involve embedding and similarity search for a real implementation.
+        Full-text search over fact keys and values, best BM25 match first.
+        Uses the FTS5 index, so cost grows with the number of matching rows, not the table size.
+        """
+        fts_query = build_fts_query(query_text or "")
+        if fts_query is None:
+            return []
+        rows = self._connection().execute(
+            """
+            SELECT facts.key, facts.value
+            FROM facts_fts JOIN facts ON facts.id = facts_fts.rowid
+            WHERE facts_fts MATCH ?
+            ORDER BY bm25(facts_fts)
+            LIMIT ?
+            """,
+            (fts_query, top_k)
+        ).fetchall()
+        return [{"key": key, "value": json.loads(value)} for key, value in rows]
+
+    def semantic_search_facts(self, query_text, top_k=3, nprobe=None):
+        """
+        Embedding similarity search over facts, most similar first.
+        Each result also carries its cosine "score".
         """
-        # Very naive keyword search for demonstration
-        results = []
-        for key, value in self.memory_data.items():
-            if query_text.lower() in key.lower() or query_text.lower() in str(value).lower():
-                results.append({"key": key, "value": value})
-            if len(results) >= top_k:
+        if self.vector_index is None:
+            raise RuntimeError("semantic_search_facts needs LongTermMemory(embedder=...).")
+        if not query_text or not query_text.strip():
+            return []
+        hits = self.vector_index.search(self.embedder.embed(query_text), top_k=top_k, nprobe=nprobe)
+        if not hits:
+            return []
+        placeholders = ",".join("?" * len(hits))
+        rows = dict((fact_id, (key, value)) for fact_id, key, value in self._connection().execute(
+            f"SELECT id, key, value FROM facts WHERE id IN ({placeholders})", [fact_id for fact_id, _ in hits]))
+        return [{"key": rows[fact_id][0], "value": json.loads(rows[fact_id][1]), "score": score}
+                for fact_id, score in hits if fact_id in rows]
+
+    def rebuild_vector_index(self, batch_size=10000):
+        """Re-embeds every stored fact (e.g. after switching embedders or importing facts without one)."""
+        if self.vector_index is None:
+            raise RuntimeError("rebuild_vector_index needs LongTermMemory(embedder=...).")
+        cursor = self._connection().execute("SELECT id, key, value FROM facts")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
                 break
-        return results
+            vectors = self.embedder.embed_batch([fact_text(key, json.loads(value)) for _, key, value in rows])
+            self.vector_index.add_batch([fact_id for fact_id, _, _ in rows], vectors)
+        self.vector_index.flush()
 
     def _load_memory(self):
-        """Placeholder for loading memory from persistent storage."""
-        # Example: if os.path.exists(self.storage_path): load data
-        print(f"Attempting to load memory from {self.storage_path} (simulated).")
-        pass
+        """Opens the database and creates the schema if needed."""
+        connection = self._connection()
+        with connection:
+            connection.executescript(_SCHEMA)
 
     def _save_memory(self):
-        """Placeholder for saving memory to persistent storage."""
-        # Example: with open(self.storage_path, 'w') as f: json.dump(self.memory_data, f)
-        print(f"Attempting to save memory to {self.storage_path} (simulated).")
-        pass
+        """Writes are committed per transaction; this folds the WAL back into the main file."""
+        if not self._uri:
+            self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+        if self.vector_index is not None:
+            self.vector_index.flush()
 
 if __name__ == '__main__':
     ltm = LongTermMemory()
     ltm.store_fact("user_name", "Aryaman")
     ltm.store_fact("user_preference_topic", "AI technology")
     ltm.store_fact("important_meeting_date", "2024-12-25")
-    
+
     print("Retrieved 'user_name':", ltm.retrieve_fact("user_name"))
     print("Search related to 'AI':", ltm.search_related_facts("AI"))
     print("Search related to 'meeting':", ltm.search_related_facts("meeting"))
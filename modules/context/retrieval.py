@@ -1,46 +1,152 @@
 # modules/context/retrieval.py
 # System for retrieving relevant context for the current conversation turn.
 
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .tokens import estimate_tokens
+from ..ai_core.processor import format_history
+from ..monitoring.instrumentation import observe_retrieval
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(result_lists, k=60):
+    """
+    Fuses ranked fact lists: each fact scores sum(1 / (k + rank)) over the lists it appears in.
+    Facts are deduplicated by key; the first occurrence's value is kept.
+    :return: Facts ordered by fused score, each with an "rrf_score".
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, fact in enumerate(results, start=1):
+            entry = fused.get(fact["key"])
+            if entry is None:
+                entry = fused[fact["key"]] = {"key": fact["key"], "value": fact["value"], "rrf_score": 0.0}
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda fact: fact["rrf_score"], reverse=True)
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
 class ContextRetriever:
-    def __init__(self, short_term_memory_provider, long_term_memory_provider=None):
+    def __init__(self, short_term_memory_provider, long_term_memory_provider=None, token_counter=None, max_workers=2):
         """
         Initializes the context retriever.
         :param short_term_memory_provider: An instance of ConversationHistory (or similar).
         :param long_term_memory_provider: An instance of LongTermMemory (or similar).
+        :param token_counter: Callable text -> token count used for the facts budget.
+        :param max_workers: Threads for running the long-term searches concurrently.
         """
         self.short_term_memory = short_term_memory_provider
         self.long_term_memory = long_term_memory_provider
-        print("ContextRetriever initialized.")
+        self.token_counter = token_counter or estimate_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="guru-retrieval")
+        logger.debug("ContextRetriever initialized.")
 
-    def retrieve_relevant_context(self, current_query, max_short_term_history=5, search_long_term=True):
+    def retrieve_relevant_context(self, current_query, max_short_term_history=5, search_long_term=True,
+                                  search_mode="hybrid", top_k=2, token_budget=None):
         """
         Retrieves relevant context based on the current query.
         Combines short-term conversation history and potentially long-term facts.
+        See retrieve_with_timings for the parameters.
         """
-        context_parts = []
+        return self.retrieve_with_timings(current_query, max_short_term_history, search_long_term,
+                                          search_mode, top_k, token_budget)["context"]
 
-        # 1. Get recent conversation history
+    def retrieve_with_timings(self, current_query, max_short_term_history=5, search_long_term=True,
+                              search_mode="hybrid", top_k=2, token_budget=None, candidates_per_backend=None):
+        """
+        Retrieves context and reports how long each stage took.
+        :param search_mode: "lexical" (full-text), "semantic" (embedding similarity) or "hybrid"
+                            (both run concurrently and fused with reciprocal rank fusion). Hybrid
+                            falls back to lexical when the long-term memory has no vector index.
+        :param top_k: Maximum number of facts to include.
+        :param token_budget: If set, facts are added in rank order only while they fit this many tokens.
+        :param candidates_per_backend: Results fetched from each backend before fusion (default 4 * top_k).
+        :return: {"context": str or None, "facts": [...], "timings": {stage: milliseconds}}
+        """
+        started = time.perf_counter()
+        timings = {}
+        searches = {}
+
+        # 1. Start the long-term searches first so they overlap with history formatting
+        if self.long_term_memory and search_long_term and current_query:
+            has_vectors = getattr(self.long_term_memory, "vector_index", None) is not None
+            if search_mode == "hybrid" and not has_vectors:
+                search_mode = "lexical"
+            fetch_k = top_k if search_mode != "hybrid" else (candidates_per_backend or 4 * top_k)
+            if search_mode in ("lexical", "hybrid"):
+                searches["lexical"] = self._executor.submit(
+                    _timed, self.long_term_memory.search_related_facts, current_query, top_k=fetch_k)
+            if search_mode in ("semantic", "hybrid"):
+                searches["vector"] = self._executor.submit(
+                    _timed, self.long_term_memory.semantic_search_facts, current_query, top_k=fetch_k)
+
+        # 2. Recent conversation history
+        context_parts = []
+        history_started = time.perf_counter()
         history = self.short_term_memory.get_history()
         if history:
             # Take the last few items, or implement more sophisticated selection
             relevant_history = history[-max_short_term_history:]
-            history_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in relevant_history])
-            context_parts.append(f"Recent Conversation:\n{history_str}")
+            context_parts.append(f"Recent Conversation:\n{format_history(relevant_history)}")
+        timings["history_ms"] = (time.perf_counter() - history_started) * 1000
+
+        # 3. Collect, fuse and trim the long-term facts
+        related_facts = []
+        if searches:
+            result_lists = []
+            for name, future in searches.items():
+                try:
+                    results, elapsed_ms = future.result()
+                except Exception as e:
+                    logger.error(f"{name} long-term search failed: {e}")
+                    results, elapsed_ms = [], 0.0
+                timings[f"{name}_ms"] = elapsed_ms
+                result_lists.append(results)
+
+            fusion_started = time.perf_counter()
+            if len(result_lists) > 1:
+                related_facts = reciprocal_rank_fusion(result_lists)
+            else:
+                related_facts = result_lists[0]
+            related_facts = self._trim_facts(related_facts, top_k, token_budget)
+            timings["fusion_ms"] = (time.perf_counter() - fusion_started) * 1000
 
-        # 2. Search long-term memory if available and enabled
-        if self.long_term_memory and search_long_term:
-            related_facts = self.long_term_memory.search_related_facts(current_query, top_k=2)
             if related_facts:
                 facts_str = "\n".join([f"- {fact['key']}: {fact['value']}" for fact in related_facts])
                 context_parts.append(f"Relevant Information:\n{facts_str}")
-        
-        # 3. Summarize context if it's too long (placeholder)
-        # combined_context = "\n\n".join(context_parts)
-        # if len(combined_context) > 1000: # Arbitrary length
-        #     # Potentially call an AI model to summarize
-        #     combined_context = "Placeholder: Context summarized: " + combined_context[:200] + "..."
-            
-        return "\n\n".join(context_parts) if context_parts else None
+
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
+        observe_retrieval(timings)
+        return {
+            "context": "\n\n".join(context_parts) if context_parts else None,
+            "facts": related_facts,
+            "timings": timings,
+        }
+
+    def _trim_facts(self, facts, top_k, token_budget):
+        kept, used = [], 0
+        for fact in facts:
+            if len(kept) >= top_k:
+                break
+            if token_budget is not None:
+                cost = self.token_counter(f"- {fact['key']}: {fact['value']}")
+                if used + cost > token_budget:
+                    continue
+                used += cost
+            kept.append(fact)
+        return kept
+
+    def close(self):
+        """Shuts down the search thread pool."""
+        self._executor.shutdown(wait=False)
 
 if __name__ == '__main__':
     from .history import ConversationHistory
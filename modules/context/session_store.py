@@ -0,0 +1,288 @@
+# modules/context/session_store.py
+# Keeps one ConversationHistory per user session instead of a single global history.
+# SharedSessionHistoryStore keeps them in a shared store (see shared_store.py) as well, so with
+# several worker processes any worker can serve any turn of a conversation.
+
+import functools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .history import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE_NAME = "guru_session_id"
+SESSION_HEADER_NAME = "X-Session-ID"
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+
+
+def resolve_session_id(header_value=None, cookie_value=None):
+    """
+    Picks the session ID for a request: explicit header first, then cookie.
+    Malformed or missing IDs get a fresh random one.
+    :return: (session_id, is_new) - is_new tells the caller to set the cookie.
+    """
+    for candidate in (header_value, cookie_value):
+        if candidate and _SESSION_ID_PATTERN.match(candidate):
+            return candidate, False
+    return uuid.uuid4().hex, True
+
+
+class SessionHistoryStore:
+    def __init__(self, max_sessions=20000, ttl_seconds=3600, max_history_length=10, history_max_tokens=None,
+                 summary_worker=None, contents_factory=None, clock=time.monotonic):
+        """
+        Initializes the session-keyed history store.
+        Memory is bounded by max_sessions * max_history_length messages: the least recently
+        used session is evicted once max_sessions is reached, and idle sessions expire after ttl_seconds.
+        :param max_sessions: Maximum number of sessions held in memory.
+        :param ttl_seconds: Idle time after which a session is dropped (None disables expiry).
+        :param max_history_length: Passed to each per-session ConversationHistory.
+        :param history_max_tokens: Token budget of each history (ConversationHistory max_tokens).
+        :param summary_worker: Optional SummaryWorker shared by all sessions; each session keeps
+                               its own rolling summary of trimmed turns.
+        :param contents_factory: Optional callable returning an IncrementalContents for each new
+                                 session (see ConversationHistory.get_prompt_contents).
+        :param clock: Monotonic time source (injectable for tests).
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1.")
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_history_length = max_history_length
+        self.history_max_tokens = history_max_tokens
+        self.summary_worker = summary_worker
+        self.contents_factory = contents_factory
+        self._clock = clock
+        self._sessions = OrderedDict()  # session_id -> (ConversationHistory, last_access), oldest first
+        self._lock = threading.Lock()
+        self.evicted_lru = 0
+        self.evicted_expired = 0
+        logger.info(f"SessionHistoryStore initialized (max_sessions={max_sessions}, ttl={ttl_seconds}s).")
+
+    def _new_history(self):
+        return ConversationHistory(max_history_length=self.max_history_length, max_tokens=self.history_max_tokens,
+                                   summary_worker=self.summary_worker,
+                                   contents_builder=self.contents_factory() if self.contents_factory else None)
+
+    def get(self, session_id):
+        """
+        Returns the ConversationHistory for session_id, creating it if needed. O(1) amortized.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and self._is_expired(entry[1], now):
+                del self._sessions[session_id]
+                self.evicted_expired += 1
+                entry = None
+
+            if entry is None:
+                history = self._new_history()
+                self._evict_expired(now)
+                while len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted_lru += 1
+            else:
+                history = entry[0]
+                self._sessions.move_to_end(session_id)
+            self._sessions[session_id] = (history, now)
+            return history
+
+    def drop(self, session_id):
+        """Removes a session's history (e.g. when the user resets the conversation)."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def stats(self):
+        """Returns store size and eviction counters."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evicted_lru": self.evicted_lru,
+                "evicted_expired": self.evicted_expired,
+            }
+
+    def _is_expired(self, last_access, now):
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _evict_expired(self, now):
+        # Sessions are ordered by last access, so expired ones are all at the front.
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if not self._is_expired(last_access, now):
+                break
+            del self._sessions[session_id]
+            self.evicted_expired += 1
+
+
+class SharedSessionHistoryStore(SessionHistoryStore):
+    NAMESPACE = "sessions"
+
+    def __init__(self, store, max_conflict_retries=16, **kwargs):
+        """
+        Session histories kept in a shared store, so any worker process can serve any turn.
+        Each worker keeps the histories it has served in its local store (bounded and expired as
+        in SessionHistoryStore) and checks the stored version on every get(): a history another
+        worker has changed since is reloaded, and only then. Every change is written back with
+        compare-and-set; when another worker wrote first, its state is loaded and the change is
+        re-applied on top (a message is appended after the other worker's, a summary is kept if
+        it was folded from the same turns, and a clear wins), so concurrent turns aren't lost.
+        Writes happen with the history's lock held (and, under asgi.py, on the event loop), so
+        they never wait: a write that still conflicts after one rebase is handed to a background
+        thread, which backs off without the lock and writes it (and any later changes to that
+        history, in order) once it stops colliding.
+        :param store: MemorySharedStore or SQLiteSharedStore; entries expire after ttl_seconds.
+        :param max_conflict_retries: Background compare-and-set attempts before giving up on a
+                                     history's unwritten changes (with a short random backoff
+                                     between them, so writers that keep colliding spread out).
+                                     It is then reloaded from the store on the next get().
+        :param kwargs: As for SessionHistoryStore.
+        """
+        super().__init__(**kwargs)
+        self.store = store
+        self.max_conflict_retries = max_conflict_retries
+        self._replaying = threading.local()  # Set while a change is re-applied after a conflict
+        self._unsynced = {}  # session_id -> (history, changes) waiting for _resync to write them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="guru-session-sync")
+        self.reloads = 0
+        self.conflicts = 0
+        self.lost_changes = 0
+
+    def get(self, session_id):
+        """
+        Returns the ConversationHistory for session_id, up to date with the shared store.
+        """
+        history = super().get(session_id)
+        if history.on_change is None:
+            history.on_change = functools.partial(self._persist, session_id)
+        version = self.store.version(self.NAMESPACE, session_id)
+        if version != history.store_version and not self._is_unsynced(session_id, history):
+            with history._lock:
+                self._reload(session_id, history)
+        return history
+
+    def drop(self, session_id):
+        """Removes a session's history here and in the shared store."""
+        with self._lock:
+            self._unsynced.pop(session_id, None)
+        self.store.delete(self.NAMESPACE, session_id)
+        return super().drop(session_id)
+
+    def wait(self, timeout=None):
+        """Blocks until the changes handed to the background thread so far are written (or given up)."""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _is_unsynced(self, session_id, history):
+        with self._lock:
+            unsynced = self._unsynced.get(session_id)
+            return unsynced is not None and unsynced[0] is history
+
+    def _reload(self, session_id, history):
+        entry = self.store.get(self.NAMESPACE, session_id)
+        history.set_state(json.loads(entry[1]) if entry is not None else None)
+        history.store_version = entry[0] if entry is not None else None
+        with self._lock:
+            self.reloads += 1
+        return entry
+
+    def _write(self, session_id, history):
+        version = self.store.compare_and_set(self.NAMESPACE, session_id, json.dumps(history.get_state()),
+                                             history.store_version or 0, self.ttl_seconds)
+        if version is None:
+            with self._lock:
+                self.conflicts += 1
+            return False
+        history.store_version = version
+        return True
+
+    def _persist(self, session_id, history, change):
+        # ConversationHistory's on_change; runs with the history's lock held, so it never sleeps
+        if getattr(self._replaying, "active", False):
+            return
+        with self._lock:
+            unsynced = self._unsynced.get(session_id)
+            if unsynced is not None and unsynced[0] is history:
+                unsynced[1].append(change)  # Written after the earlier ones, by _resync
+                return
+        if self._write(session_id, history):
+            return
+        self._rebase(session_id, history, [change])
+        if self._write(session_id, history):
+            return
+        with self._lock:
+            self._unsynced[session_id] = (history, [change])
+        self._executor.submit(self._resync, session_id, history)
+
+    def _resync(self, session_id, history):
+        """Background: writes a history's unsynced changes, backing off (without its lock) between tries."""
+        for attempt in range(self.max_conflict_retries):
+            time.sleep(random.uniform(0, min(0.05, 0.0005 * 2 ** attempt)))
+            with history._lock:
+                with self._lock:
+                    unsynced = self._unsynced.get(session_id)
+                    if unsynced is None or unsynced[0] is not history:
+                        return  # Dropped meanwhile
+                    changes = list(unsynced[1])
+                self._rebase(session_id, history, changes)
+                if self._write(session_id, history):
+                    with self._lock:
+                        del self._unsynced[session_id]
+                    return
+        with history._lock:
+            with self._lock:
+                unsynced = self._unsynced.get(session_id)
+                if unsynced is None or unsynced[0] is not history:
+                    return
+                del self._unsynced[session_id]
+                self.lost_changes += len(unsynced[1])
+            history.store_version = None  # Reloaded from the store on the next get()
+        logger.error(f"Session {session_id}: gave up writing {len(unsynced[1])} change(s) after "
+                     f"{self.max_conflict_retries} conflicting writes.")
+
+    def _rebase(self, session_id, history, changes):
+        """Loads the state another worker wrote and re-applies changes (oldest first) on top of it."""
+        if any(change[0] == "clear" for change in changes):
+            # Our state (empty, plus whatever followed the clear) replaces theirs; only the
+            # version to compare against changes
+            history.store_version = self.store.version(self.NAMESPACE, session_id)
+            return
+        self._reload(session_id, history)
+        self._replaying.active = True
+        try:
+            for change in changes:
+                if change[0] == "message":
+                    history.add_message(change[1], change[2])
+                elif change[0] == "summary":
+                    _, summary, base_summary, folded_turns = change
+                    state = history.get_state()
+                    if state["summary"] == base_summary and state["pending"][:len(folded_turns)] == folded_turns:
+                        state["summary"] = summary
+                        state["pending"] = state["pending"][len(folded_turns):]
+                        history.set_state(state)
+        finally:
+            self._replaying.active = False
+
+    def stats(self):
+        """Returns store size, eviction counters and shared-store sync counters."""
+        stats = super().stats()
+        with self._lock:
+            stats.update(reloads=self.reloads, conflicts=self.conflicts, lost_changes=self.lost_changes)
+        return stats
@@ -0,0 +1,263 @@
+# modules/context/shared_store.py
+# Key-value store shared by the worker processes of a multi-process deployment (see serve.py):
+# session histories, response cache entries and rate-limit counters live here so any worker
+# can serve any request. Values are strings (JSON) under a namespace and key; every write bumps
+# the entry's version, which makes compare-and-set and cheap "has it changed?" checks possible.
+# MemorySharedStore keeps entries in this process (single process, tests); SQLiteSharedStore
+# keeps them in one SQLite file, which every process on the box opens.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Expired entries are deleted every this many writes
+PURGE_EVERY_WRITES = 1000
+
+
+class MemorySharedStore:
+    def __init__(self, clock=time.time):
+        """
+        In-process store with the SQLiteSharedStore interface.
+        :param clock: Wall-clock time source for expiry (injectable for tests).
+        """
+        self._clock = clock
+        self._entries = {}  # (namespace, key) -> [version, value, expires_at]
+        self._versions = {}  # (namespace, key) -> last version, kept across expiry so versions never repeat
+        self._lock = threading.RLock()
+        self._writes = 0
+
+    def _live(self, namespace, key):
+        entry = self._entries.get((namespace, key))
+        if entry is not None and entry[2] is not None and entry[2] <= self._clock():
+            del self._entries[(namespace, key)]
+            return None
+        return entry
+
+    def get(self, namespace, key):
+        """(version, value), or None if the key is missing or expired."""
+        with self._lock:
+            entry = self._live(namespace, key)
+            return (entry[0], entry[1]) if entry is not None else None
+
+    def version(self, namespace, key):
+        with self._lock:
+            entry = self._live(namespace, key)
+            return entry[0] if entry is not None else None
+
+    def put(self, namespace, key, value, ttl_seconds=None):
+        """Stores value (replacing any other); returns its version."""
+        with self._lock:
+            version = self._versions.get((namespace, key), 0) + 1
+            self._versions[(namespace, key)] = version
+            expires_at = self._clock() + ttl_seconds if ttl_seconds is not None else None
+            self._entries[(namespace, key)] = [version, value, expires_at]
+            self._writes += 1
+            if self._writes % PURGE_EVERY_WRITES == 0:
+                self.purge_expired()
+            return version
+
+    def compare_and_set(self, namespace, key, value, expected_version, ttl_seconds=None):
+        """
+        Stores value only if the entry is still at expected_version (0: only if it doesn't exist).
+        :return: The new version, or None if another writer got there first.
+        """
+        with self._lock:
+            entry = self._live(namespace, key)
+            if (entry[0] if entry is not None else 0) != expected_version:
+                return None
+            return self.put(namespace, key, value, ttl_seconds)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the get/put/delete calls inside the block under the store's lock, so other threads
+        see all of them or none (there is no rollback: the block shouldn't fail halfway).
+        """
+        with self._lock:
+            yield self
+
+    def purge_expired(self):
+        with self._lock:
+            now = self._clock()
+            expired = [k for k, entry in self._entries.items() if entry[2] is not None and entry[2] <= now]
+            for k in expired:
+                del self._entries[k]
+            # Versions of deleted keys are only needed while an entry could still be compared against
+            for k in [k for k in self._versions if k not in self._entries]:
+                del self._versions[k]
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries)}
+
+
+class SQLiteSharedStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at) WHERE expires_at IS NOT NULL;
+    """
+
+    def __init__(self, path, busy_timeout=5.0, clock=time.time):
+        """
+        Store in one SQLite database file, shared by every process that opens it.
+        Connections are pooled per process and opened on first use, so a store created before
+        fork() is safe to use in the children; a thread borrows one per call (or per
+        transaction). WAL mode lets readers run alongside the (serialized) writers.
+        :param path: Database file; created if missing.
+        :param busy_timeout: Seconds a writer waits for another process's write to finish.
+        :param clock: Wall-clock time source for expiry (injectable for tests).
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._pid = None
+        self._idle = []  # This process's idle connections
+        self._local = threading.local()  # The connection of a transaction in progress on this thread
+        self._writes = 0
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    def _in_transaction(self):
+        # Threads don't survive fork(), but the forking thread's transaction state would
+        local = self._local
+        return getattr(local, "connection", None) is not None and local.pid == os.getpid()
+
+    @contextmanager
+    def _connection(self):
+        if self._in_transaction():
+            yield self._local.connection
+            return
+        if self._pid != os.getpid():  # First use, or a child after fork(): the parent's connections aren't ours
+            self._pid, self._idle = os.getpid(), []
+        idle = self._idle
+        try:
+            connection = idle.pop()
+        except IndexError:
+            connection = self._open()
+        try:
+            yield connection
+        finally:
+            idle.append(connection)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Makes the get/put/delete calls inside the block atomic (e.g. across several keys).
+        The write lock is taken up front, so the block should be short.
+        """
+        if self._in_transaction():
+            yield self  # Nested: part of the enclosing transaction
+            return
+        local = self._local
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            local.connection, local.pid = connection, os.getpid()
+            try:
+                yield self
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+            finally:
+                local.connection = None
+
+    def get(self, namespace, key):
+        """(version, value), or None if the key is missing or expired."""
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT version, value FROM entries WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, self._clock())).fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def version(self, namespace, key):
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT version FROM entries WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, self._clock())).fetchone()
+        return row[0] if row is not None else None
+
+    def _write(self, namespace, key, value, ttl_seconds, expected_version):
+        now = self._clock()
+        expires_at = now + ttl_seconds if ttl_seconds is not None else None
+        if expected_version:
+            # Updating a live entry at a known version (the common case) is one statement, so it
+            # needs no explicit transaction
+            with self._connection() as connection:
+                cursor = connection.execute(
+                    "UPDATE entries SET version = version + 1, value = ?, expires_at = ? WHERE namespace = ? "
+                    "AND key = ? AND version = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (value, expires_at, namespace, key, expected_version, now))
+            if cursor.rowcount != 1:
+                return None
+            self._count_write()
+            return expected_version + 1
+        with self.transaction(), self._connection() as connection:
+            row = connection.execute("SELECT version, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                                     (namespace, key)).fetchone()
+            stored = row[0] if row is not None else 0
+            live = row is not None and (row[1] is None or row[1] > now)
+            if expected_version is not None and (stored if live else 0) != expected_version:
+                return None
+            version = stored + 1  # Versions keep counting up through expiry, so they never repeat
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, version, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, version, value, expires_at))
+        self._count_write()
+        return version
+
+    def _count_write(self):
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self.purge_expired()
+
+    def put(self, namespace, key, value, ttl_seconds=None):
+        """Stores value (replacing any other); returns its version."""
+        return self._write(namespace, key, value, ttl_seconds, None)
+
+    def compare_and_set(self, namespace, key, value, expected_version, ttl_seconds=None):
+        """
+        Stores value only if the entry is still at expected_version (0: only if it doesn't exist).
+        :return: The new version, or None if another writer got there first.
+        """
+        return self._write(namespace, key, value, ttl_seconds, expected_version)
+
+    def delete(self, namespace, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_expired(self):
+        if self._in_transaction():
+            return 0  # Not inside a caller's transaction; the next purge will catch up
+        with self._connection() as connection:
+            cursor = connection.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                                        (self._clock(),))
+        return cursor.rowcount
+
+    def stats(self):
+        with self._connection() as connection:
+            row = connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return {"entries": row[0]}
@@ -0,0 +1,199 @@
+# modules/context/summarizer.py
+# Rolling conversation summaries.
+# Turns trimmed from a ConversationHistory are folded into a running summary by a summarizer:
+# ExtractiveSummarizer (local, keeps the most informative sentences within a token budget) or
+# ModelSummarizer (asks the model, falling back to extractive). SummaryWorker runs the folding on
+# a background thread so it never sits on the request path; the summary itself lives on the
+# session's ConversationHistory.
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9']+")
+_SUMMARY_LINE = re.compile(r"^- (\w+): (.+)$")
+_STOPWORDS = frozenset("""
+a an the and or but if so of to in on at by for with from as is are was were be been being am do does did
+i me my we our you your it its this that these those there here he she they them his her their what which
+who whom how why when where can could would should will shall may might must not no yes just very really
+too also than then now up down out about into over again more most some any all have has had get got
+ok okay hi hello thanks thank please let lets sure well oh like
+""".split())
+
+
+def _content_words(text):
+    return [word for word in (w.lower() for w in _WORD_PATTERN.findall(text)) if word not in _STOPWORDS and len(word) > 1]
+
+
+class ExtractiveSummarizer:
+    def __init__(self, max_tokens=300, token_counter=None, user_weight=1.5, redundancy=0.6):
+        """
+        Keeps the sentences that best cover the conversation's recurring content words.
+        The summary is one "- role: sentence" line per kept sentence, in conversation order.
+        Earlier summary lines compete with the new sentences each time, so the summary rolls
+        forward at a constant size instead of growing.
+        :param max_tokens: Token budget of the summary.
+        :param token_counter: Callable text -> token count (defaults to estimate_tokens).
+        :param user_weight: Score multiplier for the user's own sentences (goals, names, preferences).
+        :param redundancy: Sentences sharing more than this fraction of content words with an
+                           already kept sentence are skipped.
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or estimate_tokens
+        self.user_weight = user_weight
+        self.redundancy = redundancy
+
+    def _candidates(self, previous_summary, messages):
+        candidates = []  # (role, sentence)
+        for line in (previous_summary or "").splitlines():
+            match = _SUMMARY_LINE.match(line.strip())
+            if match:
+                candidates.append((match.group(1), match.group(2)))
+            elif line.strip():  # A summary from another summarizer: keep its sentences
+                candidates.extend(("summary", s) for s in _SENTENCE_SPLIT.split(line.strip()) if s)
+        for message in messages:
+            role = "model" if message["role"] in ("model", "assistant") else "user"
+            for sentence in _SENTENCE_SPLIT.split(message["content"]):
+                sentence = " ".join(sentence.split())
+                if len(_content_words(sentence)) >= 2:
+                    candidates.append((role, sentence))
+        return candidates
+
+    def summarize(self, previous_summary, messages):
+        """
+        :param previous_summary: The current summary (or None).
+        :param messages: Turns to fold in, oldest first ({"role", "content"} dicts).
+        :return: The new summary text.
+        """
+        candidates = self._candidates(previous_summary, messages)
+        if not candidates:
+            return previous_summary
+        words = [set(_content_words(sentence)) for _, sentence in candidates]
+        frequency = Counter(word for sentence_words in words for word in sentence_words)
+        scored = []
+        for position, ((role, sentence), sentence_words) in enumerate(zip(candidates, words)):
+            if not sentence_words:
+                continue
+            # Sentences about what keeps coming up score highest; length is only rewarded sub-linearly
+            score = sum(frequency[word] for word in sentence_words) / math.sqrt(len(sentence_words))
+            score *= self.user_weight if role == "user" else 1.0
+            score *= 0.5 + 0.5 * (position + 1) / len(candidates)  # Prefer newer content on ties
+            scored.append((score, position))
+        kept, used = [], 0
+        for _, position in sorted(scored, reverse=True):
+            role, sentence = candidates[position]
+            line = f"- {role}: {sentence}"
+            tokens = self.token_counter(line)
+            if used + tokens > self.max_tokens:
+                continue
+            sentence_words = words[position]
+            if any(len(sentence_words & words[other]) > self.redundancy * min(len(sentence_words), len(words[other]))
+                   for other in kept):
+                continue
+            kept.append(position)
+            used += tokens
+        return "\n".join(f"- {candidates[p][0]}: {candidates[p][1]}" for p in sorted(kept)) or previous_summary
+
+
+class ModelSummarizer:
+    PROMPT = ("Update the running summary of a conversation between a user and GURU, an AI assistant. "
+              "Keep facts about the user, their goals, decisions made and open questions; drop small talk. "
+              "Reply with the summary only, in at most {words} words.\n\n"
+              "Current summary:\n{summary}\n\nNew turns:\n{turns}")
+
+    def __init__(self, client, max_tokens=300, fallback=None):
+        """
+        Summarizes with the model (a GeminiClient or ModelRouter); any failure falls back to
+        `fallback` (default: ExtractiveSummarizer with the same budget).
+        """
+        self.client = client
+        self.max_tokens = max_tokens
+        self.fallback = fallback or ExtractiveSummarizer(max_tokens=max_tokens)
+
+    def summarize(self, previous_summary, messages):
+        from ..ai_core.gemini_client import extract_chunk_text
+        turns = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = self.PROMPT.format(words=self.max_tokens * 3 // 4, summary=previous_summary or "(none)", turns=turns)
+        try:
+            texts = []
+            for chunk in self.client.generate_response(prompt=prompt, generation_config={"max_output_tokens": self.max_tokens},
+                                                       stream=True):
+                if isinstance(chunk, str):  # "Error_...: ..." from GeminiClient
+                    raise RuntimeError(chunk)
+                texts.append(extract_chunk_text(chunk) or "")
+            summary = "".join(texts).strip()
+            if not summary:
+                raise RuntimeError("empty summary")
+            return summary
+        except Exception as e:
+            logger.warning(f"Model summary failed ({e}); using extractive summary.")
+            return self.fallback.summarize(previous_summary, messages)
+
+
+class SummaryWorker:
+    def __init__(self, summarizer, max_workers=1):
+        """
+        Folds trimmed turns into their session's summary on background threads.
+        A history has at most one fold job at a time; turns trimmed while it runs are picked up
+        by the same job, so summaries are applied in order.
+        :param summarizer: Anything with summarize(previous_summary, messages) -> str.
+        """
+        self.summarizer = summarizer
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="guru-summary")
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._counts = {"jobs": 0, "summaries": 0, "folded_turns": 0, "failed": 0}
+
+    def submit(self, history):
+        """Called by ConversationHistory when it has trimmed turns and no fold job running."""
+        future = self._executor.submit(self._fold, history)
+        with self._lock:
+            self._counts["jobs"] += 1
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _fold(self, history):
+        while True:
+            batch = history._next_summary_batch()
+            if batch is None:
+                return
+            turns, previous_summary, generation = batch
+            try:
+                summary = self.summarizer.summarize(previous_summary, turns)
+            except Exception as e:
+                logger.error(f"Conversation summary failed; {len(turns)} trimmed turns are lost: {e}")
+                self._count("failed")
+                continue
+            history._apply_summary(summary, generation)
+            self._count("summaries")
+            self._count("folded_turns", len(turns))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def wait(self, timeout=None):
+        """Blocks until every fold job submitted so far has finished (tests, shutdown)."""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "pending": len(self._futures)}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
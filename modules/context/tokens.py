@@ -0,0 +1,35 @@
+# modules/context/tokens.py
+# Token estimation for context budgeting.
+# Any callable taking a string and returning an int can be plugged into ConversationHistory.
+
+import math
+import re
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Cheap, offline token estimate.
+    Gemini's tokenizer averages roughly 4 characters per token for English, but short
+    punctuation-heavy text tokenizes closer to one token per word/symbol, so take the larger.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_WORD_PATTERN.findall(text)) * 3 // 4, 1)
+
+
+class ModelTokenCounter:
+    def __init__(self, model):
+        """
+        Exact token counts from the model's own tokenizer.
+        Note: GenerativeModel.count_tokens is a network round trip, so this is meant for
+        offline calibration rather than the request path.
+        :param model: A GenerativeModel (or anything with count_tokens(text).total_tokens).
+        """
+        self.model = model
+
+    def __call__(self, text):
+        if not text:
+            return 0
+        return self.model.count_tokens(text).total_tokens
@@ -0,0 +1,242 @@
+# modules/context/vector_index.py
+# Vector index for semantic fact retrieval.
+# Vectors live in one memory-mapped float32 matrix (plus an int64 id column) so a large
+# store can be searched without loading it onto the Python heap. Search is exact by default;
+# an optional IVF coarse quantizer restricts it to the nearest clusters for large corpora.
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k highest scores, best first. O(n) selection plus an O(k log k) sort."""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorIndex:
+    def __init__(self, path=None, dim=256, capacity=1024):
+        """
+        Initializes the index.
+        :param path: Base path for the memory-mapped files (<path>, <path>.ids, <path>.meta.json).
+                     None keeps everything in RAM.
+        :param dim: Vector dimensionality.
+        :param capacity: Initial number of rows; the files double in size as needed.
+        """
+        self.path = path
+        self.dim = dim
+        self.size = 0
+        self._slots = {}  # id -> row
+        self._lock = threading.RLock()
+        self.ivf = None
+        if path and os.path.exists(self._meta_path()):
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+            self.dim, self.size, capacity = meta["dim"], meta["size"], meta["capacity"]
+            self._open(capacity)
+            self._slots = {int(fact_id): row for row, fact_id in enumerate(self._ids[:self.size])}
+            logger.info(f"VectorIndex loaded {self.size} vectors from {path}.")
+        else:
+            self._open(max(capacity, 1))
+
+    def _meta_path(self):
+        return f"{self.path}.meta.json"
+
+    def _open(self, capacity):
+        self.capacity = capacity
+        if self.path is None:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            ids = np.zeros(capacity, dtype=np.int64)
+            if self.size:
+                vectors[:self.size] = self._vectors[:self.size]
+                ids[:self.size] = self._ids[:self.size]
+            self._vectors, self._ids = vectors, ids
+            return
+        for file_path, row_bytes in ((self.path, self.dim * 4), (f"{self.path}.ids", 8)):
+            with open(file_path, "ab") as f:
+                needed = capacity * row_bytes
+                if f.tell() < needed:
+                    f.truncate(needed)
+        self._vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(f"{self.path}.ids", dtype=np.int64, mode="r+", shape=(capacity,))
+
+    def _ensure_capacity(self, needed):
+        if needed <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        if self.path is not None:
+            self.flush()
+        self._open(new_capacity)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, fact_id):
+        return int(fact_id) in self._slots
+
+    def add(self, fact_id, vector):
+        """Adds or replaces the vector for fact_id."""
+        self.add_batch([fact_id], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_batch(self, fact_ids, vectors):
+        """Adds or replaces many vectors at once; vectors is an (n, dim) array."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            rows = []
+            for fact_id in fact_ids:
+                fact_id = int(fact_id)
+                row = self._slots.get(fact_id)
+                if row is None:
+                    self._ensure_capacity(self.size + 1)
+                    row = self.size
+                    self.size += 1
+                    self._slots[fact_id] = row
+                    self._ids[row] = fact_id
+                rows.append(row)
+            rows = np.asarray(rows, dtype=np.int64)
+            self._vectors[rows] = vectors
+            if self.ivf is not None:
+                self.ivf.assign_rows(rows, vectors)
+
+    def remove(self, fact_id):
+        """Removes fact_id by moving the last row into its place. Returns True if it was present."""
+        with self._lock:
+            row = self._slots.pop(int(fact_id), None)
+            if row is None:
+                return False
+            last = self.size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = moved_id
+                self._slots[moved_id] = row
+                if self.ivf is not None:
+                    self.ivf.move_row(last, row)
+            elif self.ivf is not None:
+                self.ivf.clear_row(last)
+            self.size = last
+            return True
+
+    def search(self, query_vector, top_k=5, nprobe=None):
+        """
+        Returns [(fact_id, score), ...] by descending inner product (cosine for normalized vectors).
+        Uses the IVF quantizer when one has been trained, otherwise an exact vectorized scan.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        with self._lock:
+            if self.size == 0:
+                return []
+            if self.ivf is not None:
+                rows = self.ivf.candidate_rows(query_vector, nprobe)
+                scores = self._vectors[rows] @ query_vector
+                best = top_k_indices(scores, top_k)
+                rows, scores = rows[best], scores[best]
+            else:
+                scores = self._vectors[:self.size] @ query_vector
+                rows = top_k_indices(scores, top_k)
+                scores = scores[rows]
+            return [(int(self._ids[row]), float(score)) for row, score in zip(rows, scores)]
+
+    def train_ivf(self, n_lists=None, nprobe=8, sample_size=50000, iterations=10, seed=0):
+        """
+        Builds an IVF (coarse-quantized) index over the current vectors. Worth it from roughly
+        100k vectors up; smaller stores are faster with the exact scan.
+        :param n_lists: Number of clusters (defaults to ~sqrt(size)).
+        :param nprobe: Clusters scanned per query by default.
+        """
+        with self._lock:
+            n_lists = n_lists or max(1, int(np.sqrt(self.size)))
+            self.ivf = IVFQuantizer(n_lists=n_lists, nprobe=nprobe)
+            self.ivf.train(self._vectors[:self.size], sample_size=sample_size, iterations=iterations, seed=seed)
+            self.ivf.assign_rows(np.arange(self.size), self._vectors[:self.size])
+            return self.ivf
+
+    def flush(self):
+        """Writes the memory-mapped arrays and metadata to disk."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._vectors.flush()
+            self._ids.flush()
+            with open(self._meta_path(), "w") as f:
+                json.dump({"dim": self.dim, "size": self.size, "capacity": self.capacity}, f)
+
+
+class IVFQuantizer:
+    def __init__(self, n_lists, nprobe=8):
+        """
+        Inverted-file coarse quantizer: vectors are bucketed by their nearest centroid and a
+        query only scans the buckets of its nprobe nearest centroids.
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)  # row -> list
+        self._order = None  # rows sorted by list, rebuilt lazily after changes
+        self._offsets = None
+
+    def train(self, vectors, sample_size=50000, iterations=10, seed=0):
+        """Spherical k-means on a sample of the vectors."""
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        sample = np.asarray(vectors[rng.choice(n, size=min(sample_size, n), replace=False)])
+        self.n_lists = min(self.n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        self.centroids = centroids
+
+    def _assign(self, vectors, batch_size=65536):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            labels[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ self.centroids.T, axis=1)
+        return labels
+
+    def assign_rows(self, rows, vectors):
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return
+        needed = int(rows.max()) + 1
+        if needed > self._assignments.size:
+            grown = np.full(max(needed, self._assignments.size * 2), -1, dtype=np.int32)
+            grown[:self._assignments.size] = self._assignments
+            self._assignments = grown
+        self._assignments[rows] = self._assign(np.asarray(vectors))
+        self._order = None
+
+    def move_row(self, source, target):
+        self._assignments[target] = self._assignments[source]
+        self._assignments[source] = -1
+        self._order = None
+
+    def clear_row(self, row):
+        self._assignments[row] = -1
+        self._order = None
+
+    def candidate_rows(self, query_vector, nprobe=None):
+        """Rows in the nprobe clusters nearest to the query."""
+        if self._order is None:
+            valid = np.flatnonzero(self._assignments >= 0)
+            self._order = valid[np.argsort(self._assignments[valid], kind="stable")]
+            self._offsets = np.searchsorted(self._assignments[self._order], np.arange(self.n_lists + 1))
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        lists = top_k_indices(self.centroids @ query_vector, nprobe)
+        return np.concatenate([self._order[self._offsets[i]:self._offsets[i + 1]] for i in lists])
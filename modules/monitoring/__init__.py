@@ -0,0 +1 @@
+# Monitoring Module
\ No newline at end of file
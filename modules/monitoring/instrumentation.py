@@ -0,0 +1,103 @@
+# modules/monitoring/instrumentation.py
+# GURU's metrics and the hooks that feed them: the chat route, the Gemini client streams and
+# the context retriever. Everything here is a thread-sharded update, so the per-request cost
+# is a handful of dict operations.
+
+import functools
+import logging
+
+from .metrics import REGISTRY, LATENCY_BUCKETS, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+CHAT_REQUESTS = REGISTRY.counter(
+    "guru_chat_requests_total", "Chat requests by HTTP status.", labelnames=("status",))
+CHAT_STREAMS = REGISTRY.counter(
+    "guru_chat_streams_total", "Chat streams by outcome (completed, error, disconnected).", labelnames=("outcome",))
+CHAT_TTFT = REGISTRY.histogram(
+    "guru_chat_time_to_first_token_seconds", "Time from request to the first token frame.", LATENCY_BUCKETS)
+CHAT_STREAM_DURATION = REGISTRY.histogram(
+    "guru_chat_stream_duration_seconds", "Time from request to the end of the stream.", LATENCY_BUCKETS)
+CHAT_RESPONSE_CHUNKS = REGISTRY.histogram(
+    "guru_chat_response_chunks", "Model chunks per streamed reply.", SIZE_BUCKETS)
+CHAT_RESPONSE_BYTES = REGISTRY.histogram(
+    "guru_chat_response_bytes", "UTF-8 bytes per streamed reply.", SIZE_BUCKETS)
+GEMINI_REQUESTS = REGISTRY.counter(
+    "guru_gemini_requests_total", "Streamed Gemini requests by model.", labelnames=("model",))
+GEMINI_ERRORS = REGISTRY.counter(
+    "guru_gemini_errors_total", "Gemini errors by model and type.", labelnames=("model", "type"))
+RETRIEVAL_STAGE = REGISTRY.histogram(
+    "guru_retrieval_stage_seconds", "ContextRetriever stage timings.", LATENCY_BUCKETS, labelnames=("stage",))
+
+
+def instrument_chat(view):
+    """Decorator for the chat view: counts requests by response status."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        result = view(*args, **kwargs)
+        status = result[1] if isinstance(result, tuple) else getattr(result, "status_code", 200)
+        CHAT_REQUESTS.inc(labels=(str(status),))
+        return result
+    return wrapper
+
+
+def observe_chat_stream(metrics, outcome="completed"):
+    """Records an SSE stream's summary (SSEFrameBuilder.metrics()) once it ends."""
+    CHAT_STREAMS.inc(labels=(outcome,))
+    if metrics.get("ttft_ms") is not None:
+        CHAT_TTFT.observe(metrics["ttft_ms"] / 1000)
+    CHAT_STREAM_DURATION.observe(metrics["total_ms"] / 1000)
+    CHAT_RESPONSE_CHUNKS.observe(metrics["chunks"])
+    CHAT_RESPONSE_BYTES.observe(metrics["bytes"])
+
+
+def error_type(chunk):
+    """'Error_API_Call: boom' -> 'Error_API_Call'."""
+    return chunk.split(":", 1)[0] if chunk.startswith("Error") else "Error"
+
+
+def observe_gemini_stream(model_name, chunks):
+    """Wraps a GeminiClient chunk stream, counting the request and any error chunks it yields."""
+    GEMINI_REQUESTS.inc(labels=(model_name,))
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                GEMINI_ERRORS.inc(labels=(model_name, error_type(chunk)))
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+async def aobserve_gemini_stream(model_name, chunks):
+    """Async variant of observe_gemini_stream."""
+    GEMINI_REQUESTS.inc(labels=(model_name,))
+    try:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                GEMINI_ERRORS.inc(labels=(model_name, error_type(chunk)))
+            yield chunk
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def observe_retrieval(timings):
+    """Records ContextRetriever.retrieve_with_timings() stage timings (milliseconds)."""
+    for stage_ms, value in timings.items():
+        RETRIEVAL_STAGE.observe(value / 1000, labels=(stage_ms[:-3] if stage_ms.endswith("_ms") else stage_ms,))
+
+
+def register_stats_source(name, documentation, stats_fn, gauges=(), counters=()):
+    """
+    Exposes numeric fields of a component's stats() dict (caches, session store, ...) as
+    scrape-time metrics: guru_<name>_<field> gauges and guru_<name>_<field>_total counters.
+    """
+    for field in gauges:
+        REGISTRY.callback(f"guru_{name}_{field}", f"{documentation}: {field}.",
+                          lambda field=field: stats_fn().get(field))
+    for field in counters:
+        REGISTRY.callback(f"guru_{name}_{field}_total", f"{documentation}: {field}.",
+                          lambda field=field: stats_fn().get(field), type_name="counter")
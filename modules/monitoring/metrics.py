@@ -0,0 +1,216 @@
+# modules/monitoring/metrics.py
+# Minimal Prometheus-style metrics with low-contention updates.
+# Counters and histograms are sharded per thread: the request path only touches its own
+# thread's cells (no lock), and shards are summed when /metrics is scraped.
+
+import bisect
+import math
+import threading
+
+# Seconds; covers cache hits (ms) up to long streamed replies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """
+    Per-thread shards of {label values: cell}. Only the owning thread writes to its shard.
+    Shards of threads that have exited (e.g. per-request server threads) are folded into a
+    retired total so memory and scrape cost track live threads, not requests served.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # [(thread, shard)]
+        self._retired = {}
+        self._shards_lock = threading.Lock()  # Taken once per thread (shard creation) and per scrape
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._shards_lock:
+                self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead_shards(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for labels, cell in shard.items():
+                    self._retired[labels] = self._merge(self._retired.get(labels), cell)
+        self._shards = live
+
+    def _merge(self, total, cell):
+        raise NotImplementedError
+
+    def _snapshots(self):
+        with self._shards_lock:
+            self._retire_dead_shards()
+            snapshots = [dict(shard) for _, shard in self._shards]
+            snapshots.append(dict(self._retired))
+        return snapshots
+
+
+class Counter(_Sharded):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _merge(self, total, cell):
+        return (total or 0) + cell
+
+    def inc(self, amount=1, labels=()):
+        """Adds amount to the series for the given label values (a tuple, in labelnames order)."""
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return sum(snapshot.get(labels, 0) for snapshot in self._snapshots())
+
+    def samples(self):
+        totals = {}
+        for snapshot in self._snapshots():
+            for labels, value in snapshot.items():
+                totals[labels] = totals.get(labels, 0) + value
+        for labels, value in sorted(totals.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram(_Sharded):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+
+    def _merge(self, total, cell):
+        return list(cell) if total is None else [a + b for a, b in zip(total, cell)]
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]  # bucket counts..., +Inf, sum
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self, labels=()):
+        """(per-bucket counts incl. +Inf, count, sum) for one series."""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for snapshot in self._snapshots():
+            cell = snapshot.get(labels)
+            if cell is not None:
+                cell = list(cell)
+                counts = [a + b for a, b in zip(counts, cell[:-1])]
+                total += cell[-1]
+        return counts, sum(counts), total
+
+    def samples(self):
+        series = set()
+        for snapshot in self._snapshots():
+            series.update(snapshot)
+        for labels in sorted(series):
+            counts, count, total = self.snapshot(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))]), cumulative)
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), count
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+
+
+class CallbackMetric:
+    def __init__(self, name, documentation, callback, type_name="gauge", labelnames=()):
+        """
+        A value read from elsewhere at scrape time (e.g. cache stats, store sizes).
+        :param callback: Returns a number, or a {label values tuple: number} dict when labelnames is set.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.type_name = type_name
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if value is None:
+            return
+        if not self.labelnames:
+            yield self.name, "", value
+            return
+        for labels, labelled_value in sorted(value.items()):
+            yield self.name, _format_labels(self.labelnames, labels), labelled_value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Re-importing a module must not duplicate series
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._register(Histogram(name, documentation, buckets, labelnames))
+
+    def callback(self, name, documentation, callback, type_name="gauge", labelnames=()):
+        """Registers (or replaces) a scrape-time metric."""
+        metric = CallbackMetric(name, documentation, callback, type_name, labelnames)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -1,91 +1,279 @@
 # modules/sentiment/analyzer.py
 # Detects sentiment from text.
+# The "lexicon" engine is VADER-style: word valences adjusted by intensifiers, negations,
+# ALL-CAPS emphasis, "but" and !/?, normalized into a compound score in [-1, 1]. Texts are
+# tokenized once into lexicon ids; analyze_batch() scores all tokens of all texts with NumPy,
+# and stream() keeps a running score over streamed chunks.
+# The "custom_ml" engine is the logistic regression trained by training.py, loaded from its
+# memory-mapped artifact.
+
+import logging
+import math
+
+import numpy as np
+
+from .linear_model import LinearSentimentModel
+from .lexicon import (
+    default_lexicon, punctuation_emphasis,
+    C_INCR, N_SCALAR, BUT_BEFORE, BUT_AFTER, NORMALIZATION_ALPHA, WINDOW, WINDOW_DAMPING
+)
+
+logger = logging.getLogger(__name__)
+
+LEXICON_METHODS = ("lexicon", "vader", "nltk_vader", "textblob_placeholder")
+# Below this many texts, NumPy's per-call overhead outweighs vectorization (~35us per chat message
+# through the per-token path vs ~200us for a one-text array pass)
+VECTORIZE_MIN_BATCH = 32
+
+
+def label_for(compound):
+    if compound >= 0.05:
+        return "positive"
+    if compound <= -0.05:
+        return "negative"
+    return "neutral"
+
+
+def _finalize(raw, pos_sum, neg_sum, neutral_count, emphasis):
+    """VADER's normalization of the summed token sentiments into the result dict."""
+    if raw > 0:
+        raw += emphasis
+    elif raw < 0:
+        raw -= emphasis
+    compound = max(-1.0, min(1.0, raw / math.sqrt(raw * raw + NORMALIZATION_ALPHA)))
+    if pos_sum > abs(neg_sum):
+        pos_sum += emphasis
+    elif pos_sum < abs(neg_sum):
+        neg_sum -= emphasis
+    total = pos_sum + abs(neg_sum) + neutral_count
+    if total:
+        pos, neg, neu = abs(pos_sum) / total, abs(neg_sum) / total, neutral_count / total
+    else:
+        pos, neg, neu = 0.0, 0.0, 1.0
+    compound = round(compound, 4)
+    return {"neg": round(neg, 3), "neu": round(neu, 3), "pos": round(pos, 3),
+            "compound": compound, "polarity": compound, "label": label_for(compound)}
+
+
+def _from_probability(probability):
+    """Result dict for a model's P(positive): compound = 2p - 1."""
+    compound = round(2 * probability - 1, 4)
+    return {"neg": round(1 - probability, 3), "neu": 0.0, "pos": round(probability, 3),
+            "compound": compound, "polarity": compound, "label": label_for(compound)}
+
 
 class SentimentAnalyzer:
-    def __init__(self, method="textblob_placeholder"): # or "nltk_vader", "custom_ml"
+    def __init__(self, method="lexicon", lexicon=None, model_path="sentiment_model_custom"):
         """
         Initializes the sentiment analyzer.
-        :param method: The technique/library to use (e.g., TextBlob, NLTK VADER, custom ML model).
+        :param method: "lexicon" (VADER-style rules; "vader", "nltk_vader" and "textblob_placeholder"
+                       are accepted as aliases) or "custom_ml" (a model trained by SentimentModelTrainer).
+        :param lexicon: Optional Lexicon (e.g. Lexicon.from_vader_file(...)); defaults to the built-in one.
+        :param model_path: custom_ml artifact path (as passed to SentimentModelTrainer). If it can't be
+                           loaded, every text scores neutral.
         """
         self.method = method
-        print(f"SentimentAnalyzer initialized using method: {self.method} (simulated).")
-
-        if self.method == "textblob_placeholder":
-            # from textblob import TextBlob # Would be imported here
-            pass
-        elif self.method == "nltk_vader":
-            # import nltk
-            # try:
-            #     from nltk.sentiment.vader import SentimentIntensityAnalyzer
-            #     self.analyzer = SentimentIntensityAnalyzer()
-            # except LookupError:
-            #     nltk.download('vader_lexicon')
-            #     from nltk.sentiment.vader import SentimentIntensityAnalyzer
-            #     self.analyzer = SentimentIntensityAnalyzer()
-            pass
-        else:
-            # Placeholder for custom model loading
-            pass
+        self.lexicon = lexicon or default_lexicon()
+        self.model = None
+        if method == "custom_ml":
+            try:
+                self.model = LinearSentimentModel.load(model_path)
+            except (FileNotFoundError, ValueError) as e:
+                logger.warning(f"custom_ml sentiment model unavailable ({e}); scoring everything neutral.")
+        logger.info(f"SentimentAnalyzer initialized using method: {self.method}.")
 
     def analyze_sentiment(self, text):
         """
         Analyzes the sentiment of a given text.
-        :return: A dictionary with sentiment scores (e.g., polarity, subjectivity, or pos/neg/neu).
-                 Example: {'polarity': 0.8, 'subjectivity': 0.75} for TextBlob
-                          {'neg': 0.0, 'neu': 0.3, 'pos': 0.7, 'compound': 0.9} for VADER
+        :return: {'neg', 'neu', 'pos': proportions, 'compound': -1..1, 'polarity': same as compound,
+                  'label': 'positive' | 'negative' | 'neutral'}
         """
-        if not text or not text.strip():
-            return {"polarity": 0.0, "subjectivity": 0.0, "label": "neutral"}
-
-
-        if self.method == "textblob_placeholder":
-            # Simulating TextBlob
-            # blob = TextBlob(text)
-            # polarity = blob.sentiment.polarity
-            # subjectivity = blob.sentiment.subjectivity
-            # For simulation:
-            polarity = 0.0
-            if "happy" in text.lower() or "great" in text.lower(): polarity = 0.8
-            elif "sad" in text.lower() or "bad" in text.lower(): polarity = -0.6
-            subjectivity = 0.5 # Default placeholder
-            
-            label = "neutral"
-            if polarity > 0.1: label = "positive"
-            elif polarity < -0.1: label = "negative"
-            
-            return {"polarity": polarity, "subjectivity": subjectivity, "label": label}
-
-        elif self.method == "nltk_vader":
-            # scores = self.analyzer.polarity_scores(text)
-            # For simulation:
-            compound = 0.0
-            if "love" in text.lower() or "excellent" in text.lower(): compound = 0.85
-            elif "hate" in text.lower() or "terrible" in text.lower(): compound = -0.75
-            
-            label = "neutral"
-            if compound >= 0.05: label = "positive"
-            elif compound <= -0.05: label = "negative"
-
-            return {"neg": 0.0, "neu": 0.5, "pos": 0.5, "compound": compound, "label": label} # Simplified scores
-
-        print(f"Simulating sentiment analysis for: '{text}'")
-        return {"label": "neutral", "score": 0.0} # Default for other methods
+        if self.method not in LEXICON_METHODS:
+            return self._analyze_with_model([text])[0]
+        running = StreamingSentiment(self.lexicon)
+        running._consume(text or "")
+        return running.score()
+
+    def analyze_batch(self, texts):
+        """Scores many texts at once; returns one analyze_sentiment() dict per text."""
+        if self.method not in LEXICON_METHODS:
+            return self._analyze_with_model(texts)
+        if len(texts) < VECTORIZE_MIN_BATCH:
+            return [self.analyze_sentiment(text) for text in texts]
+        lexicon = self.lexicon
+        ids, caps, offsets, emphasis, mixed = [], [], [0], [], []
+        for text in texts:
+            text_ids, text_caps, exclamations, questions = lexicon.tokenize(text or "")
+            ids.extend(text_ids)
+            caps.extend(text_caps)
+            offsets.append(len(ids))
+            emphasis.append(punctuation_emphasis(exclamations, questions))
+            n_caps = sum(text_caps)
+            mixed.append(0 < n_caps < len(text_caps))
+        if not ids:
+            return [_finalize(0.0, 0.0, 0.0, 0, e) for e in emphasis]
+
+        ids = np.asarray(ids, dtype=np.intp)
+        caps = np.asarray(caps, dtype=bool)
+        offsets = np.asarray(offsets)
+        doc = np.repeat(np.arange(len(texts)), np.diff(offsets))
+        position = np.arange(len(ids)) - offsets[doc]
+
+        valence = lexicon.valence[ids]
+        sign = np.sign(valence)
+        base = valence.copy()
+        caps_part = sign * C_INCR * caps
+        negations = np.zeros(len(ids))
+        for k in range(1, WINDOW + 1):
+            valid = position >= k
+            previous = np.where(valid, np.roll(ids, k), 0)
+            boost = lexicon.boost[previous]
+            damping = WINDOW_DAMPING[k - 1]
+            base += sign * boost * damping
+            caps_part += sign * C_INCR * (np.roll(caps, k) & valid & (boost != 0)) * damping
+            negations += lexicon.negation[previous]
+        scale = N_SCALAR ** negations
+
+        # Tokens before a text's first "but" count half, tokens after it one and a half
+        is_but = ids == lexicon.but_id
+        buts_before = np.cumsum(is_but) - is_but
+        buts_before -= buts_before[offsets[:-1][doc]]
+        has_but = np.bincount(doc, weights=is_but, minlength=len(texts)) > 0
+        weight = np.where(has_but[doc], np.where(buts_before > 0, BUT_AFTER, BUT_BEFORE), 1.0)
+
+        sentiment = weight * scale * (base + np.asarray(mixed)[doc] * caps_part)
+        raw = np.bincount(doc, weights=sentiment, minlength=len(texts))
+        pos_sum = np.bincount(doc, weights=np.where(sentiment > 0, sentiment + 1, 0.0), minlength=len(texts))
+        neg_sum = np.bincount(doc, weights=np.where(sentiment < 0, sentiment - 1, 0.0), minlength=len(texts))
+        neutral = np.bincount(doc, weights=sentiment == 0, minlength=len(texts))
+        return [_finalize(*values) for values in zip(raw.tolist(), pos_sum.tolist(), neg_sum.tolist(),
+                                                     neutral.tolist(), emphasis)]
+
+    def _analyze_with_model(self, texts):
+        if self.model is None:
+            return [_finalize(0.0, 0.0, 0.0, 0, 0.0) for _ in texts]
+        return [_from_probability(p) for p in self.model.predict_proba_texts([text or "" for text in texts]).tolist()]
+
+    def stream(self):
+        """A StreamingSentiment that scores text chunk by chunk as it arrives."""
+        if self.method not in LEXICON_METHODS:
+            return _BufferedStream(self)
+        return StreamingSentiment(self.lexicon)
+
+
+class _BufferedStream:
+    """stream() for custom_ml: n-gram features need the whole text, so each score re-reads it."""
+    def __init__(self, analyzer):
+        self._analyzer = analyzer
+        self._parts = []
+
+    def feed(self, chunk):
+        self._parts.append(chunk)
+        return self.score()
+
+    def finish(self):
+        return self.score()
+
+    def score(self):
+        return self._analyzer.analyze_sentiment("".join(self._parts))
+
+
+class StreamingSentiment:
+    """
+    Running sentiment over streamed text (e.g. model reply chunks). Each token is scored once,
+    when the whitespace after it arrives; score() at the end equals analyze_sentiment() on the
+    whole text. Per-token sums are kept split by "but" side and ALL-CAPS share, because both
+    adjustments depend on text that may not have arrived yet.
+    """
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon or default_lexicon()
+        self._pending = ""
+        self._window = []  # Last WINDOW (id, caps) pairs, oldest first
+        self._seen_but = False
+        self._tokens = 0
+        self._caps_tokens = 0
+        self._exclamations = 0
+        self._questions = 0
+        self._neutral = 0
+        # [before first "but", after it] x (base sum, caps sum, count) for positive / negative tokens
+        self._positive = [[0.0, 0.0, 0], [0.0, 0.0, 0]]
+        self._negative = [[0.0, 0.0, 0], [0.0, 0.0, 0]]
+
+    def feed(self, chunk):
+        """Adds a chunk of text; returns the running score."""
+        text = self._pending + chunk
+        cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"))
+        self._pending = text[cut + 1:]
+        if cut >= 0:
+            self._consume(text[:cut + 1])
+        return self.score()
+
+    def finish(self):
+        """Scores any text held back at the end; returns the final score."""
+        if self._pending:
+            self._consume(self._pending)
+            self._pending = ""
+        return self.score()
+
+    def _consume(self, text):
+        lexicon = self.lexicon
+        ids, caps, exclamations, questions = lexicon.tokenize(text)
+        self._exclamations += exclamations
+        self._questions += questions
+        valences, boosts, negation = lexicon.valence_list, lexicon.boost_list, lexicon.negation_list
+        window = self._window
+        for token_id, token_caps in zip(ids, caps):
+            self._tokens += 1
+            self._caps_tokens += token_caps
+            valence = valences[token_id]
+            if token_id == lexicon.but_id:
+                self._seen_but = True
+            if valence:
+                sign = 1.0 if valence > 0 else -1.0
+                base, caps_part, negations = valence, sign * C_INCR * token_caps, 0
+                for k, (previous, previous_caps) in enumerate(reversed(window), start=1):
+                    boost = boosts[previous]
+                    damping = WINDOW_DAMPING[k - 1]
+                    base += sign * boost * damping
+                    caps_part += sign * C_INCR * (previous_caps and boost != 0) * damping
+                    negations += negation[previous]
+                scale = N_SCALAR ** negations
+                sums = (self._positive if sign * scale > 0 else self._negative)[self._seen_but]
+                sums[0] += scale * base
+                sums[1] += scale * caps_part
+                sums[2] += 1
+            else:
+                self._neutral += 1
+            window.append((token_id, token_caps))
+            if len(window) > WINDOW:
+                del window[0]
+
+    def score(self):
+        """Sentiment of the text consumed so far (same dict as SentimentAnalyzer.analyze_sentiment)."""
+        mixed = 0 < self._caps_tokens < self._tokens
+        weights = (BUT_BEFORE, BUT_AFTER) if self._seen_but else (1.0, 1.0)
+        raw = pos_sum = neg_sum = 0.0
+        for side, weight in enumerate(weights):
+            for sums, offset in ((self._positive[side], 1), (self._negative[side], -1)):
+                total = weight * (sums[0] + mixed * sums[1])
+                raw += total
+                if offset > 0:
+                    pos_sum += total + sums[2]
+                else:
+                    neg_sum += total - sums[2]
+        return _finalize(raw, pos_sum, neg_sum, self._neutral,
+                         punctuation_emphasis(self._exclamations, self._questions))
+
 
 if __name__ == '__main__':
-    analyzer_tb = SentimentAnalyzer(method="textblob_placeholder")
-    text1 = "GURU is a wonderfully helpful AI!"
-    sentiment1 = analyzer_tb.analyze_sentiment(text1)
-    print(f"Sentiment for '{text1}': {sentiment1}")
-
-    text2 = "I am very unhappy with this response."
-    sentiment2 = analyzer_tb.analyze_sentiment(text2)
-    print(f"Sentiment for '{text2}': {sentiment2}")
-
-    text3 = "This is a factual statement."
-    sentiment3 = analyzer_tb.analyze_sentiment(text3)
-    print(f"Sentiment for '{text3}': {sentiment3}")
-    
-    # analyzer_vader = SentimentAnalyzer(method="nltk_vader")
-    # text4 = "VADER is great for social media text."
-    # sentiment4 = analyzer_vader.analyze_sentiment(text4)
-    # print(f"Sentiment for '{text4}' (VADER sim): {sentiment4}")
+    analyzer = SentimentAnalyzer()
+    for text in ("GURU is a wonderfully helpful AI!", "I am very unhappy with this response.",
+                 "This is a factual statement.", "The answer was not bad, but the wait was TERRIBLE!!"):
+        print(f"Sentiment for '{text}': {analyzer.analyze_sentiment(text)}")
+
+    print("Batch:", [result["label"] for result in analyzer.analyze_batch(["great", "awful", "meh"])])
+
+    running = analyzer.stream()
+    for chunk in ("I really lo", "ve this, ", "thank you so much!"):
+        print(f"After {chunk!r}: {running.feed(chunk)['compound']}")
+    print("Final:", running.finish())
@@ -0,0 +1,215 @@
+# modules/sentiment/features.py
+# Sparse text features for the trainable sentiment model.
+# HashingVectorizer maps words and word bigrams straight to column indices (no vocabulary to
+# store or grow), producing CSRMatrix rows. Feature matrices for large datasets are written to
+# disk in chunks and memory-mapped back, so training never holds the whole dataset in RAM.
+
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+class CSRMatrix:
+    """
+    Minimal compressed-sparse-row matrix: row i's columns are indices[indptr[i]:indptr[i+1]]
+    with values data[indptr[i]:indptr[i+1]]. The arrays may be in-memory or memory-mapped.
+    `source` is the write_features() prefix a memory-mapped matrix was opened from (else None).
+    """
+    def __init__(self, data, indices, indptr, n_features, source=None):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.n_features = n_features
+        self.source = source
+
+    @property
+    def shape(self):
+        return (len(self.indptr) - 1, self.n_features)
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1] - self.indptr[0])
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row_ids(self):
+        """Row number of every stored value."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def rows(self, start, stop):
+        """Rows [start, stop) as a CSRMatrix sharing (views of) this matrix's arrays."""
+        begin, end = int(self.indptr[start]), int(self.indptr[stop])
+        return CSRMatrix(self.data[begin:end], self.indices[begin:end],
+                         np.asarray(self.indptr[start:stop + 1]) - begin, self.n_features)
+
+    def take(self, rows):
+        """The given rows (any order, repeats allowed) copied into a new in-memory CSRMatrix."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.asarray(self.indptr[rows])
+        lengths = np.asarray(self.indptr[rows + 1]) - starts
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        positions = np.arange(indptr[-1], dtype=np.int64) + np.repeat(starts - indptr[:-1], lengths)
+        return CSRMatrix(np.asarray(self.data[positions]), np.asarray(self.indices[positions]), indptr, self.n_features)
+
+    def dot(self, weights):
+        """X @ weights for a dense weight vector: one value per row."""
+        data = np.asarray(self.data, dtype=np.float64)
+        products = data * np.asarray(weights)[np.asarray(self.indices)]
+        return np.bincount(self.row_ids(), weights=products, minlength=len(self))
+
+    @classmethod
+    def vstack(cls, matrices, n_features):
+        data = np.concatenate([m.data for m in matrices]) if matrices else np.zeros(0, np.float32)
+        indices = np.concatenate([m.indices for m in matrices]) if matrices else np.zeros(0, np.int32)
+        lengths = np.concatenate([np.diff(m.indptr) for m in matrices]) if matrices else np.zeros(0, np.int64)
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        return cls(data, indices, indptr, n_features)
+
+
+class HashingVectorizer:
+    def __init__(self, n_features=2 ** 20, ngram_range=(1, 2), cache_size=1_000_000):
+        """
+        Hashing-trick bag of n-grams with signed buckets and L2-normalized rows.
+        :param n_features: Number of columns (hash buckets).
+        :param ngram_range: (min n, max n) word n-grams; (1, 2) adds bigrams such as "not good".
+        :param cache_size: Distinct n-grams whose (column, sign) is memoized; chat vocabulary is
+                           heavily skewed, so most lookups skip the hash entirely.
+        """
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def params(self):
+        """What an artifact must record to reproduce these features."""
+        return {"n_features": self.n_features, "ngram_range": list(self.ngram_range), "hash": "crc32", "lowercase": True}
+
+    def _bucket(self, gram):
+        cached = self._cache.get(gram)
+        if cached is None:
+            h = zlib.crc32(gram.encode("utf-8"))  # Stable across processes, unlike hash()
+            cached = (h % self.n_features, 1.0 if (h >> 31) & 1 else -1.0)
+            if len(self._cache) < self.cache_size:
+                self._cache[gram] = cached
+        return cached
+
+    def grams(self, text):
+        words = _TOKEN_PATTERN.findall(text.lower())
+        low, high = self.ngram_range
+        grams = list(words) if low <= 1 else []
+        for n in range(max(low, 2), high + 1):
+            grams.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+        return grams
+
+    def _row_counts(self, text):
+        row = {}
+        cache = self._cache
+        for gram in self.grams(text or ""):
+            cached = cache.get(gram) or self._bucket(gram)  # Inlined cache hit: this loop is the hot path
+            column = cached[0]
+            row[column] = row.get(column, 0.0) + cached[1]
+        return row
+
+    def transform_row(self, text):
+        """(column indices, values) of one L2-normalized row."""
+        matrix = self.transform([text])
+        return matrix.indices, matrix.data
+
+    def transform(self, texts):
+        """CSRMatrix with one L2-normalized row per text."""
+        indices, data = [], []
+        indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        for i, text in enumerate(texts):
+            row = self._row_counts(text)
+            indices.extend(row.keys())
+            data.extend(row.values())
+            indptr[i + 1] = len(indices)
+        values = np.asarray(data, dtype=np.float32)
+        # Row norms in one pass over all values rather than one small NumPy call per row
+        lengths = np.diff(indptr)
+        squares = np.bincount(np.repeat(np.arange(len(texts)), lengths), weights=values * values, minlength=len(texts))
+        norms = np.sqrt(squares).astype(np.float32)
+        norms[norms == 0] = 1.0
+        values /= np.repeat(norms, lengths)
+        return CSRMatrix(values, np.asarray(indices, dtype=np.int32), indptr, self.n_features)
+
+
+def _feature_paths(prefix):
+    return {name: f"{prefix}.{name}" for name in ("data", "indices", "indptr", "labels")}
+
+
+def write_features(rows, prefix, vectorizer, chunk_rows=10000):
+    """
+    Vectorizes (text, label) pairs chunk by chunk into memory-mappable files:
+    <prefix>.data (float32), .indices (int32), .indptr (int64), .labels (int8) and .meta.json.
+    Memory use is bounded by one chunk. Returns open_features(prefix).
+    """
+    paths = _feature_paths(prefix)
+    directory = os.path.dirname(os.path.abspath(prefix))
+    os.makedirs(directory, exist_ok=True)
+    total_rows, nnz = 0, 0
+    with open(paths["data"], "wb") as data_file, open(paths["indices"], "wb") as indices_file, \
+            open(paths["indptr"], "wb") as indptr_file, open(paths["labels"], "wb") as labels_file:
+        indptr_file.write(np.zeros(1, dtype=np.int64).tobytes())
+        texts, labels = [], []
+
+        def flush():
+            nonlocal total_rows, nnz
+            matrix = vectorizer.transform(texts)
+            data_file.write(matrix.data.astype(np.float32).tobytes())
+            indices_file.write(matrix.indices.astype(np.int32).tobytes())
+            indptr_file.write((matrix.indptr[1:] + nnz).astype(np.int64).tobytes())
+            labels_file.write(np.asarray(labels, dtype=np.int8).tobytes())
+            total_rows += len(texts)
+            nnz += matrix.nnz
+            texts.clear()
+            labels.clear()
+
+        for text, label in rows:
+            texts.append(text)
+            labels.append(label)
+            if len(texts) >= chunk_rows:
+                flush()
+        if texts:
+            flush()
+    with open(f"{prefix}.meta.json", "w") as f:
+        json.dump({"rows": total_rows, "nnz": nnz, "vectorizer": vectorizer.params()}, f)
+    return open_features(prefix)
+
+
+def dump_features(matrix, labels, prefix, vectorizer):
+    """Writes an existing CSRMatrix and its labels in write_features()' layout; returns the prefix."""
+    paths = _feature_paths(prefix)
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    indptr = np.asarray(matrix.indptr, dtype=np.int64)
+    np.asarray(matrix.data, dtype=np.float32).tofile(paths["data"])
+    np.asarray(matrix.indices, dtype=np.int32).tofile(paths["indices"])
+    (indptr - indptr[0]).tofile(paths["indptr"])
+    np.asarray(labels, dtype=np.int8).tofile(paths["labels"])
+    with open(f"{prefix}.meta.json", "w") as f:
+        json.dump({"rows": len(matrix), "nnz": matrix.nnz, "vectorizer": vectorizer.params()}, f)
+    return prefix
+
+
+def open_features(prefix):
+    """Memory-maps a feature set written by write_features: (CSRMatrix, int8 labels)."""
+    with open(f"{prefix}.meta.json") as f:
+        meta = json.load(f)
+    paths = _feature_paths(prefix)
+    rows, nnz = meta["rows"], meta["nnz"]
+
+    def mapped(path, dtype, length):
+        # np.memmap refuses zero-length files
+        return np.memmap(path, dtype=dtype, mode="r", shape=(length,)) if length else np.zeros(0, dtype)
+
+    matrix = CSRMatrix(mapped(paths["data"], np.float32, nnz), mapped(paths["indices"], np.int32, nnz),
+                       mapped(paths["indptr"], np.int64, rows + 1), meta["vectorizer"]["n_features"], source=prefix)
+    return matrix, mapped(paths["labels"], np.int8, rows)
@@ -0,0 +1,155 @@
+# modules/sentiment/lexicon.py
+# Sentiment lexicon compiled once into lookup tables for the VADER-style scorer in analyzer.py.
+# Every known word (valence entries, intensifiers, negations, "but") gets an integer id; id 0 is
+# "unknown". Per-id properties live in NumPy arrays, so scoring a tokenized text is array indexing.
+
+import re
+
+import numpy as np
+
+# VADER's empirically derived constants (Hutto & Gilbert, 2014)
+B_INCR = 0.293      # Intensifier ("very good")
+B_DECR = -0.293     # Dampener ("slightly good")
+C_INCR = 0.733      # ALL-CAPS emphasis when the text mixes caps and non-caps words
+N_SCALAR = -0.74    # Negation ("not good")
+BUT_BEFORE = 0.5    # Sentiment before "but" is damped...
+BUT_AFTER = 1.5     # ...and after it emphasized
+NORMALIZATION_ALPHA = 15
+WINDOW = 3          # Intensifiers/negations reach up to 3 words ahead
+WINDOW_DAMPING = (1.0, 0.95, 0.9)
+
+# Valence on VADER's -4..+4 scale. A compact built-in list covering common chat vocabulary;
+# Lexicon.from_vader_file() loads the full VADER lexicon (vader_lexicon.txt) when available.
+_VALENCE_TABLE = """
+good 1.9 great 3.1 excellent 2.7 amazing 2.8 awesome 3.1 wonderful 2.7 fantastic 2.6 brilliant 2.8
+love 3.2 loved 2.9 loves 2.7 lovely 2.8 like 1.5 liked 1.8 likes 1.8 enjoy 2.2 enjoyed 2.3 nice 1.8
+happy 2.7 happier 2.4 glad 2.0 pleased 1.9 delighted 2.9 thrilled 3.0 excited 1.4 exciting 2.2
+thanks 1.9 thank 1.5 thankful 2.7 grateful 2.0 appreciate 1.7 appreciated 2.3 helpful 1.8 useful 1.9
+perfect 2.7 best 3.2 better 1.9 beautiful 2.9 cool 1.3 fun 2.3 funny 1.9 interesting 1.7 impressive 2.3
+friendly 2.2 smart 1.7 clever 1.6 clear 1.6 easy 1.9 fine 0.8 ok 0.9 okay 0.9 yes 1.7 yay 2.4
+win 2.8 won 2.7 success 2.7 successful 2.8 solved 1.1 fixed 1.1 works 0.6 working 0.4 correct 1.7
+hope 1.9 hopeful 2.3 optimistic 1.3 confident 2.2 calm 1.3 relaxed 2.2 relief 2.1 relieved 1.6 safe 1.9
+proud 2.1 joy 2.8 joyful 2.9 fabulous 2.4 superb 3.1 incredible 2.2 magnificent 3.4 outstanding 3.0
+welcome 2.0 congrats 2.4 congratulations 2.9 cheers 2.1 sweet 2.0 cute 2.0 wow 2.8 haha 2.0 lol 2.9
+agree 1.5 recommend 1.5 support 1.7 trust 2.3 care 2.2 caring 2.2 gentle 1.9 generous 2.3 honest 2.3
+fair 1.3 free 2.3 fresh 1.3 healthy 1.7 strong 2.3 powerful 1.8 positive 2.6 benefit 2.0 benefits 1.6
+bad -2.5 worse -2.1 worst -3.1 terrible -2.1 horrible -2.5 awful -2.0 poor -2.1 hate -2.7 hated -3.2
+hates -1.9 dislike -1.6 sad -2.1 sadly -1.6 unhappy -1.8 angry -2.3 annoyed -1.6 annoying -1.7 mad -2.2
+upset -1.6 frustrated -2.4 frustrating -1.9 disappointed -1.9 disappointing -2.2 depressed -2.3
+stupid -2.4 dumb -2.3 useless -1.8 broken -1.9 wrong -2.1 fail -2.5 failed -2.3 fails -2.2 failure -2.3
+error -1.7 errors -1.4 bug -1.0 bugs -1.0 crash -1.7 crashed -1.6 problem -1.7 problems -1.7 issue -0.5
+slow -1.0 confusing -1.3 confused -1.3 difficult -1.5 hard -0.4 boring -1.3 ugly -2.3 nasty -2.6
+sorry -0.3 worried -1.2 worry -1.9 afraid -2.2 scared -1.9 fear -2.2 anxious -1.0 stress -1.8
+stressed -1.4 tired -1.9 sick -2.3 hurt -2.4 pain -2.3 painful -2.4 cry -2.1 crying -2.1 lonely -1.5
+lost -1.3 lose -1.7 losing -1.6 loss -1.3 no -1.2 nope -0.5 sucks -1.5 suck -1.9 crap -1.6
+damn -1.7 hell -3.6 wtf -2.8 ridiculous -1.5 pathetic -2.0 disaster -3.1 mess -1.5 miserable -2.2
+lazy -1.4 rude -2.0 mean -0.8 evil -3.4 cruel -2.8 danger -2.4 dangerous -2.1 risk -1.1 threat -2.4
+ignore -1.5 ignored -1.3 reject -1.7 rejected -2.3 blame -1.4 guilty -1.8 shame -2.1 ashamed -2.1
+unfortunately -1.8 fault -1.7 complain -1.5 complaint -1.2 waste -1.8 wasted -2.2 garbage -1.5
+nightmare -2.7 killing -3.4 kill -3.7 dead -3.3 die -2.9 died -2.6 dying -2.9 war -2.9
+:) 2.0 :-) 1.3 :d 2.3 :-d 2.3 :( -1.9 :-( -1.5 ;) 0.9 ;-) 1.4 :p 1.4 :/ -1.4 :'( -2.2 <3 1.9
+"""
+
+_BOOSTER_WORDS = {
+    "absolutely", "amazingly", "awfully", "completely", "considerably", "decidedly", "deeply",
+    "enormously", "entirely", "especially", "exceptionally", "extremely", "fabulously", "greatly",
+    "highly", "hugely", "incredibly", "intensely", "majorly", "more", "most", "particularly",
+    "purely", "quite", "really", "remarkably", "so", "substantially", "thoroughly", "totally",
+    "tremendously", "truly", "unbelievably", "unusually", "utterly", "very", "super", "such",
+}
+_DAMPENER_WORDS = {
+    "almost", "barely", "hardly", "kinda", "kindof", "less", "little", "marginally", "occasionally",
+    "partly", "scarcely", "slightly", "somewhat", "sorta", "sortof",
+}
+_NEGATIONS = {
+    "aint", "arent", "cannot", "cant", "couldnt", "darent", "didnt", "doesnt", "ain't", "aren't",
+    "can't", "couldn't", "daren't", "didn't", "doesn't", "dont", "hadnt", "hasnt", "havent", "isnt",
+    "mightnt", "mustnt", "neither", "don't", "hadn't", "hasn't", "haven't", "isn't", "mightn't",
+    "mustn't", "neednt", "needn't", "never", "none", "nope", "nor", "not", "nothing", "nowhere",
+    "oughtnt", "shant", "shouldnt", "wasnt", "werent", "oughtn't", "shan't", "shouldn't", "wasn't",
+    "weren't", "without", "wont", "wouldnt", "won't", "wouldn't", "rarely", "seldom", "despite",
+}
+
+# Words (with inner apostrophes) and a handful of ASCII emoticons
+TOKEN_PATTERN = re.compile(r"[:;=][-']?[()dDpP/]|<3|[A-Za-z0-9]+(?:['’][A-Za-z]+)*")
+
+
+def _parse_valence_table(table):
+    fields = table.split()
+    return {fields[i]: float(fields[i + 1]) for i in range(0, len(fields), 2)}
+
+
+class Lexicon:
+    def __init__(self, valences=None, boosters=_BOOSTER_WORDS, dampeners=_DAMPENER_WORDS, negations=_NEGATIONS):
+        """
+        Compiles the word lists into id-indexed arrays.
+        :param valences: {word or emoticon: valence}; defaults to the built-in table.
+        """
+        if valences is None:
+            valences = _parse_valence_table(_VALENCE_TABLE)
+        words = sorted(set(valences) | set(boosters) | set(dampeners) | set(negations) | {"but"})
+        self.index = {word: i + 1 for i, word in enumerate(words)}  # 0 = unknown word
+        size = len(words) + 1
+        self.valence = np.zeros(size)
+        self.boost = np.zeros(size)
+        self.negation = np.zeros(size, dtype=bool)
+        self.but_id = self.index["but"]
+        for word, value in valences.items():
+            self.valence[self.index[word]] = value
+        for word in boosters:
+            self.boost[self.index[word]] = B_INCR
+        for word in dampeners:
+            self.boost[self.index[word]] = B_DECR
+        for word in negations:
+            self.negation[self.index[word]] = True
+        # Plain-list copies for the per-token streaming path (list indexing beats NumPy scalars)
+        self.valence_list = self.valence.tolist()
+        self.boost_list = self.boost.tolist()
+        self.negation_list = self.negation.tolist()
+
+    @classmethod
+    def from_vader_file(cls, path):
+        """Loads a VADER-format lexicon: one 'token<TAB>mean valence<TAB>...' entry per line."""
+        valences = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 2:
+                    try:
+                        valences[fields[0].lower()] = float(fields[1])
+                    except ValueError:
+                        continue
+        return cls(valences)
+
+    def tokenize(self, text):
+        """
+        One pass over the text: (token ids, ALL-CAPS flags, '!' count, '?' count).
+        Emoticons are never ALL-CAPS; single letters don't count as caps either.
+        """
+        tokens = TOKEN_PATTERN.findall(text)
+        lookup = self.index.get
+        if "’" in text:
+            ids = [lookup(token.lower().replace("’", "'"), 0) for token in tokens]
+        else:
+            ids = [lookup(token.lower(), 0) for token in tokens]
+        caps = [token.isupper() and len(token) > 1 and token[0].isalnum() for token in tokens]
+        return ids, caps, text.count("!"), text.count("?")
+
+
+def punctuation_emphasis(exclamations, questions):
+    """VADER's boost for '!' (up to 4) and repeated '?' (2 or more)."""
+    emphasis = min(exclamations, 4) * 0.292
+    if questions > 1:
+        emphasis += questions * 0.18 if questions <= 3 else 0.96
+    return emphasis
+
+
+_DEFAULT_LEXICON = None
+
+
+def default_lexicon():
+    """The built-in lexicon, compiled on first use and shared."""
+    global _DEFAULT_LEXICON
+    if _DEFAULT_LEXICON is None:
+        _DEFAULT_LEXICON = Lexicon()
+    return _DEFAULT_LEXICON
@@ -0,0 +1,64 @@
+# modules/sentiment/linear_model.py
+# Inference side of the trainable sentiment model: a logistic regression over hashed n-grams.
+# The artifact is <path>.weights.npy (float32, memory-mapped on load, so loading is a few
+# milliseconds regardless of size) plus <path>.meta.json (bias and vectorizer hash parameters).
+
+import json
+import os
+
+import numpy as np
+
+from .features import HashingVectorizer
+
+ARTIFACT_FORMAT = "guru-sentiment-logreg"
+ARTIFACT_VERSION = 1
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -35.0, 35.0)))
+
+
+class LinearSentimentModel:
+    def __init__(self, weights, bias, vectorizer):
+        """
+        :param weights: One float per hashed feature column (may be a read-only memmap).
+        :param bias: Intercept.
+        :param vectorizer: HashingVectorizer with the parameters the model was trained with.
+        """
+        self.weights = weights
+        self.bias = float(bias)
+        self.vectorizer = vectorizer
+
+    def predict_proba(self, features):
+        """P(positive) for each row of a CSRMatrix."""
+        return sigmoid(features.dot(self.weights) + self.bias)
+
+    def predict_proba_texts(self, texts):
+        return self.predict_proba(self.vectorizer.transform(texts))
+
+    def save(self, path):
+        """Writes the artifact; returns the weights file path."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        weights_path = f"{path}.weights.npy"
+        np.save(weights_path, np.asarray(self.weights, dtype=np.float32))
+        with open(f"{path}.meta.json", "w") as f:
+            json.dump({"format": ARTIFACT_FORMAT, "version": ARTIFACT_VERSION, "bias": self.bias,
+                       "vectorizer": self.vectorizer.params()}, f)
+        return weights_path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads an artifact written by save(). Raises FileNotFoundError or ValueError."""
+        with open(f"{path}.meta.json") as f:
+            meta = json.load(f)
+        if meta.get("format") != ARTIFACT_FORMAT or meta.get("version") != ARTIFACT_VERSION:
+            raise ValueError(f"{path} is not a {ARTIFACT_FORMAT} v{ARTIFACT_VERSION} artifact.")
+        params = meta["vectorizer"]
+        if params.get("hash") != "crc32" or not params.get("lowercase", True):
+            raise ValueError(f"Unsupported vectorizer parameters in {path}: {params}")
+        weights = np.load(f"{path}.weights.npy", mmap_mode="r" if mmap else None)
+        vectorizer = HashingVectorizer(n_features=params["n_features"], ngram_range=params["ngram_range"])
+        if len(weights) != vectorizer.n_features:
+            raise ValueError(f"{path}: {len(weights)} weights for {vectorizer.n_features} features.")
+        return cls(weights, meta["bias"], vectorizer)
@@ -0,0 +1,83 @@
+# modules/sentiment/pipeline.py
+# Tone adaptation for chat replies, kept off the critical path.
+# The user's message is scored on a worker thread while the model call starts. When the first
+# model token is ready, the chat route asks for the tone prefix. It gets one only if sentiment
+# has already finished; otherwise the prefix is skipped, so tone adaptation never delays the
+# first token. Short messages and weak scores get no prefix: an opener on a guess reads worse
+# than none.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .analyzer import SentimentAnalyzer
+from .response_modifier import ResponseModifier
+
+logger = logging.getLogger(__name__)
+
+
+class ToneTask:
+    """Sentiment of one user message, being computed in the background."""
+    def __init__(self, pipeline, future):
+        self._pipeline = pipeline
+        self._future = future
+        self.sentiment = None
+
+    def prefix_if_ready(self):
+        """
+        Returns the reply prefix for the user's sentiment ('' for none) without waiting:
+        if the analysis hasn't finished yet, it is abandoned and '' is returned.
+        """
+        if self._future is None:  # Message too short to score
+            self._pipeline._count("neutral")
+            return ""
+        if not self._future.done():
+            self._future.cancel()
+            self._pipeline._count("late")
+            logger.debug("Sentiment not ready at first token; skipping tone prefix.")
+            return ""
+        try:
+            self.sentiment = self._future.result()
+        except Exception as e:
+            self._pipeline._count("failed")
+            logger.error(f"Sentiment analysis failed: {e}")
+            return ""
+        confident = abs(self.sentiment.get("compound", 0.0)) >= self._pipeline.min_compound
+        prefix = self._pipeline.modifier.prefix_for(self.sentiment) if confident else ""
+        self._pipeline._count("prefixed" if prefix else "neutral")
+        return prefix
+
+
+class TonePipeline:
+    def __init__(self, analyzer=None, modifier=None, max_workers=2, min_words=3, min_compound=0.5):
+        """
+        :param analyzer: SentimentAnalyzer used for user messages (default: lexicon engine).
+        :param modifier: ResponseModifier choosing the prefix.
+        :param max_workers: Threads scoring messages; the work is tens of microseconds per message.
+        :param min_words: Messages with fewer words get no prefix and aren't scored.
+        :param min_compound: Smallest |compound| score that gets a prefix.
+        """
+        self.analyzer = analyzer or SentimentAnalyzer()
+        self.modifier = modifier or ResponseModifier()
+        self.min_words = min_words
+        self.min_compound = min_compound
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="guru-sentiment")
+        self._lock = threading.Lock()
+        self._counts = {"prefixed": 0, "neutral": 0, "late": 0, "failed": 0}
+
+    def start(self, message):
+        """Starts scoring `message`; call this together with the model call."""
+        if len((message or "").split()) < self.min_words:
+            return ToneTask(self, None)
+        return ToneTask(self, self._executor.submit(self.analyzer.analyze_sentiment, message))
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -1,46 +1,55 @@
 # modules/sentiment/response_modifier.py
 # Adapts AI responses based on detected sentiment.
 
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+EMPATHETIC_PHRASES = [
+    "I understand this might be frustrating. ",
+    "I'm sorry to hear that. ",
+    "Let's try to sort this out. "
+]
+POSITIVE_PHRASES = [
+    "Great to hear! ",
+    "That's wonderful! ",
+    "Awesome! "
+]
+
+
 class ResponseModifier:
     def __init__(self):
-        print("ResponseModifier initialized.")
+        logger.debug("ResponseModifier initialized.")
 
-    def modify_response_based_on_sentiment(self, original_response, user_sentiment):
+    def prefix_for(self, user_sentiment):
         """
-        Modifies the AI's response tone or content based on user's sentiment.
-        :param original_response: The AI's initially generated response.
+        The phrase to open a reply with, given the user's sentiment ('' for none).
         :param user_sentiment: A sentiment analysis result (e.g., output from SentimentAnalyzer).
                                Example: {'label': 'negative', 'score': -0.8}
-        :return: A modified response string.
         """
-        modified_response = original_response
-
         if not user_sentiment or 'label' not in user_sentiment:
-            return original_response # No sentiment data to act upon
+            return ""  # No sentiment data to act upon
 
         sentiment_label = user_sentiment.get('label', 'neutral').lower()
-
         if sentiment_label == "negative":
             # Example: Add an empathetic phrase if user is negative
-            empathetic_phrases = [
-                "I understand this might be frustrating. ",
-                "I'm sorry to hear that. ",
-                "Let's try to sort this out. "
-            ]
-            import random
-            modified_response = random.choice(empathetic_phrases) + original_response
-        elif sentiment_label == "positive":
+            return random.choice(EMPATHETIC_PHRASES)
+        if sentiment_label == "positive":
             # Example: Add an encouraging phrase if user is positive
-            positive_phrases = [
-                "Great to hear! ",
-                "That's wonderful! ",
-                "Awesome! "
-            ]
-            import random
-            modified_response = random.choice(positive_phrases) + original_response
+            return random.choice(POSITIVE_PHRASES)
         # Could add more complex logic for "neutral" or other nuances
+        return ""
 
-        return modified_response
+    def modify_response_based_on_sentiment(self, original_response, user_sentiment):
+        """
+        Modifies the AI's response tone or content based on user's sentiment.
+        :param original_response: The AI's initially generated response.
+        :param user_sentiment: A sentiment analysis result (e.g., output from SentimentAnalyzer).
+                               Example: {'label': 'negative', 'score': -0.8}
+        :return: A modified response string.
+        """
+        return self.prefix_for(user_sentiment) + original_response
 
 if __name__ == '__main__':
     modifier = ResponseModifier()
@@ -1,122 +1,430 @@
 # modules/sentiment/training.py
 # For training or fine-tuning a custom sentiment analysis model (if ML-based approach is chosen).
+# Binary logistic regression (positive vs negative) over hashed word n-grams, trained with
+# mini-batch SGD in NumPy. Large datasets are streamed from CSV/JSONL into memory-mapped sparse
+# features on disk (see features.write_features), so memory use doesn't grow with row count.
+# Cross-validation and hyperparameter sweeps run one (params, fold) fit per task on a process
+# pool; workers memory-map the same feature files instead of receiving pickled copies.
+
+import csv
+import itertools
+import json
+import logging
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .features import HashingVectorizer, dump_features, open_features, write_features
+from .linear_model import LinearSentimentModel, sigmoid
+
+logger = logging.getLogger(__name__)
+
+# Accepted spellings of the two classes; other labels (e.g. "neutral") are skipped.
+# "4" is Sentiment140's positive class.
+POSITIVE_LABELS = frozenset({"positive", "pos", "1", "4", "true", "yes"})
+NEGATIVE_LABELS = frozenset({"negative", "neg", "0", "-1", "false", "no"})
+
+
+def encode_label(label):
+    """1 for positive, 0 for negative, None for anything else."""
+    value = str(label).strip().lower()
+    if value in POSITIVE_LABELS:
+        return 1
+    if value in NEGATIVE_LABELS:
+        return 0
+    return None
+
+
+def _label_array(labels):
+    """0/1 labels as an array; accepts arrays (used as is) or sequences of ints/label strings."""
+    if isinstance(labels, np.ndarray):
+        return labels
+    return np.asarray([label if isinstance(label, (int, np.integer)) else encode_label(label) for label in labels])
+
+
+def iter_labelled_rows(path, text_field="text", label_field="label"):
+    """
+    Streams (text, 0/1 label) pairs from a .csv (with a header row) or .jsonl file, one row at
+    a time. Rows with a missing text or an unrecognized label are skipped.
+    """
+    is_jsonl = path.endswith((".jsonl", ".ndjson", ".json"))
+    skipped = 0
+    with open(path, newline="" if not is_jsonl else None, encoding="utf-8") as f:
+        records = (json.loads(line) for line in f if line.strip()) if is_jsonl else csv.DictReader(f)
+        for record in records:
+            text = record.get(text_field)
+            label = encode_label(record.get(label_field, ""))
+            if not text or label is None:
+                skipped += 1
+                continue
+            yield text, label
+    if skipped:
+        logger.info(f"Skipped {skipped} rows without text or a positive/negative label in {path}.")
+
+
+def roc_auc(labels, scores):
+    """Area under the ROC curve (Mann-Whitney U with tied scores sharing their average rank)."""
+    labels = np.asarray(labels)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    if not positives or not negatives:
+        return None
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = np.asarray(scores)[order]
+    ranks = np.empty(len(labels))
+    # Average rank within each group of equal scores
+    starts = np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+    ends = np.r_[starts[1:], len(labels)]
+    ranks[order] = np.repeat((starts + ends + 1) / 2.0, ends - starts)
+    return float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def classification_report(labels, probabilities, threshold=0.5):
+    """Accuracy, per-class precision/recall/F1, log loss, ROC AUC and the confusion matrix."""
+    labels = np.asarray(labels, dtype=np.int64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    predicted = (probabilities >= threshold).astype(np.int64)
+    tp = int(np.sum((predicted == 1) & (labels == 1)))
+    fp = int(np.sum((predicted == 1) & (labels == 0)))
+    tn = int(np.sum((predicted == 0) & (labels == 0)))
+    fn = int(np.sum((predicted == 0) & (labels == 1)))
+
+    def scores(hits, false_alarms, misses):
+        precision = hits / (hits + false_alarms) if hits + false_alarms else 0.0
+        recall = hits / (hits + misses) if hits + misses else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4),
+                "support": hits + misses}
+
+    clipped = np.clip(probabilities, 1e-12, 1 - 1e-12)
+    log_loss = -np.mean(labels * np.log(clipped) + (1 - labels) * np.log(1 - clipped)) if len(labels) else 0.0
+    positive, negative = scores(tp, fp, fn), scores(tn, fn, fp)
+    auc = roc_auc(labels, probabilities)
+    return {
+        "samples": len(labels),
+        "accuracy": round((tp + tn) / len(labels), 4) if len(labels) else 0.0,
+        "positive": positive,
+        "negative": negative,
+        "macro_f1": round((positive["f1"] + negative["f1"]) / 2, 4),
+        "log_loss": round(float(log_loss), 4),
+        "roc_auc": round(auc, 4) if auc is not None else None,
+        "confusion": {"tp": tp, "fp": fp, "tn": tn, "fn": fn},
+    }
+
+
+class SGDLogisticRegression:
+    def __init__(self, n_features, learning_rate=0.5, l2=1e-6, epochs=5, batch_size=256,
+                 shuffle_window=65536, seed=0):
+        """
+        Mini-batch SGD for L2-regularized logistic regression on CSRMatrix features.
+        Each step only touches the columns present in the batch: L2 decay is applied lazily
+        through a global scale factor (weights = scale * v) instead of to every weight.
+        :param shuffle_window: Rows are visited in random windows of this size, shuffled within
+                               each window, so memory-mapped data is read mostly sequentially.
+        """
+        self.n_features = n_features
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.shuffle_window = shuffle_window
+        self.seed = seed
+        self._v = np.zeros(n_features, dtype=np.float64)
+        self._scale = 1.0
+        self.bias = 0.0
+        self.history = []  # Mean training log loss per epoch
+
+    @property
+    def weights(self):
+        return (self._v * self._scale).astype(np.float32)
+
+    def _step(self, batch, labels, learning_rate):
+        row_ids = batch.row_ids()
+        columns = np.asarray(batch.indices)
+        values = np.asarray(batch.data, dtype=np.float64)
+        margin = np.bincount(row_ids, weights=values * self._v[columns], minlength=len(batch)) * self._scale + self.bias
+        probabilities = sigmoid(margin)
+        errors = probabilities - labels
+        touched, inverse = np.unique(columns, return_inverse=True)
+        gradient = np.bincount(inverse, weights=values * errors[row_ids], minlength=len(touched)) / len(batch)
+        if self.l2:
+            self._scale *= 1.0 - learning_rate * self.l2
+            if self._scale < 1e-9:  # Fold the scale back in before it underflows
+                self._v *= self._scale
+                self._scale = 1.0
+        self._v[touched] -= learning_rate * gradient / self._scale
+        self.bias -= learning_rate * float(errors.mean())
+        clipped = np.clip(probabilities, 1e-12, 1 - 1e-12)
+        return float(-np.sum(labels * np.log(clipped) + (1 - labels) * np.log(1 - clipped)))
+
+    def fit(self, features, labels, rows=None):
+        """
+        Trains on a CSRMatrix (in memory or memory-mapped) and 0/1 labels; returns self.
+        :param rows: Optional sorted row numbers to train on (e.g. the training folds); default all.
+        """
+        rng = np.random.default_rng(self.seed)
+        rows = np.arange(len(features), dtype=np.int64) if rows is None else np.asarray(rows, dtype=np.int64)
+        n_rows = len(rows)
+        for epoch in range(self.epochs):
+            learning_rate = self.learning_rate / math.sqrt(epoch + 1)
+            windows = np.arange(0, n_rows, self.shuffle_window)
+            total_loss = 0.0
+            for start in rng.permutation(windows):
+                stop = min(start + self.shuffle_window, n_rows)
+                order = rows[start:stop][rng.permutation(stop - start)]
+                window = features.take(order)
+                window_labels = np.asarray(labels[order], dtype=np.float64)
+                for batch_start in range(0, len(order), self.batch_size):
+                    batch_stop = batch_start + self.batch_size
+                    total_loss += self._step(window.rows(batch_start, min(batch_stop, len(order))),
+                                             window_labels[batch_start:batch_stop], learning_rate)
+            self.history.append(total_loss / max(n_rows, 1))
+            logger.info(f"Epoch {epoch + 1}/{self.epochs}: mean log loss {self.history[-1]:.4f}")
+        return self
+
+
+def predict_in_chunks(model, features, rows=None, chunk_rows=100000):
+    """P(positive) for every row (or the given rows) of a possibly memory-mapped CSRMatrix."""
+    if rows is None:
+        chunks = (features.rows(start, min(start + chunk_rows, len(features)))
+                  for start in range(0, len(features), chunk_rows))
+    else:
+        chunks = (features.take(rows[start:start + chunk_rows]) for start in range(0, len(rows), chunk_rows))
+    probabilities = [model.predict_proba(chunk) for chunk in chunks]
+    return np.concatenate(probabilities) if probabilities else np.zeros(0)
+
+
+def assign_folds(labels, folds, seed=0):
+    """Fold number (0..folds-1) of every row, stratified by label and reproducible from seed."""
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    fold_of = np.empty(len(labels), dtype=np.int32)
+    for value in (0, 1):
+        positions = np.flatnonzero(labels == value)
+        fold_of[positions[rng.permutation(len(positions))]] = np.arange(len(positions)) % folds
+    return fold_of
+
+
+SGD_PARAMS = ("learning_rate", "l2", "epochs", "batch_size", "seed")
+CV_METRICS = ("accuracy", "macro_f1", "log_loss", "roc_auc")
+
+# Per-process cache of memory-mapped feature sets and fold assignments used by CV tasks
+_shared_features = {}
+_shared_folds = {}
+
+
+def _cv_task(task):
+    """One cross-validation fit: train on every fold but one, report on the held-out fold."""
+    features_path, params, fold, folds, fold_seed = task
+    if features_path not in _shared_features:
+        _shared_features[features_path] = open_features(features_path)
+    features, labels = _shared_features[features_path]
+    key = (features_path, folds, fold_seed)
+    if key not in _shared_folds:
+        _shared_folds[key] = assign_folds(labels, folds, fold_seed)
+    fold_of = _shared_folds[key]
+    train_rows, test_rows = np.flatnonzero(fold_of != fold), np.flatnonzero(fold_of == fold)
+    sgd = SGDLogisticRegression(features.n_features, **params).fit(features, labels, rows=train_rows)
+    model = LinearSentimentModel(sgd.weights, sgd.bias, None)
+    report = classification_report(labels[test_rows], predict_in_chunks(model, features, test_rows))
+    report["train_log_loss"] = round(sgd.history[-1], 4) if sgd.history else None
+    return report
+
+
+def default_workers():
+    """CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS/Windows
+        return os.cpu_count() or 1
+
+
+def _summarize(params, reports):
+    summary = {"params": params, "folds": reports, "mean": {}, "std": {}}
+    for metric in CV_METRICS:
+        values = [report[metric] for report in reports if report[metric] is not None]
+        summary["mean"][metric] = round(float(np.mean(values)), 4) if values else None
+        summary["std"][metric] = round(float(np.std(values)), 4) if values else None
+    return summary
+
 
 class SentimentModelTrainer:
-    def __init__(self, model_path="sentiment_model_custom"):
+    def __init__(self, model_path="sentiment_model_custom", n_features=2 ** 20, ngram_range=(1, 2),
+                 learning_rate=0.5, l2=1e-6, epochs=5, batch_size=256, seed=0):
         """
         Initializes the sentiment model trainer.
-        :param model_path: Path to save/load the custom model.
+        :param model_path: Path to save/load the custom model (<path>.weights.npy and <path>.meta.json).
+        :param n_features: Hash buckets for the n-gram features.
+        :param ngram_range: Word n-gram sizes; bigrams let the model learn "not good".
+        :param learning_rate, l2, epochs, batch_size, seed: SGD settings (see SGDLogisticRegression).
         """
         self.model_path = model_path
-        self.model = None # Placeholder for the actual ML model
-        print(f"SentimentModelTrainer initialized for model path: {self.model_path} (simulated).")
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range)
+        self.sgd_params = {"learning_rate": learning_rate, "l2": l2, "epochs": epochs,
+                           "batch_size": batch_size, "seed": seed}
+        self.model = None  # LinearSentimentModel once trained or loaded
+        self.training_history = []
+        self.cv_results = []  # Results of the last cross_validate()/sweep(), best first
+        logger.debug(f"SentimentModelTrainer initialized for model path: {self.model_path}.")
 
-    def load_data(self, data_file_path):
+    def load_data(self, data_file_path, text_field="text", label_field="label"):
         """
-        Placeholder for loading training data (e.g., CSV with text and labels).
+        Loads a CSV (with a header) or JSONL file into memory as (texts, 0/1 labels).
+        For datasets that don't fit in memory use preprocess_file() / train_file() instead.
         """
-        print(f"Simulating loading training data from: {data_file_path}")
-        # Example:
-        # import pandas as pd
-        # df = pd.read_csv(data_file_path)
-        # texts = df['text'].tolist()
-        # labels = df['sentiment_label'].tolist()
-        # return texts, labels
-        return ["Sample positive text", "Sample negative text"], ["positive", "negative"]
+        texts, labels = [], []
+        for text, label in iter_labelled_rows(data_file_path, text_field, label_field):
+            texts.append(text)
+            labels.append(label)
+        return texts, labels
 
     def preprocess_data(self, texts):
+        """Vectorizes texts into a CSRMatrix of hashed, L2-normalized n-gram counts."""
+        return self.vectorizer.transform(texts)
+
+    def preprocess_file(self, data_file_path, features_path=None, text_field="text", label_field="label"):
         """
-        Placeholder for text preprocessing (tokenization, vectorization, etc.).
+        Streams a CSV/JSONL file into memory-mapped features on disk.
+        :param features_path: File prefix for the features (default: next to model_path).
+        :return: (CSRMatrix, labels), both memory-mapped.
         """
-        print("Simulating data preprocessing (e.g., TF-IDF, Word Embeddings).")
-        # Example:
-        # from sklearn.feature_extraction.text import TfidfVectorizer
-        # vectorizer = TfidfVectorizer(max_features=5000)
-        # X = vectorizer.fit_transform(texts)
-        # self.vectorizer = vectorizer # Save for prediction
-        # return X
-        return [[0.1, 0.5], [0.8, 0.2]] # Simulated feature vectors
+        features_path = features_path or f"{self.model_path}.features"
+        rows = iter_labelled_rows(data_file_path, text_field, label_field)
+        return write_features(rows, features_path, self.vectorizer)
 
-    def train_model(self, X_train, y_train):
+    def train_model(self, X_train, y_train, **sgd_overrides):
         """
-        Placeholder for training the sentiment analysis model.
+        Trains on a CSRMatrix (from preprocess_data/preprocess_file) and labels; returns the model.
+        :param sgd_overrides: SGD settings for this run, e.g. the best params from sweep().
         """
-        print("Simulating model training (e.g., Logistic Regression, Naive Bayes, or a Neural Network).")
-        # Example:
-        # from sklearn.linear_model import LogisticRegression
-        # model = LogisticRegression()
-        # model.fit(X_train, y_train)
-        # self.model = model
-        print("Model training simulation complete.")
-        self.model = "simulated_trained_model" # Placeholder for a trained model object
+        params = self._sgd_params(sgd_overrides)
+        sgd = SGDLogisticRegression(self.vectorizer.n_features, **params).fit(X_train, _label_array(y_train))
+        self.training_history = sgd.history
+        self.model = LinearSentimentModel(sgd.weights, sgd.bias, self.vectorizer)
+        return self.model
 
-    def evaluate_model(self, X_test, y_test):
+    def train_file(self, data_file_path, features_path=None, **fields):
+        """preprocess_file() followed by train_model(); returns the model."""
+        features, labels = self.preprocess_file(data_file_path, features_path, **fields)
+        return self.train_model(features, labels)
+
+    def evaluate_model(self, X_test, y_test, chunk_rows=100000):
         """
-        Placeholder for evaluating the trained model.
+        Scores the trained model on held-out features and labels.
+        :return: classification_report() dict, or None if there is no model.
         """
         if not self.model:
-            print("Model not trained yet. Cannot evaluate.")
+            logger.warning("Model not trained yet. Cannot evaluate.")
             return None
-        print("Simulating model evaluation (e.g., accuracy, precision, recall, F1-score).")
-        # Example:
-        # y_pred = self.model.predict(X_test)
-        # from sklearn.metrics import classification_report
-        # report = classification_report(y_test, y_pred)
-        # print(report)
-        # return report
-        return {"accuracy": 0.85, "precision": 0.83, "recall": 0.87} # Simulated metrics
+        return classification_report(_label_array(y_test), predict_in_chunks(self.model, X_test, chunk_rows=chunk_rows))
+
+    def _sgd_params(self, overrides):
+        unknown = set(overrides) - set(SGD_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown SGD parameters: {sorted(unknown)} (expected some of {SGD_PARAMS})")
+        return {**self.sgd_params, **overrides}
+
+    def _shared_features_path(self, X, y, scratch):
+        """On-disk prefix workers can memory-map: X's own files, or a copy of in-memory X and y."""
+        if X.source is not None:
+            return X.source
+        return dump_features(X, _label_array(y), os.path.join(scratch, "features"), self.vectorizer)
+
+    def cross_validate(self, X, y, folds=5, workers=None, fold_seed=0, **sgd_overrides):
+        """
+        k-fold cross-validation of the current SGD settings (plus overrides).
+        :return: {"params", "folds": [per-fold classification_report], "mean": {...}, "std": {...}}
+        """
+        return self.sweep({name: [value] for name, value in sgd_overrides.items()}, X, y, folds, workers, fold_seed)[0]
+
+    def sweep(self, param_grid, X, y, folds=5, workers=None, fold_seed=0, metric="roc_auc"):
+        """
+        Cross-validates every combination in param_grid (e.g. {"learning_rate": [0.1, 0.5],
+        "l2": [1e-6, 1e-5]}) on a process pool, one task per (combination, fold).
+        X should come from preprocess_file() so workers memory-map its files; in-memory features
+        are written to a temporary directory first. Results don't depend on `workers`: folds and
+        SGD seeds are fixed by fold_seed and the params.
+        :param workers: Processes to use (default: available CPUs; 1 runs in this process).
+        :param metric: Mean fold metric used to rank the combinations (log_loss ranks lowest first).
+        :return: List of cross_validate()-style results, best first (also kept in self.cv_results).
+        """
+        if metric not in CV_METRICS:
+            raise ValueError(f"metric must be one of {CV_METRICS}")
+        names = sorted(param_grid)
+        combinations = [self._sgd_params(dict(zip(names, values)))
+                        for values in itertools.product(*(param_grid[name] for name in names))]
+        workers = workers or default_workers()
+        with tempfile.TemporaryDirectory(prefix="guru-cv-") as scratch:
+            features_path = self._shared_features_path(X, y, scratch)
+            tasks = [(features_path, params, fold, folds, fold_seed) for params in combinations for fold in range(folds)]
+            logger.info(f"Cross-validating {len(combinations)} parameter sets x {folds} folds on {workers} workers.")
+            if workers == 1 or len(tasks) == 1:
+                reports = [_cv_task(task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                    reports = list(pool.map(_cv_task, tasks))
+            # Drop this process's maps (and fold assignments) before the scratch copy is deleted
+            _shared_features.pop(features_path, None)
+            for key in [key for key in _shared_folds if key[0] == features_path]:
+                del _shared_folds[key]
+        results = [_summarize(params, reports[i * folds:(i + 1) * folds]) for i, params in enumerate(combinations)]
+        lower_is_better = metric == "log_loss"
+        results.sort(key=lambda result: (result["mean"][metric] is None,
+                                         (1 if lower_is_better else -1) * (result["mean"][metric] or 0.0)))
+        self.cv_results = results
+        return results
 
     def save_model(self):
-        """Placeholder for saving the trained model and any associated preprocessors."""
+        """Writes the model artifact to model_path; returns the weights file path (None without a model)."""
         if not self.model:
-            print("No model to save.")
-            return
-        print(f"Simulating saving model to: {self.model_path}")
-        # Example:
-        # import joblib
-        # joblib.dump({'model': self.model, 'vectorizer': self.vectorizer}, self.model_path + ".pkl")
-        print("Model saving simulation complete.")
+            logger.warning("No model to save.")
+            return None
+        weights_path = self.model.save(self.model_path)
+        logger.info(f"Saved sentiment model to {self.model_path} ({os.path.getsize(weights_path)} bytes of weights).")
+        return weights_path
 
     def load_model(self):
-        """Placeholder for loading a pre-trained model."""
-        print(f"Simulating loading model from: {self.model_path}")
-        # Example:
-        # import joblib
-        # try:
-        #     loaded_artefacts = joblib.load(self.model_path + ".pkl")
-        #     self.model = loaded_artefacts['model']
-        #     self.vectorizer = loaded_artefacts['vectorizer']
-        #     print("Model loaded successfully.")
-        #     return True
-        # except FileNotFoundError:
-        #     print("Model file not found.")
-        #     return False
-        self.model = "simulated_loaded_model" # For simulation
+        """Loads (memory-maps) the model artifact at model_path. Returns True on success."""
+        try:
+            self.model = LinearSentimentModel.load(self.model_path)
+        except (FileNotFoundError, ValueError) as e:
+            logger.error(f"Could not load sentiment model from {self.model_path}: {e}")
+            return False
+        self.vectorizer = self.model.vectorizer
         return True
 
 
 if __name__ == '__main__':
-    trainer = SentimentModelTrainer()
-    
-    # Simulate training flow
-    texts_train, labels_train = trainer.load_data("path/to/dummy_train_data.csv")
-    X_train_processed = trainer.preprocess_data(texts_train)
-    trainer.train_model(X_train_processed, labels_train)
-    
-    # Simulate evaluation data (in reality, this would be separate test data)
-    texts_test, labels_test = ["Another good example", "A very bad day"], ["positive", "negative"]
-    X_test_processed = trainer.preprocess_data(texts_test) # Ideally use vectorizer fitted on train data
-    evaluation_results = trainer.evaluate_model(X_test_processed, labels_test)
-    print(f"Simulated Evaluation Results: {evaluation_results}")
-    
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the custom_ml sentiment model from a CSV/JSONL file.")
+    parser.add_argument("train_file")
+    parser.add_argument("--test-file", help="Held-out CSV/JSONL file for the evaluation report.")
+    parser.add_argument("--model-path", default="sentiment_model_custom")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--label-field", default="label")
+    parser.add_argument("--folds", type=int, default=0, help="Cross-validate with this many folds before training.")
+    parser.add_argument("--grid", type=json.loads,
+                        help='Sweep SGD settings, e.g. \'{"learning_rate": [0.1, 0.5], "l2": [1e-6, 1e-5]}\'; '
+                             'the final model uses the best one. Implies --folds 5 unless set.')
+    parser.add_argument("--workers", type=int, help="Processes for --folds/--grid (default: all CPUs).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    trainer = SentimentModelTrainer(model_path=args.model_path, epochs=args.epochs)
+    fields = {"text_field": args.text_field, "label_field": args.label_field}
+    X_train, y_train = trainer.preprocess_file(args.train_file, **fields)
+    best_params = {}
+    if args.grid or args.folds:
+        results = trainer.sweep(args.grid or {}, X_train, y_train, folds=args.folds or 5, workers=args.workers)
+        print(json.dumps([{"params": result["params"], "mean": result["mean"], "std": result["std"]}
+                          for result in results], indent=2))
+        best_params = results[0]["params"]
+    trainer.train_model(X_train, y_train, **best_params)
+    if args.test_file:
+        X_test, y_test = trainer.preprocess_file(args.test_file, f"{args.model_path}.test-features", **fields)
+        print(json.dumps(trainer.evaluate_model(X_test, y_test), indent=2))
     trainer.save_model()
-    
-    # Simulate loading and using the model for prediction
-    new_trainer = SentimentModelTrainer()
-    if new_trainer.load_model():
-        print("New trainer loaded the model successfully (simulated).")
-        # To predict:
-        # new_text = ["This is a test sentence."]
-        # new_text_processed = new_trainer.vectorizer.transform(new_text) # Use loaded vectorizer
-        # prediction = new_trainer.model.predict(new_text_processed)
-        # print(f"Prediction for '{new_text[0]}': {prediction[0]}")
@@ -0,0 +1,175 @@
+# serve.py
+# Production entry point: a pre-fork server. The master process binds the listening socket and
+# forks N worker processes; each imports the app after the fork (so its threads, executors and
+# SQLite connections are its own) and accepts connections on the shared socket. Session
+# histories, the exact-match response cache and rate-limit counters live in a shared SQLite
+# store (GURU_SHARED_STORE, see SHARED_STATE_CONFIG in config.py), so any worker can serve any
+# turn of a conversation without sticky routing. The master restarts workers that die and stops
+# them on SIGTERM/SIGINT. POSIX only (fork).
+# Run: python serve.py --workers 4 --port 5000 [--server asgi]
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger("guru.serve")
+
+SHARED_STORE_ENV = "GURU_SHARED_STORE"
+# A worker that dies sooner than this after starting is restarted only after this long, so a
+# worker that can't start doesn't turn into a fork loop
+MIN_WORKER_UPTIME_SECONDS = 1.0
+
+
+def bind_socket(host, port, backlog=2048):
+    """The listening socket the workers share (bound before forking, so they all accept on it)."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_wsgi(wsgi_app, sock):
+    """Runs a threaded werkzeug server on sock until SIGTERM/SIGINT."""
+    from werkzeug.serving import make_server
+
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, wsgi_app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever(), which runs on this (the signalled) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+
+
+def serve_asgi(asgi_app, sock):
+    """Runs uvicorn on sock until SIGTERM/SIGINT (uvicorn handles both)."""
+    import uvicorn
+
+    uvicorn.Server(uvicorn.Config(asgi_app, log_level="warning", lifespan="on")).run(sockets=[sock])
+
+
+def run_workers(worker_main, workers, graceful_timeout=30.0):
+    """
+    Forks `workers` processes that each run worker_main() and keeps that many running until
+    SIGTERM/SIGINT, which is passed on to the workers (killed after graceful_timeout seconds).
+    :param worker_main: Called in each child after the fork; returning ends the worker.
+    :return: 0 once every worker has exited.
+    """
+    children = {}  # pid -> (worker index, started at)
+    stopping = threading.Event()
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                worker_main()
+            except BaseException:
+                logger.exception(f"Worker {index} failed.")
+                exit_code = 1
+            finally:
+                # Not sys.exit: the master's atexit handlers and buffered state are not ours to run
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        children[pid] = (index, time.monotonic())
+        logger.info(f"Started worker {index} (pid {pid}).")
+
+    def stop(signum, frame):
+        stopping.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+
+    while children and not stopping.is_set():
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in children or stopping.is_set():
+            children.pop(pid, None)
+            continue
+        index, started_at = children.pop(pid)
+        logger.warning(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting.")
+        uptime = time.monotonic() - started_at
+        if uptime < MIN_WORKER_UPTIME_SECONDS:
+            time.sleep(MIN_WORKER_UPTIME_SECONDS - uptime)
+        if not stopping.is_set():
+            spawn(index)
+
+    deadline = time.monotonic() + graceful_timeout
+    while children:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.pop(pid, None)
+            continue
+        if time.monotonic() > deadline:
+            for pid in list(children):
+                logger.warning(f"Worker pid {pid} did not stop in {graceful_timeout}s; killing it.")
+                os.kill(pid, signal.SIGKILL)
+            deadline = float("inf")
+        time.sleep(0.05)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run GURU with several worker processes sharing one socket.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi",
+                        help="wsgi: app.py on werkzeug's threaded server; asgi: asgi.py on uvicorn")
+    parser.add_argument("--shared-store", default=os.getenv(SHARED_STORE_ENV),
+                        help=f"SQLite file for shared state (default: ${SHARED_STORE_ENV}, "
+                             "else guru-<port>.db in the temp directory)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        parser.error("serve.py needs fork(); on this platform run app.py or asgi.py directly.")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+
+    logging.basicConfig(level=logging.INFO)
+    # Workers read it when they import the app (see SHARED_STATE_CONFIG)
+    os.environ[SHARED_STORE_ENV] = args.shared_store or os.path.join(tempfile.gettempdir(), f"guru-{args.port}.db")
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Serving on {args.host}:{sock.getsockname()[1]} with {args.workers} {args.server} workers; "
+                f"shared state in {os.environ[SHARED_STORE_ENV]}.")
+
+    def worker_main():
+        if args.server == "asgi":
+            from asgi import application
+            serve_asgi(application, sock)
+        else:
+            from app import app
+            serve_wsgi(app, sock)
+
+    sys.exit(run_workers(worker_main, args.workers, args.graceful_timeout))
+
+
+if __name__ == "__main__":
+    main()
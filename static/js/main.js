@@ -37,32 +37,45 @@ document.addEventListener('DOMContentLoaded', () => {
                     return;
                 }
                 
-                // Handle streaming response
+                // Handle the SSE stream: frames are separated by a blank line, each with
+                // "event:" and JSON "data:" fields; lines starting with ":" are keepalives.
                 const reader = response.body.getReader();
                 const decoder = new TextDecoder();
-                let firstChunk = true;
+                let buffer = '';
+
+                const showError = (message) => {
+                    if (guruMessageDiv) { // If we started displaying something
+                        guruMessageDiv.textContent += " " + message; // Append error to existing div
+                    } else {
+                        appendMessage(message, chatOutput, 'error-message');
+                    }
+                };
 
                 while (true) {
                     const { value, done } = await reader.read();
                     if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
 
-                    const chunkText = decoder.decode(value, { stream: true });
-                    
-                    if (chunkText.toLowerCase().startsWith("error:")) {
-                        if (guruMessageDiv) { // If we started displaying something
-                            guruMessageDiv.textContent += " " + chunkText; // Append error to existing div
-                        } else {
-                            appendMessage(chunkText, chatOutput, 'error-message');
-                        }
-                        return; // Stop processing on error
-                    }
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        const frame = parseSseFrame(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                        if (!frame) continue; // Keepalive comment
 
-                    if (firstChunk) {
-                        guruMessageDiv = appendMessage('GURU: ' + chunkText, chatOutput, 'guru-message', true);
-                        firstChunk = false;
-                    } else if (guruMessageDiv) {
-                        guruMessageDiv.textContent += chunkText;
-                        chatOutput.scrollTop = chatOutput.scrollHeight; // Scroll as content streams
+                        if (frame.event === 'token') {
+                            if (!guruMessageDiv) {
+                                guruMessageDiv = appendMessage('GURU: ' + frame.data.text, chatOutput, 'guru-message', true);
+                            } else {
+                                guruMessageDiv.textContent += frame.data.text;
+                                chatOutput.scrollTop = chatOutput.scrollHeight; // Scroll as content streams
+                            }
+                        } else if (frame.event === 'error') {
+                            showError(frame.data.message);
+                        } else if (frame.event === 'metrics') {
+                            console.debug('GURU stream metrics:', frame.data);
+                        } else if (frame.event === 'done') {
+                            return;
+                        }
                     }
                 }
 
@@ -78,6 +91,22 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// Parses one SSE frame into {event, data}; returns null for comment-only frames (keepalives).
+function parseSseFrame(frameText) {
+    let event = 'message';
+    const dataLines = [];
+    for (const line of frameText.split('\n')) {
+        if (!line || line.startsWith(':')) continue;
+        const separator = line.indexOf(':');
+        const field = separator === -1 ? line : line.slice(0, separator);
+        const value = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+        if (field === 'event') event = value;
+        else if (field === 'data') dataLines.push(value);
+    }
+    if (dataLines.length === 0) return null;
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+}
+
 // Modified appendMessage to return the new div for streaming and add CSS classes
 function appendMessage(message, outputElement, messageClass = '', returnDiv = false) {
     const messageDiv = document.createElement('div');
@@ -1,7 +1,10 @@
 # tests/test_ai_core.py
 import unittest
+import asyncio
 import os
 import sys
+import tempfile
+import time
 
 # Adjust path to import module from parent 'modules' directory
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -9,6 +12,22 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Example: Dynamically importing the target module's main class/functions
 # This is a placeholder; you'll need to define what to test
 # from modules.ai_core import some_class_or_function 
+from modules.ai_core.fake_model import FakeGenerativeModel, FakeCachingAPI
+from modules.ai_core.context_cache import ContextCacheManager, caching_can_apply
+from modules.ai_core.gemini_client import GeminiClient, extract_chunk_text
+from modules.ai_core.processor import AIProcessor, IncrementalContents, GeminiContents
+from modules.ai_core.response_cache import ResponseCache, normalize_prompt
+from modules.ai_core.semantic_cache import SemanticCache
+from modules.ai_core.embeddings import HashingEmbedder
+from modules.ai_core.scheduler import StreamScheduler, SchedulerOverloaded, StreamDeadlineExceeded
+from modules.ai_core.rate_limit import (
+    RateLimiter, RateLimitExceeded, MemoryRateLimitBackend, SharedRateLimitBackend, client_ip
+)
+from modules.context.shared_store import MemorySharedStore, SQLiteSharedStore
+from modules.ai_core.single_flight import SingleFlight
+from modules.ai_core.router import ModelRouter, ModelRoute, estimate_complexity
+from modules.ai_core.resilience import ResiliencePolicy, CircuitBreaker, is_retryable
+from modules.ai_core.sse import SSEFrameBuilder, format_sse, stream_sse, astream_sse, queue_size, KEEPALIVE_FRAME
 
 class TestAiCore(unittest.TestCase):
 
@@ -28,5 +47,1103 @@ class TestAiCore(unittest.TestCase):
 
     # Add more specific test methods for functionalities within ai_core
 
+
+class TestAIProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = AIProcessor()
+
+    def test_build_gemini_contents(self):
+        """History messages become alternating Gemini contents entries."""
+        contents = self.processor.build_gemini_contents([
+            {"role": "assistant", "content": "Welcome!"},
+            {"role": "user", "content": "Hi"},
+            {"role": "user", "content": "Are you there?"},
+            {"role": "model", "content": "Yes."},
+        ])
+        self.assertEqual(contents, [
+            {"role": "user", "parts": [{"text": "Hi"}, {"text": "Are you there?"}]},
+            {"role": "model", "parts": [{"text": "Yes."}]},
+        ])
+
+    def test_format_prompt_uses_real_newlines(self):
+        prompt = self.processor.format_prompt("And now?", conversation_history=[
+            {"role": "user", "content": "Hi"}, {"role": "model", "content": "Hello!"}])
+        self.assertEqual(prompt, "Conversation History:\nuser: Hi\nmodel: Hello!\n\nUser: And now?")
+
+    def test_incremental_contents_match_full_rebuild(self):
+        """Appends, trims and summaries give what build_gemini_contents builds from scratch."""
+        import random
+        rng = random.Random(3)
+        contents = self.processor.incremental_contents("Be GURU.")
+        messages = []
+        for step in range(300):
+            if messages and rng.random() < 0.3:
+                count = rng.randint(1, len(messages))
+                contents.trim(count)
+                del messages[:count]
+            else:
+                role = rng.choice(["user", "model", "assistant"])
+                text = "Be GURU." if rng.random() < 0.05 else f"message {step}"
+                contents.append(role, text)
+                messages.append({"role": role, "content": text})
+            snapshot = contents.snapshot()
+            self.assertEqual(snapshot, self.processor.build_gemini_contents(messages))
+            self.assertEqual(snapshot.has_system_instruction,
+                             any(m["role"] == "user" and m["content"] == "Be GURU." for m in messages))
+            summarized = contents.snapshot("Summary")
+            self.assertEqual(summarized, self.processor.build_gemini_contents(
+                [{"role": "user", "content": "Summary"}] + messages))
+
+    def test_snapshots_are_not_changed_by_later_turns(self):
+        contents = IncrementalContents()
+        contents.append("user", "Hi")
+        before = contents.snapshot()
+        contents.append("user", "Still there?")
+        contents.trim(1)
+        self.assertEqual(before, [{"role": "user", "parts": [{"text": "Hi"}]}])
+        self.assertEqual(contents.snapshot(), [{"role": "user", "parts": [{"text": "Still there?"}]}])
+
+    def test_client_trusts_tracked_system_instruction(self):
+        """A GeminiContents flag replaces the scan for an already-present system instruction."""
+        client = GeminiClient(model=FakeGenerativeModel(chunks=["ok"]), system_instruction="Be GURU.")
+        client.model_supports_system_instruction_directly = False
+        turns = [{"role": "user", "parts": [{"text": "Hi"}]}]
+        self.assertEqual(client._prepare_prompt(GeminiContents(turns, "Be GURU.", True)), turns)
+        self.assertEqual(len(client._prepare_prompt(GeminiContents(turns, "Be GURU.", False))), 2)
+        self.assertEqual(len(client._prepare_prompt(turns)), 2)  # Plain lists are still scanned
+
+
+class TestStreamingResponseParser(unittest.TestCase):
+
+    def _parse(self, chunks):
+        parser = AIProcessor().stream_parser()
+        emitted = [parser.feed(chunk) for chunk in chunks]
+        parser.finish()
+        return emitted, parser.text
+
+    def test_spaces_at_chunk_boundaries_are_kept(self):
+        emitted, text = self._parse(["Hello ", "there", " friend", "!\n", "How are", " you?"])
+        self.assertEqual(text, "Hello there friend!\nHow are you?")
+        self.assertEqual("".join(emitted), text)
+
+    def test_whitespace_is_only_stripped_at_message_edges(self):
+        emitted, text = self._parse(["\n  ", "  Sure", " thing.  ", "\n"])
+        self.assertEqual(text, "Sure thing.")
+        self.assertEqual(emitted, ["", "Sure", " thing.", ""])
+
+    def test_markup_split_across_chunks_is_removed(self):
+        _, text = self._parse(["This is *", "*important*", "* indeed"])
+        self.assertEqual(text, "This is important indeed")
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  Tell me   a JOKE!! "), "tell me a joke")
+
+    def test_lru_and_byte_cap_eviction(self):
+        """Entries are evicted least-recently-used first when either cap is hit."""
+        cache = ResponseCache(max_entries=2, max_bytes=10)
+        cache.put("a", ["aaaa"])
+        cache.put("b", ["bbbb"])
+        cache.get("a")
+        cache.put("c", ["cccc"])  # Over max_entries: evicts 'b'
+        self.assertIsNone(cache.get("b"))
+        cache.put("d", ["dddddddd"])  # Over max_bytes: evicts the rest
+        self.assertEqual(cache.get("d"), ("dddddddd",))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()["evictions"], 3)
+
+    def test_ttl_expiry(self):
+        now = [0.0]
+        cache = ResponseCache(ttl_seconds=10, clock=lambda: now[0])
+        cache.put("a", ["hello"])
+        now[0] = 11
+        self.assertIsNone(cache.get("a"))
+
+    def test_high_temperature_bypasses(self):
+        cache = ResponseCache(max_temperature=0.5)
+        self.assertTrue(cache.should_bypass({"temperature": 0.9}))
+        self.assertFalse(cache.should_bypass({"temperature": 0.2}))
+
+    def test_shared_store_is_a_second_level(self):
+        """A reply cached by one worker is a hit in another (then served from its local copy)."""
+        store = MemorySharedStore()
+        worker_a, worker_b = ResponseCache(shared_store=store), ResponseCache(shared_store=store)
+        worker_a.put("a", ["Hello ", "there"])
+        self.assertEqual(worker_b.get("a"), ("Hello ", "there"))
+        self.assertEqual(worker_b.get("a"), ("Hello ", "there"))
+        self.assertIsNone(worker_b.get("missing"))
+        self.assertEqual(worker_b.stats()["shared_hits"], 1)
+        self.assertEqual(worker_b.stats()["hits"], 2)
+        self.assertEqual(len(worker_b), 1)
+
+
+class TestGeminiClientResponseCache(unittest.TestCase):
+
+    def test_repeated_prompt_is_served_from_cache(self):
+        """A normalized repeat of a prompt replays the cached chunks without calling the model."""
+        fake_model = FakeGenerativeModel(chunks=["Why ", "did ", "the chicken..."])
+        client = GeminiClient(model=fake_model, response_cache=ResponseCache())
+        first = [extract_chunk_text(c) for c in client.generate_response("Tell me a joke", stream=True)]
+        second = [extract_chunk_text(c) for c in client.generate_response("tell me a joke!", stream=True)]
+        self.assertEqual(first, second)
+        self.assertEqual(len(fake_model.calls), 1)
+        self.assertEqual(client.response_cache.stats()["hits"], 1)
+
+    def test_errors_are_not_cached(self):
+        """A stream that fails part way is not stored."""
+        fake_model = FakeGenerativeModel(chunks=["a", "b"], error_after=1)
+        client = GeminiClient(model=fake_model, response_cache=ResponseCache())
+        list(client.generate_response("Hello", stream=True))
+        list(client.generate_response("Hello", stream=True))
+        self.assertEqual(len(fake_model.calls), 2)
+        self.assertEqual(len(client.response_cache), 0)
+
+    def test_different_history_is_a_different_entry(self):
+        """The same question in a different conversation is not a cache hit."""
+        fake_model = FakeGenerativeModel(chunks=["ok"])
+        client = GeminiClient(model=fake_model, response_cache=ResponseCache())
+        question = {"role": "user", "parts": [{"text": "Why?"}]}
+        list(client.generate_response([question], stream=True))
+        list(client.generate_response([
+            {"role": "user", "parts": [{"text": "The sky is blue."}]},
+            {"role": "model", "parts": [{"text": "Indeed."}]},
+            question,
+        ], stream=True))
+        self.assertEqual(len(fake_model.calls), 2)
+
+
+class TestSemanticCache(unittest.TestCase):
+
+    def test_embeddings_are_normalized_and_stable(self):
+        embedder = HashingEmbedder(dim=64)
+        vector = embedder.embed("Tell me a joke")
+        self.assertAlmostEqual(float(vector @ vector), 1.0, places=5)
+        self.assertTrue((vector == HashingEmbedder(dim=64).embed("tell me a JOKE")).all())
+
+    def test_near_duplicate_prompt_hits(self):
+        """A paraphrase above the threshold is served; an unrelated prompt is not."""
+        cache = SemanticCache(capacity=8, threshold=0.8)
+        cache.add("m", "sys", "Tell me a joke", None, ["Knock knock"])
+        self.assertEqual(cache.lookup("m", "sys", "tell me a joke please", None), ("Knock knock",))
+        self.assertIsNone(cache.lookup("m", "sys", "What is the capital of France?", None))
+
+    def test_rephrased_request_hits_at_default_threshold(self):
+        cache = SemanticCache(capacity=8)
+        cache.add("m", "sys", "Can you explain recursion?", None, ["It calls itself"])
+        cache.add("m", "sys", "What is the capital of France?", None, ["Paris"])
+        self.assertEqual(cache.lookup("m", "sys", "Could you please explain recursion", None), ("It calls itself",))
+        self.assertIsNone(cache.lookup("m", "sys", "What is the capital of Spain?", None))
+
+    def test_entries_expire_after_ttl(self):
+        """Like the exact-match cache, an entry stops being served after ttl_seconds."""
+        now = [0.0]
+        cache = SemanticCache(capacity=2, ttl_seconds=60, clock=lambda: now[0])
+        cache.add("m", "sys", "Tell me a joke", None, ["Knock knock"])
+        now[0] = 30.0
+        cache.add("m", "sys", "Another prompt", None, ["2"])
+        now[0] = 59.0
+        self.assertEqual(cache.lookup("m", "sys", "tell me a joke please", None), ("Knock knock",))
+        now[0] = 61.0  # The joke is expired, though "Another prompt" is the least recently used
+        self.assertIsNone(cache.lookup("m", "sys", "tell me a joke please", None))
+        cache.add("m", "sys", "Third prompt", None, ["3"])  # Reuses the expired slot, not the LRU one
+        self.assertEqual(cache.lookup("m", "sys", "Another prompt", None), ("2",))
+
+    def test_question_word_and_negation_change_the_question(self):
+        """Swapping the question word or adding a negation is a different question: both miss."""
+        cache = SemanticCache(capacity=8)
+        cache.add("m", "sys", "What is Alan Turing known for?", None, ["Computing"])
+        cache.add("m", "sys", "Is it safe to eat raw eggs?", None, ["Mostly"])
+        self.assertIsNone(cache.lookup("m", "sys", "Who is Alan Turing known for?", None))
+        self.assertIsNone(cache.lookup("m", "sys", "Is it not safe to eat raw eggs?", None))
+        self.assertIsNone(cache.lookup("m", "sys", "Isn't it safe to eat raw eggs?", None))
+        self.assertEqual(cache.lookup("m", "sys", "is it safe to eat raw eggs", None), ("Mostly",))
+
+    def test_matches_are_scoped(self):
+        """The same prompt under another model or conversation is not a match."""
+        cache = SemanticCache(capacity=8, threshold=0.8)
+        cache.add("m", "sys", "Tell me a joke", None, ["Knock knock"])
+        self.assertIsNone(cache.lookup("other-model", "sys", "Tell me a joke", None))
+        self.assertIsNone(cache.lookup("m", "sys", [
+            {"role": "user", "parts": [{"text": "Be serious."}]},
+            {"role": "model", "parts": [{"text": "Okay."}]},
+            {"role": "user", "parts": [{"text": "Tell me a joke"}]},
+        ], None))
+
+    def test_capacity_eviction_reuses_least_recently_used_slot(self):
+        cache = SemanticCache(capacity=2, threshold=0.99)
+        cache.add("m", "sys", "first prompt", None, ["1"])
+        cache.add("m", "sys", "second prompt", None, ["2"])
+        cache.lookup("m", "sys", "first prompt", None)
+        cache.add("m", "sys", "third prompt", None, ["3"])
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup("m", "sys", "second prompt", None))
+        self.assertEqual(cache.lookup("m", "sys", "first prompt", None), ("1",))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_client_serves_paraphrase_from_semantic_cache(self):
+        fake_model = FakeGenerativeModel(chunks=["Knock ", "knock"])
+        client = GeminiClient(model=fake_model, semantic_cache=SemanticCache(threshold=0.8))
+        list(client.generate_response("Tell me a joke", stream=True))
+        texts = [extract_chunk_text(c) for c in client.generate_response("Tell me a joke, please", stream=True)]
+        self.assertEqual(texts, ["Knock ", "knock"])
+        self.assertEqual(len(fake_model.calls), 1)
+
+
+class TestAsyncGeminiClient(unittest.IsolatedAsyncioTestCase):
+
+    async def test_agenerate_response_streams_fake_chunks(self):
+        """The async client yields every chunk from the fake model in order."""
+        fake_model = FakeGenerativeModel(chunks=["Hi ", "there"], chunk_delay=0.001)
+        client = GeminiClient(model_name="fake-gemini", model=fake_model)
+        texts = [extract_chunk_text(chunk) async for chunk in client.agenerate_response("Hello")]
+        self.assertEqual(texts, ["Hi ", "there"])
+        self.assertEqual(fake_model.calls[0][0], "Hello")
+
+    async def test_agenerate_response_uses_response_cache(self):
+        """The async path fills and serves from the same cache as the sync path."""
+        fake_model = FakeGenerativeModel(chunks=["cached ", "reply"])
+        client = GeminiClient(model=fake_model, response_cache=ResponseCache())
+        list(client.generate_response("Hello", stream=True))
+        texts = [extract_chunk_text(chunk) async for chunk in client.agenerate_response("hello")]
+        self.assertEqual(texts, ["cached ", "reply"])
+        self.assertEqual(len(fake_model.calls), 1)
+
+    async def test_agenerate_response_reports_stream_errors(self):
+        """Errors mid-stream surface as an error chunk, like the sync client."""
+        fake_model = FakeGenerativeModel(chunks=["a", "b", "c"], error_after=1)
+        client = GeminiClient(model=fake_model)
+        texts = [extract_chunk_text(chunk) async for chunk in client.agenerate_response("Hello")]
+        self.assertEqual(texts[0], "a")
+        self.assertTrue(texts[-1].startswith("Error_Stream_Iteration"))
+
+
+class TestStreamScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def _drain(self, scheduler, client, **kwargs):
+        return [extract_chunk_text(chunk) async for chunk in
+                scheduler.stream(lambda: client.agenerate_response("Hello"), **kwargs)]
+
+    async def test_streams_are_multiplexed_within_the_concurrency_limit(self):
+        """Many slow streams finish in roughly one stream's time and never exceed the cap."""
+        fake_model = FakeGenerativeModel(chunks=["x"] * 5, chunk_delay=0.02)
+        client = GeminiClient(model=fake_model)
+        scheduler = StreamScheduler(max_concurrency=50, max_queue=100, default_deadline=5)
+
+        peak = 0
+        original_stream = scheduler.stream
+
+        async def tracking_stream(factory, deadline=None):
+            nonlocal peak
+            async for item in original_stream(factory, deadline):
+                peak = max(peak, scheduler.active)
+                yield item
+        scheduler.stream = tracking_stream
+
+        start = time.monotonic()
+        results = await asyncio.gather(*(self._drain(scheduler, client) for _ in range(100)))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(len(results), 100)
+        self.assertTrue(all(r == ["x"] * 5 for r in results))
+        self.assertLessEqual(peak, 50)
+        self.assertLess(elapsed, 1.0)  # Sequentially this would take ~10 seconds
+        self.assertEqual(scheduler.stats()["completed"], 100)
+
+    async def test_full_queue_rejects_new_streams(self):
+        """When every slot is taken and the queue is full, new streams are rejected."""
+        fake_model = FakeGenerativeModel(chunks=["x"], chunk_delay=0.2)
+        client = GeminiClient(model=fake_model)
+        scheduler = StreamScheduler(max_concurrency=1, max_queue=1, default_deadline=5)
+
+        running = asyncio.ensure_future(self._drain(scheduler, client))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(self._drain(scheduler, client))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(SchedulerOverloaded):
+            await self._drain(scheduler, client)
+        await asyncio.gather(running, waiting)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+    async def test_deadline_cancels_slow_streams(self):
+        """A stream that outlives its deadline raises and frees its slot."""
+        fake_model = FakeGenerativeModel(chunks=["x", "y"], chunk_delay=0.5)
+        client = GeminiClient(model=fake_model)
+        scheduler = StreamScheduler(max_concurrency=1, default_deadline=5)
+        with self.assertRaises(StreamDeadlineExceeded):
+            await self._drain(scheduler, client, deadline=0.05)
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.stats()["timed_out"], 1)
+
+    async def test_waiting_tenants_are_served_round_robin(self):
+        """A tenant queued behind another tenant's burst is served next, not after the whole burst."""
+        scheduler = StreamScheduler(max_concurrency=1, default_deadline=5)
+        started = []
+
+        def factory(name):
+            async def stream():
+                started.append(name)
+                await asyncio.sleep(0.01)
+                yield name
+            return stream
+
+        async def drain(name, tenant):
+            return [item async for item in scheduler.stream(factory(name), tenant=tenant)]
+
+        burst = [asyncio.ensure_future(drain(f"a{i}", "tenant-a")) for i in range(5)]
+        await asyncio.sleep(0)
+        other = asyncio.ensure_future(drain("b0", "tenant-b"))
+        await asyncio.gather(*burst, other)
+        self.assertEqual(started[:3], ["a0", "a1", "b0"])
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+    async def test_per_tenant_queue_cap(self):
+        scheduler = StreamScheduler(max_concurrency=1, max_queue=10, max_queue_per_tenant=1, default_deadline=5)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            yield "x"
+
+        async def drain(tenant):
+            return [item async for item in scheduler.stream(slow, tenant=tenant)]
+
+        running = asyncio.ensure_future(drain("a"))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(drain("a"))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(SchedulerOverloaded):
+            await drain("a")
+        self.assertEqual(await drain("b"), ["x"])  # Other tenants still queue
+        await asyncio.gather(running, waiting)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = StreamScheduler(max_concurrency=1, default_deadline=5)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            yield "x"
+
+        async def drain(tenant):
+            return [item async for item in scheduler.stream(slow, tenant=tenant)]
+
+        running = asyncio.ensure_future(drain("a"))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(drain("b"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await running
+        self.assertEqual(scheduler.stats()["queued"], 0)
+        self.assertEqual(await drain("c"), ["x"])
+        self.assertEqual(scheduler.active, 0)
+
+class TestSSE(unittest.TestCase):
+    def _token_frames(self, frames):
+        return [frame for frame in frames if "event: token" in frame]
+
+    def test_format_sse_escapes_newlines(self):
+        frame = format_sse("token", {"text": "line one\nline two"}, event_id=7)
+        self.assertEqual(frame, 'id: 7\nevent: token\ndata: {"text": "line one\\nline two"}\n\n')
+
+    def test_builder_coalesces_small_chunks(self):
+        now = [0.0]
+        builder = SSEFrameBuilder(flush_bytes=10, flush_interval=1.0, clock=lambda: now[0])
+        self.assertIsNone(builder.add_token("Hi "))
+        self.assertIsNone(builder.add_token("the"))
+        frame = builder.add_token("re friend")
+        self.assertIn('"Hi there friend"', frame)
+        self.assertIsNone(builder.add_token("!"))
+        now[0] = 1.5
+        self.assertIn('"!?"', builder.add_token("?"))  # The buffered text got too old
+
+    def test_stream_sse_ends_with_metrics_and_done(self):
+        frames = list(stream_sse(iter([("token", "a"), ("token", "b"), ("error", {"message": "x"})])))
+        body = "".join(frames)
+        self.assertLess(body.index('"ab"'), body.index("event: error"))
+        self.assertTrue(body.endswith("event: done\ndata: {}\n\n"))
+        self.assertIn("event: metrics", body)
+
+    def test_stream_sse_sends_keepalives_while_upstream_is_quiet(self):
+        def slow_events():
+            time.sleep(0.35)
+            yield "token", "late"
+        frames = list(stream_sse(slow_events(), heartbeat_interval=0.1))
+        self.assertGreaterEqual(frames.count(KEEPALIVE_FRAME), 2)
+        self.assertEqual(len(self._token_frames(frames)), 1)
+
+    def test_closing_the_stream_cancels_the_upstream_model(self):
+        fake_model = FakeGenerativeModel(chunks=["word "] * 100, chunk_delay=0.01)
+        client = GeminiClient(model=fake_model)
+        upstream = client.generate_response("Hello", stream=True)
+
+        def events():
+            try:
+                for chunk in upstream:
+                    yield "token", chunk.text
+            finally:
+                upstream.close()
+        frames = stream_sse(events(), flush_bytes=1)
+        next(frames)
+        frames.close()  # What the WSGI server does when the client disconnects
+        deadline = time.monotonic() + 2
+        while fake_model.cancelled == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(fake_model.cancelled, 1)
+        self.assertLess(fake_model.chunks_streamed, 100)
+
+    def test_slow_client_holds_back_the_producer(self):
+        """The producer stays at most a queue's worth of events ahead and stops once the client leaves."""
+        pulled, closed = [], []
+
+        def events():
+            try:
+                for i in range(1000):
+                    pulled.append(i)
+                    yield "token", "word "
+            finally:
+                closed.append(True)
+        frames = stream_sse(events(), flush_bytes=1)
+        next(frames)
+        time.sleep(0.2)  # A client that doesn't read
+        self.assertLessEqual(len(pulled), queue_size(1) + 2)
+        frames.close()
+        deadline = time.monotonic() + 2
+        while not closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(closed, [True])
+
+    def test_async_slow_client_holds_back_the_producer(self):
+        pulled = []
+
+        async def events():
+            for i in range(1000):
+                pulled.append(i)
+                yield "token", "word "
+
+        async def read_one_then_stall():
+            frames = astream_sse(events(), flush_bytes=1)
+            await frames.__anext__()
+            await asyncio.sleep(0.1)
+            await frames.aclose()
+        asyncio.run(read_one_then_stall())
+        self.assertLessEqual(len(pulled), queue_size(1) + 2)
+
+    def test_async_producer_stops_even_if_a_cancellation_is_lost(self):
+        """An event source that swallows one cancellation is cancelled again, then closed."""
+        closed = []
+
+        async def events():
+            lost = False
+            try:
+                for index in range(1000):
+                    try:
+                        await asyncio.sleep(10 if index == 1 else 0.001)  # Waiting on the model
+                    except asyncio.CancelledError:
+                        if lost:
+                            raise
+                        lost = True  # As asyncio.wait_for can on Python < 3.12
+                    yield "token", "word "
+            finally:
+                closed.append(True)
+
+        async def read_one_then_leave():
+            frames = astream_sse(events(), flush_bytes=1)
+            await frames.__anext__()
+            await asyncio.sleep(0.05)
+            await asyncio.wait_for(frames.aclose(), timeout=2)
+        asyncio.run(read_one_then_leave())
+        self.assertEqual(closed, [True])
+
+class TestSingleFlight(unittest.TestCase):
+    def _client(self, **model_kwargs):
+        fake_model = FakeGenerativeModel(chunks=["one ", "two ", "three"], chunk_delay=0.02, **model_kwargs)
+        return fake_model, GeminiClient(model=fake_model, single_flight=SingleFlight())
+
+    def test_concurrent_identical_requests_share_one_upstream_call(self):
+        import threading
+        fake_model, client = self._client()
+        replies = []
+
+        def ask():
+            replies.append("".join(chunk.text for chunk in client.generate_response("Same question", stream=True)))
+        threads = [threading.Thread(target=ask) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(fake_model.calls), 1)
+        self.assertEqual(replies, ["one two three"] * 8)
+        self.assertEqual(client.single_flight.stats()["followers"], 7)
+
+    def test_late_subscriber_gets_replay_then_live_chunks(self):
+        fake_model, client = self._client()
+        first = client.generate_response("Same question", stream=True)
+        self.assertEqual(next(first).text, "one ")
+        second = client.generate_response("Same question", stream=True)
+        self.assertEqual([chunk.text for chunk in second], ["one ", "two ", "three"])
+        self.assertEqual([chunk.text for chunk in first], ["two ", "three"])
+        self.assertEqual(len(fake_model.calls), 1)
+
+    def test_different_prompts_are_not_coalesced(self):
+        fake_model, client = self._client()
+        list(client.generate_response("First question", stream=True))
+        list(client.generate_response("Second question", stream=True))
+        self.assertEqual(len(fake_model.calls), 2)
+
+    def test_upstream_cancelled_when_every_subscriber_leaves(self):
+        fake_model = FakeGenerativeModel(chunks=["word "] * 100, chunk_delay=0.01)
+        client = GeminiClient(model=fake_model, single_flight=SingleFlight())
+        stream = client.generate_response("Hello", stream=True)
+        next(stream)
+        stream.close()
+        deadline = time.monotonic() + 2
+        while fake_model.cancelled == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(fake_model.cancelled, 1)
+        self.assertEqual(client.single_flight.stats()["abandoned"], 1)
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_identical_async_requests_share_one_upstream_call(self):
+        fake_model = FakeGenerativeModel(chunks=["one ", "two ", "three"], chunk_delay=0.01)
+        client = GeminiClient(model=fake_model, single_flight=SingleFlight())
+
+        async def ask():
+            return "".join([chunk.text async for chunk in client.agenerate_response("Same question")])
+        replies = await asyncio.gather(*(ask() for _ in range(8)))
+        self.assertEqual(replies, ["one two three"] * 8)
+        self.assertEqual(len(fake_model.calls), 1)
+
+    async def test_async_upstream_cancelled_when_every_subscriber_leaves(self):
+        fake_model = FakeGenerativeModel(chunks=["word "] * 100, chunk_delay=0.01)
+        client = GeminiClient(model=fake_model, single_flight=SingleFlight())
+        stream = client.agenerate_response("Hello")
+        await stream.__anext__()
+        await stream.aclose()
+        self.assertEqual(fake_model.cancelled, 1)
+        self.assertLess(fake_model.chunks_streamed, 100)
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_recovers_through_half_open(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=10.0, clock=lambda: now[0])
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())   # One trial call while half-open
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_trial_call_reopens(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5.0, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 5.0
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.stats()["times_opened"], 2)
+
+
+class TestResiliencePolicy(unittest.TestCase):
+    def _client(self, policy=None, **model_kwargs):
+        from google.api_core.exceptions import ServiceUnavailable
+        model_kwargs.setdefault("error_factory", lambda: ServiceUnavailable("brownout"))
+        fake_model = FakeGenerativeModel(chunks=["Hi ", "there"], **model_kwargs)
+        policy = policy or ResiliencePolicy(sleep=lambda seconds: None)
+        return fake_model, GeminiClient(model=fake_model, resilience=policy)
+
+    def _reply(self, client):
+        return "".join(extract_chunk_text(chunk) for chunk in client.generate_response("Hello", stream=True))
+
+    def test_retryable_errors_are_retried_before_first_token(self):
+        fake_model, client = self._client(fail_first_calls=2)
+        self.assertEqual(self._reply(client), "Hi there")
+        self.assertEqual(len(fake_model.calls), 3)
+        self.assertEqual(client.resilience.retries, 2)
+
+    def test_non_retryable_errors_fail_immediately(self):
+        fake_model, client = self._client(fail_first_calls=1, error_factory=lambda: RuntimeError("bad request"))
+        self.assertTrue(self._reply(client).startswith("Error_API_Call: bad request"))
+        self.assertEqual(len(fake_model.calls), 1)
+        self.assertFalse(is_retryable(RuntimeError("bad request")))
+
+    def test_first_token_timeout_triggers_a_retry(self):
+        policy = ResiliencePolicy(first_token_timeout=0.1, sleep=lambda seconds: None)
+        fake_model, client = self._client(policy, first_chunk_delays=[1.0])
+        started = time.monotonic()
+        self.assertEqual(self._reply(client), "Hi there")
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(policy.timeouts, 1)
+        self.assertEqual(len(fake_model.calls), 2)
+
+    def test_slow_first_token_is_hedged(self):
+        policy = ResiliencePolicy(hedge=True, hedge_min_samples=5, sleep=lambda seconds: None)
+        for _ in range(5):
+            policy.latency.record(0.02)
+        fake_model, client = self._client(policy, first_chunk_delays=[1.0, 0.0])
+        started = time.monotonic()
+        self.assertEqual(self._reply(client), "Hi there")
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual((policy.hedges, policy.hedge_wins), (1, 1))
+
+    def test_open_circuit_fails_fast(self):
+        policy = ResiliencePolicy(max_retries=0, breaker=CircuitBreaker(failure_threshold=1), sleep=lambda seconds: None)
+        fake_model, client = self._client(policy, fail_first_calls=1)
+        self.assertIn("brownout", self._reply(client))
+        self.assertIn("circuit breaker is open", self._reply(client))
+        self.assertEqual(len(fake_model.calls), 1)
+        self.assertEqual(policy.stats()["circuit"]["state"], "open")
+
+    def test_breaker_counts_calls_not_attempts(self):
+        """Two failed requests of three attempts each are two failures, below a threshold of 5."""
+        policy = ResiliencePolicy(max_retries=2, breaker=CircuitBreaker(failure_threshold=5), sleep=lambda seconds: None)
+        fake_model, client = self._client(policy, fail_first_calls=6)
+        for _ in range(2):
+            self.assertIn("brownout", self._reply(client))
+        self.assertEqual(len(fake_model.calls), 6)
+        self.assertEqual(policy.stats()["circuit"]["state"], "closed")
+        self.assertEqual(policy.stats()["circuit"]["consecutive_failures"], 2)
+
+    def test_no_hedge_beyond_half_open_trial_calls(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5.0, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 5.0  # Half-open: one trial call
+        policy = ResiliencePolicy(hedge=True, hedge_min_samples=5, breaker=breaker, sleep=lambda seconds: None)
+        for _ in range(5):
+            policy.latency.record(0.02)
+        fake_model, client = self._client(policy, first_chunk_delays=[0.2])
+        self.assertEqual(self._reply(client), "Hi there")
+        self.assertEqual(len(fake_model.calls), 1)
+        self.assertEqual(policy.hedges, 0)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_backoff_is_jittered_and_capped(self):
+        import random
+        policy = ResiliencePolicy(backoff_base=0.5, backoff_max=2.0, rng=random.Random(0))
+        delays = [policy.backoff(retry) for retry in range(6)]
+        self.assertTrue(all(0 <= delay <= 2.0 for delay in delays))
+        self.assertEqual(len(set(delays)), len(delays))
+
+
+class TestAsyncResiliencePolicy(unittest.IsolatedAsyncioTestCase):
+    async def _reply(self, client):
+        return "".join([extract_chunk_text(chunk) async for chunk in client.agenerate_response("Hello")])
+
+    async def test_async_retry_and_hedge(self):
+        from google.api_core.exceptions import ServiceUnavailable
+        policy = ResiliencePolicy(hedge=True, hedge_min_samples=5)
+        policy.backoff = lambda retry: 0.0
+        for _ in range(5):
+            policy.latency.record(0.02)
+        fake_model = FakeGenerativeModel(chunks=["Hi ", "there"], fail_first_calls=1,
+                                         first_chunk_delays=[0.0, 1.0, 0.0],
+                                         error_factory=lambda: ServiceUnavailable("brownout"))
+        client = GeminiClient(model=fake_model, resilience=policy)
+        started = time.monotonic()
+        self.assertEqual(await self._reply(client), "Hi there")
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual((policy.retries, policy.hedges, policy.hedge_wins), (1, 1, 1))
+        self.assertEqual(fake_model.cancelled, 1)  # The slow attempt was cancelled
+
+    async def test_cancelled_half_open_trial_gives_its_slot_back(self):
+        """A trial call cancelled while waiting (or backing off) doesn't leave the breaker stuck half-open."""
+        import asyncio
+        from google.api_core.exceptions import ServiceUnavailable
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5.0, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 5.0  # Half-open: one trial call
+        policy = ResiliencePolicy(breaker=breaker)
+        policy.backoff = lambda retry: 10.0
+
+        async def hangs():
+            await asyncio.sleep(10)
+
+        async def fails():
+            raise ServiceUnavailable("brownout")
+
+        for start_call in (hangs, fails):  # Cancelled waiting for the upstream, then during the retry sleep
+            task = asyncio.ensure_future(policy.aopen_stream(start_call))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(breaker.state, "half_open")
+            self.assertTrue(breaker.allow())  # The trial slot is free again
+            breaker.release()
+
+        fake_model = FakeGenerativeModel(chunks=["Hi ", "there"])
+        self.assertEqual(await self._reply(GeminiClient(model=fake_model, resilience=policy)), "Hi there")
+        self.assertEqual(breaker.state, "closed")
+
+class TestModelRouter(unittest.TestCase):
+    def _router(self, fast_model=None, large_model=None, **router_kwargs):
+        self.fast_model = fast_model or FakeGenerativeModel(chunks=["fast ", "reply"])
+        self.large_model = large_model or FakeGenerativeModel(chunks=["large ", "reply"])
+        return ModelRouter([
+            ModelRoute("large", GeminiClient(model=self.large_model), tier="large", expected_ttft_ms=900),
+            ModelRoute("fast", GeminiClient(model=self.fast_model), tier="fast", expected_ttft_ms=400),
+        ], **router_kwargs)
+
+    def _reply(self, router, prompt):
+        return "".join(extract_chunk_text(chunk) or "" for chunk in router.generate_response(prompt, stream=True))
+
+    def test_chit_chat_goes_to_fast_model_and_reasoning_to_large(self):
+        router = self._router()
+        self.assertEqual(self._reply(router, "hey, how's it going?"), "fast reply")
+        self.assertEqual(self._reply(router, "Explain step by step why quicksort is O(n log n) and compare the trade-offs."),
+                         "large reply")
+        self.assertGreater(estimate_complexity("Why? And how would you design it?"), estimate_complexity("hi!"))
+
+    def test_long_conversation_goes_to_large_model(self):
+        router = self._router(long_prompt_tokens=50)
+        history = [{'role': 'user', 'parts': [{'text': 'word ' * 200}]},
+                   {'role': 'model', 'parts': [{'text': 'ok'}]},
+                   {'role': 'user', 'parts': [{'text': 'thanks'}]}]
+        self.assertEqual(self._reply(router, history), "large reply")
+
+    def test_error_before_first_token_fails_over(self):
+        router = self._router(fast_model=FakeGenerativeModel(chunks=["fast"], fail_first_calls=1))
+        self.assertEqual(self._reply(router, "hello"), "large reply")
+        self.assertEqual(router.failovers, 1)
+        self.assertEqual(router.stats()["models"]["fast"]["failures"], 1)
+
+    def test_blocked_reply_fails_over(self):
+        router = self._router(fast_model=FakeGenerativeModel(chunks=[""]))
+        self.assertEqual(self._reply(router, "hello"), "large reply")
+
+    def test_last_model_error_is_passed_through(self):
+        router = self._router(fast_model=FakeGenerativeModel(fail_first_calls=1),
+                              large_model=FakeGenerativeModel(fail_first_calls=1))
+        self.assertTrue(self._reply(router, "hello").startswith("Error_API_Call"))
+
+    def test_slow_model_loses_chit_chat_traffic(self):
+        router = self._router(fast_model=FakeGenerativeModel(chunks=["fast"], first_chunk_delay=1.0), ewma_alpha=1.0)
+        self._reply(router, "hello")
+        self.assertEqual(router.plan("hello again")[0].name, "large")
+
+    def test_failing_model_drops_in_plan_order(self):
+        """An error before the first token counts as a slow sample, so the failing model is tried later."""
+        router = self._router(fast_model=FakeGenerativeModel(chunks=["fast"], fail_first_calls=1))
+        self.assertEqual(router.plan("hello")[0].name, "fast")
+        self.assertEqual(self._reply(router, "hello"), "large reply")
+        self.assertEqual(router.plan("hello again")[0].name, "large")
+        self.assertGreater(router.stats()["models"]["fast"]["ewma_ttft_ms"], 900)
+
+    def test_blocked_reply_adds_no_latency_penalty(self):
+        router = self._router(fast_model=FakeGenerativeModel(chunks=[""]))
+        self._reply(router, "hello")
+        self.assertEqual(router.stats()["models"]["fast"]["ewma_ttft_ms"], 400)
+
+
+class TestAsyncModelRouter(unittest.IsolatedAsyncioTestCase):
+    async def test_async_failover(self):
+        router = ModelRouter([
+            ModelRoute("fast", GeminiClient(model=FakeGenerativeModel(fail_first_calls=1)), tier="fast", expected_ttft_ms=100),
+            ModelRoute("large", GeminiClient(model=FakeGenerativeModel(chunks=["large ", "reply"])), tier="large"),
+        ])
+        reply = "".join([extract_chunk_text(chunk) async for chunk in router.agenerate_response("hello")])
+        self.assertEqual(reply, "large reply")
+        self.assertEqual(router.failovers, 1)
+
+class TestLazyGeminiClient(unittest.TestCase):
+    """The SDK model is built on first use (or warm_up), not in the constructor."""
+    def setUp(self):
+        import types
+        from modules.ai_core import gemini_client
+        self.built = []
+        fake_sdk = types.SimpleNamespace(
+            configure=lambda api_key: None,
+            GenerativeModel=lambda name, **kwargs: self.built.append(name) or FakeGenerativeModel(chunks=["lazy"]))
+        self.original_import = gemini_client._import_genai
+        gemini_client._import_genai = lambda: fake_sdk
+        self.gemini_client = gemini_client
+
+    def tearDown(self):
+        self.gemini_client._import_genai = self.original_import
+
+    def test_constructor_defers_model_construction(self):
+        client = GeminiClient(api_key="test-key", model_name="lazy-model")
+        self.assertFalse(client.ready)
+        self.assertEqual(self.built, [])
+        reply = "".join(extract_chunk_text(chunk) for chunk in client.generate_response("hi", stream=True))
+        self.assertEqual(reply, "lazy")
+        self.assertTrue(client.ready)
+        self.assertEqual(self.built, ["lazy-model"])
+
+    def test_router_warm_up_builds_every_model(self):
+        router = ModelRouter([ModelRoute(name, GeminiClient(api_key="test-key", model_name=name)) for name in ("a", "b")])
+        self.assertFalse(router.ready)
+        self.assertTrue(router.warm_up())
+        self.assertTrue(router.ready)
+        self.assertEqual(sorted(self.built), ["a", "b"])
+
+
+class TestContextCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.api = FakeCachingAPI(chunks=["from ", "cache"], min_tokens=100, clock=lambda: self.now)
+        self.cache = ContextCacheManager(self.api, ttl_seconds=600, refresh_margin_seconds=60, min_tokens=100,
+                                         history_step_tokens=50, retry_after_seconds=300, clock=lambda: self.now)
+        self.fake_model = FakeGenerativeModel(chunks=["full ", "prompt"])
+        self.addCleanup(self.cache.close)
+
+    def client(self, system_instruction="You are GURU.", model_name="fake-gemini"):
+        return GeminiClient(model_name=model_name, model=self.fake_model, system_instruction=system_instruction,
+                            context_cache=self.cache)
+
+    def ask(self, client, prompt):
+        texts = [extract_chunk_text(c) for c in client.generate_response(prompt, stream=True)]
+        self.cache.wait()
+        return "".join(texts)
+
+    def turns(self, count):
+        return [{"role": "user" if i % 2 == 0 else "model", "parts": [{"text": f"Turn {i}: " + "detail " * 12}]}
+                for i in range(count)]
+
+    def test_long_system_instruction_is_cached_once(self):
+        """A persona above min_tokens is cached; later requests send only the prompt."""
+        client = self.client(system_instruction="Persona guidance. " * 100)
+        self.assertEqual(self.ask(client, "Hello"), "full prompt")
+        self.assertEqual(len(self.api.handles), 1)
+        self.assertEqual(self.ask(client, "Hello again"), "from cache")
+        self.assertEqual(self.ask(client, "And again"), "from cache")
+        self.assertEqual(len(self.api.handles), 1)
+        self.assertEqual(self.api.models[0].calls[-1][0], "And again")
+        self.assertEqual(len(self.fake_model.calls), 1)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_short_prompts_are_not_cached(self):
+        """Below min_tokens nothing is created, and requests go to the model as before."""
+        client = self.client()
+        self.ask(client, "Hello")
+        self.ask(client, self.turns(3))
+        self.assertEqual(self.api.handles, [])
+        self.assertEqual(len(self.fake_model.calls), 2)
+
+    def test_caching_only_applies_when_the_budget_can_reach_min_tokens(self):
+        """The persona plus the whole history budget must be able to reach min_tokens."""
+        self.assertFalse(caching_can_apply("You are GURU.", 50, 100))
+        self.assertTrue(caching_can_apply("You are GURU.", 100, 100))
+        self.assertTrue(caching_can_apply("Persona guidance. " * 100, 0, 100))
+
+    def test_history_prefix_grows_and_replaces_shorter_prefix(self):
+        """Long conversations cache everything but the newest turn, then send only what follows it."""
+        client = self.client()
+        self.ask(client, self.turns(9))
+        self.assertEqual(len(self.api.handles), 1)
+        self.assertEqual(len(self.api.handles[0].contents), 8)
+        self.assertEqual(self.ask(client, self.turns(11)), "from cache")
+        self.assertEqual(self.api.models[0].calls[-1][0], self.turns(11)[8:])
+        self.ask(client, self.turns(13))  # 4 uncached turns reach history_step_tokens
+        self.assertEqual(len(self.api.handles), 2)
+        self.assertTrue(self.api.handles[0].deleted)
+        self.ask(client, self.turns(15))
+        self.assertEqual(self.api.models[1].calls[-1][0], self.turns(15)[12:])
+
+    def test_handle_is_refreshed_before_expiry(self):
+        client = self.client(system_instruction="Persona guidance. " * 100)
+        self.ask(client, "Hello")
+        self.now += 560  # Inside the refresh margin
+        self.assertEqual(self.ask(client, "Still there?"), "from cache")
+        self.assertEqual(self.api.refreshes, 1)
+        self.now += 500  # Past the original TTL, within the refreshed one
+        self.assertEqual(self.ask(client, "Still there?"), "from cache")
+        self.assertEqual(self.cache.stats()["refreshed"], 1)
+
+    def test_expired_handle_falls_back_to_full_prompt(self):
+        client = self.client(system_instruction="Persona guidance. " * 100)
+        self.ask(client, "Hello")
+        self.now += 1000
+        self.assertEqual(self.ask(client, "Hello?"), "full prompt")
+        self.assertEqual(self.cache.stats()["expired"], 1)
+        self.assertEqual(self.ask(client, "Hello?"), "from cache")  # Re-created by the previous request
+
+    def test_rejected_handle_falls_back_transparently(self):
+        """A handle deleted server-side fails the cached call; the full prompt is sent instead."""
+        client = self.client(system_instruction="Persona guidance. " * 100)
+        self.ask(client, "Hello")
+        self.api.handles[0].deleted = True
+        self.assertEqual(self.ask(client, "Hello?"), "full prompt")
+        self.assertEqual(self.fake_model.calls[-1][0], "Hello?")
+        self.assertEqual(self.cache.stats()["fallbacks"], 1)
+
+    def test_failed_create_pauses_caching_for_that_model(self):
+        self.api.unsupported_models.add("no-cache-model")
+        client = self.client(system_instruction="Persona guidance. " * 100, model_name="no-cache-model")
+        self.ask(client, "Hello")
+        self.ask(client, "Hello?")
+        self.assertEqual(self.cache.stats()["create_failures"], 1)
+        self.assertEqual(len(self.fake_model.calls), 2)
+        self.now += 301
+        self.ask(client, "Hello?")
+        self.assertEqual(self.cache.stats()["create_failures"], 2)
+
+
+class TestAsyncContextCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_agenerate_response_uses_cached_context(self):
+        api = FakeCachingAPI(chunks=["from ", "cache"], min_tokens=100)
+        cache = ContextCacheManager(api, min_tokens=100)
+        self.addCleanup(cache.close)
+        fake_model = FakeGenerativeModel(chunks=["full ", "prompt"])
+        client = GeminiClient(model=fake_model, system_instruction="Persona guidance. " * 100, context_cache=cache)
+        first = [extract_chunk_text(c) async for c in client.agenerate_response("Hello")]
+        cache.wait()
+        second = [extract_chunk_text(c) async for c in client.agenerate_response("Hello again")]
+        self.assertEqual((first, second), (["full ", "prompt"], ["from ", "cache"]))
+        self.assertEqual(api.models[0].calls[0][0], "Hello again")
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.backend = MemoryRateLimitBackend(clock=lambda: self.now)
+
+    def limiter(self, limits=None, **kwargs):
+        limits = limits or {"ip": {"requests_per_minute": 60, "burst": 3}}
+        return RateLimiter(limits, backend=self.backend, **kwargs)
+
+    def test_burst_then_lazy_refill(self):
+        limiter = self.limiter()
+        for _ in range(3):
+            limiter.admit(ip="1.2.3.4")
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.admit(ip="1.2.3.4")
+        self.assertEqual(raised.exception.scope, "ip")
+        self.assertAlmostEqual(raised.exception.retry_after, 1.0)
+        limiter.admit(ip="5.6.7.8")  # Other callers are unaffected
+        self.now += 1.0
+        limiter.admit(ip="1.2.3.4")
+        self.assertEqual(limiter.stats()["rate_limited"], 1)
+
+    def test_every_bucket_must_pass_and_none_is_charged_otherwise(self):
+        limiter = self.limiter({"ip": {"requests_per_minute": 60, "burst": 3},
+                                "session": {"requests_per_minute": 60, "burst": 1}})
+        limiter.admit(ip="1.2.3.4", session_id="session-a")
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.admit(ip="1.2.3.4", session_id="session-a")
+        self.assertEqual(raised.exception.scope, "session")
+        limiter.admit(ip="1.2.3.4", session_id="session-b")
+        limiter.admit(ip="1.2.3.4", session_id="session-c")  # The rejected request took no IP token
+        with self.assertRaises(RateLimitExceeded):
+            limiter.admit(ip="1.2.3.4", session_id="session-d")  # New sessions don't escape the IP limit
+
+    def test_bucket_table_is_bounded(self):
+        self.backend.max_keys = 100
+        limiter = self.limiter()
+        for i in range(1000):
+            limiter.admit(ip=f"10.0.{i // 256}.{i % 256}")
+        self.assertEqual(self.backend.stats()["buckets"], 100)
+        self.assertEqual(self.backend.stats()["evicted_buckets"], 900)
+
+    def test_open_stream_caps(self):
+        limiter = self.limiter(max_streams={"ip": 3, "session": 1})
+        permit = limiter.admit(ip="1.2.3.4", session_id="session-a")
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.admit(ip="1.2.3.4", session_id="session-a")
+        self.assertEqual(raised.exception.scope, "session")
+        self.assertEqual(self.backend.stats()["open_streams"], 2)  # The rejected request holds no IP slot
+        permit.release()
+        permit.release()
+        self.assertEqual(self.backend.stats()["open_streams"], 0)
+        limiter.admit(ip="1.2.3.4", session_id="session-a")
+
+    def test_stream_limited_request_takes_no_tokens(self):
+        limiter = self.limiter({"ip": {"requests_per_minute": 60, "burst": 3}}, max_streams={"ip": 1})
+        permit = limiter.admit(ip="1.2.3.4")
+        level = self.backend._buckets["ip:1.2.3.4"].tokens
+        for _ in range(5):
+            with self.assertRaises(RateLimitExceeded):
+                limiter.admit(ip="1.2.3.4")
+        self.assertEqual(self.backend._buckets["ip:1.2.3.4"].tokens, level)
+        permit.release()
+
+    def test_rate_limited_request_holds_no_stream_slot(self):
+        limiter = self.limiter({"ip": {"requests_per_minute": 60, "burst": 1}}, max_streams={"ip": 2})
+        limiter.admit(ip="1.2.3.4")
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.admit(ip="1.2.3.4")
+        self.assertIn("Too many requests", str(raised.exception))
+        self.assertEqual(self.backend.stats()["open_streams"], 1)
+
+    def test_shared_backend_enforces_one_global_limit(self):
+        """Two workers' limiters over the same backend share the buckets."""
+        workers = [self.limiter(), self.limiter()]
+        for i in range(3):
+            workers[i % 2].admit(ip="1.2.3.4")
+        for worker in workers:
+            with self.assertRaises(RateLimitExceeded):
+                worker.admit(ip="1.2.3.4")
+
+    def test_api_key_overrides_and_tenant(self):
+        limiter = self.limiter({"ip": {"requests_per_minute": 600, "burst": 100},
+                                "api_key": {"requests_per_minute": 60, "burst": 1}},
+                               tenant_limits={"big-tenant-key": {"burst": 5}})
+        for _ in range(5):
+            permit = limiter.admit(ip="1.2.3.4", api_key="big-tenant-key")
+        with self.assertRaises(RateLimitExceeded):
+            limiter.admit(ip="1.2.3.4", api_key="big-tenant-key")
+        limiter.admit(ip="1.2.3.4", api_key="small-tenant-key")
+        with self.assertRaises(RateLimitExceeded):
+            limiter.admit(ip="1.2.3.4", api_key="small-tenant-key")
+        self.assertNotEqual(permit.tenant, "big-tenant-key")  # Grouped by key digest, never the key itself
+        self.assertFalse(any("tenant-key" in key for key in self.backend._buckets))
+        self.assertEqual(limiter.admit(ip="1.2.3.4").tenant, "1.2.3.4")
+
+    def test_unknown_scope_is_rejected(self):
+        with self.assertRaises(ValueError):
+            RateLimiter({"user": {"requests_per_minute": 1, "burst": 1}})
+
+    def test_shared_store_backend_across_workers(self):
+        """Limiters in two processes, each with its own connection to one SQLite file, share limits."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "shared.db")
+            clock = lambda: self.now
+            backends = [SharedRateLimitBackend(SQLiteSharedStore(path, clock=clock), clock=clock) for _ in range(2)]
+            workers = [RateLimiter({"ip": {"requests_per_minute": 60, "burst": 3}}, max_streams={"ip": 2},
+                                   backend=backend) for backend in backends]
+            permits = [workers[i % 2].admit(ip="1.2.3.4") for i in range(2)]
+            bucket = backends[0].store.get(SharedRateLimitBackend.BUCKETS_NAMESPACE, "ip:1.2.3.4")
+            with self.assertRaises(RateLimitExceeded) as raised:
+                workers[0].admit(ip="1.2.3.4")
+            self.assertIn("open replies", str(raised.exception))  # Both stream slots are held
+            # ... and the rejected request took no token
+            self.assertEqual(backends[1].store.get(SharedRateLimitBackend.BUCKETS_NAMESPACE, "ip:1.2.3.4"), bucket)
+            for permit in permits:
+                permit.release()
+            workers[1].admit(ip="1.2.3.4").release()
+            with self.assertRaises(RateLimitExceeded) as raised:
+                workers[0].admit(ip="1.2.3.4")
+            self.assertAlmostEqual(raised.exception.retry_after, 1.0)
+            self.now += 1.0
+            workers[0].admit(ip="1.2.3.4").release()
+            self.assertEqual(backends[0].stats()["open_streams"], 0)
+
+    def test_dead_workers_stream_slots_are_freed_when_the_lease_ends(self):
+        store = MemorySharedStore(clock=lambda: self.now)
+        backend = SharedRateLimitBackend(store, stream_lease_seconds=60, clock=lambda: self.now)
+        limiter = RateLimiter({}, max_streams={"ip": 1}, backend=backend)
+        limiter.admit(ip="1.2.3.4")  # Never released, as if its worker died
+        with self.assertRaises(RateLimitExceeded):
+            limiter.admit(ip="1.2.3.4")
+        self.now += 61
+        limiter.admit(ip="1.2.3.4").release()
+        self.assertEqual(store.stats()["entries"], 0)
+
+    def test_client_ip(self):
+        self.assertEqual(client_ip("10.0.0.1", "6.6.6.6, 1.2.3.4"), "10.0.0.1")
+        self.assertEqual(client_ip("10.0.0.1", "6.6.6.6, 1.2.3.4", trust_forwarded_for=True), "1.2.3.4")
+
+
 if __name__ == '__main__':
     unittest.main()
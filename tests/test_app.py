@@ -10,18 +10,44 @@ except ImportError:
     from app import app
 
 
+def parse_sse(body):
+    """Splits an SSE body into (event, data) pairs, skipping keepalive comments."""
+    import json
+    events = []
+    for frame in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.split("\n") if line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def fresh_rate_limiter():
+    """The configured limits with empty buckets, so tests don't use up each other's allowance."""
+    from config import RATE_LIMIT_CONFIG
+    from modules.ai_core.rate_limit import RateLimiter
+    return RateLimiter(RATE_LIMIT_CONFIG["limits"], max_streams=RATE_LIMIT_CONFIG["max_streams"])
+
+
 class AppTestCase(unittest.TestCase):
     def setUp(self):
         """Set up test client and other test variables."""
+        import app as guru_app
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        self.guru_app = guru_app
+        self.original_client = guru_app.gemini_client
+        self.original_rate_limiter = guru_app.rate_limiter
+        guru_app.rate_limiter = fresh_rate_limiter()
+        # A local fake model stands in for Gemini so the chat tests run offline without an API key
+        guru_app.gemini_client = GeminiClient(model=FakeGenerativeModel(chunks=["Hello ", "there"]))
         app.testing = True
         self.client = app.test_client()
-        # You might want to mock environment variables or services here
-        # os.environ['GEMINI_API_KEY'] = 'test_key_for_app_tests'
 
 
     def tearDown(self):
         """Executed after each test."""
-        pass
+        self.guru_app.gemini_client = self.original_client
+        self.guru_app.rate_limiter = self.original_rate_limiter
 
     def test_health_check(self):
         """Test the health check endpoint."""
@@ -39,9 +65,17 @@ class AppTestCase(unittest.TestCase):
         """Test the chat API endpoint with valid data."""
         response = self.client.post('/api/chat', json={'message': 'Hello GURU'})
         self.assertEqual(response.status_code, 200)
-        json_data = response.get_json()
-        self.assertIn('reply', json_data)
-        # self.assertEqual(json_data['reply'], 'GURU echoes: Hello GURU') # If placeholder is active
+        events = parse_sse(response.get_data(as_text=True))
+        self.assertEqual("".join(data["text"] for event, data in events if event == "token"), "Hello there")
+        self.assertEqual(events[-1][0], "done")
+
+    def test_ready_check(self):
+        """/ready is 200 once a model can serve chat traffic and 503 when none is configured."""
+        self.assertEqual(self.client.get('/ready').status_code, 200)
+        self.guru_app.gemini_client = None
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.get_json()['ready'])
 
     def test_chat_api_no_message(self):
         """Test the chat API endpoint with no message."""
@@ -51,5 +85,396 @@ class AppTestCase(unittest.TestCase):
         self.assertIn('error', json_data)
         self.assertEqual(json_data['error'], 'No message provided')
 
+class ChatSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        """Use a local fake model so /api/chat can stream without an API key."""
+        import app as guru_app
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        self.guru_app = guru_app
+        self.original_client = guru_app.gemini_client
+        self.original_rate_limiter = guru_app.rate_limiter
+        guru_app.rate_limiter = fresh_rate_limiter()
+        guru_app.gemini_client = GeminiClient(model=FakeGenerativeModel(chunks=["Hi ", "there"]))
+        app.testing = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.guru_app.gemini_client = self.original_client
+        self.guru_app.rate_limiter = self.original_rate_limiter
+
+    def test_sessions_keep_separate_histories(self):
+        """Messages sent under different session IDs land in different histories."""
+        self.client.post('/api/chat', json={'message': 'I am Alice'}, headers={'X-Session-ID': 'alice-session'}).get_data()
+        self.client.post('/api/chat', json={'message': 'I am Bob'}, headers={'X-Session-ID': 'bob-session'}).get_data()
+        alice_history = self.guru_app.session_store.get('alice-session').get_history()
+        bob_history = self.guru_app.session_store.get('bob-session').get_history()
+        self.assertEqual(alice_history[0]['content'], 'I am Alice')
+        self.assertEqual(bob_history[0]['content'], 'I am Bob')
+        self.assertEqual(len(alice_history), 2)  # user turn + model reply
+
+    def test_chat_sends_multi_turn_contents(self):
+        """The second turn of a session sends the earlier turns as Gemini contents."""
+        fake_model = self.guru_app.gemini_client.model
+        headers = {'X-Session-ID': 'multi-turn-session'}
+        self.client.post('/api/chat', json={'message': 'My name is Alex'}, headers=headers).get_data()
+        self.client.post('/api/chat', json={'message': 'What is my name?'}, headers=headers).get_data()
+        contents = fake_model.calls[-1][0]
+        self.assertEqual([entry['role'] for entry in contents], ['user', 'model', 'user'])
+        self.assertEqual(contents[0]['parts'][0]['text'], 'My name is Alex')
+        self.assertEqual(contents[-1]['parts'][0]['text'], 'What is my name?')
+
+    def test_reply_keeps_spaces_between_chunks(self):
+        """Chunk boundaries don't glue words together in the stream or the stored history."""
+        headers = {'X-Session-ID': 'spacing-session'}
+        body = self.client.post('/api/chat', json={'message': 'Hello'}, headers=headers).get_data(as_text=True)
+        tokens = "".join(data['text'] for event, data in parse_sse(body) if event == 'token')
+        self.assertEqual(tokens, 'Hi there')
+        self.assertEqual(self.guru_app.session_store.get('spacing-session').get_history()[-1]['content'], 'Hi there')
+
+    def test_new_session_sets_cookie(self):
+        """A request without a session gets a session cookie."""
+        response = self.client.post('/api/chat', json={'message': 'Hello'})
+        response.get_data()
+        self.assertIn('guru_session_id=', response.headers.get('Set-Cookie', ''))
+
+    def test_chat_streams_sse_frames(self):
+        """The reply is framed as numbered token events followed by metrics and done."""
+        response = self.client.post('/api/chat', json={'message': 'Hello'})
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.headers.get('Cache-Control'), 'no-cache')
+        events = [event for event, _ in parse_sse(body)]
+        self.assertEqual(events[-2:], ['metrics', 'done'])
+        self.assertIn('token', events)
+        ids = [int(line[4:]) for line in body.split("\n") if line.startswith("id: ")]
+        self.assertEqual(ids, list(range(1, len(ids) + 1)))
+
+    def test_metrics_endpoint_reports_chat_streams(self):
+        """/metrics exposes request counts and stream histograms in Prometheus text format."""
+        self.client.post('/api/chat', json={'message': 'Hello'}).get_data()
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('guru_chat_requests_total{status="200"}', body)
+        self.assertIn('guru_chat_time_to_first_token_seconds_count', body)
+        self.assertIn('guru_gemini_requests_total{model="gemini-2.0-flash"}', body)
+        self.assertIn('guru_session_store_sessions', body)
+
+    def test_tone_prefix_sent_when_sentiment_is_ready(self):
+        """A negative message gets an empathetic opener when sentiment finishes before the first token;
+        the history keeps only the model's reply."""
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.sentiment.response_modifier import EMPATHETIC_PHRASES
+        self.guru_app.gemini_client.model = FakeGenerativeModel(chunks=["Hi ", "there"], first_chunk_delay=0.2)
+        headers = {'X-Session-ID': 'tone-session'}
+        body = self.client.post('/api/chat', json={'message': 'This is terrible, I hate it'}, headers=headers).get_data(as_text=True)
+        reply = "".join(data['text'] for event, data in parse_sse(body) if event == 'token')
+        self.assertIn(reply[:-len('Hi there')], EMPATHETIC_PHRASES)
+        self.assertTrue(reply.endswith('Hi there'))
+        self.assertEqual(self.guru_app.session_store.get('tone-session').get_history()[-1]['content'], 'Hi there')
+
+    def test_tone_prefix_skipped_for_short_or_mild_messages(self):
+        """Too few words, or a weak score, is too little to go on: no opener."""
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        self.guru_app.gemini_client.model = FakeGenerativeModel(chunks=["Hi ", "there"], first_chunk_delay=0.2)
+        for message in ('Terrible!', 'This is terrible'):
+            body = self.client.post('/api/chat', json={'message': message}).get_data(as_text=True)
+            reply = "".join(data['text'] for event, data in parse_sse(body) if event == 'token')
+            self.assertEqual(reply, 'Hi there')
+
+    def test_tone_prefix_skipped_when_sentiment_is_late(self):
+        """Sentiment never holds back the first token: if it isn't done, the reply goes out unprefixed."""
+        import threading
+        from modules.sentiment.pipeline import TonePipeline
+        release = threading.Event()
+
+        class SlowAnalyzer:
+            def analyze_sentiment(self, text):
+                release.wait(5)
+                return {'label': 'negative'}
+
+        original_pipeline = self.guru_app.tone_pipeline
+        self.guru_app.tone_pipeline = TonePipeline(analyzer=SlowAnalyzer())
+        try:
+            body = self.client.post('/api/chat', json={'message': 'This is terrible'}).get_data(as_text=True)
+            reply = "".join(data['text'] for event, data in parse_sse(body) if event == 'token')
+            self.assertEqual(reply, 'Hi there')
+            self.assertEqual(self.guru_app.tone_pipeline.stats()['late'], 1)
+        finally:
+            release.set()
+            self.guru_app.tone_pipeline.close()
+            self.guru_app.tone_pipeline = original_pipeline
+
+    def test_default_config_sets_up_no_context_cache(self):
+        """The default history budget never reaches min_tokens, so no request pays for cache lookups."""
+        from modules.ai_core.config import CONTEXT_CACHE_CONFIG, CONTEXT_WINDOW_MAX_TOKENS, SYSTEM_INSTRUCTION_TEXT
+        from modules.ai_core.context_cache import caching_can_apply
+        self.assertFalse(caching_can_apply(SYSTEM_INSTRUCTION_TEXT, CONTEXT_WINDOW_MAX_TOKENS,
+                                           CONTEXT_CACHE_CONFIG["min_tokens"]))
+        self.assertIsNone(self.guru_app.context_cache)
+
+    def test_upstream_error_is_an_error_event(self):
+        """A failing model stream ends with an error event instead of text in the reply."""
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        self.guru_app.gemini_client.model = FakeGenerativeModel(chunks=["Hi ", "there"], error_after=1)
+        body = self.client.post('/api/chat', json={'message': 'Hello'}).get_data(as_text=True)
+        events = dict(parse_sse(body))
+        self.assertIn('Error_Stream_Iteration', events['error']['message'])
+        self.assertIn('done', events)
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        import app as guru_app
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        from modules.ai_core.rate_limit import RateLimiter
+        self.guru_app = guru_app
+        self.original_client = guru_app.gemini_client
+        self.original_rate_limiter = guru_app.rate_limiter
+        guru_app.gemini_client = GeminiClient(model=FakeGenerativeModel(chunks=["Hi"]))
+        guru_app.rate_limiter = RateLimiter({"ip": {"requests_per_minute": 60, "burst": 2}}, max_streams={"ip": 2})
+        app.testing = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.guru_app.gemini_client = self.original_client
+        self.guru_app.rate_limiter = self.original_rate_limiter
+
+    def test_over_the_limit_is_429_with_retry_after(self):
+        headers = {'X-Session-ID': 'rate-limited-session'}
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/chat', json={'message': 'Hi'}, headers=headers).status_code, 200)
+        response = self.client.post('/api/chat', json={'message': 'One more'}, headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        history = self.guru_app.session_store.get('rate-limited-session').get_history()
+        self.assertNotIn('One more', [message['content'] for message in history])
+
+    def test_stream_slots_are_released_when_replies_end(self):
+        for _ in range(2):
+            with self.client.post('/api/chat', json={'message': 'Hi'}) as response:  # Servers close responses when done
+                response.get_data()
+        self.assertEqual(self.guru_app.rate_limiter.stats()["open_streams"], 0)
+
+
+class AsgiChatTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """Point the app at a local fake model instead of the real Gemini API."""
+        import app as guru_app
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        self.guru_app = guru_app
+        self.original_client = guru_app.gemini_client
+        self.original_rate_limiter = guru_app.rate_limiter
+        guru_app.rate_limiter = fresh_rate_limiter()
+        self.fake_model = FakeGenerativeModel(chunks=["Hello ", "from GURU"], chunk_delay=0.001)
+        guru_app.gemini_client = GeminiClient(model=self.fake_model)
+
+    def tearDown(self):
+        self.guru_app.gemini_client = self.original_client
+        self.guru_app.rate_limiter = self.original_rate_limiter
+
+    async def _request(self, path, method, body=b"", disconnect_after_frames=None, headers=()):
+        import asyncio
+        from asgi import application
+        sent = []
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        client_gone = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await client_gone.wait()  # Like a real server, only report a disconnect when it happens
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            frames = sum(1 for m in sent if m.get("body"))
+            if disconnect_after_frames is not None and frames >= disconnect_after_frames:
+                client_gone.set()
+
+        await application({"type": "http", "path": path, "method": method, "headers": list(headers),
+                           "client": ("127.0.0.1", 50000)}, receive, send)
+        status = sent[0]["status"]
+        body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+        return status, body
+
+    async def test_async_chat_streams_reply(self):
+        """The ASGI chat route streams the fake model's reply."""
+        status, body = await self._request('/api/chat', 'POST', b'{"message": "Hello GURU"}')
+        self.assertEqual(status, 200)
+        self.assertIn(b'from GURU', body)
+        self.assertIn(b'event: done', body)
+
+    async def test_async_disconnect_cancels_upstream(self):
+        """A client that goes away mid-reply stops the model stream."""
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        fake_model = FakeGenerativeModel(chunks=["word "] * 200, chunk_delay=0.01)
+        self.guru_app.gemini_client = GeminiClient(model=fake_model)
+        status, body = await self._request('/api/chat', 'POST', b'{"message": "Hello GURU"}', disconnect_after_frames=1)
+        self.assertEqual(status, 200)
+        self.assertNotIn(b'event: done', body)
+        self.assertEqual(fake_model.cancelled, 1)
+        self.assertLess(fake_model.chunks_streamed, 200)
+
+    async def test_async_chat_rate_limited(self):
+        """The ASGI route applies the same limits, per API key here, and answers 429 with Retry-After."""
+        from modules.ai_core.rate_limit import RateLimiter
+        self.guru_app.rate_limiter = RateLimiter({"api_key": {"requests_per_minute": 60, "burst": 1}})
+        headers = [(b"x-api-key", b"tenant-key")]
+        status, _ = await self._request('/api/chat', 'POST', b'{"message": "Hello"}', headers=headers)
+        self.assertEqual(status, 200)
+        status, body = await self._request('/api/chat', 'POST', b'{"message": "Hello"}', headers=headers)
+        self.assertEqual(status, 429)
+        self.assertIn(b'Too many requests', body)
+        self.assertEqual(self.guru_app.rate_limiter.stats()["open_streams"], 0)
+
+    async def test_async_overloaded_scheduler_leaves_history_untouched(self):
+        """A request the scheduler turns away adds no user turn, so a retry doesn't repeat the question."""
+        import asgi
+        from modules.ai_core.scheduler import StreamScheduler
+        original_scheduler = asgi.stream_scheduler
+        asgi.stream_scheduler = StreamScheduler(max_concurrency=1, max_queue=0)
+        asgi.stream_scheduler.active = 1  # Its only slot is taken
+        headers = [(b"x-session-id", b"overloaded-session-1")]
+        try:
+            status, body = await self._request('/api/chat', 'POST', b'{"message": "Hello"}', headers=headers)
+        finally:
+            asgi.stream_scheduler = original_scheduler
+        self.assertEqual(status, 429)
+        self.assertIn(b'busy', body)
+        self.assertEqual(self.guru_app.session_store.get("overloaded-session-1").get_history(), [])
+
+    async def test_async_tone_prefix_not_stored_in_history(self):
+        """The ASGI route also sends the opener but stores only the model's reply."""
+        from modules.sentiment.response_modifier import EMPATHETIC_PHRASES
+        self.fake_model.first_chunk_delay = 0.2
+        headers = [(b"x-session-id", b"async-tone-session")]
+        status, body = await self._request('/api/chat', 'POST', b'{"message": "This is terrible, I hate it"}',
+                                           headers=headers)
+        self.assertEqual(status, 200)
+        reply = "".join(data['text'] for event, data in parse_sse(body.decode()) if event == 'token')
+        self.assertIn(reply[:-len('Hello from GURU')], EMPATHETIC_PHRASES)
+        history = self.guru_app.session_store.get("async-tone-session").get_history()
+        self.assertEqual(history[-1]['content'], 'Hello from GURU')
+
+    async def test_async_chat_no_message(self):
+        """The ASGI chat route rejects empty messages like the Flask route."""
+        status, body = await self._request('/api/chat', 'POST', b'{}')
+        self.assertEqual(status, 400)
+        self.assertIn(b'No message provided', body)
+
+class SharedStateTestCase(unittest.TestCase):
+    """Two session stores over one SQLite file stand in for two worker processes."""
+    def setUp(self):
+        import tempfile
+        import app as guru_app
+        from modules.ai_core.fake_model import FakeGenerativeModel
+        from modules.ai_core.gemini_client import GeminiClient
+        from modules.context.session_store import SharedSessionHistoryStore
+        from modules.context.shared_store import SQLiteSharedStore
+        self.guru_app = guru_app
+        self.original_client = guru_app.gemini_client
+        self.original_rate_limiter = guru_app.rate_limiter
+        self.original_session_store = guru_app.session_store
+        guru_app.rate_limiter = fresh_rate_limiter()
+        self.fake_model = FakeGenerativeModel(chunks=["Hi ", "there"])
+        guru_app.gemini_client = GeminiClient(model=self.fake_model)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, "shared.db")
+        self.workers = [SharedSessionHistoryStore(
+            SQLiteSharedStore(path),
+            contents_factory=lambda: guru_app.ai_processor.incremental_contents(guru_app.SYSTEM_INSTRUCTION_TEXT)
+        ) for _ in range(2)]
+        app.testing = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.guru_app.gemini_client = self.original_client
+        self.guru_app.rate_limiter = self.original_rate_limiter
+        self.guru_app.session_store = self.original_session_store
+        self.temp_dir.cleanup()
+
+    def test_turns_alternate_between_workers(self):
+        """Each turn goes to the other worker, which still sends the whole conversation."""
+        headers = {'X-Session-ID': 'shared-session'}
+        for turn, message in enumerate(['My name is Alex', 'I like chess', 'What is my name?']):
+            self.guru_app.session_store = self.workers[turn % 2]
+            with self.client.post('/api/chat', json={'message': message}, headers=headers) as response:
+                response.get_data()
+        contents = self.fake_model.calls[-1][0]
+        self.assertEqual([entry['role'] for entry in contents], ['user', 'model', 'user', 'model', 'user'])
+        self.assertEqual(contents[0]['parts'][0]['text'], 'My name is Alex')
+        self.assertEqual(len(self.workers[1].get('shared-session').get_history()), 6)
+
+
+@unittest.skipUnless(hasattr(os, "fork") and os.path.isdir("/proc"), "serve.py needs fork(); the test reads /proc")
+class PreforkServerTestCase(unittest.TestCase):
+    def worker_pids(self, master_pid):
+        pids = []
+        for entry in os.listdir("/proc"):
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == master_pid:
+                        pids.append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+        return pids
+
+    def wait_for(self, condition, timeout=30.0):
+        import time
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = condition()
+            if result:
+                return result
+            time.sleep(0.05)
+        self.fail("Timed out waiting for the pre-fork server.")
+
+    def test_workers_serve_restart_and_stop(self):
+        import signal
+        import socket
+        import subprocess
+        import sys
+        import tempfile
+        import urllib.request
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = dict(os.environ, GEMINI_API_KEY="")
+            server = subprocess.Popen(
+                [sys.executable, "serve.py", "--workers", "2", "--host", "127.0.0.1", "--port", str(port),
+                 "--shared-store", os.path.join(temp_dir, "shared.db")],
+                cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                workers = self.wait_for(lambda: len(self.worker_pids(server.pid)) == 2 and self.worker_pids(server.pid))
+
+                def healthy():
+                    try:
+                        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as response:
+                            return response.status == 200
+                    except OSError:
+                        return False
+
+                self.wait_for(healthy)
+                os.kill(workers[0], signal.SIGKILL)
+                restarted = self.wait_for(lambda: (pids := self.worker_pids(server.pid)) and len(pids) == 2
+                                          and workers[0] not in pids and pids)
+                self.assertIn(workers[1], restarted)
+                for _ in range(10):
+                    self.assertTrue(self.wait_for(healthy))
+                server.send_signal(signal.SIGTERM)
+                self.assertEqual(server.wait(timeout=30), 0)
+                self.assertEqual(self.worker_pids(server.pid), [])
+            finally:
+                if server.poll() is None:
+                    server.kill()
+                    server.wait()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,10 @@
 # tests/test_context.py
 import unittest
 import os
+import subprocess
 import sys
+import tempfile
+import threading
 
 # Adjust path to import module from parent 'modules' directory
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -9,6 +12,19 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Example: Dynamically importing the target module's main class/functions
 # This is a placeholder; you'll need to define what to test
 # from modules.context import some_class_or_function 
+from modules.context.history import ConversationHistory
+from modules.context.session_store import SessionHistoryStore, SharedSessionHistoryStore, resolve_session_id
+from modules.context.shared_store import MemorySharedStore, SQLiteSharedStore
+from modules.context.memory import LongTermMemory, build_fts_query
+from modules.context.vector_index import VectorIndex, top_k_indices
+from modules.context.retrieval import ContextRetriever, reciprocal_rank_fusion
+from modules.context.summarizer import ExtractiveSummarizer, ModelSummarizer, SummaryWorker
+from modules.context.history import SUMMARY_PREFIX
+from modules.ai_core.processor import AIProcessor, IncrementalContents
+import time
+from modules.ai_core.embeddings import HashingEmbedder
+from modules.context.tokens import estimate_tokens
+import numpy as np
 
 class TestContext(unittest.TestCase):
 
@@ -28,5 +44,665 @@ class TestContext(unittest.TestCase):
 
     # Add more specific test methods for functionalities within context
 
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionHistoryStore(unittest.TestCase):
+
+    def test_sessions_are_isolated(self):
+        """Each session ID gets its own history."""
+        store = SessionHistoryStore(max_sessions=10)
+        store.get("session-a").add_message("user", "Hello from A")
+        store.get("session-b").add_message("user", "Hello from B")
+        self.assertEqual(store.get("session-a").get_history(), [{"role": "user", "content": "Hello from A"}])
+        self.assertEqual(len(store), 2)
+
+    def test_least_recently_used_session_is_evicted(self):
+        """Once the cap is reached the least recently used session is dropped."""
+        store = SessionHistoryStore(max_sessions=2)
+        store.get("session-a")
+        store.get("session-b")
+        store.get("session-a")  # 'b' is now the least recently used
+        store.get("session-c")
+        self.assertIn("session-a", store)
+        self.assertNotIn("session-b", store)
+        self.assertEqual(store.stats()["evicted_lru"], 1)
+
+    def test_idle_sessions_expire(self):
+        """Sessions idle for longer than the TTL start over with an empty history."""
+        clock = FakeClock()
+        store = SessionHistoryStore(max_sessions=10, ttl_seconds=60, clock=clock)
+        store.get("session-a").add_message("user", "Hi")
+        clock.now = 61
+        self.assertEqual(store.get("session-a").get_history(), [])
+        self.assertEqual(store.stats()["evicted_expired"], 1)
+
+    def test_concurrent_appends_are_not_lost(self):
+        """Appends from many threads to one session are all recorded."""
+        history = SessionHistoryStore(max_sessions=10, max_history_length=1000).get("session-a")
+
+        def append_messages():
+            for i in range(100):
+                history.add_message("user", f"message {i}")
+
+        threads = [threading.Thread(target=append_messages) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(history.get_history()), 800)
+
+    def test_resolve_session_id(self):
+        """Header wins over cookie; malformed IDs are replaced with a new one."""
+        self.assertEqual(resolve_session_id("header-session-1", "cookie-session-1"), ("header-session-1", False))
+        self.assertEqual(resolve_session_id(None, "cookie-session-1"), ("cookie-session-1", False))
+        session_id, is_new = resolve_session_id("bad id!", None)
+        self.assertTrue(is_new)
+        self.assertEqual(len(session_id), 32)
+
+class TestContextWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.counted = []
+
+        def counter(text):
+            self.counted.append(text)
+            return len(text.split())
+
+        self.history = ConversationHistory(max_history_length=10, token_counter=counter)
+
+    def test_window_keeps_newest_messages_within_budget(self):
+        """Only the newest messages that fit in the token budget are returned, oldest first."""
+        self.history.add_message("user", "one two three")
+        self.history.add_message("model", "four five")
+        self.history.add_message("user", "six seven")
+        window = self.history.get_context_window(max_tokens=4)
+        self.assertEqual([m["content"] for m in window], ["four five", "six seven"])
+        self.assertEqual(len(self.history.get_context_window(max_tokens=100)), 3)
+
+    def test_newest_message_is_always_included(self):
+        """A single oversized message still makes it into the window."""
+        self.history.add_message("user", "a b c d e f")
+        self.assertEqual(len(self.history.get_context_window(max_tokens=2)), 1)
+
+    def test_token_counts_are_cached_and_trimmed(self):
+        """Each message is counted once and the running total follows trimming."""
+        history = ConversationHistory(max_history_length=2, token_counter=lambda text: len(text.split()))
+        history.add_message("user", "a b c")
+        history.add_message("model", "d e")
+        history.add_message("user", "f")
+        self.assertEqual(history.total_tokens, 3)
+        for _ in range(3):
+            self.history.get_context_window(max_tokens=1)
+        self.history.add_message("user", "x y")
+        self.assertEqual(self.counted, ["x y"])
+
+class TestPromptContents(unittest.TestCase):
+
+    def test_prompt_contents_follow_the_history(self):
+        """Pre-built contents match building the context window from scratch, summary included."""
+        processor = AIProcessor()
+        worker = SummaryWorker(ExtractiveSummarizer(max_tokens=30))
+        history = ConversationHistory(max_history_length=4, max_tokens=60, summary_worker=worker,
+                                      contents_builder=processor.incremental_contents())
+        for i in range(12):
+            history.add_message("user" if i % 2 == 0 else "model", f"Turn {i} talks about deployment option {i}.")
+            worker.wait(timeout=5)
+            expected = processor.build_gemini_contents(history.get_context_window(max_tokens=200))
+            self.assertEqual(history.get_prompt_contents(max_tokens=200), expected)
+            # A budget smaller than the history falls back to converting the window
+            small = processor.build_gemini_contents(history.get_context_window(max_tokens=15))
+            self.assertEqual(history.get_prompt_contents(max_tokens=15), small)
+        self.assertIsNotNone(history.summary)
+        history.clear_history()
+        self.assertEqual(history.get_prompt_contents(max_tokens=200), [])
+        worker.close()
+
+    def test_store_builds_contents_per_session(self):
+        store = SessionHistoryStore(contents_factory=IncrementalContents)
+        store.get("session-a").add_message("user", "Hello from A")
+        self.assertEqual(store.get("session-a").get_prompt_contents(),
+                         [{"role": "user", "parts": [{"text": "Hello from A"}]}])
+        self.assertEqual(store.get("session-b").get_prompt_contents(), [])
+
+    def test_prompt_contents_without_a_builder(self):
+        """Without a contents_builder the window is converted on each call, with the same result."""
+        history = ConversationHistory()
+        self.assertEqual(history.get_prompt_contents(), [])
+        history.add_message("user", "Hello")
+        history.add_message("model", "Hi there")
+        self.assertEqual(history.get_prompt_contents(),
+                         AIProcessor().build_gemini_contents(history.get_context_window(max_tokens=1000)))
+
+
+class TestRollingSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = SummaryWorker(ExtractiveSummarizer(max_tokens=60))
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_trimmed_turns_are_folded_into_the_summary(self):
+        """Turns over the token budget end up in the summary, which leads the context window."""
+        history = ConversationHistory(max_history_length=100, max_tokens=40, summary_worker=self.worker)
+        history.add_message("user", "My name is Priya and I maintain the billing service written in Go.")
+        history.add_message("model", "Nice to meet you, Priya! What would you like to work on?")
+        for i in range(10):
+            history.add_message("user", f"Question number {i} about retries in the payment client.")
+        self.worker.wait(timeout=5)
+        self.assertLessEqual(history.total_tokens, 40)
+        summary = history.summarize_conversation()
+        self.assertIn("Priya", summary)
+        window = history.get_context_window(max_tokens=120)
+        self.assertEqual(window[0], {"role": "user", "content": SUMMARY_PREFIX + summary})
+        self.assertEqual(window[1:], history.get_history())
+        self.assertEqual(self.worker.stats()["folded_turns"], 12 - len(history.get_history()))
+
+    def test_prompt_size_stays_constant(self):
+        """However long the conversation, summary plus window stays within the budget."""
+        history = ConversationHistory(max_history_length=6, max_tokens=80, summary_worker=self.worker)
+        sizes = []
+        for i in range(200):
+            history.add_message("user" if i % 2 == 0 else "model", f"Turn {i} mentions topic{i % 17} and detail{i}.")
+            self.worker.wait(timeout=5)
+            window = history.get_context_window(max_tokens=150)
+            sizes.append(sum(history.token_counter(message["content"]) for message in window))
+        self.assertLessEqual(max(sizes), 150)
+        self.assertLessEqual(history.summary_tokens, 60 + history.token_counter(SUMMARY_PREFIX))
+
+    def test_summarization_is_off_the_request_path(self):
+        """add_message doesn't wait for a slow summarizer."""
+        release = threading.Event()
+
+        class SlowSummarizer:
+            def summarize(self, previous_summary, messages):
+                release.wait(5)
+                return f"{len(messages)} turns"
+
+        worker = SummaryWorker(SlowSummarizer())
+        history = ConversationHistory(max_history_length=1, summary_worker=worker)
+        started = time.perf_counter()
+        for i in range(5):
+            history.add_message("user", f"message {i}")
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIsNone(history.summarize_conversation())
+        release.set()
+        worker.wait(timeout=5)
+        self.assertEqual(worker.stats()["folded_turns"], 4)
+        self.assertEqual(worker.stats()["jobs"], 1)  # Later trims joined the running job
+        worker.close()
+
+    def test_clear_discards_in_flight_summary(self):
+        release = threading.Event()
+
+        class SlowSummarizer:
+            def summarize(self, previous_summary, messages):
+                release.wait(5)
+                return "stale"
+
+        worker = SummaryWorker(SlowSummarizer())
+        history = ConversationHistory(max_history_length=1, summary_worker=worker)
+        history.add_message("user", "first")
+        history.add_message("user", "second")
+        history.clear_history()
+        release.set()
+        worker.wait(timeout=5)
+        self.assertIsNone(history.summarize_conversation())
+        worker.close()
+
+    def test_extractive_summary_rolls_within_budget(self):
+        summarizer = ExtractiveSummarizer(max_tokens=40)
+        summary = summarizer.summarize(None, [
+            {"role": "user", "content": "Hi! I'm deploying GURU on Kubernetes. The Kubernetes pods keep restarting."},
+            {"role": "model", "content": "Sure. Restarting pods usually mean failing liveness probes."},
+        ])
+        self.assertTrue(all(line.startswith(("- user: ", "- model: ")) for line in summary.splitlines()))
+        self.assertIn("Kubernetes", summary)
+        for i in range(20):
+            summary = summarizer.summarize(summary, [{"role": "user", "content": f"Unrelated fact number {i} about lunch."}])
+            self.assertLessEqual(estimate_tokens(summary), 40)
+
+    def test_model_summarizer_falls_back_on_errors(self):
+        class ErrorClient:
+            def generate_response(self, prompt, generation_config=None, safety_settings=None, stream=False):
+                return iter(["Error_API_Call: quota exceeded"])
+
+        class Chunk:
+            def __init__(self, text):
+                self.text = text
+
+        class SummaryClient:
+            def generate_response(self, prompt, generation_config=None, safety_settings=None, stream=False):
+                return iter([Chunk("The user "), Chunk("likes Go.")])
+
+        turns = [{"role": "user", "content": "I write services in Go every day."}]
+        self.assertEqual(ModelSummarizer(SummaryClient()).summarize(None, turns), "The user likes Go.")
+        self.assertEqual(ModelSummarizer(ErrorClient()).summarize(None, turns), "- user: I write services in Go every day.")
+
+
+class TestLongTermMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "memory.db")
+        self.memory = LongTermMemory(storage_path=self.db_path)
+
+    def tearDown(self):
+        self.memory.close()
+        self.tmp_dir.cleanup()
+
+    def test_facts_persist_across_instances(self):
+        self.memory.store_fact("user_name", "Aryaman")
+        self.memory.store_fact("user_name", "Alex")  # Overwrites
+        self.memory.store_fact("favourite_numbers", [3, 7])
+        reopened = LongTermMemory(storage_path=self.db_path)
+        self.assertEqual(reopened.retrieve_fact("user_name"), "Alex")
+        self.assertEqual(reopened.retrieve_fact("favourite_numbers"), [3, 7])
+        self.assertIsNone(reopened.retrieve_fact("missing"))
+        self.assertEqual(reopened.count(), 2)
+        reopened.close()
+
+    def test_search_ranks_by_bm25(self):
+        """Full-text search matches key and value words, best match first."""
+        self.memory.store_facts({
+            "user_preference_topic": "AI technology",
+            "important_meeting_date": "2024-12-25",
+            "project_guru_goal": "Advanced conversational AI assistant for AI research",
+        })
+        results = self.memory.search_related_facts("meeting")
+        self.assertEqual([r["key"] for r in results], ["important_meeting_date"])
+        results = self.memory.search_related_facts("AI research", top_k=2)
+        self.assertEqual(results[0]["key"], "project_guru_goal")
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.memory.search_related_facts("?!"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.memory.store_fact("pet", "a cat named Miso")
+        self.memory.store_fact("pet", "a dog named Rex")
+        self.assertEqual(self.memory.search_related_facts("cat"), [])
+        self.assertTrue(self.memory.delete_fact("pet"))
+        self.assertEqual(self.memory.search_related_facts("dog"), [])
+
+    def test_each_thread_uses_its_own_connection(self):
+        """Writers on several threads all land in the same database."""
+        def write(thread_index):
+            self.memory.store_facts((f"fact_{thread_index}_{i}", f"value {i}") for i in range(50))
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.memory.count(), 200)
+
+    def test_in_memory_store_is_shared_between_threads(self):
+        memory = LongTermMemory(storage_path=":memory:")
+        memory.store_fact("color", "blue")
+        found = []
+        thread = threading.Thread(target=lambda: found.append(memory.retrieve_fact("color")))
+        thread.start()
+        thread.join()
+        self.assertEqual(found, ["blue"])
+        memory.close()
+
+    def test_build_fts_query(self):
+        self.assertEqual(build_fts_query("user_name AI"), '"user"* OR "name"* OR "ai"*')
+        self.assertIsNone(build_fts_query("   "))
+
+class TestVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _random_unit_vectors(self, n, dim, seed=0):
+        vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def test_top_k_indices(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+        self.assertEqual(top_k_indices(scores, 2).tolist(), [1, 3])
+        self.assertEqual(top_k_indices(scores, 10).tolist(), [1, 3, 2, 0])
+
+    def test_exact_search_grows_and_persists(self):
+        """The memory-mapped index grows past its initial capacity and reloads from disk."""
+        path = os.path.join(self.tmp_dir.name, "facts.vectors")
+        vectors = self._random_unit_vectors(100, 16)
+        index = VectorIndex(path=path, dim=16, capacity=8)
+        index.add_batch(range(1000, 1100), vectors)
+        self.assertEqual(index.search(vectors[42], top_k=1)[0][0], 1042)
+        index.flush()
+
+        reloaded = VectorIndex(path=path, dim=16)
+        self.assertEqual(len(reloaded), 100)
+        self.assertEqual(reloaded.search(vectors[7], top_k=3)[0][0], 1007)
+
+    def test_remove_keeps_other_ids_searchable(self):
+        vectors = self._random_unit_vectors(10, 8)
+        index = VectorIndex(dim=8, capacity=4)
+        index.add_batch(range(10), vectors)
+        self.assertTrue(index.remove(3))
+        self.assertFalse(index.remove(3))
+        self.assertEqual(len(index), 9)
+        self.assertEqual(index.search(vectors[9], top_k=1)[0][0], 9)
+        self.assertNotIn(3, [fact_id for fact_id, _ in index.search(vectors[3], top_k=9)])
+
+    def test_ivf_search_finds_exact_neighbours_with_full_probe(self):
+        vectors = self._random_unit_vectors(2000, 32)
+        index = VectorIndex(dim=32, capacity=2000)
+        index.add_batch(range(2000), vectors)
+        exact = [fact_id for fact_id, _ in index.search(vectors[5], top_k=5)]
+        index.train_ivf(n_lists=16, nprobe=16)
+        self.assertEqual([fact_id for fact_id, _ in index.search(vectors[5], top_k=5)], exact)
+        index.add(5000, vectors[5])  # New vectors are assigned to a cluster as they arrive
+        self.assertIn(5000, [fact_id for fact_id, _ in index.search(vectors[5], top_k=2, nprobe=4)])
+
+    def test_ivf_forgets_removed_last_row(self):
+        vectors = self._random_unit_vectors(200, 16)
+        index = VectorIndex(dim=16, capacity=200)
+        index.add_batch(range(200), vectors)
+        index.train_ivf(n_lists=8, nprobe=8)
+        index.search(vectors[0], top_k=1)  # Builds the quantizer's row order
+        self.assertTrue(index.remove(199))  # The last row: nothing is moved into its place
+        self.assertNotIn(199, [fact_id for fact_id, _ in index.search(vectors[199], top_k=5)])
+        index.add(500, vectors[3])  # Reuses the freed row
+        self.assertEqual({fact_id for fact_id, _ in index.search(vectors[3], top_k=2)}, {3, 500})
+
+
+class TestSemanticMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = LongTermMemory(storage_path=":memory:", embedder=HashingEmbedder())
+        self.memory.store_facts({
+            "user_name": "Alex",
+            "project_guru_goal": "Advanced conversational AI",
+            "favourite_food": "spicy ramen noodles",
+        })
+
+    def tearDown(self):
+        self.memory.close()
+
+    def test_semantic_search_ranks_similar_facts_first(self):
+        results = self.memory.semantic_search_facts("what food do I like? ramen?", top_k=2)
+        self.assertEqual(results[0]["key"], "favourite_food")
+        self.assertIn("score", results[0])
+
+    def test_deleted_facts_leave_the_index(self):
+        self.memory.delete_fact("favourite_food")
+        keys = [r["key"] for r in self.memory.semantic_search_facts("ramen noodles", top_k=3)]
+        self.assertNotIn("favourite_food", keys)
+
+    def test_retriever_can_use_semantic_search(self):
+        retriever = ContextRetriever(ConversationHistory(), long_term_memory_provider=self.memory)
+        context = retriever.retrieve_relevant_context("goal of the guru project", search_mode="semantic")
+        self.assertIn("project_guru_goal", context)
+
+class SlowMemory:
+    """Long-term memory stand-in whose two searches each take a fixed time."""
+    vector_index = object()
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def search_related_facts(self, query_text, top_k=3):
+        time.sleep(self.delay)
+        return [{"key": "shared", "value": "in both"}, {"key": "lexical_only", "value": "from FTS"}][:top_k]
+
+    def semantic_search_facts(self, query_text, top_k=3):
+        time.sleep(self.delay)
+        return [{"key": "vector_only", "value": "from vectors"}, {"key": "shared", "value": "in both"}][:top_k]
+
+
+class TestHybridRetrieval(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([
+            [{"key": "a", "value": 1}, {"key": "b", "value": 2}],
+            [{"key": "b", "value": 2}, {"key": "c", "value": 3}],
+        ])
+        self.assertEqual([fact["key"] for fact in fused], ["b", "a", "c"])
+
+    def test_searches_run_concurrently_and_are_fused(self):
+        """Both backends overlap, results are deduped, and every stage is timed."""
+        retriever = ContextRetriever(ConversationHistory(), long_term_memory_provider=SlowMemory(0.2))
+        result = retriever.retrieve_with_timings("anything", top_k=3)
+        self.assertEqual([fact["key"] for fact in result["facts"]], ["shared", "vector_only", "lexical_only"])
+        self.assertLess(result["timings"]["total_ms"], 350)  # Sequentially this takes ~400 ms
+        for stage in ("history_ms", "lexical_ms", "vector_ms", "fusion_ms", "total_ms"):
+            self.assertIn(stage, result["timings"])
+        retriever.close()
+
+    def test_facts_are_trimmed_to_token_budget(self):
+        retriever = ContextRetriever(ConversationHistory(), long_term_memory_provider=SlowMemory(0),
+                                     token_counter=lambda text: len(text.split()))
+        result = retriever.retrieve_with_timings("anything", top_k=3, token_budget=9)
+        self.assertEqual([fact["key"] for fact in result["facts"]], ["shared", "vector_only"])
+        retriever.close()
+
+    def test_hybrid_falls_back_to_lexical_without_vectors(self):
+        memory = LongTermMemory(storage_path=":memory:")
+        memory.store_fact("user_name", "Alex")
+        retriever = ContextRetriever(ConversationHistory(), long_term_memory_provider=memory)
+        result = retriever.retrieve_with_timings("name")
+        self.assertEqual(result["facts"][0]["key"], "user_name")
+        self.assertNotIn("vector_ms", result["timings"])
+        retriever.close()
+        memory.close()
+
+class TestSharedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "shared.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def stores(self):
+        return [MemorySharedStore(clock=self.clock), SQLiteSharedStore(self.path, clock=self.clock)]
+
+    def test_versions_and_compare_and_set(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                self.assertIsNone(store.get("ns", "key"))
+                self.assertIsNone(store.compare_and_set("ns", "key", "a", 1))
+                first = store.compare_and_set("ns", "key", "a", 0)
+                self.assertEqual(store.get("ns", "key"), (first, "a"))
+                self.assertIsNone(store.compare_and_set("ns", "key", "b", 0))  # Already exists
+                second = store.compare_and_set("ns", "key", "b", first)
+                self.assertGreater(second, first)
+                self.assertIsNone(store.compare_and_set("ns", "key", "c", first))  # Stale version
+                self.assertEqual(store.version("ns", "key"), second)
+                self.assertIsNone(store.get("other", "key"))  # Namespaces are separate
+                store.delete("ns", "key")
+                self.assertIsNone(store.version("ns", "key"))
+
+    def test_entries_expire(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                version = store.put("ns", "short", "x", ttl_seconds=10)
+                store.put("ns", "forever", "y")
+                self.clock.now += 11
+                self.assertIsNone(store.get("ns", "short"))
+                self.assertEqual(store.get("ns", "forever")[1], "y")
+                # An expired entry counts as missing, and its key's versions keep increasing
+                self.assertGreater(store.compare_and_set("ns", "short", "z", 0), version)
+                self.clock.now += 100
+                store.put("ns", "gone", "w", ttl_seconds=1)
+                self.clock.now += 2
+                self.assertEqual(store.purge_expired(), 1)
+                self.assertEqual(store.stats()["entries"], 2)
+                self.clock.now = 0
+
+    def test_sqlite_transaction_rolls_back_on_error(self):
+        store = SQLiteSharedStore(self.path)
+        with self.assertRaises(RuntimeError):
+            with store.transaction():
+                store.put("ns", "a", "1")
+                raise RuntimeError("halfway")
+        self.assertIsNone(store.get("ns", "a"))
+
+    def test_processes_share_one_sqlite_file(self):
+        """Concurrent compare-and-set increments from several processes are all counted."""
+        script = (
+            "import sys\n"
+            "from modules.context.shared_store import SQLiteSharedStore\n"
+            "store = SQLiteSharedStore(sys.argv[1])\n"
+            "for _ in range(50):\n"
+            "    while True:\n"
+            "        entry = store.get('ns', 'counter')\n"
+            "        version, value = entry if entry else (0, '0')\n"
+            "        if store.compare_and_set('ns', 'counter', str(int(value) + 1), version) is not None:\n"
+            "            break\n"
+        )
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        processes = [subprocess.Popen([sys.executable, "-c", script, self.path], cwd=root) for _ in range(4)]
+        for process in processes:
+            self.assertEqual(process.wait(timeout=60), 0)
+        self.assertEqual(SQLiteSharedStore(self.path).get("ns", "counter")[1], "200")
+
+
+class GatedSummarizer:
+    """Summarizes only once the gate is set, so a test can act while a fold is in flight."""
+    def __init__(self, summarizer, gate):
+        self.summarizer = summarizer
+        self.gate = gate
+
+    def summarize(self, previous_summary, messages):
+        self.gate.wait(timeout=5)
+        return self.summarizer.summarize(previous_summary, messages)
+
+
+class ContendedStore(MemorySharedStore):
+    """Loses the first `lose` compare-and-set calls, as if another worker always wrote first."""
+    def __init__(self, lose):
+        super().__init__()
+        self.lose = lose
+
+    def compare_and_set(self, *args, **kwargs):
+        if self.lose > 0:
+            self.lose -= 1
+            return None
+        return super().compare_and_set(*args, **kwargs)
+
+
+class TestSharedSessionHistoryStore(unittest.TestCase):
+    """Two stores over one SQLite file stand in for two worker processes."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, "shared.db")
+        self.summary_worker = SummaryWorker(ExtractiveSummarizer(max_tokens=60))
+        self.workers = [SharedSessionHistoryStore(SQLiteSharedStore(path), max_history_length=4,
+                                                  summary_worker=self.summary_worker,
+                                                  contents_factory=IncrementalContents)
+                        for _ in range(2)]
+
+    def tearDown(self):
+        self.summary_worker.close()
+        self.temp_dir.cleanup()
+
+    def test_any_worker_serves_any_turn(self):
+        a, b = self.workers
+        a.get("session-a").add_message("user", "My name is Alex")
+        b.get("session-a").add_message("model", "Hi Alex!")
+        a.get("session-a").add_message("user", "What is my name?")
+        history = b.get("session-a")
+        self.assertEqual([message["content"] for message in history.get_history()],
+                         ["My name is Alex", "Hi Alex!", "What is my name?"])
+        contents = history.get_prompt_contents(max_tokens=1000)
+        self.assertEqual([entry["role"] for entry in contents], ["user", "model", "user"])
+        self.assertEqual(b.stats()["reloads"], 2)
+        b.get("session-a")
+        self.assertEqual(b.stats()["reloads"], 2)  # Unchanged since: nothing to reload
+
+    def test_concurrent_turns_on_two_workers_are_merged(self):
+        a, b = self.workers
+        a.get("session-a").add_message("user", "first")
+        history_a, history_b = a.get("session-a"), b.get("session-a")
+        history_a.add_message("user", "from a")
+        history_b.add_message("user", "from b")  # Written on top of a stale version
+        expected = ["first", "from a", "from b"]
+        self.assertEqual([message["content"] for message in history_b.get_history()], expected)
+        self.assertEqual([message["content"] for message in a.get("session-a").get_history()], expected)
+        self.assertEqual(b.stats()["conflicts"], 1)
+
+    def test_summary_is_shared_and_survives_a_concurrent_turn(self):
+        a, b = self.workers
+        gate = threading.Event()
+        self.summary_worker.summarizer = GatedSummarizer(self.summary_worker.summarizer, gate)
+        history_a = a.get("session-a")
+        history_a.add_message("user", "My name is Priya and I maintain the billing service written in Go.")
+        for i in range(4):
+            history_a.add_message("user", f"Question number {i} about retries in the payment client.")
+        history_b = b.get("session-a")
+        self.assertEqual(history_b.get_state()["pending"][0]["content"][:10], "My name is")
+        history_b.add_message("user", "Another question from the second worker.")
+        gate.set()
+        self.summary_worker.wait(timeout=5)
+        # a folded the turn while b wrote a newer version; the summary was rebased onto it
+        self.assertIn("Priya", b.get("session-a").summarize_conversation())
+        self.assertEqual(b.get("session-a").get_state()["pending"], [])
+        self.assertEqual(a.stats()["conflicts"], 1)
+        self.assertIn("Another question", b.get("session-a").get_history()[-1]["content"])
+
+    def test_clear_and_drop_reach_every_worker(self):
+        a, b = self.workers
+        a.get("session-a").add_message("user", "Hello")
+        b.get("session-a").clear_history()
+        self.assertEqual(a.get("session-a").get_history(), [])
+        a.get("session-a").add_message("user", "Hello again")
+        b.drop("session-a")
+        self.assertEqual(a.get("session-a").get_history(), [])
+
+    def test_contended_writes_back_off_off_the_request_path(self):
+        """A write that still conflicts after a rebase returns at once; the retries sleep on a
+        background thread, without the history's lock, and keep later changes in order."""
+        import json
+        from unittest import mock
+        from modules.context import session_store
+        store = ContendedStore(lose=4)
+        sessions = SharedSessionHistoryStore(store)
+        self.addCleanup(sessions.close)
+        history = sessions.get("session-a")
+        sleeps = []
+        real_sleep = time.sleep
+
+        def recording_sleep(seconds):
+            sleeps.append((threading.current_thread() is threading.main_thread(), history._lock._is_owned()))
+            real_sleep(seconds)
+
+        with mock.patch.object(session_store.time, "sleep", recording_sleep):
+            history.add_message("user", "first")  # Conflict, rebase, conflict: handed to the background
+            history.add_message("model", "second")
+            sessions.wait(timeout=5)
+        self.assertTrue(sleeps)
+        self.assertEqual(sleeps, [(False, False)] * len(sleeps))
+        stored = json.loads(store.get(SharedSessionHistoryStore.NAMESPACE, "session-a")[1])
+        self.assertEqual([message["content"] for message in stored["messages"]], ["first", "second"])
+        self.assertEqual((sessions.stats()["conflicts"], sessions.stats()["lost_changes"]), (4, 0))
+
+    def test_given_up_changes_are_reloaded_on_next_get(self):
+        store = ContendedStore(lose=100)
+        sessions = SharedSessionHistoryStore(store, max_conflict_retries=2)
+        self.addCleanup(sessions.close)
+        store.put(SharedSessionHistoryStore.NAMESPACE, "session-a",
+                  '{"messages": [], "summary": null, "pending": []}')
+        sessions.get("session-a").add_message("user", "never written")
+        sessions.wait(timeout=5)
+        self.assertEqual(sessions.stats()["lost_changes"], 1)
+        self.assertEqual(sessions.get("session-a").get_history(), [])
+
+
 if __name__ == '__main__':
     unittest.main()
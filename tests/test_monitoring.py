@@ -0,0 +1,73 @@
+# tests/test_monitoring.py
+import unittest
+import os
+import sys
+import threading
+
+# Adjust path to import module from parent 'modules' directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.monitoring.metrics import MetricsRegistry
+from modules.monitoring.instrumentation import error_type, observe_gemini_stream, GEMINI_ERRORS, GEMINI_REQUESTS
+
+
+class TestCounter(unittest.TestCase):
+    def test_increments_from_many_threads_are_summed(self):
+        counter = MetricsRegistry().counter("test_total", "Test counter.", labelnames=("kind",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(labels=("a",))
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5, labels=("b",))
+        self.assertEqual(counter.value(labels=("a",)), 8000)
+        self.assertEqual(counter.value(labels=("b",)), 5)
+
+    def test_shards_of_finished_threads_are_retired(self):
+        counter = MetricsRegistry().counter("test_total", "Test counter.")
+        for _ in range(20):
+            thread = threading.Thread(target=counter.inc)
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.value(), 20)
+        self.assertLessEqual(len(counter._shards), 1)
+
+
+class TestHistogramAndRender(unittest.TestCase):
+    def test_render_uses_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+        registry.counter("test_requests_total", "Requests.", labelnames=("status",)).inc(labels=("200",))
+        registry.callback("test_entries", "Entries.", lambda: 3)
+        text = registry.render()
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("test_seconds_count 3", text)
+        self.assertIn('test_requests_total{status="200"} 1', text)
+        self.assertIn("test_entries 3", text)
+
+    def test_registering_twice_returns_the_same_metric(self):
+        registry = MetricsRegistry()
+        self.assertIs(registry.counter("test_total", "A."), registry.counter("test_total", "A."))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_gemini_stream_errors_are_counted_by_type(self):
+        before = GEMINI_ERRORS.value(labels=("test-model", "Error_API_Call"))
+        requests_before = GEMINI_REQUESTS.value(labels=("test-model",))
+        chunks = list(observe_gemini_stream("test-model", iter(["Error_API_Call: boom"])))
+        self.assertEqual(chunks, ["Error_API_Call: boom"])
+        self.assertEqual(GEMINI_ERRORS.value(labels=("test-model", "Error_API_Call")), before + 1)
+        self.assertEqual(GEMINI_REQUESTS.value(labels=("test-model",)), requests_before + 1)
+        self.assertEqual(error_type("Error_Stream_Iteration: x"), "Error_Stream_Iteration")
+
+if __name__ == '__main__':
+    unittest.main()
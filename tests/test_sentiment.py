@@ -9,6 +9,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Example: Dynamically importing the target module's main class/functions
 # This is a placeholder; you'll need to define what to test
 # from modules.sentiment import some_class_or_function 
+from modules.sentiment.analyzer import SentimentAnalyzer
+from modules.sentiment.lexicon import Lexicon
+from modules.sentiment.pipeline import TonePipeline
+from modules.sentiment.features import HashingVectorizer
+from modules.sentiment.training import SentimentModelTrainer, assign_folds, classification_report
+from modules.sentiment.response_modifier import POSITIVE_PHRASES
 
 class TestSentiment(unittest.TestCase):
 
@@ -28,5 +34,197 @@ class TestSentiment(unittest.TestCase):
 
     # Add more specific test methods for functionalities within sentiment
 
+class TestLexiconSentiment(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = SentimentAnalyzer()
+
+    def compound(self, text):
+        return self.analyzer.analyze_sentiment(text)["compound"]
+
+    def test_labels(self):
+        self.assertEqual(self.analyzer.analyze_sentiment("GURU is great, thanks!")["label"], "positive")
+        self.assertEqual(self.analyzer.analyze_sentiment("This is terrible and I hate it")["label"], "negative")
+        self.assertEqual(self.analyzer.analyze_sentiment("The meeting is at noon.")["label"], "neutral")
+        self.assertEqual(self.analyzer.analyze_sentiment("")["label"], "neutral")
+
+    def test_rules(self):
+        self.assertLess(self.compound("not good"), 0)
+        self.assertGreater(self.compound("very good"), self.compound("good"))
+        self.assertLess(self.compound("slightly good"), self.compound("good"))
+        self.assertGreater(self.compound("good!!!"), self.compound("good"))
+        self.assertGreater(self.compound("this is GOOD stuff"), self.compound("this is good stuff"))
+        # After "but" counts more than before it
+        self.assertLess(self.compound("the food was good but the service was awful"), 0)
+
+    def test_batch_matches_single(self):
+        texts = ["I love it", "not bad at all", "", "this is SO bad!!", "meh", "great but slow"] * 10
+        batch = self.analyzer.analyze_batch(texts)
+        for text, result in zip(texts, batch):
+            single = self.analyzer.analyze_sentiment(text)
+            self.assertAlmostEqual(result["compound"], single["compound"], places=3)
+            self.assertEqual(result["label"], single["label"])
+
+    def test_streaming_matches_whole_text(self):
+        text = "Honestly I was not happy at first, but this is REALLY helpful. Thank you so much!!"
+        running = self.analyzer.stream()
+        for start in range(0, len(text), 5):
+            running.feed(text[start:start + 5])
+        self.assertEqual(running.finish(), self.analyzer.analyze_sentiment(text))
+
+    def test_custom_lexicon_file(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("splendid\t3.0\t0.5\t[3, 3]\n")
+        try:
+            analyzer = SentimentAnalyzer(lexicon=Lexicon.from_vader_file(f.name))
+        finally:
+            os.remove(f.name)
+        self.assertEqual(analyzer.analyze_sentiment("splendid")["label"], "positive")
+        self.assertEqual(analyzer.analyze_sentiment("good")["label"], "neutral")
+
+
+class TestTonePipeline(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = TonePipeline()
+
+    def tearDown(self):
+        self.pipeline.close()
+
+    def ready_task(self, message):
+        task = self.pipeline.start(message)
+        task._future.result(timeout=5)
+        return task
+
+    def test_prefix_follows_sentiment(self):
+        self.assertIn(self.ready_task("I love this, thanks!").prefix_if_ready(), POSITIVE_PHRASES)
+        self.assertEqual(self.ready_task("The meeting is at noon.").prefix_if_ready(), "")
+        self.assertEqual(self.pipeline.stats(), {"prefixed": 1, "neutral": 1, "late": 0, "failed": 0})
+
+    def test_short_or_weak_messages_get_no_prefix(self):
+        short = self.pipeline.start("thanks")
+        self.assertIsNone(short._future)  # Not even scored
+        self.assertEqual(short.prefix_if_ready(), "")
+        self.assertEqual(self.ready_task("This is terrible").prefix_if_ready(), "")  # compound -0.48
+        self.assertEqual(self.pipeline.stats(), {"prefixed": 0, "neutral": 2, "late": 0, "failed": 0})
+
+
+class TestSentimentTraining(unittest.TestCase):
+    POSITIVE = "great love helpful perfect thanks awesome".split()
+    NEGATIVE = "awful hate broken slow useless terrible".split()
+    FILLER = "the code answer reply it this is was and so".split()
+
+    def setUp(self):
+        import random
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.rng = random.Random(0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def example(self):
+        positive = self.rng.random() < 0.5
+        words = [self.rng.choice(self.FILLER) for _ in range(6)]
+        words += [self.rng.choice(self.POSITIVE if positive else self.NEGATIVE) for _ in range(2)]
+        self.rng.shuffle(words)
+        return " ".join(words), "positive" if positive else "negative"
+
+    def write_csv(self, name, rows):
+        import csv
+        with open(self.path(name), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["text", "label"])
+            writer.writerows(rows)
+            writer.writerow(["no label here", "neutral"])  # Skipped
+        return self.path(name)
+
+    def write_jsonl(self, name, rows):
+        import json
+        with open(self.path(name), "w") as f:
+            for text, label in rows:
+                f.write(json.dumps({"text": text, "label": label}) + "\n")
+        return self.path(name)
+
+    def test_vectorizer_rows_are_normalized(self):
+        matrix = HashingVectorizer(n_features=2 ** 10).transform(["good good not bad", ""])
+        self.assertEqual(matrix.shape, (2, 2 ** 10))
+        self.assertAlmostEqual(float((matrix.rows(0, 1).data ** 2).sum()), 1.0, places=5)
+        self.assertEqual(len(matrix.rows(1, 2).data), 0)
+        picked = matrix.take([1, 0, 0])
+        self.assertEqual(picked.nnz, 2 * matrix.nnz)
+        row_sums = picked.dot([1.0] * 2 ** 10)
+        self.assertEqual(row_sums[0], 0.0)
+        self.assertAlmostEqual(row_sums[1], float(matrix.rows(0, 1).data.sum()), places=5)
+        self.assertEqual(row_sums[1], row_sums[2])
+
+    def test_train_evaluate_save_and_load(self):
+        model_path = self.path("model")
+        trainer = SentimentModelTrainer(model_path=model_path, n_features=2 ** 14, epochs=5, batch_size=32)
+        trainer.train_file(self.write_csv("train.csv", [self.example() for _ in range(2000)]))
+        X_test, y_test = trainer.preprocess_file(self.write_jsonl("test.jsonl", [self.example() for _ in range(300)]),
+                                                 self.path("test-features"))
+        self.assertEqual(len(X_test), 300)
+        report = trainer.evaluate_model(X_test, y_test)
+        self.assertGreater(report["accuracy"], 0.95)
+        self.assertGreater(report["roc_auc"], 0.95)
+        self.assertEqual(sum(report["confusion"].values()), 300)
+        self.assertTrue(os.path.exists(trainer.save_model()))
+
+        reloaded = SentimentModelTrainer(model_path=model_path)
+        self.assertTrue(reloaded.load_model())
+        self.assertEqual(reloaded.evaluate_model(X_test, y_test), report)
+
+        analyzer = SentimentAnalyzer(method="custom_ml", model_path=model_path)
+        self.assertEqual(analyzer.analyze_sentiment("this answer is great thanks")["label"], "positive")
+        results = analyzer.analyze_batch(["awful and broken", "perfect"])
+        self.assertEqual([r["label"] for r in results], ["negative", "positive"])
+        running = analyzer.stream()
+        running.feed("so ")
+        self.assertEqual(running.feed("useless")["label"], "negative")
+
+    def test_missing_model_scores_neutral(self):
+        self.assertFalse(SentimentModelTrainer(model_path=self.path("missing")).load_model())
+        analyzer = SentimentAnalyzer(method="custom_ml", model_path=self.path("missing"))
+        self.assertEqual(analyzer.analyze_sentiment("great")["label"], "neutral")
+
+    def test_sweep_is_deterministic_across_workers(self):
+        trainer = SentimentModelTrainer(model_path=self.path("model"), n_features=2 ** 12, epochs=2, batch_size=32)
+        X, y = trainer.preprocess_file(self.write_csv("train.csv", [self.example() for _ in range(600)]))
+        grid = {"learning_rate": [0.05, 0.5]}
+        in_process = trainer.sweep(grid, X, y, folds=3, workers=1)
+        pooled = trainer.sweep(grid, X, y, folds=3, workers=2)
+        self.assertEqual(in_process, pooled)
+        self.assertEqual(len(pooled[0]["folds"]), 3)
+        self.assertGreaterEqual(pooled[0]["mean"]["roc_auc"], pooled[1]["mean"]["roc_auc"])
+        self.assertEqual(sum(fold["samples"] for fold in pooled[0]["folds"]), 600)
+        with self.assertRaises(ValueError):
+            trainer.sweep({"momentum": [0.9]}, X, y)
+
+    def test_cross_validate_in_memory_features(self):
+        trainer = SentimentModelTrainer(model_path=self.path("model"), n_features=2 ** 12, batch_size=16)
+        texts, labels = zip(*[self.example() for _ in range(200)])
+        result = trainer.cross_validate(trainer.preprocess_data(list(texts)), labels, folds=4, workers=2, l2=0.0)
+        self.assertEqual(result["params"]["l2"], 0.0)
+        self.assertGreater(result["mean"]["accuracy"], 0.9)
+        self.assertEqual(trainer.cv_results, [result])
+
+    def test_folds_are_stratified(self):
+        labels = [1] * 30 + [0] * 90
+        fold_of = assign_folds(labels, 3, seed=7)
+        for fold in range(3):
+            in_fold = [label for label, f in zip(labels, fold_of) if f == fold]
+            self.assertEqual((in_fold.count(1), in_fold.count(0)), (10, 30))
+        self.assertEqual(list(fold_of), list(assign_folds(labels, 3, seed=7)))
+
+    def test_classification_report(self):
+        report = classification_report([1, 1, 0, 0], [0.9, 0.4, 0.2, 0.6])
+        self.assertEqual(report["accuracy"], 0.5)
+        self.assertEqual(report["confusion"], {"tp": 1, "fp": 1, "tn": 1, "fn": 1})
+        self.assertEqual(report["roc_auc"], 0.75)
+
+
 if __name__ == '__main__':
     unittest.main()